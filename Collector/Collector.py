@@ -20,15 +20,23 @@ import base64
 import hashlib
 import json
 import os
+import pickle
 import shutil
+import stat
 import sys
+import time
 from tempfile import mkstemp
 from zipfile import ZipFile
 
+import requests
+
+from Collector.SubmissionCounter import SubmissionCounter, crashFingerprint
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Running.AutoRunner import AutoRunner
 from FTB.Signatures.CrashInfo import CrashInfo
 from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.SignatureIndex import SignatureIndex
+from FTB.Signatures.SignatureManifest import hashSignatureFiles
 from Reporter.Reporter import Reporter, remote_checks, signature_checks
 
 __all__ = []
@@ -36,14 +44,84 @@ __version__ = 0.1
 __date__ = "2014-10-01"
 __updated__ = "2014-10-01"
 
+# Pre-parsed index of all signatures in the signature directory, so searching
+# doesn't need to read and parse every signature file.
+SIGNATURE_INDEX_FILE = "signatures.index"
+SIGNATURE_INDEX_VERSION = 1
+
+# Hashes of the local signatures as listed in the server's signature manifest,
+# along with the ETag of that manifest.
+SIGNATURE_MANIFEST_FILE = "signatures.manifest.json"
+# Above this many changed signatures, all of them are downloaded at once
+SIGNATURE_DELTA_LIMIT = 1000
+# Number of changed signatures requested at once
+SIGNATURE_DELTA_CHUNK = 200
+
+# Maximum number of crashes submitted in one request by submit_many
+SUBMIT_BATCH_SIZE = 100
+
+# Per-crash occurrence counters used by submit_deduplicated, kept in the
+# signature directory unless specified otherwise.
+SUBMISSION_COUNTER_FILE = "submissions.json"
+# Number of top frames identifying repeated occurrences of a crash
+DEDUP_FRAMES = 8
+# Number of occurrences of each crash submitted in full
+DEDUP_FULL_SUBMISSIONS = 3
+# Minimum time (seconds) between reports of further occurrences of a crash
+DEDUP_REPORT_INTERVAL = 60
+
+# Files the Collector keeps in the signature directory besides the signatures
+_COLLECTOR_FILES = (
+    SIGNATURE_INDEX_FILE,
+    SIGNATURE_MANIFEST_FILE,
+    SUBMISSION_COUNTER_FILE,
+    SUBMISSION_COUNTER_FILE + ".lock",
+)
+
+
+def _is_collector_file(name):
+    if name in _COLLECTOR_FILES:
+        return True
+    # Temporary files are named ".<name of the file they replace><random>"
+    return name.startswith(".") and (
+        name[1:].startswith(_COLLECTOR_FILES)
+        or ".signature" in name
+        or ".metadata" in name
+    )
+
+
+# Signature indices loaded in this process, by signature directory:
+# (fingerprint, (SignatureIndex, metadata))
+_SIGNATURE_INDICES = {}
+
+
+def _is_private_file(fileStat):
+    # Regular file that only the current user could have written
+    if not stat.S_ISREG(fileStat.st_mode):
+        return False
+    if hasattr(os, "getuid"):
+        if fileStat.st_uid != os.getuid():
+            return False
+        if fileStat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            return False
+    return True
+
 
 class Collector(Reporter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Crashes queued with submit_later, already serialized
+        self.__pending = []
+
     @remote_checks
     @signature_checks
     def refresh(self):
         """
         Refresh signatures by contacting the server, downloading new signatures
         and invalidating old ones.
+
+        If the server provides a signature manifest, only signatures that changed
+        since the last refresh are downloaded.
         """
         url = "%s://%s:%d/crashmanager/rest/signatures/download/" % (
             self.serverProtocol,
@@ -51,15 +129,102 @@ class Collector(Reporter):
             self.serverPort,
         )
 
+        localManifest = self.__read_signature_manifest()
+        headers = {}
+        if localManifest.get("etag"):
+            headers["If-None-Match"] = localManifest["etag"]
+
+        response = self.get(
+            url,
+            params={"manifest": "1"},
+            headers=headers,
+            stream=True,
+            expected=(
+                requests.codes["ok"],
+                requests.codes["not_modified"],
+                requests.codes["not_found"],
+            ),
+        )
+
+        if response.status_code == requests.codes["not_modified"]:
+            return
+
+        manifest, etag = (None, None)
+        if response.status_code == requests.codes["ok"]:
+            if not response.headers.get("Content-Type", "").startswith(
+                "application/json"
+            ):
+                # Older servers ignore the manifest parameter and send all
+                # signatures right away.
+                self.__refresh_from_response(response)
+                return
+
+            manifest = response.json()
+            etag = response.headers.get("ETag")
+
+            hashes = localManifest.get("hashes", {})
+            changed = sorted(
+                bucketId
+                for bucketId, contentHash in manifest.items()
+                if hashes.get(bucketId) != contentHash
+                or not os.path.exists(
+                    os.path.join(self.sigCacheDir, f"{bucketId}.signature")
+                )
+            )
+            if len(changed) <= SIGNATURE_DELTA_LIMIT:
+                self.__refresh_delta(url, manifest, etag, changed, hashes)
+                return
+
+        # No manifest on the server or too many changes, get all signatures
         response = self.get(url, stream=True)
+        self.__refresh_from_response(response, manifest, etag)
 
+    def __refresh_from_response(self, response, manifest=None, etag=None):
         (zipFileFd, zipFileName) = mkstemp(prefix="fuzzmanager-signatures")
 
         with os.fdopen(zipFileFd, "wb") as zipFile:
             shutil.copyfileobj(response.raw, zipFile)
 
-        self.refreshFromZip(zipFileName)
-        os.remove(zipFileName)
+        try:
+            hashes = self.refreshFromZip(zipFileName)
+        finally:
+            os.remove(zipFileName)
+
+        if manifest is not None and hashes == manifest:
+            self.__write_signature_manifest(hashes, etag)
+
+    def __refresh_delta(self, url, manifest, etag, changed, hashes):
+        hashes = {
+            bucketId: hashes[bucketId] for bucketId in manifest if bucketId in hashes
+        }
+
+        for idx in range(0, len(changed), SIGNATURE_DELTA_CHUNK):
+            bucketIds = changed[idx : idx + SIGNATURE_DELTA_CHUNK]
+            response = self.get(
+                url, params={"buckets": ",".join(bucketIds)}, stream=True
+            )
+
+            (zipFileFd, zipFileName) = mkstemp(prefix="fuzzmanager-signatures")
+            try:
+                with os.fdopen(zipFileFd, "wb") as zipFile:
+                    shutil.copyfileobj(response.raw, zipFile)
+
+                with ZipFile(zipFileName, "r") as zipFile:
+                    if zipFile.testzip():
+                        raise RuntimeError(
+                            f"Bad CRC for downloaded zipfile {zipFileName}"
+                        )
+                    hashes.update(self.__update_signatures(zipFile))
+            finally:
+                os.remove(zipFileName)
+
+        self.__remove_signatures(keep=manifest)
+
+        # The manifest and signatures on the server are updated separately, so
+        # only remember the ETag if we really got what the manifest announced.
+        # Otherwise the next refresh fetches the differing signatures again.
+        self.__write_signature_manifest(hashes, etag if hashes == manifest else None)
+        self.__get_signature_index()
 
     @signature_checks
     def refreshFromZip(self, zipFileName):
@@ -67,23 +232,107 @@ class Collector(Reporter):
         Refresh signatures from a local zip file, adding new signatures
         and invalidating old ones. (This is a non-standard use case;
         you probably want to use refresh() instead.)
+
+        Only files that changed are rewritten, each one atomically.
+
+        @rtype: dict
+        @return: Manifest hashes of the signatures in the zip file, by bucket id
         """
         with ZipFile(zipFileName, "r") as zipFile:
             if zipFile.testzip():
                 raise RuntimeError(f"Bad CRC for downloaded zipfile {zipFileName}")
 
-            # Now clean the signature directory, only deleting signatures and metadata
-            for sigFile in os.listdir(self.sigCacheDir):
-                if sigFile.endswith(".signature") or sigFile.endswith(".metadata"):
+            hashes = self.__update_signatures(zipFile)
+
+        # Now clean the signature directory, only deleting signatures and metadata
+        self.__remove_signatures(keep=hashes, warn=True)
+        self.__write_signature_manifest(hashes)
+
+        # Rebuild the index now rather than on the first search
+        self.__get_signature_index()
+        return hashes
+
+    def __update_signatures(self, zipFile):
+        """
+        Write the signatures and metadata from the given zip file to the signature
+        directory, skipping files that didn't change.
+
+        @rtype: dict
+        @return: Manifest hashes of the signatures in the zip file, by bucket id
+        """
+        files = {}
+        for member in zipFile.infolist():
+            name = member.filename
+            if os.path.basename(name) != name or not name.endswith(
+                (".signature", ".metadata")
+            ):
+                print(
+                    "Warning: Skipping unexpected file in signatures:",
+                    name,
+                    file=sys.stderr,
+                )
+                continue
+
+            data = zipFile.read(member)
+            (bucketId, ext) = os.path.splitext(name)
+            files.setdefault(bucketId, {})[ext] = data
+            self.__write_signature_file(name, data)
+
+        return {
+            bucketId: hashSignatureFiles(
+                data.get(".signature", b""), data.get(".metadata")
+            )
+            for bucketId, data in files.items()
+        }
+
+    def __write_signature_file(self, name, data):
+        path = os.path.join(self.sigCacheDir, name)
+        try:
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return
+        except FileNotFoundError:
+            pass
+
+        # Replace the file atomically, so a concurrent search never sees a partially
+        # written signature.
+        (fd, tmpName) = mkstemp(prefix=f".{name}", dir=self.sigCacheDir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmpName, 0o644)
+            os.replace(tmpName, path)
+        except BaseException:
+            os.remove(tmpName)
+            raise
+
+    def __remove_signatures(self, keep, warn=False):
+        for sigFile in os.listdir(self.sigCacheDir):
+            if sigFile.endswith(".signature") or sigFile.endswith(".metadata"):
+                if os.path.splitext(sigFile)[0] not in keep:
                     os.remove(os.path.join(self.sigCacheDir, sigFile))
-                else:
-                    print(
-                        "Warning: Skipping deletion of non-signature file:",
-                        sigFile,
-                        file=sys.stderr,
-                    )
+            elif warn and not _is_collector_file(sigFile):
+                print(
+                    "Warning: Skipping deletion of non-signature file:",
+                    sigFile,
+                    file=sys.stderr,
+                )
 
-            zipFile.extractall(self.sigCacheDir)
+    def __read_signature_manifest(self):
+        try:
+            with open(os.path.join(self.sigCacheDir, SIGNATURE_MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(manifest, dict) or not isinstance(
+            manifest.get("hashes"), dict
+        ):
+            return {}
+        return manifest
+
+    def __write_signature_manifest(self, hashes, etag=None):
+        data = json.dumps({"etag": etag, "hashes": hashes})
+        self.__write_signature_file(SIGNATURE_MANIFEST_FILE, data.encode("utf-8"))
 
     @remote_checks
     def submit(
@@ -124,6 +373,222 @@ class Collector(Reporter):
             self.serverPort,
         )
 
+        data = self.__crash_data(
+            crashInfo, testCase, testCaseQuality, testCaseSize, metaData
+        )
+        return self.post(url, data).json()
+
+    @remote_checks
+    def submit_many(self, crashes):
+        """
+        Submit many crashes to the server at once. This is much cheaper for the
+        server than submitting them one by one. Crashes are sent in batches of
+        SUBMIT_BATCH_SIZE, or one by one if the server doesn't support bulk
+        submission.
+
+        @type crashes: list(dict)
+        @param crashes: The keyword arguments to L{submit} for each crash
+
+        @rtype: list(dict)
+        @return: The server response for each crash. Responses for crashes
+                 submitted in bulk don't include the raw crash data.
+        """
+        return self.__submit_data(
+            [
+                self.__crash_data(
+                    crash["crashInfo"],
+                    crash.get("testCase"),
+                    crash.get("testCaseQuality", 0),
+                    crash.get("testCaseSize"),
+                    crash.get("metaData"),
+                )
+                for crash in crashes
+            ]
+        )
+
+    @remote_checks
+    def submit_later(
+        self,
+        crashInfo,
+        testCase=None,
+        testCaseQuality=0,
+        testCaseSize=None,
+        metaData=None,
+    ):
+        """
+        Queue the given crash for submission with L{flush}, taking the same
+        arguments as L{submit}. The testcase is read immediately, so it may be
+        removed once this returns. Once SUBMIT_BATCH_SIZE crashes are queued,
+        they are submitted automatically.
+
+        @rtype: list(dict) or None
+        @return: The server responses if the queued crashes were submitted
+        """
+        self.__pending.append(
+            self.__crash_data(
+                crashInfo, testCase, testCaseQuality, testCaseSize, metaData
+            )
+        )
+        if len(self.__pending) >= SUBMIT_BATCH_SIZE:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """
+        Submit all crashes queued with L{submit_later}.
+
+        @rtype: list(dict)
+        @return: The server response for each crash, see L{submit_many}
+        """
+        pending, self.__pending = self.__pending, []
+        return self.__submit_data(pending)
+
+    @remote_checks
+    def submit_deduplicated(
+        self,
+        crashInfo,
+        testCase=None,
+        testCaseQuality=0,
+        testCaseSize=None,
+        metaData=None,
+        fullSubmissions=DEDUP_FULL_SUBMISSIONS,
+        numFrames=DEDUP_FRAMES,
+        counterFile=None,
+    ):
+        """
+        Submit the given crash like L{submit}, unless the same crash (by short
+        signature and top frames) was already submitted fullSubmissions times.
+        Further occurrences are only counted in a file shared by all processes
+        and reported to the server as hits of the first submitted crash, at most
+        every DEDUP_REPORT_INTERVAL seconds.
+
+        @type fullSubmissions: int
+        @param fullSubmissions: Number of occurrences to submit in full
+
+        @type numFrames: int
+        @param numFrames: Number of top frames identifying the crash
+
+        @type counterFile: str
+        @param counterFile: File to keep the occurrence counters in
+                            (default: SUBMISSION_COUNTER_FILE in the signature
+                            directory)
+
+        @rtype: dict or None
+        @return: The server response if the crash was submitted in full
+        """
+        counter = self.__submission_counter(counterFile)
+        fingerprint = crashFingerprint(crashInfo, numFrames)
+
+        with counter.update(fingerprint) as count:
+            count["count"] += 1
+            submit = count["submitted"] < fullSubmissions
+            if submit:
+                count["submitted"] += 1
+            else:
+                count["pending"] += 1
+
+        if submit:
+            try:
+                result = self.submit(
+                    crashInfo, testCase, testCaseQuality, testCaseSize, metaData
+                )
+            except BaseException:
+                # Nothing was submitted, so a later occurrence has to be instead
+                with counter.update(fingerprint) as count:
+                    count["submitted"] -= 1
+                raise
+            with counter.update(fingerprint) as count:
+                if count["crash"] is None:
+                    count["crash"] = result["id"]
+            return result
+
+        self.__report_hits(counter, fingerprint)
+        return None
+
+    @remote_checks
+    def flush_hits(self, counterFile=None):
+        """
+        Report all occurrences counted by L{submit_deduplicated} that weren't
+        reported to the server yet, regardless of DEDUP_REPORT_INTERVAL.
+
+        @type counterFile: str
+        @param counterFile: File the occurrence counters are kept in
+        """
+        counter = self.__submission_counter(counterFile)
+        for fingerprint in counter.fingerprints():
+            self.__report_hits(counter, fingerprint, force=True)
+
+    def __submission_counter(self, counterFile):
+        if counterFile is None:
+            if self.sigCacheDir is None:
+                raise RuntimeError(
+                    "Must specify either a counter file or sigCacheDir "
+                    "(configuration property: sigdir) to deduplicate crashes."
+                )
+            counterFile = os.path.join(self.sigCacheDir, SUBMISSION_COUNTER_FILE)
+        return SubmissionCounter(counterFile)
+
+    def __report_hits(self, counter, fingerprint, force=False):
+        now = time.time()
+        with counter.update(fingerprint) as count:
+            if (
+                not count["pending"]
+                or count["crash"] is None
+                or (not force and now - count["reported"] < DEDUP_REPORT_INTERVAL)
+            ):
+                return
+            crashId, pending = (count["crash"], count["pending"])
+            count["reported"] = now
+
+        url = "%s://%s:%d/crashmanager/rest/crashes/%d/hits/" % (
+            self.serverProtocol,
+            self.serverHost,
+            self.serverPort,
+            crashId,
+        )
+        response = self.post(
+            url,
+            json={"count": pending},
+            expected=(requests.codes["ok"], requests.codes["not_found"]),
+        )
+        # The server can only count hits once the crash was triaged into a
+        # bucket. Until then (or on servers without hit reporting), keep them.
+        if (
+            response.status_code == requests.codes["ok"]
+            and response.json()["bucket"] is not None
+        ):
+            with counter.update(fingerprint) as count:
+                count["pending"] -= pending
+
+    def __submit_data(self, crashes):
+        url = "%s://%s:%d/crashmanager/rest/crashes/" % (
+            self.serverProtocol,
+            self.serverHost,
+            self.serverPort,
+        )
+
+        results = []
+        for offset in range(0, len(crashes), SUBMIT_BATCH_SIZE):
+            response = self.post(
+                url + "bulk/",
+                json=crashes[offset : offset + SUBMIT_BATCH_SIZE],
+                expected=(
+                    requests.codes["created"],
+                    requests.codes["not_found"],
+                    requests.codes["method_not_allowed"],
+                ),
+            )
+            if response.status_code != requests.codes["created"]:
+                # Servers without bulk submission treat bulk/ as a crash id
+                for data in crashes[offset:]:
+                    results.append(self.post(url, data).json())
+                break
+            results.extend(response.json())
+        return results
+
+    def __crash_data(
+        self, crashInfo, testCase, testCaseQuality, testCaseSize, metaData
+    ):
         # Serialize our crash information, testcase and metadata into a dictionary to
         # POST
         data = {}
@@ -141,7 +606,9 @@ class Collector(Reporter):
             if isBinary:
                 testCaseData = base64.b64encode(testCaseData)
 
-            data["testcase"] = testCaseData
+            # Decoded like the server does for form data, so we can also
+            # submit it as JSON
+            data["testcase"] = testCaseData.decode("utf-8", errors="replace")
             data["testcase_isbinary"] = isBinary
             data["testcase_quality"] = testCaseQuality
             data["testcase_size"] = testCaseSize
@@ -174,7 +641,7 @@ class Collector(Reporter):
         if crashInfo.configuration.args:
             data["args"] = json.dumps(crashInfo.configuration.args)
 
-        return self.post(url, data).json()
+        return data
 
     @signature_checks
     def search(self, crashInfo):
@@ -190,27 +657,136 @@ class Collector(Reporter):
                  None if no match.
         """
 
-        cachedSigFiles = os.listdir(self.sigCacheDir)
+        index, allMetadata = self.__get_signature_index()
+
+        # If several signatures match, the first one in the directory wins
+        for sigFile in index.getMatches(crashInfo, addedOrder=True):
+            return (os.path.join(self.sigCacheDir, sigFile), allMetadata.get(sigFile))
+
+        return (None, None)
+
+    def __get_signature_index(self):
+        """
+        Get the index of all signatures in the signature directory. The index is
+        kept in memory and in the signature directory and rebuilt whenever the
+        signature files change.
+
+        @rtype: tuple
+        @return: Tuple containing the SignatureIndex, with signature filenames
+                 as keys, and a dictionary of the metadata of each signature.
+        """
+        # Signature files can be modified in place, which doesn't change the
+        # directory, so check the size and modification time of each of them.
+        state = []
+        with os.scandir(self.sigCacheDir) as entries:
+            for entry in entries:
+                if entry.name.endswith((".signature", ".metadata")):
+                    entryStat = entry.stat()
+                    state.append((entry.name, entryStat.st_size, entryStat.st_mtime_ns))
+        fingerprint = hashlib.sha1(repr(sorted(state)).encode("utf-8")).hexdigest()
+
+        cached = _SIGNATURE_INDICES.get(self.sigCacheDir)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        result = self.__load_signature_index(fingerprint)
+        if result is None:
+            result = self.__build_signature_index(fingerprint)
+
+        _SIGNATURE_INDICES[self.sigCacheDir] = (fingerprint, result)
+        return result
+
+    def __load_signature_index(self, fingerprint):
+        indexFile = os.path.join(self.sigCacheDir, SIGNATURE_INDEX_FILE)
+        try:
+            fd = os.open(
+                indexFile,
+                os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0) | getattr(os, "O_BINARY", 0),
+            )
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(
+                f"Warning: Ignoring signature index {indexFile}: {e}", file=sys.stderr
+            )
+            return None
+
+        with os.fdopen(fd, "rb") as f:
+            # Unpickling can execute code and the signature directory may be
+            # shared, so only trust an index nobody else could have written.
+            if not _is_private_file(os.fstat(f.fileno())):
+                print(
+                    f"Warning: Ignoring signature index {indexFile}: not a regular "
+                    "file, owned by another user or writable by others",
+                    file=sys.stderr,
+                )
+                return None
+            try:
+                data = pickle.load(f)
+            except Exception as e:  # noqa
+                # Corrupt or written by an incompatible version, just rebuild it
+                print(
+                    f"Warning: Ignoring signature index {indexFile}: {e}",
+                    file=sys.stderr,
+                )
+                return None
+
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != SIGNATURE_INDEX_VERSION
+            or data.get("fingerprint") != fingerprint
+        ):
+            return None
+        return (data["index"], data["metadata"])
 
-        for sigFile in cachedSigFiles:
+    def __build_signature_index(self, fingerprint):
+        index = SignatureIndex()
+        allMetadata = {}
+        for sigFile in os.listdir(self.sigCacheDir):
             if not sigFile.endswith(".signature"):
                 continue
 
-            sigFile = os.path.join(self.sigCacheDir, sigFile)
-            if not os.path.isdir(sigFile):
-                with open(sigFile) as f:
-                    sigData = f.read()
-                    crashSig = CrashSignature(sigData)
-                    if crashSig.matches(crashInfo):
-                        metadataFile = sigFile.replace(".signature", ".metadata")
-                        metadata = None
-                        if os.path.exists(metadataFile):
-                            with open(metadataFile) as m:
-                                metadata = json.loads(m.read())
-
-                        return (sigFile, metadata)
+            sigPath = os.path.join(self.sigCacheDir, sigFile)
+            if not os.path.isdir(sigPath):
+                with open(sigPath) as f:
+                    try:
+                        index.add(sigFile, CrashSignature(f.read()))
+                    except RuntimeError as e:
+                        print(
+                            f"Warning: Ignoring invalid signature {sigFile}: {e}",
+                            file=sys.stderr,
+                        )
+                        continue
+
+                metadataFile = sigPath.replace(".signature", ".metadata")
+                if os.path.exists(metadataFile):
+                    with open(metadataFile) as m:
+                        allMetadata[sigFile] = json.loads(m.read())
+
+        data = {
+            "version": SIGNATURE_INDEX_VERSION,
+            "fingerprint": fingerprint,
+            "index": index,
+            "metadata": allMetadata,
+        }
+        # Write to a temporary file first, so other processes never see a partially
+        # written index. Failing to write it only makes other processes slower.
+        indexFileName = None
+        try:
+            (indexFd, indexFileName) = mkstemp(
+                prefix=f".{SIGNATURE_INDEX_FILE}", dir=self.sigCacheDir
+            )
+            with os.fdopen(indexFd, "wb") as indexFile:
+                pickle.dump(data, indexFile, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(
+                indexFileName, os.path.join(self.sigCacheDir, SIGNATURE_INDEX_FILE)
+            )
+        except OSError as e:
+            print(f"Warning: Failed to write signature index: {e}", file=sys.stderr)
+            if indexFileName is not None and os.path.exists(indexFileName):
+                os.remove(indexFileName)
 
-        return (None, None)
+        return (index, allMetadata)
 
     @signature_checks
     def generate(
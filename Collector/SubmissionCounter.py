@@ -0,0 +1,112 @@
+"""
+SubmissionCounter -- Persistent per-crash occurrence counters
+
+Used by L{Collector.submit_deduplicated} to submit only the first few
+occurrences of a crash in full and to count the remaining ones, even across
+processes sharing the same counter file.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from tempfile import mkstemp
+
+from fasteners import InterProcessLock
+
+
+def crashFingerprint(crashInfo, numFrames):
+    """
+    Compute a fingerprint identifying repeated occurrences of the same crash.
+
+    @type crashInfo: CrashInfo
+    @param crashInfo: CrashInfo instance obtained from L{CrashInfo.fromRawCrashData}
+
+    @type numFrames: int
+    @param numFrames: Number of top backtrace frames to include
+
+    @rtype: str
+    @return: Hex digest of the short signature and the top frames
+    """
+    parts = [crashInfo.createShortSignature()]
+    parts.extend(crashInfo.backtrace[:numFrames])
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class SubmissionCounter:
+    """
+    Counters of crash occurrences by fingerprint, stored as JSON. Each counter
+    holds the number of occurrences seen, the number submitted in full, the
+    id of the first crash entry created on the server, the number of
+    occurrences not reported to the server yet and the time of the last
+    report.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = InterProcessLock(path + ".lock")
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                counters = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(counters, dict):
+            return {}
+        return counters
+
+    def _save(self, counters):
+        (fd, tmpFile) = mkstemp(
+            prefix=f".{os.path.basename(self.path)}",
+            dir=os.path.dirname(self.path) or ".",
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(counters, f)
+            os.replace(tmpFile, self.path)
+        except BaseException:
+            os.unlink(tmpFile)
+            raise
+
+    @contextmanager
+    def update(self, fingerprint):
+        """
+        Lock the counter file and yield the counter for the given fingerprint,
+        storing all changes made to it.
+
+        @type fingerprint: str
+        @param fingerprint: Crash fingerprint, see L{crashFingerprint}
+
+        @rtype: dict
+        @return: The counter, created if it doesn't exist yet
+        """
+        with self.lock:
+            counters = self._load()
+            counter = counters.setdefault(
+                fingerprint,
+                {
+                    "count": 0,
+                    "submitted": 0,
+                    "crash": None,
+                    "pending": 0,
+                    "reported": time.time(),
+                },
+            )
+            yield counter
+            self._save(counters)
+
+    def fingerprints(self):
+        """
+        @rtype: list(str)
+        @return: All fingerprints with counters
+        """
+        with self.lock:
+            return list(self._load())
@@ -22,9 +22,10 @@ from urllib.parse import urlsplit
 
 import pytest
 import requests
+from django.core.management import call_command
 
 from Collector.Collector import Collector, main
-from crashmanager.models import CrashEntry
+from crashmanager.models import Bucket, BucketHit, CrashEntry
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures.CrashInfo import CrashInfo
 
@@ -186,6 +187,178 @@ def test_collector_submit(mock_expanduser, live_server, tmp_path, fm_user):
         collector.submit(crashInfo, str(testcase_path))
 
 
+@patch("os.path.expanduser")
+@patch("time.sleep", new=Mock())
+def test_collector_submit_many(mock_expanduser, live_server, tmp_path, fm_user):
+    """Test bulk and queued crash submission"""
+    mock_expanduser.side_effect = lambda path: str(
+        tmp_path
+    )  # ensure fuzzmanager config is not used
+
+    url = urlsplit(live_server.url)
+    (tmp_path / "sigcache").mkdir()
+    collector = Collector(
+        sigCacheDir=str(tmp_path / "sigcache"),
+        serverHost=url.hostname,
+        serverPort=url.port,
+        serverProtocol=url.scheme,
+        serverAuthToken=fm_user.token,
+        clientId="test-fuzzer1",
+        tool="test-tool",
+    )
+    text_path = tmp_path / "testcase.js"
+    text_path.write_bytes(exampleTestCase)
+    binary_path = tmp_path / "testcase.bin"
+    binary_path.write_bytes(b"\0")
+    config = ProgramConfiguration(
+        "mozilla-central", "x86-64", "linux", version="ba0bc4f26681"
+    )
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+
+    results = collector.submit_many(
+        [
+            {"crashInfo": crashInfo, "testCase": str(text_path)},
+            {
+                "crashInfo": crashInfo,
+                "testCase": str(binary_path),
+                "testCaseQuality": 5,
+                "metaData": {"var1": "val1"},
+            },
+            {"crashInfo": crashInfo},
+        ]
+    )
+    assert len(results) == 3
+    entries = [CrashEntry.objects.get(pk=result["id"]) for result in results]
+    for entry in entries:
+        assert entry.rawStderr == asan_trace_crash.rstrip()
+        assert entry.tool.name == "test-tool"
+        assert entry.client.name == "test-fuzzer1"
+        assert entry.product.version == config.version
+    assert not entries[0].testcase.isBinary
+    with open(entries[0].testcase.test.path, "rb") as testcase_fp:
+        assert testcase_fp.read() == exampleTestCase
+    assert entries[1].testcase.isBinary
+    assert entries[1].testcase.quality == 5
+    with open(entries[1].testcase.test.path, "rb") as testcase_fp:
+        assert testcase_fp.read() == b"\0"
+    assert json.loads(entries[1].metadata) == {"var1": "val1"}
+    assert entries[2].testcase is None
+
+    # queued crashes are submitted once the batch is full, or on flush
+    with patch("Collector.Collector.SUBMIT_BATCH_SIZE", 2):
+        assert collector.submit_later(crashInfo, str(text_path)) is None
+        text_path.unlink()
+        assert len(collector.submit_later(crashInfo)) == 2
+        assert collector.submit_later(crashInfo) is None
+    assert len(collector.flush()) == 1
+    assert collector.flush() == []
+    assert CrashEntry.objects.count() == 6
+
+    # servers without bulk submission get the crashes one by one
+    post = collector._session.post
+
+    class response_t:
+        status_code = 404
+        text = "Not found"
+
+    def old_server_post(url, *args, **kwds):
+        if url.endswith("/bulk/"):
+            return response_t()
+        return post(url, *args, **kwds)
+
+    collector._session.post = old_server_post
+    results = collector.submit_many([{"crashInfo": crashInfo}] * 2)
+    assert len(results) == 2
+    assert "rawStderr" in results[0]
+    assert CrashEntry.objects.count() == 8
+
+    # permission errors are not mistaken for a missing bulk endpoint
+    response_t.status_code = 403
+    response_t.text = "Forbidden"
+    with pytest.raises(RuntimeError, match="status code 403"):
+        collector.submit_many([{"crashInfo": crashInfo}] * 2)
+    assert CrashEntry.objects.count() == 8
+
+
+@patch("os.path.expanduser")
+@patch("time.sleep", new=Mock())
+def test_collector_submit_deduplicated(mock_expanduser, live_server, tmp_path, fm_user):
+    """Test that repeated crashes are only counted after the first submissions"""
+    mock_expanduser.side_effect = lambda path: str(
+        tmp_path
+    )  # ensure fuzzmanager config is not used
+
+    url = urlsplit(live_server.url)
+    (tmp_path / "sigcache").mkdir()
+    collector = Collector(
+        sigCacheDir=str(tmp_path / "sigcache"),
+        serverHost=url.hostname,
+        serverPort=url.port,
+        serverProtocol=url.scheme,
+        serverAuthToken=fm_user.token,
+        clientId="test-fuzzer1",
+        tool="test-tool",
+    )
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+    otherInfo = CrashInfo.fromRawCrashData([], ["Assertion failure: other"], config)
+
+    results = [
+        collector.submit_deduplicated(crashInfo, fullSubmissions=2) for _ in range(5)
+    ]
+    assert [result is None for result in results] == [False, False, True, True, True]
+    assert collector.submit_deduplicated(otherInfo, fullSubmissions=2) is not None
+    assert CrashEntry.objects.count() == 3
+
+    counters = json.loads((tmp_path / "sigcache" / "submissions.json").read_text())
+    assert sorted(
+        (counter["count"], counter["submitted"], counter["pending"])
+        for counter in counters.values()
+    ) == [(1, 1, 0), (5, 2, 3)]
+
+    # hits can't be counted until the first crash is in a bucket
+    collector.flush_hits()
+    assert not BucketHit.objects.exists()
+
+    bucket = Bucket.objects.create(signature="{}")
+    entry = CrashEntry.objects.get(pk=results[0]["id"])
+    entry.bucket = bucket
+    entry.save()
+    collector.flush_hits()
+    assert sum(BucketHit.objects.values_list("count", flat=True)) == 4
+
+    counters = json.loads((tmp_path / "sigcache" / "submissions.json").read_text())
+    assert sorted(counter["pending"] for counter in counters.values()) == [0, 0]
+
+
+def test_collector_submit_deduplicated_error(tmp_path):
+    """Test that a failed submission is submitted again by a later occurrence"""
+    collector = Collector(
+        sigCacheDir=str(tmp_path),
+        serverHost="aol.com",
+        serverPort=70,
+        serverProtocol="gopher",
+        serverAuthToken="token",
+        clientId="test-fuzzer1",
+        tool="test-tool",
+    )
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], ["Assertion failure: test"], config)
+
+    collector.submit = Mock(side_effect=RuntimeError("server error"))
+    with pytest.raises(RuntimeError, match="server error"):
+        collector.submit_deduplicated(crashInfo, fullSubmissions=1)
+    (counter,) = json.loads((tmp_path / "submissions.json").read_text()).values()
+    assert (counter["submitted"], counter["pending"], counter["crash"]) == (0, 0, None)
+
+    collector.submit = Mock(return_value={"id": 1})
+    assert collector.submit_deduplicated(crashInfo, fullSubmissions=1) == {"id": 1}
+    (counter,) = json.loads((tmp_path / "submissions.json").read_text()).values()
+    assert (counter["submitted"], counter["pending"], counter["crash"]) == (1, 0, 1)
+
+
 def test_collector_refresh(capsys, tmp_path):
     """Test signature downloads"""
     # create a test signature zip
@@ -201,21 +374,43 @@ def test_collector_refresh(capsys, tmp_path):
     sigs_path.mkdir()
     (sigs_path / "test1.signature").touch()
     (sigs_path / "other.txt").touch()
-    assert {f.name for f in sigs_path.iterdir()} == {"test1.signature", "other.txt"}
+    # files of the Collector itself, including leftover temporary files
+    own_files = {
+        "submissions.json",
+        "submissions.json.lock",
+        ".submissions.jsonk2j3h4",
+        ".signatures.indexa8s7d6",
+        ".test1.signaturez0x9c8",
+    }
+    for name in own_files:
+        (sigs_path / name).touch()
+    assert {f.name for f in sigs_path.iterdir()} == {
+        "test1.signature",
+        "other.txt",
+    } | own_files
 
     with outzip_path.open("rb") as fp:
 
         class response_t:
             status_code = requests.codes["ok"]
             text = "OK"
+            headers = {"Content-Type": "application/octet-stream"}
             raw = fp
 
+        class no_manifest_t:
+            status_code = requests.codes["not_found"]
+            text = "Not found"
+
         # this asserts the expected arguments and returns the open handle to out.zip as
         # 'raw' which is read by refresh()
-        def myget(url, stream=None, headers=None):
+        def myget(url, stream=None, headers=None, params=None):
             assert url == "gopher://aol.com:70/crashmanager/rest/signatures/download/"
             assert stream is True
             assert headers == {"Authorization": "Token token"}
+            if params == {"manifest": "1"}:
+                # the server has no manifest, so all signatures are downloaded
+                return no_manifest_t()
+            assert params is None
             return response_t()
 
         # create Collector
@@ -234,11 +429,19 @@ def test_collector_refresh(capsys, tmp_path):
         collector.refresh()
 
     # check that it worked
-    assert {f.name for f in sigs_path.iterdir()} == {"test2.signature", "other.txt"}
+    assert {f.name for f in sigs_path.iterdir()} == {
+        "test2.signature",
+        "other.txt",
+        "signatures.index",
+        "signatures.manifest.json",
+    } | own_files
     assert (sigs_path / "test2.signature").read_text() == "test2"
-    assert (
-        "other.txt" in capsys.readouterr()[1]
-    )  # should have had a warning about unrecognized file
+    stderr = capsys.readouterr()[1]
+    # should have had a warning about unrecognized file
+    assert "other.txt" in stderr
+    assert stderr.count("Skipping deletion of non-signature file") == 1
+    # and one about the invalid signature, which isn't indexed
+    assert "Ignoring invalid signature test2.signature" in stderr
 
     # check that 404 raises
 
@@ -257,6 +460,7 @@ def test_collector_refresh(capsys, tmp_path):
         class response_t:  # noqa
             status_code = requests.codes["ok"]
             text = "OK"
+            headers = {}
             raw = fp
 
         collector._session.get = lambda *_, **__: response_t()
@@ -273,6 +477,7 @@ def test_collector_refresh(capsys, tmp_path):
         class response_t:  # noqa
             status_code = requests.codes["ok"]
             text = "OK"
+            headers = {}
             raw = fp
 
         collector._session.get = lambda *_, **__: response_t()
@@ -281,6 +486,109 @@ def test_collector_refresh(capsys, tmp_path):
             collector.refresh()
 
 
+@patch("os.path.expanduser")
+def test_collector_refresh_delta(
+    mock_expanduser, live_server, tmp_path, fm_user, settings
+):
+    """Test that only changed signatures are downloaded"""
+    mock_expanduser.side_effect = lambda path: str(tmp_path)
+    settings.SIGNATURE_STORAGE = str(tmp_path / "storage")
+    (tmp_path / "storage").mkdir()
+    sigs_path = tmp_path / "sigcache"
+    sigs_path.mkdir()
+
+    def export():
+        call_command(
+            "export_signatures",
+            str(tmp_path / "storage" / "signatures.zip"),
+            manifest=str(tmp_path / "storage" / "signatures.manifest.json"),
+        )
+
+    url = urlsplit(live_server.url)
+    collector = Collector(
+        sigCacheDir=str(sigs_path),
+        serverHost=url.hostname,
+        serverPort=url.port,
+        serverProtocol=url.scheme,
+        serverAuthToken=fm_user.token,
+        clientId="test-fuzzer1",
+        tool="test-tool",
+    )
+    requested = []
+    get = collector._session.get
+
+    def myget(*args, **kwds):
+        response = get(*args, **kwds)
+        requested.append((kwds.get("params"), response.status_code))
+        return response
+
+    collector._session.get = myget
+
+    def sig(symptom):
+        return json.dumps({"symptoms": [{"type": "output", "value": symptom}]})
+
+    bucket1 = Bucket.objects.create(signature=sig("foo"))
+    bucket2 = Bucket.objects.create(signature=sig("bar"))
+    export()
+
+    # the first refresh downloads everything that is in the manifest
+    collector.refresh()
+    assert requested == [
+        ({"manifest": "1"}, 200),
+        ({"buckets": f"{bucket1.pk},{bucket2.pk}"}, 200),
+    ]
+    assert (sigs_path / f"{bucket1.pk}.signature").read_text() == sig("foo")
+    assert (sigs_path / f"{bucket2.pk}.signature").read_text() == sig("bar")
+
+    # nothing changed on the server
+    requested.clear()
+    collector.refresh()
+    assert requested == [({"manifest": "1"}, 304)]
+
+    # only the changed signature is downloaded, removed ones are deleted
+    bucket2.signature = sig("baz")
+    bucket2.save()
+    bucket3 = Bucket.objects.create(signature=sig("qux"))
+    bucket1_pk = bucket1.pk
+    bucket1.delete()
+    export()
+    requested.clear()
+    collector.refresh()
+    assert requested == [
+        ({"manifest": "1"}, 200),
+        ({"buckets": f"{bucket2.pk},{bucket3.pk}"}, 200),
+    ]
+    assert {f.name for f in sigs_path.glob("*.signature")} == {
+        f"{bucket2.pk}.signature",
+        f"{bucket3.pk}.signature",
+    }
+    assert (sigs_path / f"{bucket2.pk}.signature").read_text() == sig("baz")
+    assert not (sigs_path / f"{bucket1_pk}.metadata").exists()
+
+    crashInfo = CrashInfo.fromRawCrashData(
+        [], ["qux"], ProgramConfiguration("product", "x86-64", "linux")
+    )
+    assert collector.search(crashInfo)[0] == str(sigs_path / f"{bucket3.pk}.signature")
+
+    # a new export with the same signatures doesn't rewrite anything
+    requested.clear()
+    collector.refresh()
+    assert requested == [({"manifest": "1"}, 304)]
+
+    def mtimes():
+        return {
+            f.name: f.stat().st_mtime_ns
+            for f in sigs_path.iterdir()
+            if f.suffix in {".signature", ".metadata", ".index"}
+        }
+
+    before = mtimes()
+    export()
+    collector.refresh()
+    assert requested[1:] == [({"manifest": "1"}, 200)]
+    assert mtimes() == before
+
+
 def test_collector_generate_search(tmp_path):
     """Test sigcache generation and search"""
     # create a cache dir
@@ -323,6 +631,143 @@ def test_collector_generate_search(tmp_path):
     assert result is None
 
 
+def test_collector_search_index(capsys, tmp_path, monkeypatch):
+    """Test that the signature index is reused and rebuilt on changes"""
+    cache_dir = tmp_path / "sigcache"
+    cache_dir.mkdir()
+    collector = Collector(sigCacheDir=str(cache_dir))
+
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+    sig = collector.generate(crashInfo, False, False, 8)
+    assert collector.search(crashInfo) == (sig, None)
+    assert (cache_dir / "signatures.index").is_file()
+
+    # another process loads the index file instead of parsing the signatures
+    monkeypatch.setattr("Collector.Collector._SIGNATURE_INDICES", {})
+    parse = Mock(side_effect=AssertionError("signature parsed"))
+    monkeypatch.setattr("Collector.Collector.CrashSignature", parse)
+    assert collector.search(crashInfo) == (sig, None)
+    monkeypatch.undo()
+
+    # new signatures and metadata are picked up
+    other = CrashInfo.fromRawCrashData([], ["Assertion failure: foo"], config)
+    otherSig = collector.generate(other, False, False, 8)
+    with open(otherSig.replace(".signature", ".metadata"), "w") as f:
+        f.write('{"frequent": true}')
+    assert collector.search(other) == (otherSig, {"frequent": True})
+    assert collector.search(crashInfo) == (sig, None)
+
+    # removed signatures no longer match
+    os.remove(sig)
+    assert collector.search(crashInfo) == (None, None)
+
+    # a corrupt index is rebuilt
+    monkeypatch.setattr("Collector.Collector._SIGNATURE_INDICES", {})
+    (cache_dir / "signatures.index").write_bytes(b"garbage")
+    assert collector.search(other) == (otherSig, {"frequent": True})
+    assert "Ignoring signature index" in capsys.readouterr()[1]
+    monkeypatch.setattr("Collector.Collector._SIGNATURE_INDICES", {})
+    parse = Mock(side_effect=AssertionError("signature parsed"))
+    monkeypatch.setattr("Collector.Collector.CrashSignature", parse)
+    assert collector.search(other) == (otherSig, {"frequent": True})
+
+
+def test_collector_search_modified_in_place(tmp_path):
+    """Test that signature files modified in place are picked up"""
+    cache_dir = tmp_path / "sigcache"
+    cache_dir.mkdir()
+    collector = Collector(sigCacheDir=str(cache_dir))
+
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+    other = CrashInfo.fromRawCrashData([], ["Assertion failure: foo"], config)
+    sig = collector.generate(crashInfo, False, False, 8)
+    assert collector.search(crashInfo) == (sig, None)
+
+    # Rewriting the file doesn't change the directory
+    dir_mtime = os.stat(cache_dir).st_mtime_ns
+    sig_mtime = os.stat(sig).st_mtime_ns
+    with open(sig, "w") as f:
+        f.write(str(other.createCrashSignature()))
+    os.utime(sig, ns=(sig_mtime + 10**9, sig_mtime + 10**9))
+    assert os.stat(cache_dir).st_mtime_ns == dir_mtime
+
+    assert collector.search(crashInfo) == (None, None)
+    assert collector.search(other) == (sig, None)
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="POSIX permissions")
+def test_collector_search_untrusted_index(capsys, tmp_path, monkeypatch):
+    """Test that index files others could have written are not loaded"""
+    cache_dir = tmp_path / "sigcache"
+    cache_dir.mkdir()
+    collector = Collector(sigCacheDir=str(cache_dir))
+
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+    sig = collector.generate(crashInfo, False, False, 8)
+    assert collector.search(crashInfo) == (sig, None)
+    index = cache_dir / "signatures.index"
+    assert (index.stat().st_mode & 0o777) == 0o600
+
+    load = Mock(side_effect=AssertionError("untrusted index loaded"))
+
+    # writable by others
+    index.chmod(0o666)
+    monkeypatch.setattr("Collector.Collector._SIGNATURE_INDICES", {})
+    monkeypatch.setattr("Collector.Collector.pickle.load", load)
+    assert collector.search(crashInfo) == (sig, None)
+    assert "writable by others" in capsys.readouterr()[1]
+    monkeypatch.undo()
+
+    # symlink to a file elsewhere
+    target = tmp_path / "elsewhere.index"
+    index.replace(target)
+    index.symlink_to(target)
+    monkeypatch.setattr("Collector.Collector._SIGNATURE_INDICES", {})
+    monkeypatch.setattr("Collector.Collector.pickle.load", load)
+    assert collector.search(crashInfo) == (sig, None)
+    assert "Ignoring signature index" in capsys.readouterr()[1]
+    monkeypatch.undo()
+
+    # owned by another user
+    monkeypatch.setattr("Collector.Collector._SIGNATURE_INDICES", {})
+    monkeypatch.setattr("Collector.Collector.pickle.load", load)
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(index).st_uid + 1)
+    assert collector.search(crashInfo) == (sig, None)
+    assert "owned by another user" in capsys.readouterr()[1]
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_collector_search_order(tmp_path, monkeypatch, reverse):
+    """Test that the first matching signature in the directory is returned"""
+    cache_dir = tmp_path / "sigcache"
+    cache_dir.mkdir()
+    collector = Collector(sigCacheDir=str(cache_dir))
+
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+    sigs = sorted(
+        [
+            collector.generate(crashInfo, False, False, 8),
+            collector.generate(crashInfo, False, False, 3),
+        ],
+        reverse=reverse,
+    )
+
+    listdir = os.listdir
+    monkeypatch.setattr(
+        "Collector.Collector.os.listdir",
+        lambda path: sorted(listdir(path), reverse=reverse),
+    )
+    assert collector.search(crashInfo) == (sigs[0], None)
+
+
 def test_collector_download(tmp_path, monkeypatch):
     """Test testcase downloads"""
     # create Collector
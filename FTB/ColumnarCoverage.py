@@ -0,0 +1,487 @@
+"""
+ColumnarCoverage -- Columnar, memory-mappable storage of server-side coverage
+
+Stores a coverage tree in the server-side format (see L{CoverageHelper}) in a
+binary layout that can be read without parsing the whole file, so requests for
+a single directory or file only touch the parts of the file they need.
+
+The layout (version 1, little-endian) consists of:
+
+  header        magic, version, line item size, node count, names size, lines
+  node table    one fixed-size record per node, in breadth-first order so the
+                children of each directory are stored next to each other
+  names         UTF-8 encoded node names, referenced by the node records
+  lines         packed line coverage of all files (int32, or int64 if any
+                value doesn't fit), aligned to 8 bytes
+
+Each node record holds the precomputed linesTotal and linesCovered of its
+subtree, so directories can be summarized without reading any line coverage.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+
+from FTB.CoverageHelper import summary_fields
+
+MAGIC = b"FMCOVCOL"
+VERSION = 1
+
+# magic, version, line item size, node count, names size, line count
+_HEADER = struct.Struct("<8sIIQQQ")
+
+# name offset, name length, flags, first child, child count, line offset,
+# line count, lines total, lines covered
+_NODE = struct.Struct("<QIIIIQQQQ")
+
+_FLAG_DIRECTORY = 1
+_FLAG_NAME_NULL = 2
+
+_NODE_KEYS = {
+    "name",
+    "children",
+    "coverage",
+    "linesTotal",
+    "linesCovered",
+    "linesMissed",
+    "coveragePercent",
+}
+
+
+def is_columnar(data):
+    """
+    @type data: bytes
+    @param data: The start of a coverage file
+
+    @rtype: bool
+    @return: True if the data is in the columnar format
+    """
+    return data[: len(MAGIC)] == MAGIC
+
+
+def dumps(tree):
+    """
+    Serialize a coverage tree to the columnar format.
+
+    @type tree: dict
+    @param tree: Coverage in server-side format
+
+    @rtype: bytes
+    @return: The serialized coverage
+
+    @raise ValueError: If the tree can't be represented exactly (e.g. because
+                       it has unknown fields or non-integer line coverage)
+    """
+    try:
+        return _dumps(tree, "i")
+    except OverflowError:
+        pass
+    try:
+        return _dumps(tree, "q")
+    except OverflowError:
+        raise ValueError("Line coverage does not fit a 64-bit integer")
+
+
+def _dumps(tree, typecode):
+    lines = array(typecode)
+
+    # Breadth-first, so the children of each node are contiguous
+    order = [(None, tree)]
+    layout = []
+    pos = 0
+    while pos < len(order):
+        (name, node) = order[pos]
+        pos += 1
+
+        if not isinstance(node, dict) or not _NODE_KEYS.issuperset(node):
+            raise ValueError(f"Unsupported coverage node {name!r}")
+        if node.get("name", name) != name:
+            raise ValueError(f"Name mismatch for coverage node {name!r}")
+        if "children" in node and "coverage" in node:
+            raise ValueError(f"Coverage node {name!r} has children and coverage")
+
+        if "children" in node:
+            children = node["children"]
+            if not isinstance(children, dict):
+                raise ValueError(f"Unsupported children of coverage node {name!r}")
+            layout.append((name, node, len(order), len(children), 0, 0))
+            order.extend(children.items())
+        else:
+            coverage = node.get("coverage")
+            if not isinstance(coverage, list):
+                raise ValueError(f"Missing coverage of coverage node {name!r}")
+            offset = len(lines)
+            try:
+                lines.extend(coverage)
+            except TypeError:
+                raise ValueError(f"Unsupported coverage of coverage node {name!r}")
+            layout.append((name, node, 0, 0, offset, len(coverage)))
+
+    # Summaries are stored as given, or calculated bottom-up if missing
+    totals = [None] * len(layout)
+    for idx in range(len(layout) - 1, -1, -1):
+        (name, node, firstChild, childCount, offset, count) = layout[idx]
+        if "linesTotal" in node and "linesCovered" in node:
+            total = node["linesTotal"]
+            covered = node["linesCovered"]
+        elif "children" in node:
+            children = totals[firstChild : firstChild + childCount]
+            total = sum(x[0] for x in children)
+            covered = sum(x[1] for x in children)
+        else:
+            leaf = lines[offset : offset + count]
+            total = sum(1 for x in leaf if x >= 0)
+            covered = sum(1 for x in leaf if x > 0)
+        if not isinstance(total, int) or not isinstance(covered, int):
+            raise ValueError(f"Unsupported summary of coverage node {name!r}")
+
+        summary = summary_fields(total, covered)
+        for field in ("linesMissed", "coveragePercent"):
+            if field in node and node[field] != summary[field]:
+                raise ValueError(f"Inconsistent summary of coverage node {name!r}")
+        totals[idx] = (total, covered)
+
+    names = bytearray()
+    records = []
+    try:
+        for (name, node, firstChild, childCount, offset, count), (
+            total,
+            covered,
+        ) in zip(layout, totals):
+            flags = 0
+            if "children" in node:
+                flags |= _FLAG_DIRECTORY
+            if name is None:
+                flags |= _FLAG_NAME_NULL
+                encoded = b""
+            else:
+                encoded = name.encode("utf-8")
+            records.append(
+                _NODE.pack(
+                    len(names),
+                    len(encoded),
+                    flags,
+                    firstChild,
+                    childCount,
+                    offset,
+                    count,
+                    total,
+                    covered,
+                )
+            )
+            names += encoded
+    except struct.error as e:
+        raise ValueError(f"Unsupported coverage summary: {e}")
+
+    if sys.byteorder != "little":
+        lines.byteswap()
+
+    header = _HEADER.pack(
+        MAGIC, VERSION, lines.itemsize, len(layout), len(names), len(lines)
+    )
+    data = [header]
+    data.extend(records)
+    data.append(bytes(names))
+    size = sum(len(x) for x in data)
+    data.append(b"\0" * (-size % 8))
+    data.append(lines.tobytes())
+    return b"".join(data)
+
+
+def dump_stream(fp, root, read, wide=False):
+    """
+    Write coverage in the columnar format without holding all of its line
+    coverage in memory, e.g. when merging coverage on disk.
+
+    @type fp: file
+    @param fp: Binary file to write to
+
+    @type root: dict
+    @param root: Structure of the coverage. Directories are dicts mapping the
+                 names of their children to the children, leaves are tuples
+                 (key, line count, lines total, lines covered). The root node
+                 has no name.
+
+    @type read: callable
+    @param read: Called with the key of each leaf to get its line coverage
+
+    @type wide: bool
+    @param wide: Store lines as int64 instead of int32
+
+    @raise ValueError: If the line coverage doesn't match the structure or
+                       can't be stored. Parts of the data may have been
+                       written already in that case.
+    """
+    typecode = "q" if wide else "i"
+
+    # Breadth-first, so the children of each node are contiguous
+    order = [(None, root)]
+    layout = []
+    pos = 0
+    while pos < len(order):
+        (name, node) = order[pos]
+        pos += 1
+        if isinstance(node, dict):
+            layout.append((name, node, len(order), len(node)))
+            order.extend(node.items())
+        else:
+            layout.append((name, node, 0, 0))
+
+    totals = [None] * len(layout)
+    for idx in range(len(layout) - 1, -1, -1):
+        (_, node, firstChild, childCount) = layout[idx]
+        if isinstance(node, dict):
+            children = totals[firstChild : firstChild + childCount]
+            totals[idx] = (sum(x[0] for x in children), sum(x[1] for x in children))
+        else:
+            totals[idx] = (node[2], node[3])
+
+    names = bytearray()
+    records = []
+    lineCount = 0
+    try:
+        for (name, node, firstChild, childCount), (total, covered) in zip(
+            layout, totals
+        ):
+            flags = 0
+            count = 0
+            if isinstance(node, dict):
+                flags |= _FLAG_DIRECTORY
+            else:
+                count = node[1]
+            if name is None:
+                flags |= _FLAG_NAME_NULL
+                encoded = b""
+            else:
+                encoded = name.encode("utf-8")
+            records.append(
+                _NODE.pack(
+                    len(names),
+                    len(encoded),
+                    flags,
+                    firstChild,
+                    childCount,
+                    lineCount,
+                    count,
+                    total,
+                    covered,
+                )
+            )
+            names += encoded
+            lineCount += count
+    except struct.error as e:
+        raise ValueError(f"Unsupported coverage summary: {e}")
+
+    header = _HEADER.pack(
+        MAGIC, VERSION, array(typecode).itemsize, len(layout), len(names), lineCount
+    )
+    size = len(header) + len(names) + len(records) * _NODE.size
+    fp.write(header)
+    fp.write(b"".join(records))
+    fp.write(bytes(names))
+    fp.write(b"\0" * (-size % 8))
+
+    for name, node, _, _ in layout:
+        if isinstance(node, dict):
+            continue
+        try:
+            lines = array(typecode, read(node[0]))
+        except (TypeError, OverflowError):
+            raise ValueError(f"Unsupported coverage of coverage node {name!r}")
+        if len(lines) != node[1]:
+            raise ValueError(f"Line count mismatch of coverage node {name!r}")
+        if sys.byteorder != "little":
+            lines.byteswap()
+        fp.write(lines.tobytes())
+
+
+class ColumnarCoverage:
+    """
+    Read access to coverage in the columnar format. Nodes are identified by
+    their index in the node table, the root node has index 0.
+    """
+
+    def __init__(self, data):
+        """
+        @type data: bytes or mmap.mmap
+        @param data: The serialized coverage, see L{dumps}
+        """
+        self.data = data
+        if len(data) < _HEADER.size:
+            raise ValueError("Truncated columnar coverage")
+
+        (magic, version, itemSize, nodeCount, namesSize, lineCount) = (
+            _HEADER.unpack_from(data, 0)
+        )
+        if magic != MAGIC or version != VERSION or itemSize not in (4, 8):
+            raise ValueError("Unsupported columnar coverage")
+
+        self.typecode = "i" if itemSize == 4 else "q"
+        self.itemSize = itemSize
+        self.nodeCount = nodeCount
+        self.nodesOffset = _HEADER.size
+        self.namesOffset = self.nodesOffset + nodeCount * _NODE.size
+        self.linesOffset = self.namesOffset + namesSize
+        self.linesOffset += -self.linesOffset % 8
+
+        if len(data) < self.linesOffset + lineCount * itemSize:
+            raise ValueError("Truncated columnar coverage")
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory-map the given file. The result should be closed after use.
+
+        @type path: str
+        @param path: Path to a file in the columnar format
+
+        @rtype: ColumnarCoverage
+        @return: The coverage in the file
+        """
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(data)
+        except ValueError:
+            data.close()
+            raise
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _record(self, idx):
+        return _NODE.unpack_from(self.data, self.nodesOffset + idx * _NODE.size)
+
+    def _name(self, record):
+        if record[2] & _FLAG_NAME_NULL:
+            return None
+        start = self.namesOffset + record[0]
+        return bytes(self.data[start : start + record[1]]).decode("utf-8")
+
+    def find(self, names):
+        """
+        @type names: list(str)
+        @param names: Path components of the node, relative to the root
+
+        @rtype: int
+        @return: Index of the node, or None if there is no such node
+        """
+        idx = 0
+        for name in names:
+            record = self._record(idx)
+            if not record[2] & _FLAG_DIRECTORY:
+                return None
+
+            encoded = name.encode("utf-8")
+            for child in range(record[3], record[3] + record[4]):
+                childRecord = self._record(child)
+                if childRecord[1] != len(encoded) or childRecord[2] & _FLAG_NAME_NULL:
+                    continue
+                start = self.namesOffset + childRecord[0]
+                if self.data[start : start + childRecord[1]] == encoded:
+                    idx = child
+                    break
+            else:
+                return None
+        return idx
+
+    def lines(self, idx):
+        """
+        @type idx: int
+        @param idx: Index of a leaf node
+
+        @rtype: list(int)
+        @return: The line coverage of the leaf
+        """
+        record = self._record(idx)
+        start = self.linesOffset + record[5] * self.itemSize
+        result = array(self.typecode)
+        result.frombytes(self.data[start : start + record[6] * self.itemSize])
+        if sys.byteorder != "little":
+            result.byteswap()
+        return result.tolist()
+
+    def node(self, idx, strip=False):
+        """
+        Create the coverage tree (in server-side format) for the given node.
+
+        @type idx: int
+        @param idx: Index of the node
+
+        @type strip: bool
+        @param strip: If the node is a directory, leave out the line coverage of
+                      all leaves below it (see Collection.strip), which avoids
+                      reading any line coverage at all.
+
+        @rtype: dict
+        @return: The coverage of the node and all nodes below it
+        """
+        record = self._record(idx)
+        if not record[2] & _FLAG_DIRECTORY:
+            result = summary_fields(record[7], record[8])
+            result["name"] = self._name(record)
+            result["coverage"] = self.lines(idx)
+            return result
+
+        return self._directory(idx, record, strip)
+
+    def _directory(self, idx, record, strip):
+        result = summary_fields(record[7], record[8])
+        result["name"] = self._name(record)
+        children = {}
+        for child in range(record[3], record[3] + record[4]):
+            childRecord = self._record(child)
+            if childRecord[2] & _FLAG_DIRECTORY:
+                childNode = self._directory(child, childRecord, strip)
+            else:
+                childNode = summary_fields(childRecord[7], childRecord[8])
+                childNode["name"] = self._name(childRecord)
+                if not strip:
+                    childNode["coverage"] = self.lines(child)
+            children[childNode["name"]] = childNode
+        result["children"] = children
+        return result
+
+    def tree(self):
+        """
+        @rtype: dict
+        @return: The complete coverage tree in server-side format
+        """
+        return self.node(0)
+
+    def iter_nodes(self):
+        """
+        Generate all nodes depth-first, each directory after its children, as
+        tuples (names, coverage). The names are the path components of the
+        node and coverage is None for directories. Only the line coverage of
+        one leaf is held in memory at a time.
+
+        @rtype: iterator(tuple(tuple(str), list(int)))
+        """
+        return self._iter_nodes(0, self._record(0), ())
+
+    def _iter_nodes(self, idx, record, names):
+        if not record[2] & _FLAG_DIRECTORY:
+            yield (names, self.lines(idx))
+            return
+
+        for child in range(record[3], record[3] + record[4]):
+            childRecord = self._record(child)
+            yield from self._iter_nodes(
+                child, childRecord, names + (self._name(childRecord),)
+            )
+        yield (names, None)
@@ -13,6 +13,16 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
 import re
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Leaves shorter than this are merged in pure Python, where converting to and
+# from arrays would cost more than it saves.
+NUMPY_MIN_LINES = 64
 
 
 def merge_coverage_data(r, s):
@@ -39,67 +49,7 @@ def merge_coverage_data(r, s):
                     # Fast path, subtree only in merge source
                     r["children"][child] = s["children"][child]
         else:
-            rc = r["coverage"]
-            sc = s["coverage"]
-
-            # GCOV bug, if the file has 0% coverage, then all of the file
-            # is reported as not coverable. If s has that property, we simply
-            # ignore it. If r has that property, we replace it by s.
-            if sc.count(-1) == len(sc):
-                if rc.count(-1) != len(rc):
-                    # print("Warning: File %s reports no coverable lines" % r['name'])
-                    stats["null_coverable_count"] += 1
-                return
-
-            if rc.count(-1) == len(rc):
-                if sc.count(-1) != len(sc):
-                    # print("Warning: File %s reports no coverable lines" % r['name'])
-                    stats["null_coverable_count"] += 1
-
-                r["coverage"] = sc
-                return
-
-            # grcov does not always output the correct length for files when they end in
-            # non-coverable lines.  We record this, then ignore the excess lines.
-            if len(rc) != len(sc):
-                # print(
-                #     "Warning: Length mismatch for file %s (%s vs. %s)"
-                #     % (r['name'], len(rc), len(sc))
-                # )
-                stats["length_mismatch_count"] += 1
-
-            # Disable the assertion for now
-            # assert(len(r['coverage']) == len(s['coverage']))
-
-            minlen = min(len(rc), len(sc))
-
-            for idx in range(0, minlen):
-                # There are multiple situations where coverage reports might disagree
-                # about which lines are coverable and which are not. Sometimes, GCOV
-                # reports this wrong in headers, but it can also happen when mixing
-                # Clang and GCOV reports. Clang seems to consider more lines as
-                # coverable than GCOV.
-                #
-                # As a short-term solution we will always treat a location as *not*
-                # coverable if any of the reports says it is not coverable. We will
-                # still record these mismatches so we can track them and confirm them
-                # going down once we fix the various root causes for this behavior.
-                if (sc[idx] < 0 and rc[idx] >= 0) or (rc[idx] < 0 and sc[idx] >= 0):
-                    # print(
-                    #     "Warning: Coverable/Non-Coverable mismatch for file %s (idx "
-                    #     "%s, %s vs. %s)" %
-                    #     (r['name'], idx, rc[idx], sc[idx])
-                    # )
-                    stats["coverable_mismatch_count"] += 1
-
-                    # Explicitly mark as not coverable
-                    rc[idx] = -1
-                if sc[idx] < 0 and rc[idx] >= 0:
-                    rc[idx] = sc[idx]
-                elif rc[idx] < 0 and sc[idx] >= 0:
-                    pass
-                elif rc[idx] >= 0 and sc[idx] >= 0:
-                    rc[idx] += sc[idx]
+            r["coverage"] = merge_lines(r["coverage"], s["coverage"], stats)
 
     # Merge recursively
     merge_recursive(r, s)
@@ -110,6 +60,155 @@ def merge_coverage_data(r, s):
     return stats
 
 
+def merge_lines(rc, sc, stats):
+    """
+    Merge the line coverage of one leaf into another, see L{merge_coverage_data}.
+
+    @type rc: list(int)
+    @param rc: Coverage of the merge target, possibly modified in-place
+
+    @type sc: list(int)
+    @param sc: Coverage of the merge source
+
+    @type stats: dict
+    @param stats: Warning counters of L{merge_coverage_data}, updated in-place
+
+    @rtype: list(int)
+    @return: The merged coverage, either rc or sc
+    """
+    # GCOV bug, if the file has 0% coverage, then all of the file
+    # is reported as not coverable. If s has that property, we simply
+    # ignore it. If r has that property, we replace it by s.
+    if sc.count(-1) == len(sc):
+        if rc.count(-1) != len(rc):
+            # print("Warning: File %s reports no coverable lines" % r['name'])
+            stats["null_coverable_count"] += 1
+        return rc
+
+    if rc.count(-1) == len(rc):
+        if sc.count(-1) != len(sc):
+            # print("Warning: File %s reports no coverable lines" % r['name'])
+            stats["null_coverable_count"] += 1
+
+        return sc
+
+    # grcov does not always output the correct length for files when they end in
+    # non-coverable lines.  We record this, then ignore the excess lines.
+    if len(rc) != len(sc):
+        # print(
+        #     "Warning: Length mismatch for file %s (%s vs. %s)"
+        #     % (r['name'], len(rc), len(sc))
+        # )
+        stats["length_mismatch_count"] += 1
+
+    # Disable the assertion for now
+    # assert(len(r['coverage']) == len(s['coverage']))
+
+    minlen = min(len(rc), len(sc))
+
+    if numpy is not None and minlen >= NUMPY_MIN_LINES:
+        mismatches = _merge_lines_numpy(rc, sc, minlen)
+        if mismatches is not None:
+            stats["coverable_mismatch_count"] += mismatches
+            return rc
+
+    for idx in range(0, minlen):
+        # There are multiple situations where coverage reports might disagree
+        # about which lines are coverable and which are not. Sometimes, GCOV
+        # reports this wrong in headers, but it can also happen when mixing
+        # Clang and GCOV reports. Clang seems to consider more lines as
+        # coverable than GCOV.
+        #
+        # As a short-term solution we will always treat a location as *not*
+        # coverable if any of the reports says it is not coverable. We will
+        # still record these mismatches so we can track them and confirm them
+        # going down once we fix the various root causes for this behavior.
+        if (sc[idx] < 0 and rc[idx] >= 0) or (rc[idx] < 0 and sc[idx] >= 0):
+            # print(
+            #     "Warning: Coverable/Non-Coverable mismatch for file %s (idx "
+            #     "%s, %s vs. %s)" %
+            #     (r['name'], idx, rc[idx], sc[idx])
+            # )
+            stats["coverable_mismatch_count"] += 1
+
+            # Explicitly mark as not coverable
+            rc[idx] = -1
+        if sc[idx] < 0 and rc[idx] >= 0:
+            rc[idx] = sc[idx]
+        elif rc[idx] < 0 and sc[idx] >= 0:
+            pass
+        elif rc[idx] >= 0 and sc[idx] >= 0:
+            rc[idx] += sc[idx]
+
+    return rc
+
+
+def _merge_lines_numpy(rc, sc, minlen):
+    """
+    Vectorized version of the line merge in L{merge_coverage_data}: adds the
+    first minlen lines of sc to rc in-place and marks lines as not coverable
+    if only one of both reports considers them coverable.
+
+    @type rc: list(int)
+    @param rc: Coverage of the merge target, modified in-place
+
+    @type sc: list(int)
+    @param sc: Coverage of the merge source
+
+    @type minlen: int
+    @param minlen: Number of lines to merge
+
+    @rtype: int
+    @return: Number of coverable/non-coverable mismatches, or None if the
+             coverage can't be merged exactly with NumPy (e.g. values that
+             aren't integers or that might overflow).
+    """
+    r = _to_numpy(rc[:minlen])
+    s = _to_numpy(sc[:minlen])
+    if r is None or s is None or max(r.max(), s.max()) >= 2**62:
+        return None
+
+    r_neg = r < 0
+    s_neg = s < 0
+    mismatch = r_neg != s_neg
+
+    # Both coverable: add. Only one coverable: -1. Neither: keep r.
+    merged = numpy.where(r_neg | s_neg, numpy.where(mismatch, -1, r), r + s)
+    rc[:minlen] = merged.tolist()
+    return int(numpy.count_nonzero(mismatch))
+
+
+def _to_numpy(coverage):
+    """
+    @type coverage: list(int)
+    @param coverage: Coverage of a leaf
+
+    @rtype: numpy.ndarray
+    @return: The coverage as int64 array, or None if it doesn't fit one.
+    """
+    # Going through array is about twice as fast as letting NumPy infer the
+    # type of each list item, and rejects floats and huge values for us.
+    try:
+        return numpy.frombuffer(array("q", coverage), dtype=numpy.int64)
+    except (TypeError, OverflowError):
+        return None
+
+
+def _count_lines_numpy(coverage):
+    """
+    @type coverage: list(int)
+    @param coverage: Coverage of a leaf
+
+    @rtype: tuple(int, int)
+    @return: Number of coverable and covered lines, or None if the coverage
+             doesn't fit an int64 array.
+    """
+    lines = _to_numpy(coverage)
+    if lines is None:
+        return None
+    return (int(numpy.count_nonzero(lines >= 0)), int(numpy.count_nonzero(lines > 0)))
+
+
 def calculate_summary_fields(node, name=None):
     node["name"] = name
     node["linesTotal"] = 0
@@ -125,13 +224,7 @@ def calculate_summary_fields(node, name=None):
     else:
         # This is a leaf, calculate linesTotal and linesCovered from
         # actual coverage data.
-        coverage = node["coverage"]
-
-        for line in coverage:
-            if line >= 0:
-                node["linesTotal"] += 1
-                if line > 0:
-                    node["linesCovered"] += 1
+        node["linesTotal"], node["linesCovered"] = count_lines(node["coverage"])
 
     # Calculate two more values based on total/covered because we need
     # them in the UI later anyway and can save some time by doing it here.
@@ -145,24 +238,50 @@ def calculate_summary_fields(node, name=None):
         node["coveragePercent"] = 0.0
 
 
-def apply_include_exclude_directives(node, directives):
+def count_lines(coverage):
     """
-    Applies the given include and exclude directives to the given nodeself.
-    Directives either start with a + or a - for include or exclude, followed
-    by a colon and a glob expression. The glob expression must match the
-    full path of the file(s) or dir(s) to include or exclude. All slashes in paths
-    are forward slashes, must not have a trailing slash and glob characters
-    are not allowed. ** is additionally supported for recursive directory matching.
-    @param node: The coverage node to modify, in server-side recursive format
-    @type node: dict
-    @param directives: The directives to apply
-    @type directives: list(str)
-    This method modifies the node in-place, nothing is returned.
-    IMPORTANT: This method does *not* recalculate any total/summary fields.
-               You *must* call L{calculate_summary_fields} after applying
-               this function one or more times to ensure correct results.
+    @type coverage: list(int)
+    @param coverage: Coverage of a leaf
+
+    @rtype: tuple(int, int)
+    @return: Number of coverable and covered lines (linesTotal, linesCovered)
+    """
+    counts = None
+    if numpy is not None and len(coverage) >= NUMPY_MIN_LINES:
+        counts = _count_lines_numpy(coverage)
+
+    if counts is None:
+        total = 0
+        covered = 0
+        for line in coverage:
+            if line >= 0:
+                total += 1
+                if line > 0:
+                    covered += 1
+        counts = (total, covered)
+
+    return counts
+
+
+def summary_fields(lines_total, lines_covered):
     """
+    @rtype: dict
+    @return: The summary fields calculate_summary_fields stores in a node with
+             the given number of coverable and covered lines.
+    """
+    if lines_total > 0:
+        percent = round(((float(lines_covered) / lines_total) * 100), 2)
+    else:
+        percent = 0.0
+    return {
+        "linesTotal": lines_total,
+        "linesCovered": lines_covered,
+        "linesMissed": lines_total - lines_covered,
+        "coveragePercent": percent,
+    }
+
 
+def _compile_directives(directives):
     # Pre-process the directives
     #
     # all directives become a tuple of their "/" separated parts
@@ -205,108 +324,131 @@ def apply_include_exclude_directives(node, directives):
                 # compile the resulting regex
                 parts.append(re.compile(part))
         directives_new.append((what, parts))
+    return directives_new
 
-    def _is_dir(node):
-        return "children" in node
 
-    def __apply_include_exclude_directives(node, directives):
-        if not _is_dir(node):
-            return
+def _is_dir(node):
+    return "children" in node
 
-        # print(
-        #     "\tdirectives = [ " +
-        #     ", ".join(
-        #         w + ":" + "/".join(
-        #             "**" if d == "**" else d.pattern for d in p
-        #         ) for (w, p) in directives
-        #     ) +
-        #     "]"
-        # )
 
-        # separate out files from dirs
-        original_files = []
-        original_dirs = []
-        for child in node["children"]:
-            if _is_dir(node["children"][child]):
-                original_dirs.append(child)
-            else:
-                original_files.append(child)
+def _match_children(children, directives):
+    # Returns the names of the files the compiled directives keep in the given
+    # children of a directory, and the directives to apply to each directory
+    # that is recursed into.
+
+    # separate out files from dirs
+    original_files = []
+    original_dirs = []
+    for child in children:
+        if _is_dir(children[child]):
+            original_dirs.append(child)
+        else:
+            original_files.append(child)
 
-        # run directives on files
-        files = set()
-        for what, parts in directives:
-            pattern, subtree_pattern = parts[0], parts[1:]
+    # run directives on files
+    files = set()
+    for what, parts in directives:
+        pattern, subtree_pattern = parts[0], parts[1:]
 
-            # there is still a "/" in the pattern, so it shouldn't be applied to files
-            # at this point
+        # there is still a "/" in the pattern, so it shouldn't be applied to files
+        # at this point
+        if subtree_pattern:
+            continue
+
+        if what == "+":
+            if pattern == "**":
+                files = set(original_files)
+            else:
+                files |= {
+                    child
+                    for child in original_files
+                    if pattern.match(child) is not None
+                }
+        else:  # what == "-"
+            if pattern == "**":
+                files = set()
+            else:
+                files = {child for child in files if pattern.match(child) is None}
+
+    # run directives on dirs
+    universal_directives = (
+        []
+    )  # patterns beginning with **/ should always be applied recursively
+    dirs = {}
+    for what, parts in directives:
+        pattern, subtree_pattern = parts[0], parts[1:]
+
+        if pattern == "**":
+            # ** is unique in that it applies to both files and directories at every
+            # level.  it is also the only pattern that can remove a directory from
+            # recursion
             if subtree_pattern:
+                universal_directives.append((what, parts))
+            else:
+                # +:** or -:** means it doesn't matter what preceded this,
+                #   so ignore the existing universal_directives
+                universal_directives = [(what, parts)]
+
+                # this is a unique case, so handle it separately.  it will either
+                # reset dirs to all directory children of the current node, or
+                # clear dirs
+                if what == "+":
+                    dirs = {child: [(what, parts)] for child in original_dirs}
+                else:  # what == "-"
+                    dirs = {}
                 continue
 
-            if what == "+":
-                if pattern == "**":
-                    files = set(original_files)
-                else:
-                    files |= {
-                        child
-                        for child in original_files
-                        if pattern.match(child) is not None
-                    }
-            else:  # what == "-"
+        # ** is the only case we care about that is not a subtree pattern, and it
+        # was already handled above
+        if not subtree_pattern:
+            continue
+
+        if what == "+":
+            for child in original_dirs:
+                if pattern == "**" or pattern.match(child) is not None:
+                    if child not in dirs:
+                        dirs[child] = universal_directives[:]
+                    elif pattern == "**":
+                        dirs[child].append((what, parts))
+                    dirs[child].append((what, subtree_pattern))
+        else:  # what == "-"
+            for child in dirs:
                 if pattern == "**":
-                    files = set()
-                else:
-                    files = {child for child in files if pattern.match(child) is None}
+                    dirs[child].append((what, parts))
+                if pattern == "**" or pattern.match(child) is not None:
+                    dirs[child].append((what, subtree_pattern))
 
-        # run directives on dirs
-        universal_directives = (
-            []
-        )  # patterns beginning with **/ should always be applied recursively
-        dirs = {}
-        for what, parts in directives:
-            pattern, subtree_pattern = parts[0], parts[1:]
+        if pattern == "**":
+            universal_directives.append((what, subtree_pattern))
 
-            if pattern == "**":
-                # ** is unique in that it applies to both files and directories at every
-                # level.  it is also the only pattern that can remove a directory from
-                # recursion
-                if subtree_pattern:
-                    universal_directives.append((what, parts))
-                else:
-                    # +:** or -:** means it doesn't matter what preceded this,
-                    #   so ignore the existing universal_directives
-                    universal_directives = [(what, parts)]
-
-                    # this is a unique case, so handle it separately.  it will either
-                    # reset dirs to all directory children of the current node, or
-                    # clear dirs
-                    if what == "+":
-                        dirs = {child: [(what, parts)] for child in original_dirs}
-                    else:  # what == "-"
-                        dirs = {}
-                    continue
-
-            # ** is the only case we care about that is not a subtree pattern, and it
-            # was already handled above
-            if not subtree_pattern:
-                continue
+    return (files, dirs)
 
-            if what == "+":
-                for child in original_dirs:
-                    if pattern == "**" or pattern.match(child) is not None:
-                        if child not in dirs:
-                            dirs[child] = universal_directives[:]
-                        elif pattern == "**":
-                            dirs[child].append((what, parts))
-                        dirs[child].append((what, subtree_pattern))
-            else:  # what == "-"
-                for child in dirs:
-                    if pattern == "**":
-                        dirs[child].append((what, parts))
-                    if pattern == "**" or pattern.match(child) is not None:
-                        dirs[child].append((what, subtree_pattern))
 
-            if pattern == "**":
-                universal_directives.append((what, subtree_pattern))
+def apply_include_exclude_directives(node, directives):
+    """
+    Applies the given include and exclude directives to the given nodeself.
+    Directives either start with a + or a - for include or exclude, followed
+    by a colon and a glob expression. The glob expression must match the
+    full path of the file(s) or dir(s) to include or exclude. All slashes in paths
+    are forward slashes, must not have a trailing slash and glob characters
+    are not allowed. ** is additionally supported for recursive directory matching.
+    @param node: The coverage node to modify, in server-side recursive format
+    @type node: dict
+    @param directives: The directives to apply
+    @type directives: list(str)
+    This method modifies the node in-place, nothing is returned.
+    IMPORTANT: This method does *not* recalculate any total/summary fields.
+               You *must* call L{calculate_summary_fields} after applying
+               this function one or more times to ensure correct results.
+    """
+
+    directives = _compile_directives(directives)
+
+    def __apply_include_exclude_directives(node, directives):
+        if not _is_dir(node):
+            return
+
+        (files, dirs) = _match_children(node["children"], directives)
 
         # filters are applied, now remove/recurse for each child
         for child in list(
@@ -330,7 +472,67 @@ def apply_include_exclude_directives(node, directives):
                 del node["children"][child]  # removing excluded file
 
     # begin recursion
-    __apply_include_exclude_directives(node, directives_new)
+    __apply_include_exclude_directives(node, directives)
+
+
+def calculate_directive_summaries(node, directive_sets):
+    """
+    Calculates the summary fields of the given node for several sets of include
+    and exclude directives at once. The result is the same as applying each set
+    to a copy of the node with L{apply_include_exclude_directives} followed by
+    L{calculate_summary_fields}, but the tree is walked only once and neither
+    copied nor modified.
+
+    @param node: The coverage node to process, in server-side recursive format
+    @type node: dict
+
+    @param directive_sets: The directives to evaluate, see
+                           L{apply_include_exclude_directives}
+    @type directive_sets: list(list(str))
+
+    @return: The summary fields (see L{summary_fields}) of the root node for
+             each set of directives, in the same order
+    @rtype: list(dict)
+    """
+    totals = [[0, 0] for _ in directive_sets]
+
+    def __calculate_directive_summaries(node, active):
+        # active is a list of (index, compiled directives) of all sets that
+        # include at least part of this directory
+        children = node["children"]
+        files = {}
+        dirs = {}
+        for index, directives in active:
+            (matched_files, matched_dirs) = _match_children(children, directives)
+            for child in matched_files:
+                files.setdefault(child, []).append(index)
+            for child, child_directives in matched_dirs.items():
+                dirs.setdefault(child, []).append((index, child_directives))
+
+        # Each file is only counted once, no matter how many sets include it
+        for child, indices in files.items():
+            (lines_total, lines_covered) = count_lines(children[child]["coverage"])
+            for index in indices:
+                totals[index][0] += lines_total
+                totals[index][1] += lines_covered
+
+        for child, child_active in dirs.items():
+            __calculate_directive_summaries(children[child], child_active)
+
+    if _is_dir(node):
+        __calculate_directive_summaries(
+            node,
+            [
+                (index, _compile_directives(directives))
+                for index, directives in enumerate(directive_sets)
+            ],
+        )
+    else:
+        # Directives don't apply to a single leaf
+        counts = count_lines(node["coverage"])
+        totals = [list(counts) for _ in directive_sets]
+
+    return [summary_fields(*total) for total in totals]
 
 
 def get_flattened_names(node, prefix=""):
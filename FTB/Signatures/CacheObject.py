@@ -0,0 +1,142 @@
+"""
+Cache Object Serialization
+
+Serializes the cache objects created by L{CrashInfo.toCacheObject} to strings,
+either as JSON or in a versioned, compact line-based layout that can be loaded
+with a single split instead of a full JSON parse. The compact layout stays text,
+so it can be stored in the same (text) database columns as JSON.
+
+The compact layout (version 1) consists of these lines:
+
+  FMC1                          format marker and version
+  <crash address>               hex, empty if there is no crash address
+  [=<crash instruction>]        empty if there is no crash instruction
+  [=<failure reason>]           empty if there is no failure reason
+  [<name> <value> ...]          all registers on one line, values in hex
+  <frame>                       one line per frame
+  [<index> ...]                 see below
+
+If the backtrace repeats many frames (e.g. recursion in stack overflows), the
+frame lines only contain every frame once and the last line holds the index of
+each backtrace frame into them. Otherwise the last line is empty.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+from itertools import repeat
+
+COMPACT_MARKER = "FMC1"
+
+
+def _encodeCompact(cacheObject):
+    backtrace = cacheObject["backtrace"]
+    registers = cacheObject["registers"]
+    crashAddress = cacheObject["crashAddress"]
+    crashInstruction = cacheObject["crashInstruction"]
+    failureReason = cacheObject["failureReason"]
+
+    # Anything we can't represent is left to JSON
+    for value in (crashInstruction, failureReason):
+        if value is not None and "\n" in value:
+            return None
+    if any("\n" in frame for frame in backtrace):
+        return None
+    for name, value in registers.items():
+        if not name or " " in name or "\n" in name or not isinstance(value, int):
+            return None
+    if crashAddress is not None and not isinstance(crashAddress, int):
+        return None
+
+    frameTable = {}
+    for frame in backtrace:
+        frameTable.setdefault(frame, len(frameTable))
+
+    frames = backtrace
+    indices = ""
+    # Resolving indices costs more than it saves unless there are many repeats
+    if 2 * len(frameTable) <= len(backtrace):
+        frames = frameTable
+        indices = " ".join(str(frameTable[frame]) for frame in backtrace)
+
+    lines = [
+        COMPACT_MARKER,
+        "" if crashAddress is None else f"{crashAddress:x}",
+        "" if crashInstruction is None else f"={crashInstruction}",
+        "" if failureReason is None else f"={failureReason}",
+        " ".join(f"{name} {value:x}" for name, value in registers.items()),
+    ]
+    lines.extend(frames)
+    lines.append(indices)
+    return "\n".join(lines)
+
+
+def _decodeCompact(data):
+    lines = data.split("\n")
+    registers = lines[4].split(" ") if lines[4] else []
+    frames = lines[5:-1]
+    indices = lines[-1]
+
+    backtrace = frames
+    if indices:
+        # Looking up the index strings avoids converting each of them to int
+        frameTable = dict(zip(map(str, range(len(frames))), frames))
+        backtrace = list(map(frameTable.__getitem__, indices.split(" ")))
+
+    return {
+        "backtrace": backtrace,
+        "registers": dict(zip(registers[::2], map(int, registers[1::2], repeat(16)))),
+        "crashAddress": int(lines[1], 16) if lines[1] else None,
+        "crashInstruction": lines[2][1:] if lines[2] else None,
+        "failureReason": lines[3][1:] if lines[3] else None,
+    }
+
+
+def dumpCacheObject(cacheObject, compact=True):
+    """
+    Serialize a cache object to a string.
+
+    @type cacheObject: dict
+    @param cacheObject: Cache object as returned by L{CrashInfo.toCacheObject}
+
+    @type compact: bool
+    @param compact: Use the compact layout if possible, otherwise JSON
+
+    @rtype: str
+    @return: The serialized cache object
+    """
+    if compact:
+        data = _encodeCompact(cacheObject)
+        if data is not None:
+            return data
+    return json.dumps(cacheObject)
+
+
+def loadCacheObject(data):
+    """
+    Load a cache object serialized by L{dumpCacheObject}, in either format.
+
+    @type data: str
+    @param data: The serialized cache object
+
+    @rtype: dict
+    @return: The cache object
+    """
+    if isCompact(data):
+        return _decodeCompact(data)
+    return json.loads(data)
+
+
+def isCompact(data):
+    """
+    @type data: str
+    @param data: A serialized cache object
+
+    @rtype: bool
+    @return: True if the cache object is serialized in the compact layout
+    """
+    return data.startswith(COMPACT_MARKER + "\n")
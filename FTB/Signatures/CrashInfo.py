@@ -26,6 +26,7 @@ from functools import wraps
 from FTB import AssertionHelper
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures import RegisterHelper
+from FTB.Signatures.CacheObject import loadCacheObject
 from FTB.Signatures.CrashSignature import CrashSignature
 
 
@@ -240,10 +241,12 @@ class CrashInfo(metaclass=ABCMeta):
         @type auxCrashData: List of strings
         @param auxCrashData: Optional additional crash output (e.g. GDB). If not
                              specified, stderr is used.
-        @type cacheObject: Dictionary
+        @type cacheObject: Dictionary or string
         @param cacheObject: The cache object that should be used to restore the class
                             fields instead of parsing the crash data. The appropriate
                             object can be created by calling the toCacheObject method.
+                            It may also be given in serialized form, as returned by
+                            L{CacheObject.dumpCacheObject}.
 
         @rtype: CrashInfo
         @return: Crash information object
@@ -264,6 +267,12 @@ class CrashInfo(metaclass=ABCMeta):
         if isinstance(auxCrashData, (str, bytes)):
             auxCrashData = auxCrashData.splitlines()
 
+        if isinstance(cacheObject, bytes):
+            cacheObject = cacheObject.decode("utf-8")
+
+        if isinstance(cacheObject, str):
+            cacheObject = loadCacheObject(cacheObject)
+
         if cacheObject is not None:
             c = CrashInfo()
 
@@ -16,9 +16,11 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
 import difflib
+import hashlib
 import json
 
 from FTB.Signatures import JSONHelper
+from FTB.Signatures.ObjectCache import ObjectCache
 from FTB.Signatures.Symptom import (
     OutputSymptom,
     StackFramesSymptom,
@@ -26,6 +28,9 @@ from FTB.Signatures.Symptom import (
     TestcaseSymptom,
 )
 
+# Signatures shared between all users in this process, see CrashSignature.fromCache
+SIGNATURE_CACHE = ObjectCache(4096)
+
 
 class CrashSignature:
     def __init__(self, rawSignature):
@@ -70,6 +75,27 @@ class CrashSignature:
         with open(signatureFile) as sigFd:
             return CrashSignature(sigFd.read())
 
+    @staticmethod
+    def fromCache(rawSignature):
+        """
+        Return the parsed signature for the given raw signature, shared with all
+        other callers in this process. The signature is only parsed again if it
+        was evicted from the cache in the meantime. The returned object must not
+        be modified.
+
+        @type rawSignature: string
+        @param rawSignature: A JSON-formatted string representing the crash signature
+
+        @rtype: CrashSignature
+        @return: The shared signature
+        """
+        key = hashlib.sha1(rawSignature.encode("utf-8")).digest()
+        signature = SIGNATURE_CACHE.get(key, lambda: CrashSignature(rawSignature))
+        if signature.rawSignature != rawSignature:
+            # Hash collision, don't hand out the wrong signature
+            return CrashSignature(rawSignature)
+        return signature
+
     def __str__(self):
         return str(self.rawSignature)
 
@@ -14,14 +14,43 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 @contact:    choller@mozilla.com
 """
 
+import json
 import numbers
 import re
 from abc import ABCMeta, abstractmethod
 
 from FTB.Signatures import JSONHelper
+from FTB.Signatures.ObjectCache import ObjectCache
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+
+# Matchers shared between all signatures parsed in this process
+MATCHER_CACHE = ObjectCache(65536)
 
 
 class Match(metaclass=ABCMeta):
+    @classmethod
+    def shared(cls, obj):
+        """
+        Same as the constructor, but returns an instance shared with all other
+        users creating a matcher from an identical object. This avoids compiling
+        the same regular expressions over and over again when parsing many
+        signatures. Shared instances must not be modified.
+        """
+        if isinstance(obj, (str, bytes, numbers.Integral)):
+            key = (cls, type(obj), obj)
+        else:
+            try:
+                key = (cls, json.dumps(obj, sort_keys=True))
+            except (TypeError, ValueError):
+                # Not a valid matcher either way, let the constructor complain
+                return cls(obj)
+        return MATCHER_CACHE.get(key, lambda: cls(obj))
+
     @abstractmethod
     def matches(self, value):
         pass
@@ -82,6 +111,36 @@ class StringMatch(Match):
         else:
             return self.value in value
 
+    def getRequiredLiteral(self):
+        """
+        Determine a literal string that every value matching this matcher must
+        contain. For regular expressions, this is the longest literal sequence
+        outside of any group, repetition or alternation.
+
+        @rtype: str
+        @return: The required literal or None, if there is no such literal
+        """
+        if not self.isPCRE:
+            return self.value or None
+
+        parsed = sre_parse.parse(self.value)
+        if parsed.state.flags & re.IGNORECASE:
+            return None
+
+        best = ""
+        current = []
+        for op, av in parsed:
+            if op is sre_parse.LITERAL:
+                current.append(chr(av))
+                continue
+            if len(current) > len(best):
+                best = "".join(current)
+            current = []
+        if len(current) > len(best):
+            best = "".join(current)
+
+        return best or None
+
     def __str__(self):
         return self.value
 
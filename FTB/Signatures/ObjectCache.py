@@ -0,0 +1,79 @@
+"""
+ObjectCache -- Bounded, thread-safe LRU cache of shared objects
+
+Used to share parsed signatures and their matchers between all users within
+a process. Objects obtained from such a cache must not be modified.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ObjectCache:
+    def __init__(self, size):
+        """
+        @type size: int
+        @param size: Maximum number of objects to keep, 0 disables the cache
+        """
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, create):
+        """
+        Return the object cached for the given key, or create and cache it.
+
+        @type key: hashable
+        @param key: Key identifying the object
+
+        @type create: callable
+        @param create: Called without arguments to create the object if it
+                       isn't cached. Exceptions are passed on and nothing is
+                       cached in that case.
+
+        @return: The shared object
+        """
+        with self.lock:
+            obj = self.entries.get(key)
+            if obj is not None:
+                self.entries.move_to_end(key)
+                return obj
+
+        # Create the object without holding the lock, if another thread was
+        # faster, use its object so there is only one shared instance.
+        obj = create()
+        if not self.size:
+            return obj
+
+        with self.lock:
+            obj = self.entries.setdefault(key, obj)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return obj
+
+    def resize(self, size):
+        """
+        Change the maximum number of objects, evicting the least recently
+        used ones if necessary.
+
+        @type size: int
+        @param size: Maximum number of objects to keep, 0 disables the cache
+        """
+        with self.lock:
+            self.size = size
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
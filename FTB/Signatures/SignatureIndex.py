@@ -0,0 +1,627 @@
+"""
+Signature Index
+
+Holds a set of pre-parsed crash signatures and narrows them down to the
+candidates that can possibly match a given crash, so the full (and much more
+expensive) signature matching only has to run on a small subset of them.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+from collections import deque
+
+from FTB.Signatures.Symptom import (
+    CrashAddressSymptom,
+    OutputSymptom,
+    StackFramesSymptom,
+    StackFrameSymptom,
+)
+
+WILDCARDS = {"?", "???"}
+
+# Up to this many literals, searching for each of them separately is faster
+# than a single pass of the (pure Python) Aho-Corasick automaton.
+MAX_DIRECT_LITERALS = 128
+
+
+class AhoCorasick:
+    def __init__(self, literals):
+        """
+        Build an Aho-Corasick automaton that finds all occurrences of the given
+        literals in a text in a single pass.
+
+        @type literals: iterable
+        @param literals: The (non-empty) literals to search for
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+
+        for literal in literals:
+            state = 0
+            for char in literal:
+                nextState = self.goto[state].get(char)
+                if nextState is None:
+                    nextState = len(self.goto)
+                    self.goto[state][char] = nextState
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = nextState
+            self.output[state] = (literal,)
+
+        # Breadth-first, so the failure state of each state is done before it
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nextState in self.goto[state].items():
+                queue.append(nextState)
+                failState = self.fail[state]
+                while failState and char not in self.goto[failState]:
+                    failState = self.fail[failState]
+                failState = self.goto[failState].get(char, 0)
+                if failState == nextState:
+                    failState = 0
+                self.fail[nextState] = failState
+                self.output[nextState] += self.output[failState]
+
+    def findAll(self, text):
+        """
+        Find all literals occurring in the given text.
+
+        @type text: str
+        @param text: The text to search
+
+        @rtype: set
+        @return: All literals found in the text
+        """
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+
+        found = set()
+        state = 0
+        for char in text:
+            while True:
+                nextState = goto[state].get(char)
+                if nextState is not None:
+                    state = nextState
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class _ConfigurationIndex:
+    """
+    Indexes signatures by one of their optional platforms/operatingSystems/products
+    lists. Signatures without such a list match any value.
+    """
+
+    def __init__(self, signatureAttr, configurationAttr):
+        self.signatureAttr = signatureAttr
+        self.configurationAttr = configurationAttr
+        self.unconstrained = set()
+        self.byValue = {}
+
+    def add(self, key, signature):
+        values = getattr(signature, self.signatureAttr)
+        if values is None:
+            self.unconstrained.add(key)
+            return
+        for value in values:
+            self.byValue.setdefault(value, set()).add(key)
+
+    def remove(self, key, signature):
+        values = getattr(signature, self.signatureAttr)
+        if values is None:
+            self.unconstrained.discard(key)
+            return
+        for value in values:
+            keys = self.byValue.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.byValue[value]
+
+    def lookup(self, crashInfo):
+        value = getattr(crashInfo.configuration, self.configurationAttr)
+        return (self.byValue.get(value, set()), self.unconstrained)
+
+
+class _CrashAddressIndex:
+    """
+    Indexes signatures by their first crash address symptom. Signatures are
+    grouped by the distinct address matchers they use (in practice, there are
+    only a handful like "< 0x100" or "> 0xFF"), so each matcher only has to be
+    evaluated once per lookup.
+    """
+
+    def __init__(self):
+        self.unconstrained = set()
+        self.byMatcher = {}
+        self.keyToMatcher = {}
+
+    @staticmethod
+    def getMatcher(signature):
+        for symptom in signature.symptoms:
+            if isinstance(symptom, CrashAddressSymptom):
+                return symptom.address
+        return None
+
+    def add(self, key, signature):
+        matcher = self.getMatcher(signature)
+        if matcher is None:
+            self.unconstrained.add(key)
+            return
+        matcherKey = (matcher.matchType, matcher.value)
+        self.byMatcher.setdefault(matcherKey, (matcher, set()))[1].add(key)
+        self.keyToMatcher[key] = matcherKey
+
+    def remove(self, key, signature):
+        matcherKey = self.keyToMatcher.pop(key, None)
+        if matcherKey is None:
+            self.unconstrained.discard(key)
+            return
+        keys = self.byMatcher[matcherKey][1]
+        keys.discard(key)
+        if not keys:
+            del self.byMatcher[matcherKey]
+
+    def lookup(self, crashInfo):
+        hits = set()
+        for matcher, keys in self.byMatcher.values():
+            if matcher.matches(crashInfo.crashAddress):
+                hits |= keys
+        return (hits, self.unconstrained)
+
+
+class _TopFrameIndex:
+    """
+    Indexes signatures by the matcher they require on the topmost stack frame,
+    which is the most discriminating property of almost all signatures.
+
+    Literal matchers are substring matches, so they are grouped by length and
+    looked up by sliding a window of each length over the top frame. PCRE
+    matchers are grouped by pattern and evaluated once per lookup.
+    """
+
+    def __init__(self):
+        self.unconstrained = set()
+        self.literals = {}
+        self.patterns = {}
+        self.keyToMatcher = {}
+
+    @staticmethod
+    def getMatcher(signature):
+        for symptom in signature.symptoms:
+            if isinstance(symptom, StackFramesSymptom):
+                if (
+                    symptom.functionNames
+                    and str(symptom.functionNames[0]) not in WILDCARDS
+                ):
+                    return symptom.functionNames[0]
+            elif isinstance(symptom, StackFrameSymptom):
+                frameNumber = symptom.frameNumber
+                if frameNumber.matchType is None and frameNumber.value == 0:
+                    return symptom.functionName
+        return None
+
+    def add(self, key, signature):
+        matcher = self.getMatcher(signature)
+        if matcher is None:
+            self.unconstrained.add(key)
+            return
+        if matcher.isPCRE:
+            self.patterns.setdefault(matcher.value, (matcher, set()))[1].add(key)
+        else:
+            literals = self.literals.setdefault(len(matcher.value), {})
+            literals.setdefault(matcher.value, set()).add(key)
+        self.keyToMatcher[key] = matcher
+
+    def remove(self, key, signature):
+        matcher = self.keyToMatcher.pop(key, None)
+        if matcher is None:
+            self.unconstrained.discard(key)
+            return
+        if matcher.isPCRE:
+            keys = self.patterns[matcher.value][1]
+            keys.discard(key)
+            if not keys:
+                del self.patterns[matcher.value]
+        else:
+            literals = self.literals[len(matcher.value)]
+            keys = literals[matcher.value]
+            keys.discard(key)
+            if not keys:
+                del literals[matcher.value]
+                if not literals:
+                    del self.literals[len(matcher.value)]
+
+    def lookup(self, crashInfo):
+        hits = set()
+        if not crashInfo.backtrace:
+            # Any signature requiring something on the top frame can't match
+            return (hits, self.unconstrained)
+
+        frame = crashInfo.backtrace[0]
+        for length, literals in self.literals.items():
+            windows = len(frame) - length + 1
+            if windows <= 0:
+                continue
+            if len(literals) < windows:
+                # Fewer literals than windows to test, check them directly
+                for literal, keys in literals.items():
+                    if literal in frame:
+                        hits |= keys
+            else:
+                for start in range(windows):
+                    keys = literals.get(frame[start : start + length])
+                    if keys is not None:
+                        hits |= keys
+
+        for matcher, keys in self.patterns.values():
+            if matcher.matches(frame):
+                hits |= keys
+
+        return (hits, self.unconstrained)
+
+
+class _OutputIndex:
+    """
+    Indexes signatures by the literal required by one of their output symptoms
+    (the longest one, to be most selective). For regular expressions, this is the
+    literal part every match must contain (see L{StringMatch.getRequiredLiteral}).
+
+    All output of a crash is scanned once for all of these literals, regardless of
+    the output source a symptom is restricted to.
+    """
+
+    def __init__(self):
+        self.unconstrained = set()
+        self.byLiteral = {}
+        self.keyToLiteral = {}
+        self.automaton = None
+
+    @staticmethod
+    def getLiteral(signature):
+        best = None
+        for symptom in signature.symptoms:
+            if isinstance(symptom, OutputSymptom):
+                literal = symptom.output.getRequiredLiteral()
+                if literal is not None and (best is None or len(literal) > len(best)):
+                    best = literal
+        return best
+
+    def add(self, key, signature):
+        literal = self.getLiteral(signature)
+        if literal is None:
+            self.unconstrained.add(key)
+            return
+        if literal not in self.byLiteral:
+            self.byLiteral[literal] = set()
+            self.automaton = None
+        self.byLiteral[literal].add(key)
+        self.keyToLiteral[key] = literal
+
+    def remove(self, key, signature):
+        literal = self.keyToLiteral.pop(key, None)
+        if literal is None:
+            self.unconstrained.discard(key)
+            return
+        keys = self.byLiteral[literal]
+        keys.discard(key)
+        if not keys:
+            del self.byLiteral[literal]
+            self.automaton = None
+
+    def lookup(self, crashInfo):
+        hits = set()
+        if not self.byLiteral:
+            return (hits, self.unconstrained)
+
+        lines = []
+        for line in crashInfo.rawStdout + crashInfo.rawStderr + crashInfo.rawCrashData:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", errors="replace")
+            lines.append(line)
+        text = "\n".join(lines)
+
+        if crashInfo.configuration.os == "windows" and "\\" in text:
+            # Regular expressions containing slashes also match Windows paths
+            text += "\n" + text.replace("\\", "/")
+
+        if len(self.byLiteral) <= MAX_DIRECT_LITERALS:
+            found = [literal for literal in self.byLiteral if literal in text]
+        else:
+            if self.automaton is None:
+                self.automaton = AhoCorasick(self.byLiteral)
+            found = self.automaton.findAll(text)
+
+        for literal in found:
+            hits |= self.byLiteral[literal]
+        return (hits, self.unconstrained)
+
+
+class _FrameIndex:
+    """
+    Inverted index of the function names required by the stackFrames symptoms of
+    all signatures. For a given crash, it yields a lower bound of the distance
+    computed by L{CrashSignature.getDistance}.
+
+    Every non-wildcard function name that doesn't match any frame of the crash has
+    to be replaced for the symptom to match, which adds at least one to the
+    distance, and L{StackFramesSymptom.diff} never reports a smaller distance than
+    the number of such replacements (or gives up and uses the number of function
+    names instead).
+    """
+
+    def __init__(self):
+        self.literals = {}
+        self.patterns = {}
+        self.frameCounts = {}
+        self.byFrameCount = {}
+        self.automaton = None
+
+    @staticmethod
+    def getFunctionNames(signature):
+        for symptom in signature.symptoms:
+            if isinstance(symptom, StackFramesSymptom):
+                for functionName in symptom.functionNames:
+                    if str(functionName) not in WILDCARDS:
+                        yield functionName
+
+    def add(self, key, signature):
+        count = 0
+        for functionName in self.getFunctionNames(signature):
+            count += 1
+            if functionName.isPCRE:
+                keys = self.patterns.setdefault(functionName.value, (functionName, {}))[
+                    1
+                ]
+            else:
+                if functionName.value not in self.literals:
+                    self.literals[functionName.value] = {}
+                    self.automaton = None
+                keys = self.literals[functionName.value]
+            keys[key] = keys.get(key, 0) + 1
+        self.frameCounts[key] = count
+        self.byFrameCount.setdefault(count, set()).add(key)
+
+    def remove(self, key, signature):
+        count = self.frameCounts.pop(key, None)
+        if count is None:
+            return
+        keys = self.byFrameCount[count]
+        keys.discard(key)
+        if not keys:
+            del self.byFrameCount[count]
+        for functionName in self.getFunctionNames(signature):
+            if functionName.isPCRE:
+                keys = self.patterns.get(functionName.value, (None, {}))[1]
+            else:
+                keys = self.literals.get(functionName.value, {})
+            keys.pop(key, None)
+            if keys:
+                continue
+            if functionName.isPCRE:
+                self.patterns.pop(functionName.value, None)
+            elif self.literals.pop(functionName.value, None) is not None:
+                self.automaton = None
+
+    def findLiterals(self, frames):
+        if not frames:
+            return []
+        found = []
+        if "" in self.literals:
+            # The empty string matches any frame
+            found.append("")
+        if len(self.literals) <= MAX_DIRECT_LITERALS:
+            found.extend(
+                literal
+                for literal in self.literals
+                if literal and any(literal in frame for frame in frames)
+            )
+            return found
+        if self.automaton is None:
+            self.automaton = AhoCorasick(
+                literal for literal in self.literals if literal and "\n" not in literal
+            )
+        found.extend(self.automaton.findAll("\n".join(frames)))
+        # Literals spanning lines can't be found with the automaton
+        found.extend(
+            literal
+            for literal in self.literals
+            if "\n" in literal and any(literal in frame for frame in frames)
+        )
+        return found
+
+    def getMatchedCounts(self, crashInfo):
+        """
+        @rtype: dict
+        @return: The number of function names matching any frame of the crash, for
+                 all signatures where there is at least one
+        """
+        frames = crashInfo.backtrace
+        matched = {}
+        for literal in self.findLiterals(frames):
+            for key, count in self.literals[literal].items():
+                matched[key] = matched.get(key, 0) + count
+        if frames:
+            for matcher, keys in self.patterns.values():
+                if any(matcher.matches(frame) for frame in frames):
+                    for key, count in keys.items():
+                        matched[key] = matched.get(key, 0) + count
+        return matched
+
+
+class SignatureIndex:
+    def __init__(self):
+        """
+        Create an empty signature index. Signatures are stored under arbitrary
+        (sortable) keys, e.g. bucket ids or signature file names.
+        """
+        self.signatures = {}
+
+        self.frameIndex = _FrameIndex()
+
+        # Ordered by how much they typically narrow down the candidates
+        self.indices = [
+            _TopFrameIndex(),
+            _CrashAddressIndex(),
+            _ConfigurationIndex("products", "product"),
+            _ConfigurationIndex("platforms", "platform"),
+            _ConfigurationIndex("operatingSystems", "os"),
+            # Most expensive to look up, so it comes last
+            _OutputIndex(),
+        ]
+
+    def __contains__(self, key):
+        return key in self.signatures
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def get(self, key):
+        return self.signatures.get(key)
+
+    def add(self, key, signature):
+        """
+        Add a signature to the index, replacing any signature stored under the
+        same key.
+
+        @type key: object
+        @param key: The key to store the signature under
+
+        @type signature: CrashSignature
+        @param signature: The signature to store
+        """
+        self.remove(key)
+        self.signatures[key] = signature
+        for index in self.indices:
+            index.add(key, signature)
+        self.frameIndex.add(key, signature)
+
+    def remove(self, key):
+        """
+        Remove the signature stored under the given key, if any.
+
+        @type key: object
+        @param key: The key of the signature to remove
+        """
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for index in self.indices:
+            index.remove(key, signature)
+        self.frameIndex.remove(key, signature)
+
+    def getCandidates(self, crashInfo):
+        """
+        Determine the keys of all signatures that could match the given crash.
+        This is a superset of the signatures that actually match.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash info to look up candidates for
+
+        @rtype: set
+        @return: Keys of all candidate signatures
+        """
+        candidates = None
+        for index in self.indices:
+            hits, unconstrained = index.lookup(crashInfo)
+            if candidates is None:
+                candidates = hits | unconstrained
+            else:
+                candidates = (candidates & hits) | (candidates & unconstrained)
+            if not candidates:
+                break
+        return candidates or set()
+
+    def getMatches(self, crashInfo, preferred=(), addedOrder=False):
+        """
+        Generate the keys of all signatures matching the given crash, in
+        descending key order. Keys contained in preferred are tried first.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash info to match the signatures against
+
+        @type preferred: collection
+        @param preferred: Keys to try before all other signatures
+
+        @type addedOrder: bool
+        @param addedOrder: Try the signatures in the order they were added
+                           instead of descending key order
+
+        @rtype: generator
+        @return: Keys of all matching signatures
+        """
+        candidates = self.getCandidates(crashInfo)
+        if addedOrder:
+            candidates = [key for key in self.signatures if key in candidates]
+        else:
+            candidates = sorted(candidates, reverse=True)
+        if preferred:
+            candidates = [key for key in candidates if key in preferred] + [
+                key for key in candidates if key not in preferred
+            ]
+
+        for key in candidates:
+            if self.signatures[key].matches(crashInfo):
+                yield key
+
+    def getNearest(self, crashInfo, maxDistance, limit=None):
+        """
+        Shortlist the signatures that may be within the given distance of the
+        crash (see L{CrashSignature.getDistance}), without computing any exact
+        distances. Signatures are ranked by a lower bound of their distance, then
+        by the number of function names they share with the backtrace.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash info to look up similar signatures for
+
+        @type maxDistance: int
+        @param maxDistance: Exclude signatures that are certainly farther away
+
+        @type limit: int
+        @param limit: Return at most this many keys
+
+        @rtype: list
+        @return: Keys of the nearest signatures, nearest first
+        """
+        frameIndex = self.frameIndex
+        matched = frameIndex.getMatchedCounts(crashInfo)
+
+        # Signatures with few function names can be close without sharing any
+        keys = set(matched)
+        for count, countKeys in frameIndex.byFrameCount.items():
+            if count <= maxDistance:
+                keys |= countKeys
+
+        configuration = crashInfo.configuration
+        ranked = []
+        for key in keys:
+            signature = self.signatures[key]
+            matchedCount = matched.get(key, 0)
+            bound = frameIndex.frameCounts[key] - matchedCount
+            for values, value in (
+                (signature.platforms, configuration.platform),
+                (signature.operatingSystems, configuration.os),
+                (signature.products, configuration.product),
+            ):
+                if values is not None and value not in values:
+                    bound += 1
+            if bound <= maxDistance:
+                ranked.append((bound, -matchedCount, key))
+
+        ranked.sort()
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [key for _, _, key in ranked]
@@ -0,0 +1,37 @@
+"""
+Signature Manifest
+
+Helpers for the signature manifest published alongside the exported signatures.
+The manifest maps each bucket id to a hash of its exported signature and
+metadata files, so clients can tell which signatures changed without
+downloading all of them.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import hashlib
+
+
+def hashSignatureFiles(signatureData, metadataData):
+    """
+    Calculate the manifest hash of a signature and its metadata, as written to
+    the exported files.
+
+    @type signatureData: bytes
+    @param signatureData: Content of the signature file
+
+    @type metadataData: bytes
+    @param metadataData: Content of the metadata file, or None if there is none
+
+    @rtype: str
+    @return: Hex digest identifying the content of both files
+    """
+    h = hashlib.sha1(signatureData)
+    if metadataData is not None:
+        h.update(b"\0")
+        h.update(metadataData)
+    return h.hexdigest()
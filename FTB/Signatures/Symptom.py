@@ -20,6 +20,8 @@ from abc import ABCMeta, abstractmethod
 from FTB.Signatures import JSONHelper
 from FTB.Signatures.Matchers import NumberMatch, StringMatch
 
+_WILDCARDS = ("?", "???")
+
 
 class Symptom(metaclass=ABCMeta):
     """
@@ -88,7 +90,7 @@ class OutputSymptom(Symptom):
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
         """
         Symptom.__init__(self, obj)
-        self.output = StringMatch(
+        self.output = StringMatch.shared(
             JSONHelper.getObjectOrStringChecked(obj, "value", True)
         )
         self.src = JSONHelper.getStringChecked(obj, "src")
@@ -139,16 +141,16 @@ class StackFrameSymptom(Symptom):
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
         """
         Symptom.__init__(self, obj)
-        self.functionName = StringMatch(
+        self.functionName = StringMatch.shared(
             JSONHelper.getNumberOrStringChecked(obj, "functionName", True)
         )
         self.frameNumber = JSONHelper.getNumberOrStringChecked(obj, "frameNumber")
 
         if self.frameNumber is not None:
-            self.frameNumber = NumberMatch(self.frameNumber)
+            self.frameNumber = NumberMatch.shared(self.frameNumber)
         else:
             # Default to 0
-            self.frameNumber = NumberMatch(0)
+            self.frameNumber = NumberMatch.shared(0)
 
     def matches(self, crashInfo):
         """
@@ -176,7 +178,7 @@ class StackSizeSymptom(Symptom):
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
         """
         Symptom.__init__(self, obj)
-        self.stackSize = NumberMatch(
+        self.stackSize = NumberMatch.shared(
             JSONHelper.getNumberOrStringChecked(obj, "size", True)
         )
 
@@ -199,7 +201,7 @@ class CrashAddressSymptom(Symptom):
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
         """
         Symptom.__init__(self, obj)
-        self.address = NumberMatch(
+        self.address = NumberMatch.shared(
             JSONHelper.getNumberOrStringChecked(obj, "address", True)
         )
 
@@ -230,7 +232,7 @@ class InstructionSymptom(Symptom):
         )
 
         if self.instructionName is not None:
-            self.instructionName = StringMatch(self.instructionName)
+            self.instructionName = StringMatch.shared(self.instructionName)
         elif self.registerNames is None or len(self.registerNames) == 0:
             raise RuntimeError(
                 "Must provide at least instruction name or register names"
@@ -268,7 +270,7 @@ class TestcaseSymptom(Symptom):
         Private constructor, called by L{Symptom.fromJSONObject}. Do not use directly.
         """
         Symptom.__init__(self, obj)
-        self.output = StringMatch(
+        self.output = StringMatch.shared(
             JSONHelper.getObjectOrStringChecked(obj, "value", True)
         )
 
@@ -307,7 +309,7 @@ class StackFramesSymptom(Symptom):
         rawFunctionNames = JSONHelper.getArrayChecked(obj, "functionNames", True)
 
         for fn in rawFunctionNames:
-            self.functionNames.append(StringMatch(fn))
+            self.functionNames.append(StringMatch.shared(fn))
 
     def matches(self, crashInfo):
         """
@@ -326,9 +328,12 @@ class StackFramesSymptom(Symptom):
         if self.matches(crashInfo):
             return (0, None)
 
+        matchTable = _StackMatchTable(crashInfo.backtrace)
+        rows = [matchTable.row(x) for x in self.functionNames]
+
         for depth in range(1, 4):
-            (bestDepth, bestGuess) = StackFramesSymptom._diff(
-                crashInfo.backtrace, self.functionNames, 0, 1, depth
+            (bestDepth, bestGuess) = StackFramesSymptom._diffSearch(
+                matchTable, self.functionNames, rows, 0, 1, depth
             )
             if bestDepth is not None:
                 guessedFunctionNames = [repr(x) for x in bestGuess]
@@ -355,36 +360,63 @@ class StackFramesSymptom(Symptom):
 
     @staticmethod
     def _diff(stack, signatureGuess, startIdx, depth, maxDepth):
+        matchTable = _StackMatchTable(stack)
+        rows = [matchTable.row(x) for x in signatureGuess]
+        return StackFramesSymptom._diffSearch(
+            matchTable, signatureGuess, rows, startIdx, depth, maxDepth
+        )
+
+    @staticmethod
+    def _diffSearch(
+        matchTable, signatureGuess, signatureRows, startIdx, depth, maxDepth
+    ):
+        # Depth-first search over all signatures that can be created by inserting
+        # or replacing up to maxDepth - depth + 1 wildcards at or after startIdx.
+        # The first signature found is returned, so the order in which the
+        # candidates are tried determines the proposed signature. Subtrees are
+        # skipped if the minimum edit count computed by the match table shows
+        # that they cannot contain a match, which does not change the result.
+        remainingEdits = maxDepth - depth + 1
+        if (
+            matchTable.minEdits(signatureRows, startIdx, remainingEdits)
+            > remainingEdits
+        ):
+            return (None, None)
+
+        stack = matchTable.stack
         singleWildcardMatch = StringMatch("?")
 
-        newSignatureGuess = []
-        newSignatureGuess.extend(signatureGuess)
+        newSignatureGuess = list(signatureGuess)
+        newSignatureRows = list(signatureRows)
 
         bestDepth = None
         bestGuess = None
 
-        hasVariableStackLengthQuantifier = "???" in [str(x) for x in newSignatureGuess]
+        hasVariableStackLengthQuantifier = "???" in newSignatureRows
 
         for idx in range(startIdx, len(newSignatureGuess)):
-            if idx == startIdx or (
-                str(newSignatureGuess[idx - 1]) != "?"
-                and str(newSignatureGuess[idx - 1]) != "???"
-            ):
+            if idx == startIdx or newSignatureRows[idx - 1] not in _WILDCARDS:
                 # Inserting '?' after another '?' or '???' does not make a difference
                 # because it is equivalent to inserting it before that last wildcard
                 # itself.
 
                 newSignatureGuess.insert(idx, singleWildcardMatch)
+                newSignatureRows.insert(idx, "?")
 
                 # Check if we have a match with our modification
-                if StackFramesSymptom._match(stack, newSignatureGuess):
+                if matchTable.matches(newSignatureRows):
                     return (depth, newSignatureGuess)
 
                 # If we don't have a match but we're not at our current depth limit,
                 # add one more level of depth for our search.
                 if depth < maxDepth:
-                    (newBestDepth, newBestGuess) = StackFramesSymptom._diff(
-                        stack, newSignatureGuess, idx, depth + 1, maxDepth
+                    (newBestDepth, newBestGuess) = StackFramesSymptom._diffSearch(
+                        matchTable,
+                        newSignatureGuess,
+                        newSignatureRows,
+                        idx,
+                        depth + 1,
+                        maxDepth,
                     )
 
                     if newBestDepth is not None and (
@@ -394,22 +426,21 @@ class StackFramesSymptom(Symptom):
                         bestGuess = newBestGuess
 
                 newSignatureGuess.pop(idx)
+                newSignatureRows.pop(idx)
 
             # Now repeat the same with replacing instead of adding
             # unless the match at idx is a wildcard itself
 
-            if (
-                str(newSignatureGuess[idx]) == "?"
-                or str(newSignatureGuess[idx]) == "???"
-            ):
+            if newSignatureRows[idx] in _WILDCARDS:
                 continue
 
             newMatch = singleWildcardMatch
+            newRow = "?"
             if not hasVariableStackLengthQuantifier and len(stack) > idx:
                 # We can perform some optimizations here if we have a signature that
                 # does not contain any quantifiers that can match multiple stack frames.
 
-                if newSignatureGuess[idx].matches(stack[idx]):
+                if newSignatureRows[idx][idx]:
                     # Our frame matches, so it doesn't make sense to try and mess with
                     # it
                     continue
@@ -423,19 +454,27 @@ class StackFramesSymptom(Symptom):
                         # use the stack frame as new matcher to ensure a match without
                         # using a wildcard.
                         newMatch = StringMatch(stack[idx])
+                        newRow = matchTable.row(newMatch)
 
             origMatch = newSignatureGuess[idx]
+            origRow = newSignatureRows[idx]
             newSignatureGuess[idx] = newMatch
+            newSignatureRows[idx] = newRow
 
             # Check if we have a match with our modification
-            if StackFramesSymptom._match(stack, newSignatureGuess):
+            if matchTable.matches(newSignatureRows):
                 return (depth, newSignatureGuess)
 
             # If we don't have a match but we're not at our current depth limit,
             # add one more level of depth for our search.
             if depth < maxDepth:
-                (newBestDepth, newBestGuess) = StackFramesSymptom._diff(
-                    stack, newSignatureGuess, idx, depth + 1, maxDepth
+                (newBestDepth, newBestGuess) = StackFramesSymptom._diffSearch(
+                    matchTable,
+                    newSignatureGuess,
+                    newSignatureRows,
+                    idx,
+                    depth + 1,
+                    maxDepth,
                 )
 
                 if newBestDepth is not None and (
@@ -445,6 +484,7 @@ class StackFramesSymptom(Symptom):
                     bestGuess = newBestGuess
 
             newSignatureGuess[idx] = origMatch
+            newSignatureRows[idx] = origRow
 
         return (bestDepth, bestGuess)
 
@@ -492,3 +532,131 @@ class StackFramesSymptom(Symptom):
             elif not partialStack:
                 # Out of stack to match, reject
                 return False
+
+
+class _StackMatchTable:
+    """
+    Memoized matcher results for the frames of one stack, used by
+    L{StackFramesSymptom.diff}. Every function name in a signature is represented
+    by a row holding its result for each stack frame, or by the wildcard string
+    itself, so matching a candidate signature during the search is a dynamic
+    programming pass over (frame index, function name index) that does not call
+    any matcher again.
+    """
+
+    def __init__(self, stack):
+        self.stack = stack
+        self.rows = {}
+
+    def row(self, matcher):
+        """
+        @type matcher: StringMatch
+        @param matcher: A function name matcher of a signature
+
+        @rtype: tuple(bool) or str
+        @return: The result of the matcher for each stack frame, or the wildcard
+        """
+        value = str(matcher)
+        if value in _WILDCARDS:
+            return value
+
+        key = (value, matcher.isPCRE)
+        row = self.rows.get(key)
+        if row is None:
+            row = tuple(matcher.matches(frame) for frame in self.stack)
+            self.rows[key] = row
+        return row
+
+    def _frameCount(self, rows, extraFrames):
+        # Without '???', each entry consumes at most one frame, so frames past
+        # that can't be part of a match and we don't have to look at them.
+        if "???" in rows:
+            return len(self.stack)
+        return min(len(self.stack), len(rows) + extraFrames)
+
+    def matches(self, rows):
+        """
+        Equivalent of L{StackFramesSymptom._match} for a list of rows.
+
+        @type rows: list
+        @param rows: Rows as returned by L{row}
+
+        @rtype: bool
+        @return: True if the signature described by the rows matches the stack
+        """
+        frames = self._frameCount(rows, 0)
+
+        # matched[i] is True if the rows processed so far match stack[i:]
+        matched = [True] * (frames + 1)
+        for row in reversed(rows):
+            nextMatched = matched
+            if row == "?":
+                matched = [nextMatched[i] or nextMatched[i + 1] for i in range(frames)]
+                matched.append(nextMatched[frames])
+            elif row == "???":
+                matched = list(nextMatched)
+                for i in range(frames - 1, -1, -1):
+                    matched[i] = matched[i] or matched[i + 1]
+            else:
+                matched = [row[i] and nextMatched[i + 1] for i in range(frames)]
+                matched.append(False)
+        return matched[0]
+
+    def minEdits(self, rows, startIdx, maxEdits):
+        """
+        Compute a lower bound for the number of wildcards that have to be inserted
+        or replaced at or after startIdx for the signature to match the stack.
+
+        @type rows: list
+        @param rows: Rows as returned by L{row}
+
+        @type startIdx: int
+        @param startIdx: Index of the first row that may be modified
+
+        @type maxEdits: int
+        @param maxEdits: Number of edits we are interested in. Results above this
+                         are only guaranteed to be larger than maxEdits.
+
+        @rtype: int
+        @return: The lower bound
+        """
+        # Each edit consumes at most one more frame
+        frames = self._frameCount(rows, maxEdits)
+        unmatchable = len(rows) + frames + 1
+
+        # edits[i] is the minimum number of edits needed for the rows processed so
+        # far to match stack[i:]
+        edits = [0] * (frames + 1)
+        for idx in range(len(rows) - 1, -1, -1):
+            row = rows[idx]
+            nextEdits = edits
+            if row == "?":
+                edits = [a if a < b else b for a, b in zip(nextEdits, nextEdits[1:])]
+                edits.append(nextEdits[frames])
+            elif row == "???":
+                edits = list(nextEdits)
+                for i in range(frames - 1, -1, -1):
+                    if edits[i + 1] < edits[i]:
+                        edits[i] = edits[i + 1]
+            elif idx < startIdx:
+                edits = [b if m else unmatchable for m, b in zip(row, nextEdits[1:])]
+                edits.append(unmatchable)
+            else:
+                # Replacing the entry with a wildcard consumes up to one frame
+                edits = [
+                    (b if b <= a else a + 1) if m else (a if a < b else b) + 1
+                    for m, a, b in zip(row, nextEdits, nextEdits[1:])
+                ]
+                edits.append(nextEdits[frames] + 1)
+
+            if idx >= startIdx:
+                # Inserting wildcards before the entry consumes one frame each
+                for i in range(frames - 1, -1, -1):
+                    if edits[i + 1] + 1 < edits[i]:
+                        edits[i] = edits[i + 1] + 1
+
+            # None of the steps above can decrease the minimum
+            lowest = min(edits)
+            if lowest > maxEdits:
+                return lowest
+        return edits[0]
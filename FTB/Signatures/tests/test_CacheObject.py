@@ -0,0 +1,103 @@
+"""
+Tests for cache object serialization
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CacheObject import dumpCacheObject, isCompact, loadCacheObject
+from FTB.Signatures.CrashInfo import CrashInfo
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+
+def _cacheObject(**kwds):
+    obj = {
+        "backtrace": ["foo", "bar", "baz"],
+        "registers": {},
+        "crashAddress": None,
+        "crashInstruction": None,
+        "failureReason": None,
+    }
+    obj.update(kwds)
+    return obj
+
+
+@pytest.mark.parametrize(
+    "trace", ["trace_asan_segv.txt", "trace_gdb_sample_1.txt", "tsan-report.txt"]
+)
+def test_roundtrip_fixtures(trace):
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    lines = (FIXTURE_PATH / trace).read_text().splitlines()
+    crashInfo = CrashInfo.fromRawCrashData([], lines, config, auxCrashData=lines)
+    cacheObject = crashInfo.toCacheObject()
+
+    data = dumpCacheObject(cacheObject)
+    assert isCompact(data)
+    assert len(data) < len(json.dumps(cacheObject))
+    assert loadCacheObject(data) == cacheObject
+
+    restored = CrashInfo.fromRawCrashData([], lines, config, cacheObject=data)
+    fromJSON = CrashInfo.fromRawCrashData(
+        [], lines, config, cacheObject=json.loads(json.dumps(cacheObject))
+    )
+    assert restored.toCacheObject() == cacheObject
+    assert restored.createShortSignature() == fromJSON.createShortSignature()
+
+
+@pytest.mark.parametrize(
+    "cacheObject",
+    [
+        _cacheObject(),
+        _cacheObject(backtrace=[]),
+        _cacheObject(backtrace=["", "foo", ""]),
+        _cacheObject(backtrace=["recurse"] * 100 + ["main"]),
+        _cacheObject(registers={"rax": 0, "rip": 0xFFFFFFFFFFFFFFFF}),
+        _cacheObject(crashAddress=0),
+        _cacheObject(crashAddress=0x41414141, crashInstruction=""),
+        _cacheObject(crashInstruction="mov %eax, (%rbx)", failureReason="foo bar"),
+    ],
+)
+def test_roundtrip(cacheObject):
+    data = dumpCacheObject(cacheObject)
+    assert isCompact(data)
+    assert loadCacheObject(data) == cacheObject
+    assert loadCacheObject(data.encode("utf-8").decode("utf-8")) == cacheObject
+
+
+@pytest.mark.parametrize(
+    "cacheObject",
+    [
+        _cacheObject(backtrace=["foo\nbar"]),
+        _cacheObject(failureReason="multiple\nlines"),
+        _cacheObject(registers={"r a x": 1}),
+    ],
+)
+def test_json_fallback(cacheObject):
+    data = dumpCacheObject(cacheObject)
+    assert not isCompact(data)
+    assert json.loads(data) == cacheObject
+    assert loadCacheObject(data) == cacheObject
+
+
+def test_load_json():
+    cacheObject = _cacheObject(crashAddress=1)
+    data = dumpCacheObject(cacheObject, compact=False)
+    assert data == json.dumps(cacheObject)
+    assert loadCacheObject(data) == cacheObject
+
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData(
+        [], [], config, cacheObject=data.encode("utf-8")
+    )
+    assert crashInfo.backtrace == cacheObject["backtrace"]
+    assert crashInfo.crashAddress == 1
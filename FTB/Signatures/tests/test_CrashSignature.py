@@ -7,10 +7,13 @@ Created on Oct 9, 2014
 import json
 from pathlib import Path
 
+import pytest
+
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures.CrashInfo import CrashInfo
 from FTB.Signatures.CrashSignature import CrashSignature
-from FTB.Signatures.Matchers import StringMatch
+from FTB.Signatures.Matchers import NumberMatch, StringMatch
+from FTB.Signatures.ObjectCache import ObjectCache
 from FTB.Signatures.Symptom import OutputSymptom, StackFramesSymptom
 
 FIXTURE_PATH = Path(__file__).parent / "fixtures"
@@ -577,3 +580,49 @@ def test_SignatureSanitizerHardRssLimitHeapProfile():
     )
     assert testSig.symptoms[0].output.isPCRE
     assert isinstance(testSig.symptoms[1], StackFramesSymptom)
+
+
+def test_SignatureFromCacheTest():
+    rawSignature = (FIXTURE_PATH / "sig_test_stack_frames_1.json").read_text()
+
+    signature = CrashSignature.fromCache(rawSignature)
+    assert str(signature) == rawSignature
+    assert CrashSignature.fromCache(rawSignature) is signature
+    assert CrashSignature.fromCache(rawSignature + "\n") is not signature
+
+    # Invalid signatures aren't cached, they must fail every time
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="Invalid JSON"):
+            CrashSignature.fromCache("{")
+
+    # Identical matchers are shared between signatures
+    otherSignature = CrashSignature(
+        '{"symptoms": [{"type": "stackFrames", "functionNames": '
+        f'["{signature.symptoms[0].functionNames[0]}", "/^other$/"]}}]}}'
+    )
+    assert (
+        otherSignature.symptoms[0].functionNames[0]
+        is signature.symptoms[0].functionNames[0]
+    )
+    assert StringMatch.shared("/^other$/") is StringMatch.shared("/^other$/")
+    assert StringMatch.shared("/^other$/") is not StringMatch.shared("^other$")
+    assert NumberMatch.shared("> 0x10") is NumberMatch.shared("> 0x10")
+    assert NumberMatch.shared(16) is not NumberMatch.shared("16")
+
+
+def test_ObjectCacheBoundedTest():
+    cache = ObjectCache(2)
+    assert cache.get("a", lambda: ["a"]) == ["a"]
+    first = cache.get("b", lambda: ["b"])
+    assert cache.get("b", lambda: ["other"]) is first
+    cache.get("a", lambda: ["a"])
+    cache.get("c", lambda: ["c"])
+
+    # "b" was the least recently used entry
+    assert len(cache) == 2
+    assert cache.get("b", lambda: ["other"]) == ["other"]
+
+    cache.resize(0)
+    assert not len(cache)
+    assert cache.get("a", lambda: ["new"]) == ["new"]
+    assert not len(cache)
@@ -0,0 +1,290 @@
+"""
+Tests for the signature index
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+import random
+from pathlib import Path
+
+import pytest
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures import SignatureIndex as SignatureIndexModule
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.Matchers import StringMatch
+from FTB.Signatures.SignatureIndex import AhoCorasick, SignatureIndex
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+
+def _sig(symptoms, **kwds):
+    obj = {"symptoms": symptoms}
+    obj.update(kwds)
+    return CrashSignature(json.dumps(obj))
+
+
+def _frames(*names):
+    return {"type": "stackFrames", "functionNames": list(names)}
+
+
+SIGNATURES = {
+    1: _sig([_frames("foo", "bar")]),
+    2: _sig([_frames("?", "bar")]),
+    3: _sig([_frames("/^ba[rz]$/")]),
+    4: _sig([{"type": "stackFrame", "functionName": "baz"}]),
+    5: _sig([{"type": "stackFrame", "frameNumber": 1, "functionName": "bar"}]),
+    6: _sig([_frames("foo"), {"type": "crashAddress", "address": "< 0x100"}]),
+    7: _sig([_frames("foo"), {"type": "crashAddress", "address": "> 0xFF"}]),
+    8: _sig([_frames("oo")], platforms=["x86-64"]),
+    9: _sig([_frames("foo")], products=["other"]),
+    10: _sig([_frames("foo")], operatingSystems=["linux", "windows"]),
+    11: _sig([{"src": "stderr", "type": "output", "value": "/ERROR/"}]),
+    12: _sig([_frames("")]),
+    13: _sig([_frames("foo")], products=[]),
+    14: _sig([{"type": "crashAddress", "address": ""}]),
+    15: _sig([{"src": "stderr", "type": "output", "value": "boom"}]),
+    16: _sig([{"type": "output", "value": "/^ERROR: (boom|bang)$/"}]),
+    17: _sig([{"type": "output", "value": "/(?i)error/"}]),
+    18: _sig(
+        [
+            {"type": "output", "value": "ERROR"},
+            {"src": "stdout", "type": "output", "value": "WARNING"},
+        ]
+    ),
+}
+
+
+def _crash(frames, address=None, stderr=(), platform="x86-64"):
+    config = ProgramConfiguration("test", platform, "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], list(stderr), config)
+    crashInfo.backtrace = list(frames)
+    crashInfo.crashAddress = address
+    return crashInfo
+
+
+CRASHES = [
+    _crash(["foo", "bar"], 0x10),
+    _crash(["foo", "bar"], 0x1000, platform="x86"),
+    _crash(["bar", "foo"]),
+    _crash(["baz"], stderr=["ERROR: boom"]),
+    _crash(["foobar"], 0x0),
+    _crash([]),
+    _crash([], stderr=["ERROR: boom"]),
+    _crash(["x", "bar"], 0x20),
+    _crash(["x"], stderr=["error: boom"]),
+    _crash(["x"], stderr=["ERROR: bang", "WARNING"]),
+]
+
+
+def _index(signatures=SIGNATURES):
+    index = SignatureIndex()
+    for key, signature in signatures.items():
+        index.add(key, signature)
+    return index
+
+
+@pytest.mark.parametrize("crashInfo", CRASHES)
+@pytest.mark.parametrize("directLiterals", [0, 128])
+def test_SignatureIndexMatchesLinearScan(monkeypatch, crashInfo, directLiterals):
+    monkeypatch.setattr(SignatureIndexModule, "MAX_DIRECT_LITERALS", directLiterals)
+    index = _index()
+    expected = sorted(
+        (key for key, sig in SIGNATURES.items() if sig.matches(crashInfo)),
+        reverse=True,
+    )
+    assert expected == list(index.getMatches(crashInfo))
+    assert set(expected) <= index.getCandidates(crashInfo)
+
+
+def test_SignatureIndexPrefilter():
+    index = _index()
+    # Signatures not constraining the top frame are always candidates, unless
+    # excluded by another property (here, the crash address or the output)
+    assert index.getCandidates(_crash([], 0x10)) == {2, 5, 17}
+    assert index.getCandidates(_crash([])) == {2, 5, 14, 17}
+    assert index.getCandidates(_crash(["unrelated"], 0x10)) == {2, 5, 12, 17}
+
+
+def test_SignatureIndexPreferred():
+    index = _index()
+    crashInfo = _crash(["foo", "bar"], 0x10)
+    matches = list(index.getMatches(crashInfo, preferred={1, 6}))
+    assert matches[:2] == [6, 1]
+    assert sorted(matches[2:], reverse=True) == matches[2:]
+
+
+def test_SignatureIndexAddedOrder():
+    index = _index()
+    crashInfo = _crash(["foo", "bar"], 0x10)
+    matches = list(index.getMatches(crashInfo))
+    assert list(index.getMatches(crashInfo, addedOrder=True)) == [
+        key for key in index.signatures if key in matches
+    ]
+
+
+def test_SignatureIndexRemoveReplace():
+    index = _index()
+    crashInfo = _crash(["foo", "bar"], 0x10)
+    assert 1 in index.getCandidates(crashInfo)
+
+    index.remove(1)
+    assert 1 not in index
+    assert 1 not in index.getCandidates(crashInfo)
+    assert len(index) == len(SIGNATURES) - 1
+
+    index.add(1, _sig([_frames("qux")]))
+    assert 1 not in index.getCandidates(crashInfo)
+    assert 1 in index.getCandidates(_crash(["qux"]))
+
+    for key in SIGNATURES:
+        index.remove(key)
+    assert not len(index)
+    assert not index.getCandidates(crashInfo)
+    for subindex in index.indices:
+        assert not subindex.unconstrained
+
+
+def test_SignatureIndexOutputPrefilter():
+    index = _index()
+    assert index.getCandidates(_crash([], stderr=["ERROR: boom"])) == {
+        2,
+        5,
+        11,
+        14,
+        15,
+        16,
+        17,
+    }
+    # required literal of 18 is "WARNING", regardless of its source
+    assert index.getCandidates(_crash([], stderr=["WARNING"])) == {2, 5, 14, 17, 18}
+
+
+@pytest.mark.parametrize(
+    "value, literal",
+    [
+        ("abc", "abc"),
+        ("", None),
+        ("/ab.cde/", "cde"),
+        ("/a|bcd/", None),
+        ("/(?i)foo/", None),
+        ("/^Assertion failure: (x)/", "Assertion failure: "),
+        ("/foo\\.bar(baz)?qux/", "foo.bar"),
+        ("/[ab]+/", None),
+    ],
+)
+def test_StringMatchRequiredLiteral(value, literal):
+    assert StringMatch(value).getRequiredLiteral() == literal
+
+
+def test_AhoCorasick():
+    rng = random.Random(0)
+    for _ in range(50):
+        literals = {
+            "".join(rng.choice("abc") for _ in range(rng.randint(1, 5)))
+            for _ in range(rng.randint(1, 20))
+        }
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 40)))
+        expected = {literal for literal in literals if literal in text}
+        assert AhoCorasick(literals).findAll(text) == expected
+
+
+@pytest.mark.parametrize("directLiterals", [0, 128])
+def test_SignatureIndexOutputWindowsSlashes(monkeypatch, directLiterals):
+    monkeypatch.setattr(SignatureIndexModule, "MAX_DIRECT_LITERALS", directLiterals)
+    cfg_linux = ProgramConfiguration("test", "x86-64", "linux")
+    cfg_windows = ProgramConfiguration("test", "x86-64", "windows")
+    fs_lines = (
+        (FIXTURE_PATH / "trace_assertion_path_fwd_slash.txt").read_text().splitlines()
+    )
+    bs_lines = (
+        (FIXTURE_PATH / "trace_assertion_path_bwd_slash.txt").read_text().splitlines()
+    )
+
+    linux_sig = CrashInfo.fromRawCrashData(
+        [], [], cfg_linux, auxCrashData=fs_lines
+    ).createCrashSignature()
+    index = SignatureIndex()
+    index.add(1, linux_sig)
+
+    bs_windows = CrashInfo.fromRawCrashData([], [], cfg_windows, auxCrashData=bs_lines)
+    assert list(index.getMatches(bs_windows)) == [1]
+    bs_linux = CrashInfo.fromRawCrashData([], [], cfg_linux, auxCrashData=bs_lines)
+    assert not list(index.getMatches(bs_linux))
+
+
+def _randomFrameSignatures(rng, count):
+    names = ["f%d" % idx for idx in range(12)] + ["/^f1[01]$/", "f", "?", "???"]
+    signatures = {}
+    for key in range(count):
+        frames = [rng.choice(names) for _ in range(rng.randint(1, 7))]
+        symptoms = [_frames(*frames)]
+        if rng.random() < 0.3:
+            symptoms.append(_frames(rng.choice(names[:12])))
+        kwds = {}
+        if rng.random() < 0.3:
+            kwds["platforms"] = [rng.choice(["x86", "x86-64"])]
+        signatures[key] = _sig(symptoms, **kwds)
+    return signatures
+
+
+@pytest.mark.parametrize("directLiterals", [0, 128])
+def test_SignatureIndexNearestIsSuperset(monkeypatch, directLiterals):
+    monkeypatch.setattr(SignatureIndexModule, "MAX_DIRECT_LITERALS", directLiterals)
+    rng = random.Random(1)
+    signatures = dict(SIGNATURES)
+    signatures.update(
+        (key + 100, sig) for key, sig in _randomFrameSignatures(rng, 150).items()
+    )
+    index = _index(signatures)
+    crashes = list(CRASHES)
+    for _ in range(30):
+        crashes.append(
+            _crash(
+                ["f%d" % rng.randrange(12) for _ in range(rng.randint(0, 8))],
+                platform=rng.choice(["x86", "x86-64"]),
+            )
+        )
+
+    for crashInfo in crashes:
+        distances = {key: sig.getDistance(crashInfo) for key, sig in signatures.items()}
+        for maxDistance in (0, 2, 4):
+            nearest = index.getNearest(crashInfo, maxDistance)
+            assert len(nearest) == len(set(nearest))
+            assert {
+                key for key, distance in distances.items() if distance <= maxDistance
+            } <= set(nearest)
+        # the limit keeps the best ranked keys
+        nearest = index.getNearest(crashInfo, 4)
+        assert index.getNearest(crashInfo, 4, limit=5) == nearest[:5]
+
+
+def test_SignatureIndexNearestRanking():
+    index = _index(
+        {
+            1: _sig([_frames("a", "b", "c", "d", "e", "f")]),
+            2: _sig([_frames("a", "b", "x", "y", "z", "w")]),
+            3: _sig([_frames("a", "b", "c", "d", "e", "x")]),
+            4: _sig([_frames("a", "b", "c", "d", "e", "f")], platforms=["arm"]),
+            5: _sig([{"type": "output", "value": "boom"}]),
+        }
+    )
+    crashInfo = _crash(["a", "b", "c", "d", "e", "f", "g"])
+    # ties are broken by the number of matching function names
+    assert index.getNearest(crashInfo, 4) == [1, 5, 4, 3, 2]
+    assert index.getNearest(crashInfo, 3) == [1, 5, 4, 3]
+    assert index.getNearest(crashInfo, 0) == [1, 5]
+
+    index.remove(1)
+    index.remove(4)
+    assert index.getNearest(crashInfo, 4) == [5, 3, 2]
+    for key in (2, 3, 5):
+        index.remove(key)
+    assert not index.frameIndex.literals
+    assert not index.frameIndex.frameCounts
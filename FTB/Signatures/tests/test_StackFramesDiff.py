@@ -0,0 +1,209 @@
+"""
+Tests comparing StackFramesSymptom.diff against the original exhaustive search
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import random
+
+import pytest
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.Matchers import StringMatch
+from FTB.Signatures.Symptom import StackFramesSymptom
+
+
+def _referenceMatch(partialStack, partialFunctionNames):
+    while True:
+        while (
+            partialFunctionNames
+            and partialStack
+            and str(partialFunctionNames[0]) not in {"?", "???"}
+        ):
+            if not partialFunctionNames[0].matches(partialStack[0]):
+                return False
+            partialStack = partialStack[1:]
+            partialFunctionNames = partialFunctionNames[1:]
+
+        if not partialFunctionNames:
+            return True
+
+        if str(partialFunctionNames[0]) in {"?", "???"}:
+            if _referenceMatch(partialStack, partialFunctionNames[1:]):
+                return True
+            if not partialStack:
+                return False
+            partialStack = partialStack[1:]
+            if str(partialFunctionNames[0]) == "?":
+                partialFunctionNames = partialFunctionNames[1:]
+        elif not partialStack:
+            return False
+
+
+def _referenceDiff(stack, signatureGuess, startIdx, depth, maxDepth):
+    # The search as implemented before it was memoized and pruned
+    singleWildcardMatch = StringMatch("?")
+
+    newSignatureGuess = []
+    newSignatureGuess.extend(signatureGuess)
+
+    bestDepth = None
+    bestGuess = None
+
+    hasVariableStackLengthQuantifier = "???" in [str(x) for x in newSignatureGuess]
+
+    for idx in range(startIdx, len(newSignatureGuess)):
+        if idx == startIdx or (
+            str(newSignatureGuess[idx - 1]) != "?"
+            and str(newSignatureGuess[idx - 1]) != "???"
+        ):
+            newSignatureGuess.insert(idx, singleWildcardMatch)
+
+            if _referenceMatch(stack, newSignatureGuess):
+                return (depth, newSignatureGuess)
+
+            if depth < maxDepth:
+                (newBestDepth, newBestGuess) = _referenceDiff(
+                    stack, newSignatureGuess, idx, depth + 1, maxDepth
+                )
+                if newBestDepth is not None and (
+                    bestDepth is None or newBestDepth < bestDepth
+                ):
+                    bestDepth = newBestDepth
+                    bestGuess = newBestGuess
+
+            newSignatureGuess.pop(idx)
+
+        if str(newSignatureGuess[idx]) == "?" or str(newSignatureGuess[idx]) == "???":
+            continue
+
+        newMatch = singleWildcardMatch
+        if not hasVariableStackLengthQuantifier and len(stack) > idx:
+            if newSignatureGuess[idx].matches(stack[idx]):
+                continue
+            if not newSignatureGuess[idx].isPCRE:
+                if stack[idx] in str(newSignatureGuess[idx]):
+                    newMatch = StringMatch(stack[idx])
+
+        origMatch = newSignatureGuess[idx]
+        newSignatureGuess[idx] = newMatch
+
+        if _referenceMatch(stack, newSignatureGuess):
+            return (depth, newSignatureGuess)
+
+        if depth < maxDepth:
+            (newBestDepth, newBestGuess) = _referenceDiff(
+                stack, newSignatureGuess, idx, depth + 1, maxDepth
+            )
+            if newBestDepth is not None and (
+                bestDepth is None or newBestDepth < bestDepth
+            ):
+                bestDepth = newBestDepth
+                bestGuess = newBestGuess
+
+        newSignatureGuess[idx] = origMatch
+
+    return (bestDepth, bestGuess)
+
+
+def _randomCase(rng):
+    frames = ["a", "b", "c", "ab", "bc", "x"]
+    stack = [rng.choice(frames) for _ in range(rng.randint(0, 8))]
+
+    functionNames = []
+    for _ in range(rng.randint(1, 6)):
+        kind = rng.random()
+        if kind < 0.1:
+            functionNames.append("?")
+        elif kind < 0.2:
+            functionNames.append("???")
+        elif kind < 0.3:
+            functionNames.append("/^[ab]$/")
+        elif kind < 0.4:
+            functionNames.append("abc")
+        else:
+            functionNames.append(rng.choice(frames))
+    return (stack, functionNames)
+
+
+def _referenceDiffSymptom(stack, functionNames):
+    if _referenceMatch(stack, functionNames):
+        return (0, None)
+    for depth in range(1, 4):
+        (bestDepth, bestGuess) = _referenceDiff(stack, functionNames, 0, 1, depth)
+        if bestDepth is not None:
+            guessedFunctionNames = [repr(x) for x in bestGuess]
+            while guessedFunctionNames and guessedFunctionNames[-1] in ("?", "???"):
+                guessedFunctionNames.pop()
+            if not guessedFunctionNames:
+                return (None, None)
+            return (bestDepth, guessedFunctionNames)
+    return (None, None)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_StackFramesDiffMatchesReference(seed):
+    rng = random.Random(seed)
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], [], config)
+
+    for _ in range(150):
+        (stack, functionNames) = _randomCase(rng)
+        symptom = StackFramesSymptom(
+            {"type": "stackFrames", "functionNames": functionNames}
+        )
+        crashInfo.backtrace = stack
+
+        for maxDepth in range(1, 4):
+            (expectedDepth, expectedGuess) = _referenceDiff(
+                stack, symptom.functionNames, 0, 1, maxDepth
+            )
+            (actualDepth, actualGuess) = StackFramesSymptom._diff(
+                stack, symptom.functionNames, 0, 1, maxDepth
+            )
+            assert actualDepth == expectedDepth
+            if expectedGuess is None:
+                assert actualGuess is None
+            else:
+                assert [repr(x) for x in actualGuess] == [
+                    repr(x) for x in expectedGuess
+                ]
+
+        (expectedDepth, expectedNames) = _referenceDiffSymptom(
+            stack, symptom.functionNames
+        )
+        (actualDepth, actualSymptom) = symptom.diff(crashInfo)
+        assert actualDepth == expectedDepth
+        if expectedNames is None:
+            assert actualSymptom is None
+        else:
+            assert [repr(x) for x in actualSymptom.functionNames] == expectedNames
+
+
+def test_StackFramesDiffProposedSignature():
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], [], config)
+    crashInfo.backtrace = ["js::a", "js::inlined", "js::b", "js::c", "js::x"]
+
+    signature = CrashSignature(
+        '{"symptoms": [{"type": "stackFrames", '
+        '"functionNames": ["js::a", "js::b", "js::c", "js::d"]}]}'
+    )
+    assert not signature.matches(crashInfo)
+    assert signature.getDistance(crashInfo) == 2
+
+    (depth, proposed) = signature.symptoms[0].diff(crashInfo)
+    assert depth == 2
+    assert [repr(x) for x in proposed.functionNames] == [
+        "js::a",
+        "?",
+        "js::b",
+        "js::c",
+    ]
+    assert proposed.matches(crashInfo)
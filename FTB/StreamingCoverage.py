@@ -0,0 +1,457 @@
+"""
+StreamingCoverage -- Merge server-side coverage without loading it completely
+
+Coverage trees are processed as a stream of nodes (see L{iter_json} and
+ColumnarCoverage.iter_nodes), depth-first with each directory following its
+children, so only the line coverage of a single file has to be in memory at
+any time. L{CoverageAccumulator} merges such streams the same way as
+CoverageHelper.merge_coverage_data, but keeps the merged line coverage in a
+temporary SQLite database instead of memory.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+import marshal
+import os
+import re
+import sqlite3
+import tempfile
+import zlib
+
+from FTB import ColumnarCoverage
+from FTB.CoverageHelper import count_lines, merge_lines, summary_fields
+
+_WHITESPACE = " \t\n\r"
+_SCALAR_END = re.compile(r"[,}\]\s]")
+
+
+class _JSONNodeReader:
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Read at least as much as is still buffered, so values spanning many
+        # chunks are only decoded a logarithmic number of times
+        if self.eof:
+            return False
+        data = self.fp.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + data
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buf):
+                if self.buf[self.pos] not in _WHITESPACE:
+                    return self.buf[self.pos]
+                self.pos += 1
+            if not self._fill():
+                raise ValueError("Unexpected end of coverage data")
+
+    def _consume(self, char):
+        if self._peek() != char:
+            return False
+        self.pos += 1
+        return True
+
+    def _expect(self, char):
+        if not self._consume(char):
+            raise ValueError(
+                f"Expected {char!r} in coverage data, got {self.buf[self.pos]!r}"
+            )
+
+    def _value(self):
+        if self._peek() not in '"[{':
+            # Numbers can be decoded from a prefix of themselves, make sure
+            # scalars are complete in the buffer
+            while _SCALAR_END.search(self.buf, self.pos) is None and self._fill():
+                pass
+        while True:
+            try:
+                (value, end) = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise ValueError("Invalid coverage data")
+                continue
+            self.pos = end
+            return value
+
+    def _string(self):
+        if self._peek() != '"':
+            raise ValueError("Expected a name in coverage data")
+        return self._value()
+
+    def node(self, names):
+        self._expect("{")
+        isDirectory = False
+        coverage = None
+        if not self._consume("}"):
+            while True:
+                key = self._string()
+                self._expect(":")
+                if key == "children":
+                    isDirectory = True
+                    yield from self._children(names)
+                elif key == "coverage":
+                    coverage = self._value()
+                    if not isinstance(coverage, list):
+                        raise ValueError(f"Invalid coverage of {'/'.join(names)!r}")
+                else:
+                    self._value()
+                if self._consume("}"):
+                    break
+                self._expect(",")
+
+        if isDirectory:
+            yield (names, None)
+        elif coverage is None:
+            raise ValueError(f"Missing coverage of {'/'.join(names)!r}")
+        else:
+            yield (names, coverage)
+
+    def _children(self, names):
+        self._expect("{")
+        if self._consume("}"):
+            return
+        while True:
+            name = self._string()
+            self._expect(":")
+            yield from self.node(names + (name,))
+            if self._consume("}"):
+                return
+            self._expect(",")
+
+    def end(self):
+        while True:
+            while self.pos < len(self.buf):
+                if self.buf[self.pos] not in _WHITESPACE:
+                    raise ValueError("Extra data after coverage")
+                self.pos += 1
+            if not self._fill():
+                return
+
+
+def iter_json(fp, chunk_size=1 << 16):
+    """
+    Incrementally parse coverage in server-side JSON format.
+
+    @type fp: file
+    @param fp: Text file containing the coverage
+
+    @type chunk_size: int
+    @param chunk_size: Number of characters to read at once
+
+    @rtype: iterator(tuple(tuple(str), list(int)))
+    @return: All nodes depth-first, each directory after its children, as
+             tuples (names, coverage). The names are the path components of
+             the node and coverage is None for directories. Summary fields
+             are skipped.
+
+    @raise ValueError: If the data is not valid coverage
+    """
+    reader = _JSONNodeReader(fp, chunk_size)
+    yield from reader.node(())
+    reader.end()
+
+
+class CoverageAccumulator:
+    """
+    Merges coverage trees into a temporary database, with the same result as
+    merging them in order with CoverageHelper.merge_coverage_data. Only the
+    structure of the merged tree is kept in memory.
+
+    The work can be split between several accumulators (e.g. in different
+    processes) that each merge the same trees, but only the files of their
+    partition, see L{combine}. Pickling an accumulator hands its database
+    over to the unpickled copy, only one of them may be closed. L{detach} and
+    L{attach} do the same through JSON-serializable data.
+    """
+
+    def __init__(self, directory=None, partition=None):
+        """
+        @type directory: str
+        @param directory: Where to create the database, defaults to the
+                          system temporary directory
+
+        @type partition: tuple(int, int)
+        @param partition: Index of the partition of this accumulator and the
+                          number of partitions, if only a part of the files
+                          should be merged
+        """
+        (fd, self.path) = tempfile.mkstemp(suffix=".sqlite", dir=directory)
+        os.close(fd)
+        self._connect()
+        self.db.execute("CREATE TABLE leaves (id INTEGER PRIMARY KEY, coverage BLOB)")
+
+        # Directories are dicts, leaves are their id in the database. Leaves
+        # of other partitions are 0, so all partitions have the same structure.
+        self.root = {}
+        self.leafCount = 0
+        self.partition = partition
+
+    def _connect(self):
+        # Unpickling may happen in another thread than the one using the
+        # accumulator (e.g. the result handler of a process pool)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+
+    def __getstate__(self):
+        self.db.commit()
+        state = self.__dict__.copy()
+        del state["db"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._connect()
+
+    def detach(self):
+        """
+        Hand the database over to another process, e.g. as the result of a
+        Celery task. The accumulator can't be used afterwards.
+
+        @rtype: dict
+        @return: JSON-serializable state for L{attach}
+        """
+        state = self.__getstate__()
+        self.db.close()
+        self.db = None
+        return state
+
+    @classmethod
+    def attach(cls, state):
+        """
+        @type state: dict
+        @param state: The result of L{detach}
+
+        @rtype: CoverageAccumulator
+        @return: The accumulator using the handed over database
+        """
+        accumulator = cls.__new__(cls)
+        accumulator.__setstate__(state)
+        return accumulator
+
+    def _owns(self, names):
+        if self.partition is None:
+            return True
+        (index, count) = self.partition
+        return zlib.crc32("/".join(names).encode("utf-8")) % count == index
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            os.unlink(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self, leaf):
+        (data,) = self.db.execute(
+            "SELECT coverage FROM leaves WHERE id = ?", (leaf,)
+        ).fetchone()
+        return marshal.loads(data)
+
+    def add(self, nodes):
+        """
+        Merge a coverage tree into the accumulated coverage.
+
+        @type nodes: iterator(tuple(tuple(str), list(int)))
+        @param nodes: The coverage to merge, see L{iter_json}
+
+        @rtype: dict
+        @return: Warning counters, see CoverageHelper.merge_coverage_data
+
+        @raise ValueError: If a node is a directory in one tree and a leaf in
+                           the other
+        """
+        stats = {
+            "null_coverable_count": 0,
+            "length_mismatch_count": 0,
+            "coverable_mismatch_count": 0,
+        }
+
+        try:
+            for names, coverage in nodes:
+                if not names:
+                    if coverage is not None:
+                        raise ValueError("Coverage root must be a directory")
+                    continue
+
+                parent = self.root
+                for name in names[:-1]:
+                    parent = parent.setdefault(name, {})
+                    if not isinstance(parent, dict):
+                        raise ValueError(f"{name!r} is a file and a directory")
+
+                name = names[-1]
+                node = parent.get(name)
+                if coverage is None:
+                    if node is None:
+                        parent[name] = {}
+                    elif not isinstance(node, dict):
+                        raise ValueError(f"{name!r} is a file and a directory")
+                elif node is None:
+                    if not self._owns(names):
+                        parent[name] = 0
+                        continue
+                    self.leafCount += 1
+                    parent[name] = self.leafCount
+                    self.db.execute(
+                        "INSERT INTO leaves VALUES (?, ?)",
+                        (self.leafCount, marshal.dumps(coverage)),
+                    )
+                elif isinstance(node, dict):
+                    raise ValueError(f"{name!r} is a file and a directory")
+                elif node:
+                    merged = merge_lines(self._read(node), coverage, stats)
+                    self.db.execute(
+                        "UPDATE leaves SET coverage = ? WHERE id = ?",
+                        (marshal.dumps(merged), node),
+                    )
+        finally:
+            self.db.commit()
+
+        return stats
+
+    @classmethod
+    def combine(cls, parts, directory=None):
+        """
+        Combine accumulators that merged the same trees, one for each
+        partition, into a single accumulator holding the complete result.
+
+        @type parts: list(CoverageAccumulator)
+        @param parts: Accumulators of all partitions, they are not modified
+
+        @type directory: str
+        @param directory: Where to create the database of the result
+
+        @rtype: CoverageAccumulator
+        @return: The combined accumulator, must be closed after use
+        """
+        result = cls(directory)
+        try:
+            result.root = result._combine([part.root for part in parts], parts)
+            result.db.commit()
+        except BaseException:
+            result.close()
+            raise
+        return result
+
+    def _combine(self, nodes, parts):
+        # All partitions have the same structure, in the same order
+        result = {}
+        for name, child in nodes[0].items():
+            children = [node[name] for node in nodes]
+            if isinstance(child, dict):
+                result[name] = self._combine(children, parts)
+                continue
+
+            (owner, leaf) = next((i, x) for i, x in enumerate(children) if x)
+            (data,) = (
+                parts[owner]
+                .db.execute("SELECT coverage FROM leaves WHERE id = ?", (leaf,))
+                .fetchone()
+            )
+            self.leafCount += 1
+            result[name] = self.leafCount
+            self.db.execute("INSERT INTO leaves VALUES (?, ?)", (self.leafCount, data))
+        return result
+
+    def _structure(self, node):
+        # Structure for ColumnarCoverage.dump_stream, and whether any line
+        # coverage needs 64-bit integers.
+        result = {}
+        wide = False
+        for name, child in node.items():
+            if isinstance(child, dict):
+                (result[name], childWide) = self._structure(child)
+                wide = wide or childWide
+            else:
+                coverage = self._read(child)
+                (total, covered) = count_lines(coverage)
+                result[name] = (child, len(coverage), total, covered)
+                if coverage and not wide:
+                    wide = min(coverage) < -(2**31) or max(coverage) >= 2**31
+        return (result, wide)
+
+    def dump_columnar(self, fp):
+        """
+        Write the merged coverage in the columnar format.
+
+        @type fp: file
+        @param fp: Binary file to write to
+
+        @raise ValueError: If the coverage can't be stored in the columnar
+                           format. Parts of the data may have been written
+                           already in that case.
+        """
+        (structure, wide) = self._structure(self.root)
+        ColumnarCoverage.dump_stream(fp, structure, self._read, wide=wide)
+
+    def dump_json(self, fp):
+        """
+        Write the merged coverage in the server-side JSON format, including
+        the summary fields.
+
+        @type fp: file
+        @param fp: Binary file to write to
+        """
+        (structure, _) = self._structure(self.root)
+        self._dump_json(fp, None, structure)
+
+    def _dump_json(self, fp, name, node):
+        if isinstance(node, dict):
+            totals = self._totals(node)
+        else:
+            totals = (node[2], node[3])
+
+        fields = {"name": name}
+        fields.update(summary_fields(*totals))
+        fp.write(json.dumps(fields, separators=(",", ":"))[:-1].encode("utf-8"))
+
+        if not isinstance(node, dict):
+            fp.write(b',"coverage":')
+            fp.write(
+                json.dumps(self._read(node[0]), separators=(",", ":")).encode("utf-8")
+            )
+            fp.write(b"}")
+            return
+
+        fp.write(b',"children":{')
+        for idx, (childName, child) in enumerate(node.items()):
+            if idx:
+                fp.write(b",")
+            fp.write(json.dumps(childName).encode("utf-8"))
+            fp.write(b":")
+            self._dump_json(fp, childName, child)
+        fp.write(b"}}")
+
+    def _totals(self, node):
+        total = 0
+        covered = 0
+        for child in node.values():
+            if isinstance(child, dict):
+                (childTotal, childCovered) = self._totals(child)
+            else:
+                (childTotal, childCovered) = (child[2], child[3])
+            total += childTotal
+            covered += childCovered
+        return (total, covered)
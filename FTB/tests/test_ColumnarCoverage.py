@@ -0,0 +1,112 @@
+"""
+Tests for the columnar coverage format
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import copy
+import json
+
+import pytest
+
+from FTB import ColumnarCoverage, CoverageHelper
+
+
+def _tree():
+    tree = {
+        "children": {
+            "topdir1": {
+                "children": {
+                    "subdir1": {
+                        "children": {
+                            "file1.c": {"coverage": [-1, -1, 12, 12, 10, 2, 0, 0, -1]},
+                            "file2.c": {"coverage": [-1, 20, 20, 15, 15, 15, 15, 0]},
+                        }
+                    },
+                    "file3.c": {"coverage": [0, 0, -1, 3]},
+                }
+            },
+            "": {"children": {"\u00e4.c": {"coverage": []}}},
+            "topdir2": {"children": {}},
+        }
+    }
+    CoverageHelper.calculate_summary_fields(tree)
+    return tree
+
+
+def _strip(node):
+    if "children" in node:
+        for child in node["children"].values():
+            _strip(child)
+    else:
+        del node["coverage"]
+
+
+def test_ColumnarCoverageRoundtrip(tmp_path):
+    tree = _tree()
+    data = ColumnarCoverage.dumps(tree)
+    assert ColumnarCoverage.is_columnar(data)
+    assert not ColumnarCoverage.is_columnar(json.dumps(tree).encode("utf-8"))
+
+    assert ColumnarCoverage.ColumnarCoverage(data).tree() == tree
+
+    path = tmp_path / "test.coverage"
+    path.write_bytes(data)
+    with ColumnarCoverage.ColumnarCoverage.open(str(path)) as coverage:
+        assert coverage.tree() == tree
+
+
+def test_ColumnarCoverageSubset():
+    tree = _tree()
+    coverage = ColumnarCoverage.ColumnarCoverage(ColumnarCoverage.dumps(tree))
+
+    assert coverage.find([]) == 0
+    assert coverage.find(["topdir3"]) is None
+    assert coverage.find(["topdir1", "subdir1", "file1.c", "x"]) is None
+
+    idx = coverage.find(["topdir1", "subdir1", "file1.c"])
+    expected = tree["children"]["topdir1"]["children"]["subdir1"]["children"]
+    assert coverage.node(idx) == expected["file1.c"]
+    # Leaves requested directly keep their coverage
+    assert coverage.node(idx, strip=True) == expected["file1.c"]
+
+    idx = coverage.find(["topdir1"])
+    expected = copy.deepcopy(tree["children"]["topdir1"])
+    assert coverage.node(idx) == expected
+    _strip(expected)
+    assert coverage.node(idx, strip=True) == expected
+
+    assert coverage.node(coverage.find(["", "\u00e4.c"]))["coverage"] == []
+    assert coverage.node(coverage.find(["topdir2"])) == tree["children"]["topdir2"]
+
+
+def test_ColumnarCoverageSummaries():
+    # Missing summary fields are calculated, large values stored as int64
+    tree = {"children": {"a.c": {"coverage": [-1, 0, 2**40]}}}
+    coverage = ColumnarCoverage.ColumnarCoverage(ColumnarCoverage.dumps(tree))
+    assert coverage.itemSize == 8
+
+    expected = copy.deepcopy(tree)
+    CoverageHelper.calculate_summary_fields(expected)
+    assert coverage.tree() == expected
+
+
+@pytest.mark.parametrize(
+    "tree",
+    [
+        {"children": []},
+        {"children": {"a.c": {"coverage": [1.5]}}},
+        {"children": {"a.c": {"coverage": [2**64]}}},
+        {"children": {"a.c": {"coverage": [1], "other": True}}},
+        {"children": {"a.c": {"name": "b.c", "coverage": [1]}}},
+        {"children": {"a.c": {"coverage": [1], "linesMissed": 3}}},
+        {"children": {"a.c": {}}},
+    ],
+)
+def test_ColumnarCoverageUnsupported(tree):
+    with pytest.raises(ValueError):
+        ColumnarCoverage.dumps(tree)
@@ -12,7 +12,11 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 @contact:    choller@mozilla.com
 """
 
+import copy
 import json
+import random
+
+import pytest
 
 from FTB import CoverageHelper
 
@@ -237,3 +241,71 @@ def test_CoverageHelperApplyDirectivesMakeEmpty():
     expected_names = []
 
     assert result == set(expected_names)
+
+
+def test_CoverageHelperDirectiveSummaries():
+    node = json.loads(covdata)
+    CoverageHelper.calculate_summary_fields(node)
+    original = copy.deepcopy(node)
+
+    directive_sets = [
+        [],
+        ["-:**"],
+        ["-:**", "+:topdir2/subdir1/**"],
+        ["-:topdir1/subdir1/**", "-:topdir1/subdir2/**"],
+        [
+            "-:topdir1/subdir1/**",
+            "+:topdir1/subdir?/file1.c",
+            "+:topdir1/subdir?/file3.c",
+            "-:topdir1/subdir2/**",
+        ],
+        ["-:**/file1.c", "# comment", ""],
+        ["-:**", "+:**/subdir1/**", "-:topdir2/**"],
+        ["+:topdir1/*/file2.c", "-:**/subdir2/**"],
+    ]
+
+    summaries = CoverageHelper.calculate_directive_summaries(node, directive_sets)
+    assert node == original
+
+    for directives, summary in zip(directive_sets, summaries):
+        expected = copy.deepcopy(original)
+        CoverageHelper.apply_include_exclude_directives(expected, directives)
+        CoverageHelper.calculate_summary_fields(expected)
+        del expected["children"]
+        del expected["name"]
+        assert summary == expected
+
+
+def _random_tree(rng, names, length):
+    children = {}
+    for name in names:
+        if rng.random() < 0.3:
+            continue
+        lines = length + rng.choice((0, 0, 0, -3, 5))
+        choice = rng.random()
+        if choice < 0.1:
+            coverage = [-1] * lines
+        else:
+            coverage = [rng.choice((-1, -1, 0, 0, 1, 7, 2**40)) for _ in range(lines)]
+        children[name] = {"coverage": coverage}
+    return {"name": None, "children": {"dir": {"name": "dir", "children": children}}}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_CoverageHelperMergeNumpy(monkeypatch, seed):
+    pytest.importorskip("numpy")
+    rng = random.Random(seed)
+    names = [f"file{idx}.c" for idx in range(20)]
+    r = _random_tree(rng, names, 100)
+    s = _random_tree(rng, names, 100)
+    CoverageHelper.calculate_summary_fields(r)
+    CoverageHelper.calculate_summary_fields(s)
+
+    expected = copy.deepcopy(r)
+    with monkeypatch.context() as ctx:
+        ctx.setattr(CoverageHelper, "numpy", None)
+        expected_stats = CoverageHelper.merge_coverage_data(expected, copy.deepcopy(s))
+
+    stats = CoverageHelper.merge_coverage_data(r, s)
+    assert stats == expected_stats
+    assert json.dumps(r, sort_keys=True) == json.dumps(expected, sort_keys=True)
@@ -0,0 +1,198 @@
+"""
+Tests for streaming coverage merges
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import copy
+import io
+import json
+import pickle
+import random
+
+import pytest
+
+from FTB import ColumnarCoverage, CoverageHelper, StreamingCoverage
+
+
+def _random_tree(rng, depth=0):
+    children = {}
+    for idx in range(rng.randint(0, 4)):
+        if depth < 2 and rng.random() < 0.4:
+            children[f"dir{idx}"] = _random_tree(rng, depth + 1)
+        else:
+            lines = rng.choice((0, 3, 10, 100))
+            children[f"file{idx}.c"] = {
+                "coverage": [rng.choice((-1, 0, 1, 5, 2**40)) for _ in range(lines)]
+            }
+    if depth == 0 and rng.random() < 0.5:
+        children[""] = {"children": {"ä.c": {"coverage": [rng.choice((-1, 1))]}}}
+    return {"children": children}
+
+
+def _merge(trees):
+    trees = copy.deepcopy(trees)
+    result = trees[0]
+    CoverageHelper.calculate_summary_fields(result)
+    stats = []
+    for tree in trees[1:]:
+        CoverageHelper.calculate_summary_fields(tree)
+        stats.append(CoverageHelper.merge_coverage_data(result, tree))
+    return (result, stats)
+
+
+def _order(node):
+    # Dicts compare equal regardless of order, the order of children matters
+    if "children" not in node:
+        return None
+    return [(name, _order(child)) for name, child in node["children"].items()]
+
+
+def _iter_json(tree, chunk_size):
+    return StreamingCoverage.iter_json(io.StringIO(json.dumps(tree)), chunk_size)
+
+
+def test_IterJSON():
+    tree = {
+        "linesTotal": 2,
+        "coveragePercent": 33.33,
+        "children": {
+            "a": {"children": {"b.c": {"coverage": [1, -1], "name": "b.c"}}},
+            "e": {"children": {}},
+            "c.c": {"name": "c.c", "coverage": []},
+        },
+        "name": None,
+    }
+    expected = [
+        (("a", "b.c"), [1, -1]),
+        (("a",), None),
+        (("e",), None),
+        (("c.c",), []),
+        ((), None),
+    ]
+    # Small chunks split numbers, names and arrays in all possible places
+    for chunk_size in list(range(1, 20)) + [1 << 16]:
+        assert list(_iter_json(tree, chunk_size)) == expected
+
+    del tree["coveragePercent"]
+    with ColumnarCoverage.ColumnarCoverage(ColumnarCoverage.dumps(tree)) as coverage:
+        assert list(coverage.iter_nodes()) == expected
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        "",
+        "[]",
+        '{"children": {"a.c": {}}}',
+        '{"children": {"a.c": {"coverage": 1}}}',
+        '{"children": {"a.c": {"coverage": [1, 2}}}',
+        '{"children": {}} {}',
+        '{"children": {"a.c": {"coverage": [1]}}',
+    ],
+)
+def test_IterJSONInvalid(data):
+    with pytest.raises(ValueError):
+        list(StreamingCoverage.iter_json(io.StringIO(data), 4))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_CoverageAccumulator(seed, tmp_path):
+    rng = random.Random(seed)
+    base = _random_tree(rng)
+    # Make the trees overlap, so leaves are actually merged
+    trees = [base] + [
+        rng.choice((copy.deepcopy(base), _random_tree(rng))) for _ in range(3)
+    ]
+    for tree in trees[1:]:
+        for child in tree["children"].values():
+            if "coverage" in child and rng.random() < 0.5:
+                child["coverage"].append(rng.choice((-1, 0, 2)))
+
+    (expected, expected_stats) = _merge(trees)
+
+    with StreamingCoverage.CoverageAccumulator(str(tmp_path)) as accumulator:
+        stats = [
+            accumulator.add(_iter_json(tree, rng.choice((3, 100)))) for tree in trees
+        ]
+        assert stats[1:] == expected_stats
+
+        out = io.BytesIO()
+        accumulator.dump_json(out)
+        result = json.loads(out.getvalue())
+        assert result == expected
+        assert _order(result) == _order(expected)
+
+        out = io.BytesIO()
+        accumulator.dump_columnar(out)
+        result = ColumnarCoverage.ColumnarCoverage(out.getvalue()).tree()
+        assert result == expected
+        assert _order(result) == _order(expected)
+
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_CoverageAccumulatorPartitions(seed, tmp_path):
+    rng = random.Random(seed)
+    base = _random_tree(rng)
+    trees = [base] + [
+        rng.choice((copy.deepcopy(base), _random_tree(rng))) for _ in range(3)
+    ]
+    (expected, expected_stats) = _merge(trees)
+
+    count = rng.randint(1, 4)
+    parts = []
+    stats = []
+    for idx in range(count):
+        part = StreamingCoverage.CoverageAccumulator(str(tmp_path), (idx, count))
+        stats.append([part.add(_iter_json(tree, 100)) for tree in trees])
+        # Partitions are handed over between processes by pickling or as
+        # the JSON result of a task
+        if idx % 2:
+            parts.append(pickle.loads(pickle.dumps(part)))
+        else:
+            state = json.loads(json.dumps(part.detach()))
+            parts.append(StreamingCoverage.CoverageAccumulator.attach(state))
+
+    for idx, collection_stats in enumerate(expected_stats, 1):
+        for x in collection_stats:
+            assert collection_stats[x] == sum(part[idx][x] for part in stats)
+
+    with StreamingCoverage.CoverageAccumulator.combine(
+        parts, str(tmp_path)
+    ) as accumulator:
+        out = io.BytesIO()
+        accumulator.dump_json(out)
+        result = json.loads(out.getvalue())
+        assert result == expected
+        assert _order(result) == _order(expected)
+
+    for part in parts:
+        part.close()
+    assert not list(tmp_path.iterdir())
+
+
+def test_CoverageAccumulatorConflict(tmp_path):
+    with StreamingCoverage.CoverageAccumulator(str(tmp_path)) as accumulator:
+        accumulator.add(_iter_json({"children": {"a": {"coverage": [1]}}}, 100))
+        with pytest.raises(ValueError):
+            accumulator.add(_iter_json({"children": {"a": {"children": {}}}}, 100))
+
+
+def test_CoverageAccumulatorUnsupported(tmp_path):
+    # Coverage that doesn't fit the columnar format can still be written as JSON
+    tree = {"children": {"a.c": {"coverage": [2**70, 1.5]}}}
+    with StreamingCoverage.CoverageAccumulator(str(tmp_path)) as accumulator:
+        accumulator.add(_iter_json(tree, 100))
+        with pytest.raises(ValueError):
+            accumulator.dump_columnar(io.BytesIO())
+
+        out = io.BytesIO()
+        accumulator.dump_json(out)
+        CoverageHelper.calculate_summary_fields(tree)
+        assert json.loads(out.getvalue()) == tree
@@ -1008,6 +1008,14 @@ def main(argv=None):
     fmGroup.add_argument(
         "--sigdir", dest="sigdir", help="Signature cache directory", metavar="DIR"
     )
+    fmGroup.add_argument(
+        "--dedup-submissions",
+        dest="dedup_submissions",
+        type=int,
+        help="Only submit the first N occurrences of each new crash in full and "
+        "count the rest (requires --sigdir)",
+        metavar="N",
+    )
 
     aflGroup.add_argument(
         "--test-file",
@@ -1895,7 +1903,20 @@ def main(argv=None):
                         forceCrashInstruction=False,
                         numFrames=8,
                     )
-                    collector.submit(crashInfo, testcase)
+                    if opts.dedup_submissions:
+                        result = collector.submit_deduplicated(
+                            crashInfo,
+                            testcase,
+                            fullSubmissions=opts.dedup_submissions,
+                        )
+                        if result is None:
+                            print(
+                                "Crash was submitted before, counted it.",
+                                file=sys.stderr,
+                            )
+                            continue
+                    else:
+                        collector.submit(crashInfo, testcase)
                     print("Successfully submitted crash.", file=sys.stderr)
         finally:
             try:
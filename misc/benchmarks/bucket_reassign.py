@@ -0,0 +1,129 @@
+"""
+Benchmark reassigning all crashes to a bucket with the sequential (paged)
+Bucket.reassign used by the web UI against Bucket.reassign_parallel.
+
+This creates a throwaway sqlite database in a temporary directory, so results
+are only indicative of the matching speedup. Sqlite serializes all writes.
+
+Example:
+    python misc/benchmarks/bucket_reassign.py --crashes 20000 --processes 4
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+SERVER = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "server")
+
+
+def setup_django(path):
+    sys.path.insert(0, os.path.abspath(SERVER))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings_test")
+
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = os.path.join(path, "db.sqlite3")
+    settings.DATABASES["default"]["OPTIONS"] = {"timeout": 60}
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def create_crashes(count):
+    from crashmanager.models import OS, Client, CrashEntry, Platform, Product, Tool
+    from FTB.ProgramConfiguration import ProgramConfiguration
+    from FTB.Signatures.CrashInfo import CrashInfo
+
+    defaults = {
+        "client": Client.objects.create(name="client"),
+        "os": OS.objects.create(name="linux"),
+        "platform": Platform.objects.create(name="x86-64"),
+        "product": Product.objects.create(name="product"),
+        "tool": Tool.objects.create(name="tool"),
+    }
+    config = ProgramConfiguration("product", "x86-64", "linux")
+    entries = []
+    for idx in range(count):
+        stderr = [f"line {line}" for line in range(50)]
+        stderr.append(f"Assertion failure: condition #{idx % 10}")
+        crashInfo = CrashInfo.fromRawCrashData([], stderr, config)
+        entries.append(
+            CrashEntry(
+                rawStderr="\n".join(stderr),
+                cachedCrashInfo=json.dumps(crashInfo.toCacheObject()),
+                shortSignature=crashInfo.createShortSignature(),
+                triagedOnce=True,
+                **defaults,
+            )
+        )
+    CrashEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--crashes", type=int, default=10000)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    opts = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as path:
+        setup_django(path)
+        from crashmanager.models import Bucket, BucketHit, CrashEntry
+
+        create_crashes(opts.crashes)
+        bucket = Bucket.objects.create(
+            signature=json.dumps(
+                {
+                    "symptoms": [
+                        {"type": "output", "value": "/^Assertion failure: .* #[0-4]$/"}
+                    ]
+                }
+            )
+        )
+
+        def reset():
+            CrashEntry.objects.update(bucket=None)
+            BucketHit.objects.all().delete()
+
+        # The web UI reassigns in pages of 1000 crashes
+        start = time.perf_counter()
+        offset, assigned = (0, 0)
+        while offset is not None:
+            _, _, inCount, _, offset = bucket.reassign(True, limit=1000, offset=offset)
+            assigned += inCount
+        sequential = time.perf_counter() - start
+        expected = set(CrashEntry.objects.filter(bucket=bucket).values_list("id"))
+        reset()
+
+        start = time.perf_counter()
+        parallel_assigned, _ = bucket.reassign_parallel(
+            processes=opts.processes, chunk_size=opts.chunk_size
+        )
+        parallel = time.perf_counter() - start
+        result = set(CrashEntry.objects.filter(bucket=bucket).values_list("id"))
+
+    if result != expected or parallel_assigned != assigned:
+        print("ERROR: parallel reassignment differs from sequential", file=sys.stderr)
+        return 1
+
+    print(f"{opts.crashes} crashes, {assigned} assigned")
+    print(f"sequential:              {sequential:8.3f}s")
+    print(f"parallel ({opts.processes:2d} processes): {parallel:8.3f}s")
+    print(f"speedup:                 {sequential / parallel:8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
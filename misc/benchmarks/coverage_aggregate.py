@@ -0,0 +1,146 @@
+"""
+Benchmark aggregating coverage collections by loading each of them completely
+and merging in memory (as aggregate_coverage_data used to) against merging
+them file by file into a CoverageAccumulator on disk, optionally split into
+partitions of files merged by several processes.
+
+Peak memory is measured with tracemalloc, which doesn't see the SQLite page
+cache of the accumulator (bounded by SQLite's default cache size of ~2 MiB).
+For the partitioned merge, only the memory of the parent process is measured.
+
+Example:
+    python misc/benchmarks/coverage_aggregate.py --collections 20 --files 2000 \
+        --processes 4
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from FTB import ColumnarCoverage, CoverageHelper, StreamingCoverage
+
+
+def create_tree(rng, files, lines, per_dir=50):
+    root = {"children": {}}
+    for idx in range(files):
+        directory = root["children"].setdefault(
+            f"dir{idx // per_dir}", {"children": {}}
+        )
+        coverage = [rng.choice((-1, -1, 0, 1, 3, 120)) for _ in range(lines)]
+        directory["children"][f"file{idx}.c"] = {"coverage": coverage}
+    CoverageHelper.calculate_summary_fields(root)
+    return root
+
+
+def merge_in_memory(paths, out_path):
+    with open(paths[0]) as f:
+        merged = json.load(f)
+    for path in paths[1:]:
+        with open(path) as f:
+            CoverageHelper.merge_coverage_data(merged, json.load(f))
+    with open(out_path, "wb") as f:
+        f.write(ColumnarCoverage.dumps(merged))
+
+
+def merge_streaming(paths, out_path):
+    with StreamingCoverage.CoverageAccumulator(os.path.dirname(out_path)) as acc:
+        for path in paths:
+            with open(path) as f:
+                acc.add(StreamingCoverage.iter_json(f))
+        with open(out_path, "wb") as f:
+            acc.dump_columnar(f)
+
+
+def merge_partition(paths, directory, partition):
+    acc = StreamingCoverage.CoverageAccumulator(directory, partition)
+    for path in paths:
+        with open(path) as f:
+            acc.add(StreamingCoverage.iter_json(f))
+    return acc
+
+
+def merge_partitioned(processes, paths, out_path):
+    directory = os.path.dirname(out_path)
+    with multiprocessing.get_context("fork").Pool(processes) as pool:
+        parts = pool.starmap(
+            merge_partition,
+            [(paths, directory, (idx, processes)) for idx in range(processes)],
+        )
+    with StreamingCoverage.CoverageAccumulator.combine(parts, directory) as acc:
+        with open(out_path, "wb") as f:
+            acc.dump_columnar(f)
+    for part in parts:
+        part.close()
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+
+    # Separate run, tracing allocations slows everything down considerably
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--collections", type=int, default=20)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    opts = parser.parse_args(args)
+
+    rng = random.Random(opts.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        size = 0
+        for idx in range(opts.collections):
+            path = os.path.join(tmp, f"source{idx}.json")
+            with open(path, "w") as f:
+                json.dump(create_tree(rng, opts.files, opts.lines), f)
+            paths.append(path)
+            size += os.path.getsize(path)
+        print(
+            f"{opts.collections} collections of {opts.files} files with "
+            f"{opts.lines} lines ({size / 2**20:.1f} MiB of JSON)"
+        )
+
+        results = {}
+        for name, func in (
+            ("in-memory", merge_in_memory),
+            ("streaming", merge_streaming),
+            ("parallel", functools.partial(merge_partitioned, opts.processes)),
+        ):
+            out_path = os.path.join(tmp, f"{name}.coverage")
+            elapsed, peak = measure(func, paths, out_path)
+            with ColumnarCoverage.ColumnarCoverage.open(out_path) as coverage:
+                results[name] = coverage.tree()
+            print(f"{name:10} {elapsed:8.2f}s peak {peak / 2**20:8.1f} MiB")
+
+        if any(result != results["in-memory"] for result in results.values()):
+            print("ERROR: merged coverage differs", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Benchmark reading a single directory and a single file from a large synthetic
+coverage collection stored as JSON (loaded completely, as Collection.subset
+does for JSON collections) against the memory-mapped columnar format.
+
+Example:
+    python misc/benchmarks/coverage_columnar.py --files 20000 --lines 1000
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from FTB import ColumnarCoverage, CoverageHelper
+
+
+def create_tree(rng, files, lines, per_dir=50):
+    root = {"children": {}}
+    for idx in range(files):
+        directory = root["children"].setdefault(
+            f"dir{idx // per_dir}", {"children": {}}
+        )
+        coverage = [rng.choice((-1, -1, 0, 1, 3, 120)) for _ in range(lines)]
+        directory["children"][f"file{idx}.c"] = {"coverage": coverage}
+    CoverageHelper.calculate_summary_fields(root)
+    return root
+
+
+def strip(node):
+    if "children" in node:
+        for child in node["children"].values():
+            strip(child)
+    else:
+        node.pop("coverage", None)
+
+
+def json_subset(path, names, stripped):
+    with open(path, "rb") as f:
+        node = json.load(f)
+    for name in names:
+        node = node["children"][name]
+    if stripped:
+        strip(node)
+    return node
+
+
+def columnar_subset(path, names, stripped):
+    with ColumnarCoverage.ColumnarCoverage.open(path) as coverage:
+        return coverage.node(coverage.find(names), strip=stripped)
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+
+    # Separate run, tracing allocations slows everything down considerably
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args(args)
+
+    rng = random.Random(opts.seed)
+    tree = create_tree(rng, opts.files, opts.lines)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "json.coverage")
+        columnar_path = os.path.join(tmp, "columnar.coverage")
+
+        start = time.perf_counter()
+        with open(json_path, "w") as f:
+            json.dump(tree, f, separators=(",", ":"))
+        json_write = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with open(columnar_path, "wb") as f:
+            f.write(ColumnarCoverage.dumps(tree))
+        columnar_write = time.perf_counter() - start
+
+        print(
+            f"{opts.files} files with {opts.lines} lines: "
+            f"JSON {os.path.getsize(json_path) / 2**20:.1f} MiB "
+            f"(written in {json_write:.2f}s), "
+            f"columnar {os.path.getsize(columnar_path) / 2**20:.1f} MiB "
+            f"(written in {columnar_write:.2f}s)"
+        )
+
+        directory = sorted(tree["children"])[len(tree["children"]) // 2]
+        leaf = next(iter(tree["children"][directory]["children"]))
+        requests = (
+            ("directory", [directory], True),
+            ("file", [directory, leaf], False),
+        )
+
+        for label, names, stripped in requests:
+            expected = tree
+            for name in names:
+                expected = expected["children"][name]
+            if stripped:
+                expected = copy.deepcopy(expected)
+                strip(expected)
+
+            results = {}
+            for fmt, func, path in (
+                ("json", json_subset, json_path),
+                ("columnar", columnar_subset, columnar_path),
+            ):
+                result, elapsed, peak = measure(func, path, names, stripped)
+                if result != expected:
+                    print(f"ERROR: {fmt} {label} subset differs", file=sys.stderr)
+                    return 1
+                results[fmt] = elapsed
+                print(
+                    f"{label:10} {fmt:9} {elapsed:8.4f}s "
+                    f"peak {peak / 2**20:8.1f} MiB"
+                )
+            print(f"{label:10} speedup   {results['json'] / results['columnar']:8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Benchmark merging large synthetic coverage trees with the pure Python line
+merge against the NumPy one used by CoverageHelper.merge_coverage_data.
+
+Example:
+    python misc/benchmarks/coverage_merge.py --files 5000 --lines 2000
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import argparse
+import copy
+import json
+import random
+import sys
+import time
+
+from FTB import CoverageHelper
+
+
+def create_tree(rng, files, lines, per_dir=50):
+    root = {"children": {}}
+    for idx in range(files):
+        directory = root["children"].setdefault(
+            f"dir{idx // per_dir}", {"children": {}}
+        )
+        coverage = [rng.choice((-1, -1, 0, 1, 3, 120)) for _ in range(lines)]
+        directory["children"][f"file{idx}.c"] = {"coverage": coverage}
+    CoverageHelper.calculate_summary_fields(root)
+    return root
+
+
+def merge(r, s, use_numpy):
+    numpy = CoverageHelper.numpy
+    if not use_numpy:
+        CoverageHelper.numpy = None
+    try:
+        start = time.perf_counter()
+        stats = CoverageHelper.merge_coverage_data(r, s)
+        return time.perf_counter() - start, stats
+    finally:
+        CoverageHelper.numpy = numpy
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args(args)
+
+    if CoverageHelper.numpy is None:
+        print("ERROR: NumPy is not installed", file=sys.stderr)
+        return 1
+
+    rng = random.Random(opts.seed)
+    r = create_tree(rng, opts.files, opts.lines)
+    s = create_tree(rng, opts.files, opts.lines)
+
+    results = {}
+    for name, use_numpy in (("python", False), ("numpy", True)):
+        target = copy.deepcopy(r)
+        elapsed, stats = merge(target, copy.deepcopy(s), use_numpy)
+        results[name] = (elapsed, stats, json.dumps(target, sort_keys=True))
+
+    if results["python"][1:] != results["numpy"][1:]:
+        print("ERROR: NumPy merge differs from pure Python merge", file=sys.stderr)
+        return 1
+
+    print(f"{opts.files} files with {opts.lines} lines, stats: {results['numpy'][1]}")
+    for name, (elapsed, _, _) in results.items():
+        print(f"{name:8} {elapsed:8.3f}s")
+    print(f"speedup: {results['python'][0] / results['numpy'][0]:6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
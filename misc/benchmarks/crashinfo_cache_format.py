@@ -0,0 +1,82 @@
+"""
+Benchmark the compact crash info cache format against JSON, using the crash
+traces from the FTB test fixtures (or any other directory of traces).
+
+Example:
+    python misc/benchmarks/crashinfo_cache_format.py --repeat 2000
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CacheObject import dumpCacheObject, isCompact, loadCacheObject
+from FTB.Signatures.CrashInfo import CrashInfo
+
+FIXTURES = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, "FTB", "Signatures", "tests"
+)
+
+
+def load_cache_objects(path):
+    config = ProgramConfiguration("product", "x86-64", "linux")
+    cacheObjects = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(".txt"):
+            continue
+        with open(os.path.join(path, name)) as f:
+            lines = f.read().splitlines()
+        crashInfo = CrashInfo.fromRawCrashData([], lines, config, auxCrashData=lines)
+        if crashInfo.backtrace:
+            cacheObjects.append(crashInfo.toCacheObject())
+    return cacheObjects
+
+
+def measure(func, items, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            func(item)
+    return (time.perf_counter() - start) / (repeat * len(items)) * 1e6
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--traces", default=os.path.join(FIXTURES, "fixtures"))
+    parser.add_argument("--repeat", type=int, default=1000)
+    opts = parser.parse_args(args)
+
+    cacheObjects = load_cache_objects(opts.traces)
+    jsonData = [json.dumps(obj) for obj in cacheObjects]
+    compactData = [dumpCacheObject(obj) for obj in cacheObjects]
+
+    if [loadCacheObject(data) for data in compactData] != cacheObjects:
+        print("ERROR: compact format does not round-trip", file=sys.stderr)
+        return 1
+
+    fallback = sum(not isCompact(data) for data in compactData)
+    print(f"{len(cacheObjects)} traces ({fallback} not representable, stored as JSON)")
+    print(f"{'':8} {'size':>10} {'dump (us)':>10} {'load (us)':>10}")
+    for name, data, dump, load in (
+        ("json", jsonData, json.dumps, json.loads),
+        ("compact", compactData, dumpCacheObject, loadCacheObject),
+    ):
+        print(
+            f"{name:8} {sum(len(d) for d in data):10d} "
+            f"{measure(dump, cacheObjects, opts.repeat):10.2f} "
+            f"{measure(load, data, opts.repeat):10.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Benchmark the search for signatures similar to a crash (as done by the
+findSignatures view) through SignatureIndex.getNearest against computing the
+distance to every signature.
+
+Example:
+    python misc/benchmarks/find_signatures.py --signatures 1000 --crashes 10
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.SignatureIndex import SignatureIndex
+
+MAX_DISTANCE = 4
+
+
+def make_crash(frames, rng):
+    config = ProgramConfiguration("product", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], [], config)
+    crashInfo.backtrace = frames
+    crashInfo.crashAddress = rng.choice([None, 0x10, 0x41414141])
+    return crashInfo
+
+
+def make_backtrace(functions, rng):
+    return [f"ns::function{rng.randrange(functions)}" for _ in range(12)]
+
+
+def mutate(frames, edits, functions, rng):
+    frames = list(frames)
+    for _ in range(edits):
+        idx = rng.randrange(len(frames))
+        if rng.random() < 0.5:
+            frames[idx] = f"ns::function{rng.randrange(functions)}"
+        else:
+            frames.insert(idx, f"ns::inlined{rng.randrange(functions)}")
+    return frames
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--signatures", type=int, default=1000)
+    parser.add_argument("--crashes", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args(args)
+
+    rng = random.Random(opts.seed)
+    functions = max(opts.signatures, 1)
+
+    # Signatures are generated from crashes, the same way buckets are created
+    backtraces = [make_backtrace(functions, rng) for _ in range(opts.signatures)]
+    signatures = {
+        idx: make_crash(frames, rng).createCrashSignature(maxFrames=8)
+        for idx, frames in enumerate(backtraces, 1)
+    }
+    # Crashes close to (but mostly not matching) an existing signature
+    crashes = [
+        make_crash(
+            mutate(rng.choice(backtraces), rng.randint(0, 3), functions, rng), rng
+        )
+        for _ in range(opts.crashes)
+    ]
+
+    start = time.perf_counter()
+    expected = []
+    for crashInfo in crashes:
+        distances = {
+            key: signature.getDistance(crashInfo)
+            for key, signature in signatures.items()
+        }
+        expected.append(
+            {key for key, distance in distances.items() if distance <= MAX_DISTANCE}
+        )
+    scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = SignatureIndex()
+    for key, signature in signatures.items():
+        index.add(key, signature)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = []
+    shortlisted = 0
+    for crashInfo in crashes:
+        candidates = index.getNearest(crashInfo, MAX_DISTANCE, limit=opts.limit)
+        shortlisted += len(candidates)
+        results.append(
+            {
+                key
+                for key in candidates
+                if signatures[key].getDistance(crashInfo) <= MAX_DISTANCE
+            }
+        )
+    index_time = time.perf_counter() - start
+
+    if results != expected:
+        print("ERROR: index results differ from exhaustive search", file=sys.stderr)
+        return 1
+
+    found = sum(len(result) for result in results)
+    print(
+        f"{opts.signatures} signatures, {opts.crashes} crashes "
+        f"({found} similar signatures, {shortlisted} shortlisted)"
+    )
+    print(f"exhaustive:   {scan_time:8.3f}s ({opts.crashes / scan_time:10.1f}/s)")
+    print(f"index build:  {build_time:8.3f}s")
+    print(f"index search: {index_time:8.3f}s ({opts.crashes / index_time:10.1f}/s)")
+    print(f"speedup:      {scan_time / index_time:8.1f}x (excluding build)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Benchmark matching crashes against many output (assertion style) signatures,
+comparing a linear scan over all signatures with the SignatureIndex output
+literal prefilter, using both the direct literal search and the Aho-Corasick
+automaton.
+
+Example:
+    python misc/benchmarks/output_prefilter.py --signatures 2000 --lines 500
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures import SignatureIndex as SignatureIndexModule
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.SignatureIndex import SignatureIndex
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+
+
+def make_assertion(rng, idx):
+    words = " ".join(rng.choice(WORDS) for _ in range(4))
+    return f"Assertion failure: {words} #{idx}, at src/file{idx % 50}.cpp"
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--signatures", type=int, default=1000)
+    parser.add_argument("--crashes", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=200, help="stderr lines/crash")
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args(args)
+
+    rng = random.Random(opts.seed)
+    assertions = [make_assertion(rng, idx) for idx in range(opts.signatures)]
+    signatures = {}
+    for idx, assertion in enumerate(assertions, 1):
+        value = assertion if idx % 2 else f"/^{assertion.replace('.', '[.]')}$/"
+        signatures[idx] = CrashSignature(
+            json.dumps({"symptoms": [{"type": "output", "value": value}]})
+        )
+
+    config = ProgramConfiguration("product", "x86-64", "linux")
+    crashes = []
+    for idx in range(opts.crashes):
+        stderr = [
+            " ".join(rng.choice(WORDS) for _ in range(8)) for _ in range(opts.lines)
+        ]
+        if idx % 2:
+            stderr.append(rng.choice(assertions))
+        crashes.append(CrashInfo.fromRawCrashData([], stderr, config))
+
+    start = time.perf_counter()
+    expected = [
+        [key for key in sorted(signatures, reverse=True) if signatures[key].matches(c)]
+        for c in crashes
+    ]
+    scan_time = time.perf_counter() - start
+    print(f"{opts.signatures} signatures, {opts.crashes} crashes, {opts.lines} lines")
+    print(f"linear scan:   {scan_time:8.3f}s ({opts.crashes / scan_time:10.1f}/s)")
+
+    for name, direct in (("direct", sys.maxsize), ("automaton", 0)):
+        SignatureIndexModule.MAX_DIRECT_LITERALS = direct
+        index = SignatureIndex()
+        for key, signature in signatures.items():
+            index.add(key, signature)
+        # build the automaton (if any) outside of the measurement
+        index.getCandidates(crashes[0])
+
+        start = time.perf_counter()
+        results = [list(index.getMatches(c)) for c in crashes]
+        index_time = time.perf_counter() - start
+
+        if results != expected:
+            print(f"ERROR: {name} results differ from linear scan", file=sys.stderr)
+            return 1
+        print(
+            f"{name + ':':14} {index_time:8.3f}s ({opts.crashes / index_time:10.1f}/s)"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Benchmark triage through the SignatureIndex against the linear scan over all
+bucket signatures (parse + match every signature for every crash) that the
+server used before.
+
+Example:
+    python misc/benchmarks/signature_index.py --signatures 5000 --crashes 200
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.SignatureIndex import SignatureIndex
+
+
+def make_crashes(count, frames, rng):
+    config = ProgramConfiguration("product", "x86-64", "linux")
+    crashes = []
+    for idx in range(count):
+        crashInfo = CrashInfo.fromRawCrashData([], [], config)
+        crashInfo.backtrace = [
+            f"ns{idx % 97}::function{rng.randrange(frames)}" for _ in range(8)
+        ]
+        crashInfo.crashAddress = rng.choice([None, 0x10, 0x41414141])
+        crashes.append(crashInfo)
+    return crashes
+
+
+def linear_scan(raw_signatures, crashInfo):
+    for key in sorted(raw_signatures, reverse=True):
+        if CrashSignature(raw_signatures[key]).matches(crashInfo):
+            return key
+    return None
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--signatures", type=int, default=2000)
+    parser.add_argument("--crashes", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args(args)
+
+    rng = random.Random(opts.seed)
+    frames = max(opts.signatures // 4, 1)
+
+    # Signatures are generated from crashes, the same way buckets are created
+    sig_crashes = make_crashes(opts.signatures, frames, rng)
+    raw_signatures = {
+        idx: str(
+            crashInfo.createCrashSignature(forceCrashAddress=bool(idx % 2), maxFrames=4)
+        )
+        for idx, crashInfo in enumerate(sig_crashes, 1)
+    }
+    crashes = make_crashes(opts.crashes, frames, rng)
+    # make sure some crashes actually match
+    crashes[::2] = rng.sample(sig_crashes, len(crashes[::2]))
+
+    start = time.perf_counter()
+    expected = [linear_scan(raw_signatures, crashInfo) for crashInfo in crashes]
+    scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = SignatureIndex()
+    for key, raw in raw_signatures.items():
+        index.add(key, CrashSignature(raw))
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [next(index.getMatches(crashInfo), None) for crashInfo in crashes]
+    index_time = time.perf_counter() - start
+
+    if results != expected:
+        print("ERROR: index results differ from linear scan", file=sys.stderr)
+        return 1
+
+    matched = sum(result is not None for result in results)
+    print(f"{opts.signatures} signatures, {opts.crashes} crashes ({matched} matched)")
+    print(f"linear scan:  {scan_time:8.3f}s ({opts.crashes / scan_time:10.1f}/s)")
+    print(f"index build:  {build_time:8.3f}s")
+    print(f"index triage: {index_time:8.3f}s ({opts.crashes / index_time:10.1f}/s)")
+    print(f"speedup:      {scan_time / index_time:8.1f}x (excluding build)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
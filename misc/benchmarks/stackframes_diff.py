@@ -0,0 +1,111 @@
+"""
+Benchmark StackFramesSymptom.diff (used by CrashSignature.getDistance and
+CrashSignature.fit) against the original exhaustive search, on signatures
+generated from random backtraces and crashes that differ from them by a few
+frames.
+
+Example:
+    python misc/benchmarks/stackframes_diff.py --pairs 200 --frames 12
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.Symptom import StackFramesSymptom
+
+# The original implementation is kept with the tests comparing against it
+sys.path.insert(0, str(Path(__file__).parents[2] / "FTB" / "Signatures" / "tests"))
+from test_StackFramesDiff import _referenceDiffSymptom  # noqa: E402
+
+
+def make_pair(rng, functions, frames, edits, wildcards):
+    backtrace = [f"ns::function{rng.randrange(functions)}" for _ in range(frames)]
+
+    functionNames = list(backtrace)
+    for idx in range(1, len(functionNames) - 1):
+        if rng.random() < wildcards:
+            functionNames[idx] = rng.choice(["?", "???"])
+
+    stack = list(backtrace) + ["main"]
+    for _ in range(edits):
+        idx = rng.randrange(len(stack))
+        if rng.random() < 0.5:
+            stack[idx] = f"ns::function{rng.randrange(functions)}"
+        else:
+            stack.insert(idx, f"ns::inlined{rng.randrange(functions)}")
+
+    return (StackFramesSymptom({"functionNames": functionNames}), stack)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--frames", type=int, default=12)
+    parser.add_argument("--max-edits", type=int, default=4)
+    parser.add_argument(
+        "--wildcards",
+        type=float,
+        default=0.1,
+        help="probability of replacing a signature frame with a wildcard",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args(args)
+
+    rng = random.Random(opts.seed)
+    config = ProgramConfiguration("product", "x86-64", "linux")
+    pairs = []
+    for _ in range(opts.pairs):
+        (symptom, stack) = make_pair(
+            rng,
+            50,
+            opts.frames,
+            rng.randint(1, opts.max_edits),
+            opts.wildcards,
+        )
+        crashInfo = CrashInfo.fromRawCrashData([], [], config)
+        crashInfo.backtrace = stack
+        pairs.append((symptom, crashInfo))
+
+    start = time.perf_counter()
+    expected = [
+        _referenceDiffSymptom(crashInfo.backtrace, symptom.functionNames)
+        for symptom, crashInfo in pairs
+    ]
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [symptom.diff(crashInfo) for symptom, crashInfo in pairs]
+    new_time = time.perf_counter() - start
+
+    results = [
+        (depth, None if guess is None else [repr(x) for x in guess.functionNames])
+        for depth, guess in results
+    ]
+    if results != expected:
+        print("ERROR: diff results differ from the original search", file=sys.stderr)
+        return 1
+
+    found = sum(1 for depth, _ in results if depth is not None)
+    print(
+        f"{opts.pairs} signatures of {opts.frames} frames "
+        f"({found} within distance 3)"
+    )
+    print(f"original:  {old_time:8.3f}s ({opts.pairs / old_time:10.1f}/s)")
+    print(f"memoized:  {new_time:8.3f}s ({opts.pairs / new_time:10.1f}/s)")
+    print(f"speedup:   {old_time / new_time:8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management import BaseCommand
+
+from covmanager.models import Collection, CollectionFile
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encode the coverage files of all collections in the given format "
+        "(e.g. after changing COV_STORAGE_COLUMNAR)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=("columnar", "json"),
+            default="columnar",
+            help="Format to store the coverage in",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        columnar = options["format"] == "columnar"
+        wanted = (
+            CollectionFile.FORMAT_COLUMNAR if columnar else CollectionFile.FORMAT_JSON
+        )
+
+        total, updated = (0, 0)
+        collections = (
+            Collection.objects.exclude(coverage=None)
+            .select_related("coverage")
+            .order_by("id")
+        )
+        for collection in collections.iterator():
+            total += 1
+            old = collection.coverage
+            if old.format == wanted:
+                continue
+
+            collection.loadCoverage()
+            new = CollectionFile.from_coverage(collection.content, columnar=columnar)
+            collection.content = None
+            if new.format != wanted:
+                # Can't be represented in the requested format, keep it as it is
+                new.file.delete(False)
+                new.delete()
+                continue
+
+            # Don't use save(), nothing but the encoding changes so the
+            # Collection post_save handlers must not run.
+            Collection.objects.filter(pk=collection.pk).update(coverage=new)
+            if not Collection.objects.filter(coverage=old).exists():
+                old.file.delete(False)
+                old.delete()
+            updated += 1
+
+        elapsed = time.perf_counter() - start
+        print(
+            f"Re-encoded {updated} of {total} collections as {options['format']} "
+            f"in {elapsed:.2f}s"
+        )
@@ -1,8 +1,11 @@
 import codecs
+import hashlib
 import json
+import tempfile
 
 from django.conf import settings
 from django.contrib.auth.models import User as DjangoUser  # noqa
+from django.core.files.base import ContentFile, File
 from django.core.files.storage import FileSystemStorage
 from django.db import models
 from django.db.models.signals import post_delete, post_save
@@ -10,10 +13,10 @@ from django.dispatch.dispatcher import receiver
 from django.utils import timezone
 
 from crashmanager.models import Client, Tool
-from FTB import CoverageHelper
+from FTB import ColumnarCoverage, CoverageHelper, StreamingCoverage
 
 if getattr(settings, "USE_CELERY", None):
-    from .tasks import check_revision_update
+    from .tasks import check_revision_update, warm_subset_cache
 
 
 class Repository(models.Model):
@@ -38,6 +41,107 @@ class CollectionFile(models.Model):
     )
     format = models.IntegerField(default=0)
 
+    # Values of format
+    FORMAT_JSON = 0
+    FORMAT_COLUMNAR = 1
+
+    @classmethod
+    def from_coverage(cls, coverage, columnar=None):
+        """
+        Store the given coverage in a new collection file. The columnar format
+        is used unless it is disabled or can't hold the coverage, in which case
+        it is stored as JSON.
+
+        @type coverage: dict or str
+        @param coverage: Coverage in server-side format, or its JSON text
+
+        @type columnar: bool
+        @param columnar: Whether to use the columnar format, defaults to the
+                         COV_STORAGE_COLUMNAR setting
+
+        @rtype: CollectionFile
+        @return: The new, saved collection file
+        """
+        if columnar is None:
+            columnar = getattr(settings, "COV_STORAGE_COLUMNAR", True)
+
+        data = None
+        file_format = cls.FORMAT_JSON
+        if columnar:
+            try:
+                tree = json.loads(coverage) if isinstance(coverage, str) else coverage
+                data = ColumnarCoverage.dumps(tree)
+                file_format = cls.FORMAT_COLUMNAR
+            except ValueError:
+                # Invalid JSON or not representable, keep it as it is
+                pass
+
+        if data is None:
+            if not isinstance(coverage, str):
+                coverage = json.dumps(coverage, separators=(",", ":"))
+            data = coverage.encode("utf-8")
+
+        h = hashlib.new("sha1")
+        h.update(data)
+
+        dbobj = cls(format=file_format)
+        dbobj.file.save(f"{h.hexdigest()}.coverage", ContentFile(data))
+        dbobj.save()
+        return dbobj
+
+    @classmethod
+    def from_accumulator(cls, accumulator, columnar=None):
+        """
+        Store coverage merged on disk in a new collection file, without
+        loading it into memory. See L{from_coverage} for the format used.
+
+        @type accumulator: StreamingCoverage.CoverageAccumulator
+        @param accumulator: The merged coverage
+
+        @type columnar: bool
+        @param columnar: Whether to use the columnar format, defaults to the
+                         COV_STORAGE_COLUMNAR setting
+
+        @rtype: CollectionFile
+        @return: The new, saved collection file
+        """
+        if columnar is None:
+            columnar = getattr(settings, "COV_STORAGE_COLUMNAR", True)
+
+        with tempfile.TemporaryFile(
+            dir=getattr(settings, "COV_AGGREGATE_TMPDIR", None)
+        ) as fp:
+            file_format = cls.FORMAT_JSON
+            if columnar:
+                try:
+                    accumulator.dump_columnar(fp)
+                    file_format = cls.FORMAT_COLUMNAR
+                except ValueError:
+                    # Not representable, start over with JSON
+                    fp.seek(0)
+                    fp.truncate()
+            if file_format == cls.FORMAT_JSON:
+                accumulator.dump_json(fp)
+
+            fp.seek(0)
+            h = hashlib.new("sha1")
+            for chunk in iter(lambda: fp.read(1 << 20), b""):
+                h.update(chunk)
+            fp.seek(0)
+
+            dbobj = cls(format=file_format)
+            dbobj.file.save(f"{h.hexdigest()}.coverage", File(fp))
+        dbobj.save()
+        return dbobj
+
+    def open_columnar(self):
+        """
+        @rtype: ColumnarCoverage.ColumnarCoverage
+        @return: The memory-mapped coverage, must be closed after use. Only
+                 valid for files in the columnar format.
+        """
+        return ColumnarCoverage.ColumnarCoverage.open(self.file.path)
+
 
 class Collection(models.Model):
     created = models.DateTimeField(default=timezone.now)
@@ -73,10 +177,36 @@ class Collection(models.Model):
         super().__init__(*args, **kwargs)
 
     def loadCoverage(self):
+        if self.coverage.format == CollectionFile.FORMAT_COLUMNAR:
+            with self.coverage.open_columnar() as coverage:
+                self.content = coverage.tree()
+            return
+
         self.coverage.file.open(mode="rb")
         self.content = json.load(codecs.getreader("utf-8")(self.coverage.file))
         self.coverage.file.close()
 
+    def iterCoverage(self):
+        """
+        Read the coverage of this collection one node at a time, so only the
+        coverage of a single file is held in memory.
+
+        @rtype: iterator(tuple(tuple(str), list(int)))
+        @return: All nodes of the coverage, see StreamingCoverage.iter_json
+        """
+        if self.coverage.format == CollectionFile.FORMAT_COLUMNAR:
+            with self.coverage.open_columnar() as coverage:
+                yield from coverage.iter_nodes()
+            return
+
+        self.coverage.file.open(mode="rb")
+        try:
+            yield from StreamingCoverage.iter_json(
+                codecs.getreader("utf-8")(self.coverage.file)
+            )
+        finally:
+            self.coverage.file.close()
+
     def annotateSource(self, path, coverage):
         """
         Annotate the source code to the given (leaf) coverage object by querying
@@ -95,7 +225,7 @@ class Collection(models.Model):
         provider = self.repository.getInstance()
         coverage["source"] = provider.getSource(path, self.revision)
 
-    def subset(self, path, report_configuration=None):
+    def subset(self, path, report_configuration=None, strip=False):
         """
         Calculate a subset of the coverage stored in this collection
         based on the given path.
@@ -105,12 +235,34 @@ class Collection(models.Model):
                      slashes. The path is interpreted as relative to the root
                      of the collection.
 
+        @type strip: bool
+        @param strip: If the path is a directory, strip the detailed coverage
+                      information from the result (see L{strip}). Coverage in
+                      the columnar format doesn't even have to be read then.
+
         @rtype: dict
         @return: An object that represents the requested subset of the coverage.
                  The storage format is the same as the underlying coverage uses.
 
                  None is returned if the path does not exist in the collection.
         """
+        names = [x for x in path.split("/") if x != ""]
+
+        if names and names[0] == "<unmatched-prefix>":
+            names[0] = ""
+
+        if (
+            not self.content
+            and report_configuration is None
+            and self.coverage.format == CollectionFile.FORMAT_COLUMNAR
+        ):
+            # Only read the requested node instead of loading everything
+            with self.coverage.open_columnar() as coverage:
+                idx = coverage.find(names)
+                if idx is None:
+                    return None
+                return coverage.node(idx, strip=strip)
+
         # Load coverage from disk if we haven't done that yet
         if not self.content:
             self.loadCoverage()
@@ -118,22 +270,20 @@ class Collection(models.Model):
         if report_configuration is not None:
             report_configuration.apply(self.content)
 
-        names = [x for x in path.split("/") if x != ""]
-
         if not names:
             # Querying an empty path means requesting the whole collection
-            return self.content
-
-        if names[0] == "<unmatched-prefix>":
-            names[0] = ""
+            ret = self.content
+        else:
+            try:
+                ret = self.content["children"]
+                for name in names[:-1]:
+                    ret = ret[name]["children"]
+                ret = ret[names[-1]]
+            except KeyError:
+                return None
 
-        try:
-            ret = self.content["children"]
-            for name in names[:-1]:
-                ret = ret[name]["children"]
-            ret = ret[names[-1]]
-        except KeyError:
-            return None
+        if strip and "children" in ret:
+            Collection.strip(ret)
 
         return ret
 
@@ -198,6 +348,13 @@ if getattr(settings, "USE_CELERY", None):
     def Collection_save(sender, instance, **kwargs):
         check_revision_update.delay(instance.pk)
 
+        # Directory views cached by a worker are only useful to the web
+        # processes if they are shared through Redis
+        if instance.coverage_id is not None and getattr(
+            settings, "COV_SUBSET_CACHE_REDIS", False
+        ):
+            warm_subset_cache.delay(instance.pk)
+
 
 class ReportConfiguration(models.Model):
     description = models.CharField(max_length=1023, blank=True)
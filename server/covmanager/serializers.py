@@ -1,7 +1,4 @@
-import hashlib
-
 from django.core.exceptions import MultipleObjectsReturned  # noqa
-from django.core.files.base import ContentFile
 from rest_framework import serializers
 from rest_framework.exceptions import APIException
 
@@ -91,14 +88,7 @@ class CollectionSerializer(serializers.ModelSerializer):
         ]
 
         coverage = attrs.pop("coverage")["file"]
-
-        h = hashlib.new("sha1")
-        h.update(repr(coverage).encode("utf-8"))
-
-        dbobj = CollectionFile()
-        dbobj.file.save(f"{h.hexdigest()}.coverage", ContentFile(coverage))
-        dbobj.save()
-        attrs["coverage"] = dbobj
+        attrs["coverage"] = CollectionFile.from_coverage(coverage)
 
         # Create our Collection instance
         return super().create(attrs)
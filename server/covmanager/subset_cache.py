@@ -0,0 +1,206 @@
+"""
+Cache of the stripped directory views served by the coverage browse and diff
+APIs.
+
+Computing a directory view requires reading (and for JSON collections parsing)
+the coverage of the whole collection. Views are cached in a per-process LRU
+and optionally in Redis (COV_SUBSET_CACHE_REDIS), which is shared by all
+processes and is populated by a background task as soon as a collection has
+its coverage. A view contains the summaries of its whole subtree, so the views
+of the top directories of large collections can be big: the cache is bounded
+by the size of the serialized views (COV_SUBSET_CACHE_BYTES), and views larger
+than that are not cached at all.
+
+Keys contain the collection, its coverage file, the directives of the report
+configuration and the path. Collections and their coverage never change in a
+way that keeps the same coverage file, and editing a report configuration
+changes its directives, so entries never have to be invalidated.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict, deque
+
+import redis
+from django.conf import settings
+
+LOG = logging.getLogger("covmanager")
+
+
+class SubsetCache:
+    """
+    Serialized directory views, kept in a per-process LRU of at most
+    max_bytes and optionally in Redis.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def fits(self, data):
+        # Views are ASCII-only JSON, so their length is their size in bytes
+        return len(data) <= self.max_bytes
+
+    @staticmethod
+    def key(collection, path, report_configuration=None):
+        names = [x for x in path.split("/") if x != ""]
+        if names and names[0] == "<unmatched-prefix>":
+            names[0] = ""
+
+        rc = "-"
+        if report_configuration is not None:
+            digest = hashlib.sha1(
+                report_configuration.directives.encode("utf-8")
+            ).hexdigest()
+            rc = f"{report_configuration.pk}.{digest}"
+
+        # Names are JSON encoded, joining them would be ambiguous for the
+        # empty name of <unmatched-prefix>
+        return "covmanager:subset:{}:{}:{}:{}".format(
+            collection.pk, collection.coverage_id, rc, json.dumps(names)
+        )
+
+    @staticmethod
+    def _redis():
+        if not getattr(settings, "COV_SUBSET_CACHE_REDIS", False):
+            return None
+        return redis.StrictRedis.from_url(settings.REDIS_URL)
+
+    def _put_local(self, key, data):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self.entries[key] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def get(self, key):
+        """
+        @rtype: str
+        @return: The cached view in JSON, or None
+        """
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+                return data
+
+        cache = self._redis()
+        if cache is None:
+            return None
+        try:
+            data = cache.get(key)
+        except redis.RedisError as exc:
+            LOG.warning("Reading subset cache from Redis failed: %s", exc)
+            return None
+        if data is None:
+            return None
+
+        data = data.decode("utf-8")
+        if self.fits(data):
+            self._put_local(key, data)
+        return data
+
+    def put(self, key, data):
+        self.put_many([(key, data)])
+
+    def put_many(self, items):
+        """
+        @type items: list(tuple(str, str))
+        @param items: Keys and views in JSON to cache
+        """
+        items = [(key, data) for key, data in items if self.fits(data)]
+        for key, data in items:
+            self._put_local(key, data)
+
+        cache = self._redis()
+        if cache is None or not items:
+            return
+        timeout = getattr(settings, "COV_SUBSET_CACHE_TIMEOUT", 7 * 24 * 60 * 60)
+        try:
+            pipe = cache.pipeline()
+            for key, data in items:
+                pipe.set(key, data, ex=timeout)
+            pipe.execute()
+        except redis.RedisError as exc:
+            LOG.warning("Writing subset cache to Redis failed: %s", exc)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+# Per-process cache, backed by Redis if enabled
+SUBSET_CACHE = SubsetCache(
+    getattr(settings, "COV_SUBSET_CACHE_BYTES", 64 * 1024 * 1024)
+)
+
+
+def cached_subset(collection, path, report_configuration=None):
+    """
+    Same as C{collection.subset(path, report_configuration, strip=True)}, but
+    directory views are served from and added to the cache.
+
+    @rtype: dict
+    @return: The stripped subset, or None if the path does not exist. The
+             caller may modify it.
+    """
+    key = SUBSET_CACHE.key(collection, path, report_configuration)
+    data = SUBSET_CACHE.get(key)
+    if data is not None:
+        return json.loads(data)
+
+    coverage = collection.subset(path, report_configuration, strip=True)
+    if coverage is not None and "children" in coverage:
+        SUBSET_CACHE.put(key, json.dumps(coverage))
+    return coverage
+
+
+def warm(collection, depth):
+    """
+    Cache the views of all directories of a collection (without report
+    configuration) down to the given number of path components, so the first
+    levels of the tree are cache hits in the browser.
+
+    Every view contains its whole subtree, so the views are added level by
+    level, until they would exceed the size of the cache.
+
+    @type depth: int
+    @param depth: Maximum number of path components, 0 caches only the root
+    """
+    root = collection.subset("", strip=True)
+
+    items = []
+    total = 0
+    pending = deque([("", root, 0)])
+    while pending:
+        (path, node, level) = pending.popleft()
+        data = json.dumps(node)
+        total += len(data)
+        if total > SUBSET_CACHE.max_bytes:
+            break
+        items.append((SUBSET_CACHE.key(collection, path), data))
+        if level >= depth:
+            continue
+        for name, child in node["children"].items():
+            if "children" in child:
+                if level == 0 and name == "":
+                    name = "<unmatched-prefix>"
+                pending.append((f"{path}{name}/", child, level + 1))
+
+    SUBSET_CACHE.put_many(items)
+    return len(items)
@@ -1,12 +1,13 @@
-import copy
-import hashlib
 import json
 import logging
+import shutil
+import tempfile
+import time
 
+from celery import chord
 from celeryconf import app
 from django.conf import settings
 from django.contrib.auth.models import User as DjangoUser
-from django.core.files.base import ContentFile
 from django.urls import reverse
 from notifications.signals import notify
 
@@ -162,44 +163,122 @@ def identify_coverage_drops(revision, ipc_only=False):
     check_notify_coverage_drops.delay(current.pk, previous.pk)
 
 
+@app.task
+def aggregate_coverage_partition(pks, workdir, partition):
+    """
+    Merge the files of one partition of the given collections into an
+    accumulator in workdir, see aggregate_coverage_data.
+
+    @return: The detached accumulator and the warning counters of each
+             collection
+    """
+    from covmanager.models import Collection
+    from FTB.StreamingCoverage import CoverageAccumulator
+
+    collections = Collection.objects.filter(pk__in=pks).select_related("coverage")
+    # Merge in the order given by aggregate_coverage_data, like all partitions
+    collections = sorted(collections, key=lambda collection: pks.index(collection.pk))
+
+    accumulator = CoverageAccumulator(workdir, partition)
+    try:
+        stats = [
+            accumulator.add(collection.iterCoverage()) for collection in collections
+        ]
+    except BaseException:
+        accumulator.close()
+        raise
+    return (accumulator.detach(), stats)
+
+
+@app.task(ignore_result=True)
+def aggregate_coverage_partitions_done(results, pk, workdir, start):
+    from covmanager.models import CollectionFile
+    from FTB.StreamingCoverage import CoverageAccumulator
+
+    parts = []
+    try:
+        parts = [CoverageAccumulator.attach(state) for state, _ in results]
+        # Warning counters of each collection, summed over all partitions
+        stats = [
+            {x: sum(result[1][idx][x] for result in results) for x in counters}
+            for idx, counters in enumerate(results[0][1])
+        ]
+        with CoverageAccumulator.combine(parts, workdir) as accumulator:
+            # Save the new coverage blob to disk and database
+            dbobj = CollectionFile.from_accumulator(accumulator)
+    finally:
+        for part in parts:
+            part.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    _save_aggregated_collection(pk, dbobj, stats, start, len(results))
+
+
+@app.task(ignore_result=True)
+def aggregate_coverage_partitions_failed(request, exc, traceback, workdir):
+    # Remove the accumulators of the partitions that succeeded
+    logger.error("Aggregating coverage partitions failed: %s", exc)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
 @app.task(ignore_result=True)
 def aggregate_coverage_data(pk, pks):
     from covmanager.models import Collection, CollectionFile
-    from FTB import CoverageHelper
-
-    # Fetch our existing, but incomplete destination collection
-    mergedCollection = Collection.objects.get(pk=pk)
+    from FTB.StreamingCoverage import CoverageAccumulator
 
     # Fetch all source collections
-    collections = Collection.objects.filter(pk__in=pks)
+    collections = list(Collection.objects.filter(pk__in=pks).select_related("coverage"))
+
+    # Merge the coverage of all other collections into the first one. The
+    # merged coverage is kept on disk and the source collections are read one
+    # file at a time, so memory usage doesn't grow with the size of the
+    # collections.
+    start = time.time()
+    partitions = max(getattr(settings, "COV_AGGREGATE_PARTITIONS", 1), 1)
+    tmpdir = getattr(settings, "COV_AGGREGATE_TMPDIR", None)
+
+    if partitions > 1:
+        # Each task merges the files of one partition in all collections, so
+        # every file is still merged in the same order and the result is
+        # identical. The partitions are combined once all tasks are done, so
+        # the work directory must be shared by all workers.
+        workdir = tempfile.mkdtemp(dir=tmpdir)
+        pks = [collection.pk for collection in collections]
+        chord(
+            aggregate_coverage_partition.s(pks, workdir, (idx, partitions))
+            for idx in range(partitions)
+        )(
+            aggregate_coverage_partitions_done.s(pk, workdir, start).on_error(
+                aggregate_coverage_partitions_failed.s(workdir=workdir)
+            )
+        )
+        return
 
-    # Merge the coverage of all other collections into the first one
-    first_collection = collections[0]
-    first_collection.loadCoverage()
-    newCoverage = first_collection.content
-    total_stats = None
+    with CoverageAccumulator(tmpdir) as accumulator:
+        stats = [
+            accumulator.add(collection.iterCoverage()) for collection in collections
+        ]
+
+        # Save the new coverage blob to disk and database
+        dbobj = CollectionFile.from_accumulator(accumulator)
 
-    for collection in collections[1:]:
-        # Load coverage, perform the merge, then release reference to the JSON blob
-        # again
-        collection.loadCoverage()
-        stats = CoverageHelper.merge_coverage_data(newCoverage, collection.content)
-        collection.content = None
+    _save_aggregated_collection(pk, dbobj, stats, start, partitions)
 
-        # Merge stats appropriately
+
+def _save_aggregated_collection(pk, dbobj, stats, start, partitions):
+    from covmanager.models import Collection
+
+    # Fetch our existing, but incomplete destination collection
+    mergedCollection = Collection.objects.get(pk=pk)
+
+    # Merge stats appropriately
+    total_stats = None
+    for collection_stats in stats[1:]:
         if total_stats is None:
-            total_stats = stats
+            total_stats = collection_stats
         else:
             for x in total_stats:
-                total_stats[x] += stats[x]
-
-    # Save the new coverage blob to disk and database
-    newCoverage = json.dumps(newCoverage, separators=(",", ":"))
-    h = hashlib.new("sha1")
-    h.update(newCoverage.encode("utf-8"))
-    dbobj = CollectionFile()
-    dbobj.file.save(f"{h.hexdigest()}.coverage", ContentFile(newCoverage))
-    dbobj.save()
+                total_stats[x] += collection_stats[x]
 
     if total_stats:
         mergedCollection.description += " (NC {}, LM {}, CM {})".format(
@@ -208,6 +287,12 @@ def aggregate_coverage_data(pk, pks):
             total_stats["coverable_mismatch_count"],
         )
 
+    mergedCollection.description += " (aggregated in {:.1f}s using {} {})".format(
+        time.time() - start,
+        partitions,
+        "partitions" if partitions > 1 else "partition",
+    )
+
     # Save the collection
     mergedCollection.coverage = dbobj
     mergedCollection.save()
@@ -219,9 +304,24 @@ def aggregate_coverage_data(pk, pks):
         identify_coverage_drops(mergedCollection.revision, ipc_only=False)
 
 
+@app.task(ignore_result=True)
+def warm_subset_cache(pk):
+    from covmanager.models import Collection
+
+    from .subset_cache import warm
+
+    collection = Collection.objects.get(pk=pk)
+    if collection.coverage is None:
+        return
+
+    count = warm(collection, getattr(settings, "COV_SUBSET_CACHE_WARM_DEPTH", 2))
+    logger.debug("Cached %d directory views of collection %d", count, pk)
+
+
 @app.task(ignore_result=True)
 def calculate_report_summary(pk):
     from covmanager.models import ReportConfiguration, ReportSummary
+    from FTB.CoverageHelper import calculate_directive_summaries
 
     summary = ReportSummary.objects.get(pk=pk)
 
@@ -229,35 +329,46 @@ def calculate_report_summary(pk):
     collection = summary.collection
     collection.loadCoverage()
 
-    rcs = ReportConfiguration.objects.filter(
-        public=True, repository=collection.repository
+    rcs = list(
+        ReportConfiguration.objects.filter(
+            public=True, repository=collection.repository
+        )
     )
 
+    # Evaluate all report configurations in a single walk over the coverage,
+    # instead of applying each of them to a copy of it
+    summaries = calculate_directive_summaries(
+        collection.content, [rc.directives.splitlines() for rc in rcs]
+    )
+
+    # Top-level fields of the coverage other than the summary are kept
+    root = {
+        key: value for key, value in collection.content.items() if key != "children"
+    }
+
     data = None
     waiting = {}
     arrived = {}
 
-    for rc in rcs:
-        coverage = copy.deepcopy(collection.content)
-        rc.apply(coverage)
-        if "children" in coverage:
-            del coverage["children"]
+    for rc, fields in zip(rcs, summaries):
+        coverage = dict(root, name=None)
+        coverage.update(fields)
 
         coverage["name"] = rc.description
         coverage["id"] = rc.pk
 
-        if rc.logical_parent:
+        if rc.logical_parent_id:
             # We have a parent, check if we already processed it
-            if rc.logical_parent.pk in arrived:
+            if rc.logical_parent_id in arrived:
                 # Short path, parent is already there, we can link directly
-                if "children" not in arrived[rc.logical_parent.pk]:
-                    arrived[rc.logical_parent.pk]["children"] = []
-                arrived[rc.logical_parent.pk]["children"].append(coverage)
+                if "children" not in arrived[rc.logical_parent_id]:
+                    arrived[rc.logical_parent_id]["children"] = []
+                arrived[rc.logical_parent_id]["children"].append(coverage)
             else:
                 # Parent hasn't been processed yet, so we have to wait for it
-                if rc.logical_parent.pk not in waiting:
-                    waiting[rc.logical_parent.pk] = []
-                waiting[rc.logical_parent.pk].append(coverage)
+                if rc.logical_parent_id not in waiting:
+                    waiting[rc.logical_parent_id] = []
+                waiting[rc.logical_parent_id].append(coverage)
         elif not data:
             # This is the root
             data = coverage
@@ -20,6 +20,7 @@ from django.contrib.auth.models import Permission, User
 from django.contrib.contenttypes.models import ContentType
 
 from covmanager.models import Collection, CollectionFile, Repository
+from covmanager.subset_cache import SUBSET_CACHE
 from crashmanager.models import Client, Tool
 from crashmanager.models import User as cmUser
 
@@ -56,6 +57,14 @@ HAVE_GIT = _check_git()
 HAVE_HG = _check_hg()
 
 
+@pytest.fixture(autouse=True)
+def clear_subset_cache():
+    """Primary keys are reused between tests, so cached views must not be"""
+    SUBSET_CACHE.clear()
+    yield
+    SUBSET_CACHE.clear()
+
+
 @pytest.fixture
 def covmanager_test(db):  # pylint: disable=invalid-name,unused-argument
     """Common setup/teardown tasks for all server unittests"""
@@ -0,0 +1,114 @@
+"""Tests for CovManager coverage aggregation
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import copy
+import re
+
+import pytest
+from celeryconf import app
+
+from covmanager.models import Collection, CollectionFile
+from covmanager.tasks import (
+    aggregate_coverage_data,
+    aggregate_coverage_partitions_failed,
+)
+from FTB import CoverageHelper
+
+pytestmark = pytest.mark.usefixtures("covmanager_test")  # pylint: disable=invalid-name
+
+COVERAGES = [
+    {
+        "children": {
+            "a.c": {"coverage": [-1, 1, 0]},
+            "d": {"children": {"b.c": {"coverage": [1, 1]}}},
+        }
+    },
+    {"children": {"a.c": {"coverage": [-1, 2, -1]}, "e": {"children": {}}}},
+    {
+        "children": {
+            "d": {
+                "children": {"b.c": {"coverage": [-1, -1]}, "f.c": {"coverage": [3]}}
+            },
+            "a.c": {"coverage": [-1, 0, 1, 5]},
+        }
+    },
+]
+
+
+@pytest.fixture
+def celery_eager():
+    """Run Celery tasks (including chords) in the calling process"""
+    eager = app.conf.task_always_eager
+    app.conf.task_always_eager = True
+    yield
+    app.conf.task_always_eager = eager
+
+
+@pytest.mark.parametrize("partitions", [1, 3])
+@pytest.mark.parametrize("columnar", [False, True])
+def test_aggregate_coverage_data(
+    covmgr_helper, settings, tmp_path, celery_eager, columnar, partitions
+):
+    """Aggregation on disk gives the same result as merging in memory"""
+    settings.COV_STORAGE_COLUMNAR = columnar
+    settings.COV_AGGREGATE_PARTITIONS = partitions
+    tmpdir = tmp_path / "aggregate"
+    tmpdir.mkdir()
+    settings.COV_AGGREGATE_TMPDIR = str(tmpdir)
+    repo = covmgr_helper.create_repository("git")
+
+    sources = []
+    for idx, coverage in enumerate(COVERAGES):
+        coverage = copy.deepcopy(coverage)
+        CoverageHelper.calculate_summary_fields(coverage)
+        collection = covmgr_helper.create_collection(repository=repo)
+        # Mix source formats
+        Collection.objects.filter(pk=collection.pk).update(
+            coverage=CollectionFile.from_coverage(coverage, columnar=bool(idx % 2))
+        )
+        sources.append(collection.pk)
+    merged = covmgr_helper.create_collection(repository=repo, description="merged")
+
+    aggregate_coverage_data.delay(merged.pk, sources)
+
+    expected = copy.deepcopy(COVERAGES)
+    for coverage in expected:
+        CoverageHelper.calculate_summary_fields(coverage)
+    stats = [
+        CoverageHelper.merge_coverage_data(expected[0], coverage)
+        for coverage in expected[1:]
+    ]
+    assert stats[0]["coverable_mismatch_count"] == 1
+    assert stats[1]["null_coverable_count"] == 1
+    assert stats[1]["length_mismatch_count"] == 1
+
+    merged = Collection.objects.get(pk=merged.pk)
+    assert re.fullmatch(
+        r"merged \(NC 1, LM 1, CM {}\) \(aggregated in \d+\.\ds using {} {}\)".format(
+            sum(x["coverable_mismatch_count"] for x in stats),
+            partitions,
+            "partitions" if partitions > 1 else "partition",
+        ),
+        merged.description,
+    )
+    assert merged.coverage.format == (
+        CollectionFile.FORMAT_COLUMNAR if columnar else CollectionFile.FORMAT_JSON
+    )
+    merged.loadCoverage()
+    assert merged.content == expected[0]
+    assert not list(tmpdir.iterdir())
+
+
+def test_aggregate_coverage_partitions_failed(tmp_path):
+    """The accumulators of all partitions are removed if one of them fails"""
+    workdir = tmp_path / "aggregate"
+    workdir.mkdir()
+    (workdir / "part.sqlite").touch()
+    aggregate_coverage_partitions_failed(None, RuntimeError("failed"), None, workdir)
+    assert not tmp_path.joinpath("aggregate").exists()
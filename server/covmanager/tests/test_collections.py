@@ -9,6 +9,7 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
+import copy
 import json
 import logging
 import os
@@ -18,6 +19,9 @@ import pytest
 import requests
 from django.urls import reverse
 
+from covmanager.models import Collection, CollectionFile
+from FTB import CoverageHelper
+
 LOG = logging.getLogger("fm.covmanager.tests.collections")
 pytestmark = pytest.mark.usefixtures("covmanager_test")  # pylint: disable=invalid-name
 
@@ -171,3 +175,82 @@ def test_collections_browse_api_simple_get(client, covmgr_helper):
     )
     LOG.debug(response)
     assert response.status_code == requests.codes["ok"]
+
+
+COVERAGE = {
+    "children": {
+        "": {"children": {"a.c": {"coverage": [-1, 1]}}},
+        "dir": {
+            "children": {
+                "sub": {"children": {"b.c": {"coverage": [0, 2, -1]}}},
+                "c.c": {"coverage": [3, 0, 0]},
+            }
+        },
+    }
+}
+
+
+def _create_collection(covmgr_helper, columnar):
+    coverage = copy.deepcopy(COVERAGE)
+    CoverageHelper.calculate_summary_fields(coverage)
+    repo = covmgr_helper.create_repository("git")
+    col = covmgr_helper.create_collection(repository=repo)
+    Collection.objects.filter(pk=col.pk).update(
+        coverage=CollectionFile.from_coverage(coverage, columnar=columnar)
+    )
+    col = Collection.objects.get(pk=col.pk)
+    assert col.coverage.format == (
+        CollectionFile.FORMAT_COLUMNAR if columnar else CollectionFile.FORMAT_JSON
+    )
+    return (col, coverage)
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_collections_subset(covmgr_helper, columnar):
+    """Subsets are the same for all storage formats"""
+    col, coverage = _create_collection(covmgr_helper, columnar)
+
+    assert col.subset("") == coverage
+    assert col.subset("dir/c.c") == coverage["children"]["dir"]["children"]["c.c"]
+    assert col.subset("<unmatched-prefix>/a.c")["coverage"] == [-1, 1]
+    assert col.subset("dir/x.c") is None
+    assert col.subset("dir/c.c/x") is None
+
+    # Leaves keep their coverage when stripping
+    assert col.subset("dir/c.c", strip=True)["coverage"] == [3, 0, 0]
+    expected = copy.deepcopy(coverage["children"]["dir"])
+    Collection.strip(expected)
+    assert Collection.objects.get(pk=col.pk).subset("dir", strip=True) == expected
+
+    col = Collection.objects.get(pk=col.pk)
+    col.loadCoverage()
+    assert col.content == coverage
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_collections_browse_api_directory(client, covmgr_helper, columnar):
+    """Directories are returned without detailed coverage"""
+    client.login(username="test", password="test")
+    col, coverage = _create_collection(covmgr_helper, columnar)
+    response = client.get(
+        reverse(
+            "covmanager:collections_browse_api",
+            kwargs={"collectionid": col.pk, "path": "dir/sub"},
+        )
+    )
+    assert response.status_code == requests.codes["ok"]
+    expected = copy.deepcopy(coverage["children"]["dir"]["children"]["sub"])
+    Collection.strip(expected)
+    assert json.loads(response.content) == {"path": "dir/sub", "coverage": expected}
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_collections_download(client, covmgr_helper, columnar):
+    """Downloads are JSON for all storage formats"""
+    client.login(username="test", password="test")
+    col, coverage = _create_collection(covmgr_helper, columnar)
+    response = client.get(
+        reverse("covmanager:collections_download", kwargs={"collectionid": col.pk})
+    )
+    assert response.status_code == requests.codes["ok"]
+    assert json.loads(b"".join(response)) == coverage
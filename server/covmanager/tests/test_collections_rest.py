@@ -9,7 +9,6 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
-import codecs
 import json
 import logging
 
@@ -18,7 +17,7 @@ import requests
 from django.contrib.auth.models import User
 from django.utils import dateparse, timezone
 
-from covmanager.models import Collection
+from covmanager.models import Collection, CollectionFile
 
 LOG = logging.getLogger("fm.covmanager.tests.collections.rest")
 pytestmark = pytest.mark.usefixtures("covmanager_test")  # pylint: disable=invalid-name
@@ -95,7 +94,9 @@ def test_rest_collections_post(api_client, covmgr_helper, username):
     assert len(result.tools.all()) == 1
     assert result.tools.all()[0].name == "testtool"
     assert result.revision == "abc"
-    assert json.load(codecs.getreader("utf-8")(result.coverage.file)) == cov
+    assert result.coverage.format == CollectionFile.FORMAT_COLUMNAR
+    result.loadCoverage()
+    assert result.content == cov
 
 
 def test_rest_collections_put(api_client):
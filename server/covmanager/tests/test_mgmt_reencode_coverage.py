@@ -0,0 +1,64 @@
+"""Tests for CovManager reencode_coverage management command
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from covmanager.models import Collection, CollectionFile
+
+pytestmark = pytest.mark.usefixtures("covmanager_test")  # pylint: disable=invalid-name
+
+COVERAGE = {
+    "children": {"a.c": {"coverage": [-1, 0, 3]}},
+    "linesCovered": 1,
+    "linesTotal": 2,
+}
+
+
+def test_args():
+    with pytest.raises(CommandError, match=r"Error: argument --format: invalid"):
+        call_command("reencode_coverage", "--format", "xml")
+
+
+def test_reencode(covmgr_helper, capsys):
+    repo = covmgr_helper.create_repository("git")
+    collections = [
+        covmgr_helper.create_collection(repository=repo, coverage=json.dumps(COVERAGE))
+        for _ in range(2)
+    ]
+    # collections that can't be stored as columnar are left alone
+    unsupported = covmgr_helper.create_collection(
+        repository=repo, coverage=json.dumps({"children": []})
+    )
+    old_files = [collection.coverage.pk for collection in collections]
+
+    call_command("reencode_coverage")
+    assert "Re-encoded 2 of 3 collections as columnar" in capsys.readouterr().out
+
+    assert not CollectionFile.objects.filter(pk__in=old_files).exists()
+    for collection in collections:
+        collection = Collection.objects.get(pk=collection.pk)
+        assert collection.coverage.format == CollectionFile.FORMAT_COLUMNAR
+        collection.loadCoverage()
+        # missing summary fields are filled in
+        assert collection.content["children"]["a.c"]["coverage"] == [-1, 0, 3]
+        assert collection.content["children"]["a.c"]["linesTotal"] == 2
+        assert collection.content["linesTotal"] == 2
+    unsupported = Collection.objects.get(pk=unsupported.pk)
+    assert unsupported.coverage.format == CollectionFile.FORMAT_JSON
+
+    call_command("reencode_coverage", "--format", "json")
+    assert "Re-encoded 2 of 3 collections as json" in capsys.readouterr().out
+    for collection in collections:
+        collection = Collection.objects.get(pk=collection.pk)
+        assert collection.coverage.format == CollectionFile.FORMAT_JSON
+        collection.loadCoverage()
+        assert collection.content["children"]["a.c"]["coverage"] == [-1, 0, 3]
@@ -0,0 +1,113 @@
+"""Tests for CovManager report summaries
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import copy
+import json
+
+import pytest
+
+from covmanager.models import ReportConfiguration, ReportSummary
+from covmanager.tasks import calculate_report_summary
+from FTB import CoverageHelper
+
+pytestmark = pytest.mark.usefixtures("covmanager_test")  # pylint: disable=invalid-name
+
+COVERAGE = {
+    "children": {
+        "a": {
+            "children": {
+                "b.c": {"coverage": [-1, 1, 0, 4]},
+                "c": {"children": {"d.c": {"coverage": [0, 0, 2]}}},
+            }
+        },
+        "e.c": {"coverage": [-1, -1, 3]},
+        "f": {"children": {"g.c": {"coverage": [1, 1, 0, -1, 0]}}},
+    }
+}
+
+
+def _summary(collection, rc):
+    # What calculate_report_summary used to compute for each configuration
+    coverage = copy.deepcopy(collection.content)
+    rc.apply(coverage)
+    del coverage["children"]
+    coverage["name"] = rc.description
+    coverage["id"] = rc.pk
+    return coverage
+
+
+def test_calculate_report_summary(covmgr_helper):
+    coverage = copy.deepcopy(COVERAGE)
+    CoverageHelper.calculate_summary_fields(coverage)
+    repo = covmgr_helper.create_repository("git")
+    collection = covmgr_helper.create_collection(
+        repository=repo, coverage=json.dumps(coverage)
+    )
+
+    root = ReportConfiguration.objects.create(
+        repository=repo, description="all", directives="+:**", public=True
+    )
+    # Created before its parent, so it has to wait for it
+    child = ReportConfiguration.objects.create(
+        repository=repo, description="c", directives="-:**\n+:a/c/**", public=True
+    )
+    parent = ReportConfiguration.objects.create(
+        repository=repo,
+        description="no e",
+        directives="-:e.c\n-:**/g.c",
+        public=True,
+        logical_parent=root,
+    )
+    child.logical_parent = parent
+    child.save()
+    empty = ReportConfiguration.objects.create(
+        repository=repo,
+        description="none",
+        directives="-:**",
+        public=True,
+        logical_parent=root,
+    )
+    ReportConfiguration.objects.create(
+        repository=repo, description="private", directives="+:**", logical_parent=root
+    )
+
+    summary = ReportSummary.objects.create(collection=collection)
+    calculate_report_summary(summary.pk)
+
+    collection.loadCoverage()
+    expected = _summary(collection, root)
+    expected["children"] = [_summary(collection, parent), _summary(collection, empty)]
+    expected["children"][0]["children"] = [_summary(collection, child)]
+
+    summary = ReportSummary.objects.get(pk=summary.pk)
+    assert summary.cached_result == json.dumps(expected)
+    result = json.loads(summary.cached_result)
+    assert result["linesTotal"] == 11
+    assert result["children"][0]["linesTotal"] == 6
+    assert result["children"][0]["children"][0]["linesCovered"] == 1
+    assert result["children"][1]["linesTotal"] == 0
+
+
+def test_calculate_report_summary_multiple_roots(covmgr_helper):
+    repo = covmgr_helper.create_repository("git")
+    collection = covmgr_helper.create_collection(
+        repository=repo, coverage=json.dumps(COVERAGE)
+    )
+    for description in ("a", "b"):
+        ReportConfiguration.objects.create(
+            repository=repo, description=description, directives="+:**", public=True
+        )
+
+    summary = ReportSummary.objects.create(collection=collection)
+    calculate_report_summary(summary.pk)
+
+    summary = ReportSummary.objects.get(pk=summary.pk)
+    assert json.loads(summary.cached_result) == {
+        "error": "There are multiple root reports configured."
+    }
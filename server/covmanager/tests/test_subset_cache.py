@@ -0,0 +1,182 @@
+"""Tests for the CovManager directory view cache
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import copy
+import json
+
+import pytest
+import requests
+from django.urls import reverse
+
+from covmanager.models import Collection, ReportConfiguration
+from covmanager.subset_cache import SUBSET_CACHE, SubsetCache, cached_subset, warm
+from covmanager.tasks import warm_subset_cache
+from FTB import CoverageHelper
+
+pytestmark = pytest.mark.usefixtures("covmanager_test")  # pylint: disable=invalid-name
+
+COVERAGE = {
+    "children": {
+        "": {"children": {"a.c": {"coverage": [-1, 1]}}},
+        "dir": {
+            "children": {
+                "sub": {"children": {"b.c": {"coverage": [0, 2, -1]}}},
+                "c.c": {"coverage": [3, 0, 0]},
+            }
+        },
+    }
+}
+
+
+@pytest.fixture
+def collection(covmgr_helper):
+    coverage = copy.deepcopy(COVERAGE)
+    CoverageHelper.calculate_summary_fields(coverage)
+    repo = covmgr_helper.create_repository("git")
+    return covmgr_helper.create_collection(
+        repository=repo, coverage=json.dumps(coverage)
+    )
+
+
+def _stripped(path):
+    coverage = copy.deepcopy(COVERAGE)
+    CoverageHelper.calculate_summary_fields(coverage)
+    for name in path.split("/"):
+        if name:
+            coverage = coverage["children"][name]
+    Collection.strip(coverage)
+    return coverage
+
+
+def _fail_subset(*args, **kwargs):
+    raise AssertionError("subset should not be called")
+
+
+def test_cached_subset(collection, mocker):
+    """Directory views are computed once and can be modified by the caller"""
+    result = cached_subset(collection, "dir/")
+    assert result == _stripped("dir")
+    result["children"].clear()
+
+    mocker.patch.object(Collection, "subset", _fail_subset)
+    fresh = Collection.objects.get(pk=collection.pk)
+    assert cached_subset(fresh, "/dir") == _stripped("dir")
+
+    # Leaves and missing paths are not cached
+    mocker.stopall()
+    assert cached_subset(fresh, "dir/c.c")["coverage"] == [3, 0, 0]
+    assert cached_subset(fresh, "dir/x") is None
+    assert len(SUBSET_CACHE.entries) == 1
+
+
+def test_cached_subset_report_configuration(collection):
+    """Views of report configurations are cached by their directives"""
+    rc = ReportConfiguration.objects.create(
+        repository=collection.repository, directives="-:**\n+:dir/sub/**\n"
+    )
+    assert list(cached_subset(collection, "dir", rc)["children"]) == ["sub"]
+
+    rc.directives = "-:**\n+:dir/c.c\n"
+    collection = Collection.objects.get(pk=collection.pk)
+    assert list(cached_subset(collection, "dir", rc)["children"]) == ["c.c"]
+
+    collection = Collection.objects.get(pk=collection.pk)
+    assert cached_subset(collection, "dir") == _stripped("dir")
+    assert len(SUBSET_CACHE.entries) == 3
+
+
+def test_warm(collection, mocker):
+    """Warming caches all directories down to the given depth"""
+    assert warm(collection, 1) == 3
+
+    mocker.patch.object(Collection, "subset", _fail_subset)
+    collection = Collection.objects.get(pk=collection.pk)
+    assert cached_subset(collection, "") == _stripped("")
+    assert cached_subset(collection, "dir") == _stripped("dir")
+    assert (
+        cached_subset(collection, "<unmatched-prefix>") == _stripped("")["children"][""]
+    )
+    with pytest.raises(AssertionError):
+        cached_subset(collection, "dir/sub")
+
+
+def test_cache_size():
+    """The cache stays below its size in bytes, dropping the oldest views"""
+    cache = SubsetCache(100)
+    for idx in range(10):
+        cache.put(f"key{idx}", json.dumps({"children": {}, "name": "x" * 10 * idx}))
+        assert cache.bytes == sum(len(data) for data in cache.entries.values())
+        assert cache.bytes <= 100
+    # key8 and key9 are larger than the cache
+    assert list(cache.entries) == ["key7"]
+
+    # views larger than the cache are not cached at all
+    cache.put("big", "x" * 101)
+    assert cache.get("big") is None
+    assert list(cache.entries) == ["key7"]
+
+
+def test_warm_size(collection, mocker):
+    """Warming stops when the views would exceed the size of the cache"""
+    mocker.patch.object(
+        SUBSET_CACHE,
+        "max_bytes",
+        len(json.dumps(_stripped(""))) + len(json.dumps(_stripped("dir"))),
+    )
+    # the views of <unmatched-prefix> and dir don't both fit next to the root
+    assert warm(collection, 1) == 2
+    assert SUBSET_CACHE.bytes <= SUBSET_CACHE.max_bytes
+    assert SUBSET_CACHE.key(collection, "") in SUBSET_CACHE.entries
+
+
+def test_warm_task(collection, settings):
+    settings.COV_SUBSET_CACHE_WARM_DEPTH = 0
+    warm_subset_cache(collection.pk)
+    assert list(SUBSET_CACHE.entries) == [SUBSET_CACHE.key(collection, "")]
+
+
+def test_redis(collection, mocker, settings):
+    """Views are shared through Redis if enabled"""
+    settings.COV_SUBSET_CACHE_REDIS = True
+    store = {}
+    mock_redis = mocker.patch("redis.StrictRedis.from_url")
+    mock_redis.return_value.get = mocker.Mock(
+        side_effect=lambda key: store[key].encode("utf-8") if key in store else None
+    )
+    pipe = mock_redis.return_value.pipeline.return_value
+    pipe.set = mocker.Mock(side_effect=lambda key, data, ex: store.update({key: data}))
+
+    assert cached_subset(collection, "dir") == _stripped("dir")
+    assert len(store) == 1
+
+    # Another process only has the Redis copy
+    SUBSET_CACHE.clear()
+    mocker.patch.object(Collection, "subset", _fail_subset)
+    collection = Collection.objects.get(pk=collection.pk)
+    assert cached_subset(collection, "dir") == _stripped("dir")
+    assert len(SUBSET_CACHE.entries) == 1
+
+
+def test_browse_api_cached(client, collection, mocker):
+    """The browse API serves directories from the cache"""
+    client.login(username="test", password="test")
+    url = reverse(
+        "covmanager:collections_browse_api",
+        kwargs={"collectionid": collection.pk, "path": "dir"},
+    )
+    expected = {"path": "dir", "coverage": _stripped("dir")}
+
+    response = client.get(url)
+    assert response.status_code == requests.codes["ok"]
+    assert json.loads(response.content) == expected
+
+    mocker.patch.object(Collection, "subset", _fail_subset)
+    response = client.get(url)
+    assert response.status_code == requests.codes["ok"]
+    assert json.loads(response.content) == expected
@@ -15,7 +15,14 @@ from rest_framework.authentication import SessionAuthentication, TokenAuthentica
 from crashmanager.models import Tool
 from server.views import JsonQueryFilterBackend, SimpleQueryFilterBackend
 
-from .models import Collection, Report, ReportConfiguration, ReportSummary, Repository
+from .models import (
+    Collection,
+    CollectionFile,
+    Report,
+    ReportConfiguration,
+    ReportSummary,
+    Repository,
+)
 from .serializers import (
     CollectionSerializer,
     ReportConfigurationSerializer,
@@ -23,6 +30,7 @@ from .serializers import (
     RepositorySerializer,
 )
 from .SourceCodeProvider import SourceCodeProvider
+from .subset_cache import cached_subset
 from .tasks import aggregate_coverage_data, calculate_report_summary
 
 
@@ -178,6 +186,19 @@ def collections_download(request, collectionid):
             status=202,
         )
 
+    if collection.coverage.format == CollectionFile.FORMAT_COLUMNAR:
+        # Downloads are always JSON, regardless of how we store the coverage
+        collection.loadCoverage()
+        response = HttpResponse(
+            json.dumps(collection.content, separators=(",", ":")),
+            content_type="application/octet-stream",
+        )
+        response["Content-Disposition"] = (
+            'attachment; filename="%s"'
+            % os.path.basename(collection.coverage.file.path)
+        )
+        return response
+
     cov_file = open(collection.coverage.file.path, "rb")
     response = HttpResponse(
         FileWrapper(cov_file), content_type="application/octet-stream"
@@ -206,16 +227,15 @@ def collections_browse_api(request, collectionid, path):
             ReportConfiguration, pk=request.GET["rc"]
         )
 
-    coverage = collection.subset(path, report_configuration)
+    # If we are viewing a directory, we don't need the detailed coverage
+    # information, so it is stripped before returning this data. Directory
+    # views are cached, browsing the tree requests the same ones repeatedly.
+    coverage = cached_subset(collection, path, report_configuration)
 
     if not coverage:
         raise Http404("Path not found.")
 
-    if "children" in coverage:
-        # Viewing a directory, so we should remove detailed coverage
-        # information before returning this data.
-        Collection.strip(coverage)
-    else:
+    if "children" not in coverage:
         # This is a leaf, we need to add source code
         collection.annotateSource(path, coverage)
 
@@ -261,14 +281,12 @@ def collections_diff_api(request, path):
                 status=400,
             )
 
-        coverage = collection.subset(path, report_configuration)
+        # Viewing a directory, so we should remove detailed coverage
+        # information before returning this data.
+        coverage = cached_subset(collection, path, report_configuration)
 
         if "children" in coverage:
             Collection.remove_childrens_children(coverage)
-
-            # Viewing a directory, so we should remove detailed coverage
-            # information before returning this data.
-            Collection.strip(coverage)
         else:
             # TODO: Check if the source file is identical in each collection
             # If so, we can display it. If not, we should not annotate for now.
@@ -377,8 +395,7 @@ def collections_patch_api(request, collectionid, patch_revision):
             response["coll_source"] = coll_source
             return HttpResponse(json.dumps(response), content_type="application/json")
 
-        (basepath, basename) = os.path.split(filename)
-        coverage = collection.subset(basepath)["children"][basename]["coverage"]
+        coverage = collection.subset(filename)["coverage"]
 
         missed_locations = []
         not_coverable = []
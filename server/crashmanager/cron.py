@@ -1,26 +1,55 @@
-import itertools
+import logging
 import os
 import shutil
+import time
 from datetime import timedelta
+from datetime import timezone as dt_timezone
 from tempfile import mkstemp
 
+from celery import group
 from celeryconf import app
 from django.conf import settings
+from django.core.cache import cache
 from django.core.management import call_command
 from django.db import transaction
-from django.db.models import F, Q
+from django.db.models import DateTimeField, ExpressionWrapper, F
 from django.db.models.aggregates import Count
+from django.db.models.functions import TruncHour
 from django.utils import timezone
 
+LOG = logging.getLogger("fm.crashmanager.cron")
+
+# Cache key set while optimized signatures are considered up to date
+OPTIMIZE_SIGNATURES_SCHEDULED = "crashmanager:optimize_signatures"
+
 SIGNATURES_ZIP = os.path.realpath(
     os.path.join(getattr(settings, "SIGNATURE_STORAGE", None), "signatures.zip")
 )
+SIGNATURES_MANIFEST = os.path.realpath(
+    os.path.join(
+        getattr(settings, "SIGNATURE_STORAGE", None), "signatures.manifest.json"
+    )
+)
+
+
+def _publish(src, dest):
+    # Copy next to the destination first, so downloads never see a partial file
+    fd, tmpf = mkstemp(prefix=".fm-sigs-", dir=os.path.dirname(dest))
+    os.close(fd)
+    try:
+        shutil.copy(src, tmpf)
+        os.chmod(tmpf, 0o644)
+        os.replace(tmpf, dest)
+    except BaseException:
+        os.unlink(tmpf)
+        raise
 
 
 @app.task(ignore_result=True)
 def update_crash_stats():
-    from .models import CrashEntry, CrashHit, Tool
+    from .models import CrashEntry, CrashHit
 
+    start = time.perf_counter()
     max_history = timedelta(days=getattr(settings, "CRASH_STATS_MAX_HISTORY_DAYS", 14))
     now = timezone.now()
     cur_period = CrashHit.get_period(now)
@@ -31,38 +60,91 @@ def update_crash_stats():
         # no run, go back as far in history as needed
         last_run = cur_period - max_history
 
-    for hours in itertools.count():
-        period = CrashHit.get_period(cur_period) - timedelta(hours=hours)
-        crashhits_range = CrashHit.objects.select_for_update().filter(
-            Q(lastUpdate__gt=period - timedelta(hours=1))
-            & Q(lastUpdate__gte=last_run)
-            & Q(lastUpdate__lte=period)
-        )
-        queryset = CrashEntry.objects.filter(
-            created__gt=max(period - timedelta(hours=1), last_run), created__lte=period
+    # Count all crashes since the last run at once, grouped by tool and period.
+    # A period is the end of the hour a crash falls in (see CrashHit.get_period),
+    # so truncate 1µs before the crash time to have crashes exactly on the hour
+    # end up in the period ending at that time.
+    new_hits = (
+        CrashEntry.objects.filter(created__gt=last_run, created__lte=now)
+        .annotate(
+            period=TruncHour(
+                ExpressionWrapper(
+                    F("created") - timedelta(microseconds=1),
+                    output_field=DateTimeField(),
+                ),
+                tzinfo=dt_timezone.utc,
+            )
         )
-        tools_breakdown = Tool.objects.filter(crashentry__in=queryset).annotate(
-            crashes=Count("crashentry")
-        )
-        for tool in tools_breakdown:
-            with transaction.atomic():
-                obj, created = crashhits_range.get_or_create(
-                    tool=tool,
-                    defaults={
-                        "lastUpdate": min(period, now),
-                        "count": tool.crashes,
-                    },
-                )
-                if not created:
-                    obj.lastUpdate = min(period, now)
-                    obj.count = F("count") + tool.crashes
-                    obj.save()
-        if period <= last_run:
-            break
+        .values("tool_id", "period")
+        .annotate(crashes=Count("id"))
+    )
+    counts = {
+        (row["period"] + timedelta(hours=1), row["tool_id"]): row["crashes"]
+        for row in new_hits
+    }
+
+    created, updated = (0, 0)
+    if counts:
+        first_period = min(period for period, _ in counts)
+        with transaction.atomic():
+            existing = {}
+            for hit in CrashHit.objects.select_for_update().filter(
+                lastUpdate__gt=first_period - timedelta(hours=1)
+            ):
+                existing[(CrashHit.get_period(hit.lastUpdate), hit.tool_id)] = hit
+
+            to_create = []
+            to_update = []
+            for (period, tool_id), crashes in counts.items():
+                hit = existing.get((period, tool_id))
+                if hit is None:
+                    to_create.append(
+                        CrashHit(
+                            tool_id=tool_id,
+                            lastUpdate=min(period, now),
+                            count=crashes,
+                        )
+                    )
+                else:
+                    hit.lastUpdate = min(period, now)
+                    hit.count += crashes
+                    to_update.append(hit)
+            CrashHit.objects.bulk_create(to_create)
+            CrashHit.objects.bulk_update(to_update, ["lastUpdate", "count"])
+            created, updated = (len(to_create), len(to_update))
+
     # trim old stats
     old_cutoff = cur_period - max_history
     CrashHit.objects.filter(lastUpdate__lt=old_cutoff).delete()
 
+    LOG.info(
+        "Updated crash stats since %s: %d crashes, %d hits created, %d updated "
+        "in %.3fs",
+        last_run,
+        sum(counts.values()),
+        created,
+        updated,
+        time.perf_counter() - start,
+    )
+
+
+@app.task(ignore_result=True)
+def optimize_signatures():
+    from .models import Bucket
+    from .tasks import optimize_bucket_signatures
+
+    interval = getattr(settings, "OPTIMIZE_SIGNATURES_INTERVAL", 15 * 60)
+    cache.set(OPTIMIZE_SIGNATURES_SCHEDULED, True, interval)
+
+    # Spread the buckets over all workers, each one sharing the first entries
+    # of all buckets between the buckets it optimizes
+    chunk_size = getattr(settings, "OPTIMIZE_SIGNATURES_CHUNK_SIZE", 50)
+    pks = list(Bucket.objects.order_by("pk").values_list("pk", flat=True))
+    group(
+        optimize_bucket_signatures.s(pks[offset : offset + chunk_size])
+        for offset in range(0, len(pks), chunk_size)
+    )()
+
 
 @app.task(ignore_result=True)
 def bug_update_status():
@@ -83,12 +165,15 @@ def triage_new_crashes():
 def export_signatures():
     fd, tmpf = mkstemp(prefix="fm-sigs-", suffix=".zip")
     os.close(fd)
+    fd, tmpm = mkstemp(prefix="fm-sigs-", suffix=".json")
+    os.close(fd)
     try:
-        call_command("export_signatures", tmpf)
-        os.chmod(tmpf, 0o644)
-        shutil.copy(tmpf, SIGNATURES_ZIP)
+        call_command("export_signatures", tmpf, manifest=tmpm)
+        _publish(tmpf, SIGNATURES_ZIP)
+        _publish(tmpm, SIGNATURES_MANIFEST)
     finally:
         os.unlink(tmpf)
+        os.unlink(tmpm)
 
 
 @app.task(ignore_result=True)
@@ -1,4 +1,5 @@
 import logging
+import time
 from datetime import timedelta
 
 from django.conf import settings
@@ -6,7 +7,7 @@ from django.core.management import BaseCommand, CommandError  # noqa
 from django.db.models.aggregates import Count
 from django.utils import timezone
 
-from crashmanager.models import Bucket, Bug, CrashEntry
+from crashmanager.models import Bucket, BucketHit, Bug, CrashEntry, CrashEntryPurger
 
 LOG = logging.getLogger("fm.crashmanager.cleanup_old_crashes")
 
@@ -14,7 +15,41 @@ LOG = logging.getLogger("fm.crashmanager.cleanup_old_crashes")
 class Command(BaseCommand):
     help = "Cleanup old crash entries."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of crash entries to delete at once",
+        )
+        parser.add_argument(
+            "--file-workers",
+            type=int,
+            default=4,
+            help="Number of threads removing testcase files",
+        )
+
     def handle(self, *args, **options):
+        start = time.perf_counter()
+        # Crash entries are purged without running their delete signals, but
+        # cascading deletes (e.g. a bucket gaining entries during the cleanup)
+        # still do, so update their bucket hit counters at once as well.
+        with BucketHit.batch():
+            with CrashEntryPurger(
+                batch_size=options["batch_size"], file_workers=options["file_workers"]
+            ) as purger:
+                self.cleanup(purger)
+
+        if purger.deleted:
+            elapsed = time.perf_counter() - start
+            LOG.info(
+                "Removed %d crash entries in %.2fs (%.1f rows/s)",
+                purger.deleted,
+                elapsed,
+                purger.deleted / elapsed,
+            )
+
+    def cleanup(self, purger):
         cleanup_crashes_after_days = getattr(settings, "CLEANUP_CRASHES_AFTER_DAYS", 14)
         cleanup_fixed_buckets_after_days = getattr(
             settings, "CLEANUP_FIXED_BUCKETS_AFTER_DAYS", 3
@@ -33,41 +68,16 @@ class Command(BaseCommand):
         for bug in bugs:
             # Deleting the bug causes buckets referring to this bug as well as entries
             # referring these buckets to be deleted as well due to cascading delete.
-            # However, if the associated buckets are too large, the cascading delete
-            # can easily cause Django to run out of memory so we have to manually
-            # delete issues in batches first for large buckets.
-            # The reason for Django running OOM here is probably due to the fact that
-            # we have a post-delete receiver on CrashEntry that has to be called for
-            # every single deleted entry with the full instance. Maybe Django loads
-            # a copy of all instances to be deleted into memory for this purpose.
-            crash_count = CrashEntry.objects.filter(bucket__bug=bug).count()
+            # However, cascading deletes load every entry and run its post-delete
+            # receiver, which runs out of memory for large buckets, so purge the
+            # entries in batches first.
+            crash_count = purger.purge(CrashEntry.objects.filter(bucket__bug=bug))
             if crash_count:
                 LOG.info(
-                    "Removing %d CrashEntry objects from buckets assigned to bug %s",
+                    "Removed %d CrashEntry objects from buckets assigned to bug %s",
                     crash_count,
                     bug.externalId,
                 )
-            while crash_count > 500:
-                # Deleting things in buckets is complicated:
-                #
-                # Attempting to combine a subset (LIMIT) with a delete yields
-                #   "Cannot use 'limit' or 'offset' with delete."
-                #
-                # Using a nested query with pk_in=<filter query> yields
-                #   "This version of MySQL doesn't yet support
-                #        'LIMIT & IN/ALL/ANY/SOME subquery'"
-
-                # So the only way we have left is to manually select a given amount of
-                # pks and store them in a list to use pk__in with the list and a DELETE
-                # query.
-
-                pks = list(
-                    CrashEntry.objects.filter(bucket__bug=bug).values_list(
-                        "pk", flat=True
-                    )[:500]
-                )
-                CrashEntry.objects.filter(pk__in=pks).delete()
-                crash_count = CrashEntry.objects.filter(bucket__bug=bug).count()
 
             bug.delete()
 
@@ -82,9 +92,6 @@ class Command(BaseCommand):
         # or the bucket has no bug associated with it. If the bucket has a bug
         # associated then we would want to keep entries around until the bug is fixed
         # (they will be deleted when the bucket is deleted).
-        #
-        # Again, for the same reason as mentioned above, we have to delete entries in
-        # batches.
         expiryDate = now - timedelta(
             days=cleanup_crashes_after_days,
             hours=now.hour,
@@ -92,21 +99,11 @@ class Command(BaseCommand):
             seconds=now.second,
             microseconds=now.microsecond,
         )
-        old_crashes = CrashEntry.objects.filter(
-            created__lt=expiryDate, bucket__bug=None
-        ).count()
+        old_crashes = purger.purge(
+            CrashEntry.objects.filter(created__lt=expiryDate, bucket__bug=None)
+        )
         if old_crashes:
-            LOG.info("Removing %d old, unbucketed crashes", old_crashes)
-        while old_crashes:
-            pks = list(
-                CrashEntry.objects.filter(
-                    created__lt=expiryDate, bucket__bug=None
-                ).values_list("pk", flat=True)[:500]
-            )
-            CrashEntry.objects.filter(pk__in=pks).delete()
-            old_crashes = CrashEntry.objects.filter(
-                created__lt=expiryDate, bucket__bug=None
-            ).count()
+            LOG.info("Removed %d old, unbucketed crashes", old_crashes)
 
         # Cleanup all bugs that don't belong to any bucket anymore
         orphan_bugs = Bug.objects.filter(bucket__isnull=True)
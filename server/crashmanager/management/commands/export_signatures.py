@@ -1,10 +1,14 @@
 import json
+import time
 from zipfile import ZipFile
 
 from django.core.management.base import BaseCommand
-from django.db.models.aggregates import Count, Min
+from django.db.models import F, Window
+from django.db.models.aggregates import Count
+from django.db.models.functions import RowNumber
 
 from crashmanager.models import Bucket, CrashEntry
+from FTB.Signatures.SignatureManifest import hashSignatureFiles
 
 
 class Command(BaseCommand):
@@ -14,39 +18,97 @@ class Command(BaseCommand):
         parser.add_argument(
             "filename", help="output filename to write signatures zip to"
         )
+        parser.add_argument(
+            "--manifest",
+            help="output filename to write the manifest (bucket id to content hash) to",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of buckets to fetch from the database at once",
+        )
 
     def handle(self, filename, **options):
-        with ZipFile(filename, "w") as zipFile:
-            for bucket in Bucket.objects.annotate(
-                size=Count("crashentry"), quality=Min("crashentry__testcase__quality")
-            ):
-                bestEntryQuery = (
-                    CrashEntry.objects.filter(bucket_id=bucket.pk)
-                    .filter(testcase__quality=bucket.quality)
-                    .defer("rawCrashData", "rawStderr", "rawStdout")
-                    .order_by("testcase__size", "-id")
+        start = time.perf_counter()
+
+        # The best testcase of each bucket is the one with the lowest quality value,
+        # then the smallest size, then the newest entry. Find all of them in a
+        # single query instead of one per bucket.
+        best_testcases = {
+            bucket_id: (quality, size)
+            for bucket_id, quality, size in CrashEntry.objects.filter(
+                bucket__isnull=False, testcase__isnull=False
+            )
+            .annotate(
+                row=Window(
+                    RowNumber(),
+                    partition_by=F("bucket_id"),
+                    order_by=(
+                        F("testcase__quality").asc(),
+                        F("testcase__size").asc(),
+                        F("id").desc(),
+                    ),
                 )
-                if bestEntryQuery.count():
-                    bucket.bestEntry = bestEntryQuery[0]
-                else:
-                    bucket.bestEntry = None
+            )
+            .filter(row=1)
+            .values_list("bucket_id", "testcase__quality", "testcase__size")
+        }
+        query_time = time.perf_counter() - start
+
+        buckets = (
+            Bucket.objects.annotate(size=Count("crashentry"))
+            .order_by("id")
+            .values_list(
+                "id",
+                "signature",
+                "shortDescription",
+                "frequent",
+                "bug_id",
+                "bug__externalId",
+                "size",
+            )
+        )
 
+        manifest = {}
+        with ZipFile(filename, "w") as zipFile:
+            for (
+                bucket_id,
+                signature,
+                short_description,
+                frequent,
+                bug_id,
+                bug_external_id,
+                size,
+            ) in buckets.iterator(chunk_size=options["chunk_size"]):
                 metadata = {}
-                metadata["size"] = bucket.size
-                metadata["shortDescription"] = bucket.shortDescription
-                metadata["frequent"] = bucket.frequent
-                if bucket.bug is not None:
-                    metadata["bug__id"] = bucket.bug.externalId
-
-                if (
-                    bucket.bestEntry is not None
-                    and bucket.bestEntry.testcase is not None
-                ):
-                    metadata["testcase__quality"] = bucket.bestEntry.testcase.quality
-                    metadata["testcase__size"] = bucket.bestEntry.testcase.size
-
-                sigFileName = "%d.signature" % bucket.pk
-                metaFileName = "%d.metadata" % bucket.pk
-
-                zipFile.writestr(sigFileName, bucket.signature)
-                zipFile.writestr(metaFileName, json.dumps(metadata, indent=4))
+                metadata["size"] = size
+                metadata["shortDescription"] = short_description
+                metadata["frequent"] = frequent
+                if bug_id is not None:
+                    metadata["bug__id"] = bug_external_id
+
+                if bucket_id in best_testcases:
+                    quality, testcase_size = best_testcases[bucket_id]
+                    metadata["testcase__quality"] = quality
+                    metadata["testcase__size"] = testcase_size
+
+                sigFileName = "%d.signature" % bucket_id
+                metaFileName = "%d.metadata" % bucket_id
+
+                sigData = signature.encode("utf-8")
+                metaData = json.dumps(metadata, indent=4).encode("utf-8")
+                zipFile.writestr(sigFileName, sigData)
+                zipFile.writestr(metaFileName, metaData)
+                manifest[str(bucket_id)] = hashSignatureFiles(sigData, metaData)
+
+        if options["manifest"]:
+            with open(options["manifest"], "w") as manifestFile:
+                json.dump(manifest, manifestFile)
+
+        elapsed = time.perf_counter() - start
+        print(
+            f"Exported {len(manifest)} signatures in {elapsed:.2f}s "
+            f"(best testcases: {query_time:.2f}s, "
+            f"{len(manifest) / elapsed if elapsed else 0:.1f} signatures/s)"
+        )
@@ -0,0 +1,69 @@
+import time
+
+from django.core.management import BaseCommand
+
+from crashmanager.models import CrashEntry
+from FTB.Signatures.CacheObject import dumpCacheObject, isCompact, loadCacheObject
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encode the cached crash information of all crash entries in the given "
+        "format (e.g. after changing CRASHINFO_CACHE_COMPACT)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=("compact", "json"),
+            default="compact",
+            help="Format to store the cached crash information in",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of crash entries to load and update at once",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        compact = options["format"] == "compact"
+        entries = CrashEntry.objects.exclude(cachedCrashInfo=None).exclude(
+            cachedCrashInfo=""
+        )
+
+        total, updated = (0, 0)
+        next_id = 0
+        while True:
+            batch = list(
+                entries.filter(pk__gt=next_id)
+                .order_by("id")
+                .only("id", "cachedCrashInfo")[: options["batch_size"]]
+            )
+            if not batch:
+                break
+            next_id = batch[-1].pk
+            total += len(batch)
+
+            changed = []
+            for entry in batch:
+                if isCompact(entry.cachedCrashInfo) == compact:
+                    continue
+                data = dumpCacheObject(
+                    loadCacheObject(entry.cachedCrashInfo), compact=compact
+                )
+                if data != entry.cachedCrashInfo:
+                    entry.cachedCrashInfo = data
+                    changed.append(entry)
+
+            # bulk_update does not trigger the CrashEntry save hooks, which is
+            # what we want: nothing but the encoding changes.
+            CrashEntry.objects.bulk_update(changed, ["cachedCrashInfo"])
+            updated += len(changed)
+
+        elapsed = time.perf_counter() - start
+        print(
+            f"Re-encoded {updated} of {total} crash entries as {options['format']} "
+            f"in {elapsed:.2f}s"
+        )
@@ -1,17 +1,7 @@
-from collections import OrderedDict
-
-from django.conf import settings
 from django.core.management import BaseCommand
 
 from crashmanager.models import Bucket, CrashEntry
-
-# This is a per-worker global cache mapping short descriptions of
-# crashes to a list of bucket candidates to try first.
-#
-# although this cache looks pointless within this command,
-# the command is called in a loop from triage_new_crashes.py
-# and may be called multiple times in one process by celery
-TRIAGE_CACHE = OrderedDict()
+from crashmanager.triage import BUCKET_INDEX, find_bucket
 
 
 class Command(BaseCommand):
@@ -28,47 +18,23 @@ class Command(BaseCommand):
         entry = CrashEntry.objects.get(pk=options["id"])
         crashInfo = entry.getCrashInfo(attachTestcase=True)
 
-        cacheHit = False
-
-        triage_cache_hint = TRIAGE_CACHE.get(entry.shortSignature, [])
-
-        if triage_cache_hint:
-            buckets = Bucket.objects.filter(pk__in=triage_cache_hint).order_by("-id")
-            for bucket in buckets:
-                signature = bucket.getSignature()
-                if signature.matches(crashInfo):
-                    entry.bucket = bucket
-                    print("Cache hit")
-                    cacheHit = True
-                    break
-
-        if not cacheHit:
-            buckets = Bucket.objects.exclude(pk__in=triage_cache_hint).order_by("-id")
-
-            for bucket in buckets:
-                signature = bucket.getSignature()
-                if signature.matches(crashInfo):
-                    entry.bucket = bucket
-
-                    cacheList = [bucket.pk]
-                    if triage_cache_hint:
-                        cacheList = TRIAGE_CACHE[entry.shortSignature]
-
-                        # We delete the current entry and add it again to ensure
-                        # that our dictionary remains ordered by the time of last
-                        # use. We can then just pop the first element if the cache
-                        # grows too large, evicting the least used item.
-                        del TRIAGE_CACHE[entry.shortSignature]
-                        cacheList.append(bucket.pk)
-
-                    TRIAGE_CACHE[entry.shortSignature] = cacheList
-
-                    if len(TRIAGE_CACHE) > getattr(
-                        settings, "CELERY_TRIAGE_MEMCACHE_ENTRIES", 100
-                    ):
-                        TRIAGE_CACHE.popitem(last=False)
-
-                    break
+        def accept(bucket_id):
+            bucket = Bucket.objects.filter(pk=bucket_id).first()
+            if bucket is None:
+                # Deleted by another process since the index was synced
+                BUCKET_INDEX.invalidate(bucket_id)
+                return False
+            if bucket.signature != BUCKET_INDEX.get_raw_signature(bucket_id):
+                # Modified by another process since the index was synced
+                BUCKET_INDEX.invalidate(bucket_id)
+                if not bucket.getSignature().matches(crashInfo):
+                    return False
+            entry.bucket = bucket
+            return True
+
+        _, cacheHit = find_bucket(crashInfo, entry.shortSignature, accept=accept)
+        if cacheHit:
+            print("Cache hit")
 
         entry.triagedOnce = True
         entry.save()
@@ -1,6 +1,17 @@
+import time
+
 from django.core.management import BaseCommand, call_command
+from django.db import transaction
+from django.db.models.aggregates import Max
 
-from crashmanager.models import CrashEntry
+from crashmanager.models import (
+    Bucket,
+    BucketHitCounter,
+    BucketWatch,
+    CrashEntry,
+    notify_bucket_hit,
+)
+from crashmanager.triage import BUCKET_INDEX, find_bucket
 
 
 class Command(BaseCommand):
@@ -9,13 +20,35 @@ class Command(BaseCommand):
         "before to assign them into the existing buckets."
     )
 
-    def handle(self, *args, **options):
-        entries = CrashEntry.objects.filter(triagedOnce=False, bucket=None).values_list(
-            "id", flat=True
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of crash entries to load and triage at once",
         )
 
-        for entry in entries:
-            call_command("triage_new_crash", entry)
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        untriaged = CrashEntry.objects.filter(triagedOnce=False, bucket=None)
+
+        # Only handle entries that exist now, so we finish even under a
+        # constant stream of new crashes.
+        last_id = untriaged.aggregate(Max("id"))["id__max"]
+
+        total, assigned = (0, 0)
+        next_id = 0
+        while last_id is not None:
+            ids = list(
+                untriaged.filter(pk__gt=next_id, pk__lte=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[: options["batch_size"]]
+            )
+            if not ids:
+                break
+            next_id = ids[-1]
+            assigned += self.triage_batch(ids)
+            total += len(ids)
 
         # This query ensures that all issues that have been bucketed manually before
         # the server had a chance to triage them will have their triageOnce flag set,
@@ -23,3 +56,92 @@ class Command(BaseCommand):
         CrashEntry.deferRawFields(CrashEntry.objects.exclude(bucket=None)).update(
             triagedOnce=True
         )
+
+        if total:
+            elapsed = time.perf_counter() - start
+            print(
+                f"Triaged {total} crashes ({assigned} assigned) in {elapsed:.2f}s "
+                f"({total / elapsed:.1f} crashes/s)"
+            )
+
+    @staticmethod
+    def triage_batch(ids):
+        BUCKET_INDEX.sync()
+        sources = BUCKET_INDEX.required_output_sources
+        attach_testcase = BUCKET_INDEX.requires_testcase
+
+        entries = CrashEntry.deferRawFields(
+            CrashEntry.objects.filter(pk__in=ids).select_related(
+                "os", "platform", "product", "testcase"
+            ),
+            sources,
+        )
+
+        matches = {}
+        for entry in entries:
+            crashInfo = entry.getCrashInfo(
+                attachTestcase=attach_testcase, requiredOutputSources=sources
+            )
+            bucket_id, _ = find_bucket(crashInfo, entry.shortSignature, sync=False)
+            if bucket_id is not None:
+                matches.setdefault(bucket_id, []).append(entry)
+
+        # Buckets may have been changed or removed by another process since the
+        # index was synced. Entries matched to such a bucket are triaged again
+        # one by one.
+        buckets = Bucket.objects.in_bulk(matches)
+        retry = []
+        for bucket_id in list(matches):
+            bucket = buckets.get(bucket_id)
+            expected = BUCKET_INDEX.get_raw_signature(bucket_id)
+            if bucket is None or bucket.signature != expected:
+                BUCKET_INDEX.invalidate(bucket_id)
+                retry.extend(matches.pop(bucket_id))
+
+        hits = BucketHitCounter()
+        assigned = []
+        with transaction.atomic():
+            # Skip entries that were bucketed manually in the meantime
+            unbucketed = set(
+                CrashEntry.objects.select_for_update()
+                .filter(pk__in=ids, bucket=None)
+                .values_list("id", flat=True)
+            )
+            for bucket_id, bucket_entries in matches.items():
+                bucket_entries = [e for e in bucket_entries if e.pk in unbucketed]
+                if not bucket_entries:
+                    continue
+                CrashEntry.objects.filter(
+                    pk__in=[entry.pk for entry in bucket_entries]
+                ).update(bucket_id=bucket_id, triagedOnce=True)
+                for entry in bucket_entries:
+                    entry.bucket = buckets[bucket_id]
+                    hits.add(bucket_id, entry.tool_id, entry.created)
+                assigned.extend(bucket_entries)
+
+            hits.flush()
+
+            CrashEntry.objects.filter(pk__in=ids, bucket=None).exclude(
+                pk__in=[entry.pk for entry in retry]
+            ).update(triagedOnce=True)
+
+        watched = set(
+            BucketWatch.objects.filter(
+                bucket__in=list(buckets), user__bucket_hit=True
+            ).values_list("bucket_id", flat=True)
+        )
+        for entry in assigned:
+            if entry.bucket_id in watched:
+                notify_bucket_hit(entry)
+
+        if not retry:
+            return len(assigned)
+
+        for entry in retry:
+            call_command("triage_new_crash", entry.pk)
+        return (
+            len(assigned)
+            + CrashEntry.objects.filter(
+                pk__in=[entry.pk for entry in retry], bucket__isnull=False
+            ).count()
+        )
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+import crashmanager.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0017_buckethit_unique_buckethits_per_period"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="buckethit",
+            name="begin",
+            field=models.DateTimeField(
+                db_index=True, default=crashmanager.models.buckethit_default_range_begin
+            ),
+        ),
+        migrations.AlterField(
+            model_name="crashentry",
+            name="created",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0018_buckethit_begin_crashentry_created_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bucket",
+            name="optimizedSignatureComputed",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
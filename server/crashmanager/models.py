@@ -1,6 +1,16 @@
+import contextlib
+import copy
+import functools
 import json
 import logging
+import multiprocessing
+import operator
+import os
 import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from itertools import zip_longest
 
@@ -9,7 +19,8 @@ from django.contrib.auth.models import Permission
 from django.contrib.auth.models import User as DjangoUser
 from django.contrib.contenttypes.models import ContentType
 from django.core.files.storage import FileSystemStorage
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models.functions import Greatest
 from django.db.models.signals import post_delete, post_save
 from django.dispatch.dispatcher import receiver
 from django.utils import timezone
@@ -17,12 +28,17 @@ from enumfields import Enum, EnumField
 from notifications.signals import notify
 
 from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CacheObject import dumpCacheObject, loadCacheObject
 from FTB.Signatures.CrashInfo import CrashInfo
-from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.CrashSignature import SIGNATURE_CACHE, CrashSignature
+
+from .triage import BUCKET_INDEX
 
 if getattr(settings, "USE_CELERY", None):
     from .tasks import triage_new_crash
 
+LOG = logging.getLogger("fm.crashmanager.models")
+
 
 class Tool(models.Model):
     name = models.CharField(max_length=63, unique=True)
@@ -136,6 +152,8 @@ class Bucket(models.Model):
     )
     signature = models.TextField()
     optimizedSignature = models.TextField(blank=True, null=True)
+    # When optimizedSignature was last computed in the background
+    optimizedSignatureComputed = models.DateTimeField(blank=True, null=True)
     shortDescription = models.CharField(max_length=1023, blank=True)
     frequent = models.BooleanField(blank=False, default=False)
     permanent = models.BooleanField(blank=False, default=False)
@@ -150,10 +168,11 @@ class Bucket(models.Model):
         return DjangoUser.objects.filter(id__in=ids).distinct()
 
     def getSignature(self):
-        return CrashSignature(self.signature)
+        # The parsed signature is shared, don't modify it
+        return CrashSignature.fromCache(self.signature)
 
     def getOptimizedSignature(self):
-        return CrashSignature(self.optimizedSignature)
+        return CrashSignature.fromCache(self.optimizedSignature)
 
     def save(self, *args, **kwargs):
         modified = set()
@@ -171,7 +190,8 @@ class Bucket(models.Model):
         keepOptimized = kwargs.pop("keepOptimized", False)
         if not keepOptimized:
             self.optimizedSignature = None
-            modified.add("optimizedSignature")
+            self.optimizedSignatureComputed = None
+            modified.update(("optimizedSignature", "optimizedSignatureComputed"))
 
         # required in Django 4.2+
         if "update_fields" in kwargs and kwargs["update_fields"] is not None:
@@ -268,37 +288,131 @@ class Bucket(models.Model):
                     outListCount += 1
 
         if submitSave:
-            while inList:
-                updList, inList = inList[:500], inList[500:]
-                for crash in CrashEntry.objects.filter(pk__in=updList).values(
-                    "bucket_id", "created", "tool_id"
-                ):
-                    if crash["bucket_id"] != self.id:
-                        if crash["bucket_id"] is not None:
-                            BucketHit.decrement_count(
-                                crash["bucket_id"], crash["tool_id"], crash["created"]
-                            )
-                        BucketHit.increment_count(
-                            self.id, crash["tool_id"], crash["created"]
-                        )
-                CrashEntry.objects.filter(pk__in=updList).update(bucket=self)
-            while outList:
-                updList, outList = outList[:500], outList[500:]
-                for crash in CrashEntry.objects.filter(pk__in=updList).values(
-                    "bucket_id", "created", "tool_id"
-                ):
+            self._apply_reassign(inList, outList)
+            inList, outList = [], []
+
+        return inList, outList, inListCount, outListCount, nextOffset
+
+    def _apply_reassign(self, inList, outList):
+        hits = BucketHitCounter()
+
+        while inList:
+            updList, inList = inList[:500], inList[500:]
+            for crash in CrashEntry.objects.filter(pk__in=updList).values(
+                "bucket_id", "created", "tool_id"
+            ):
+                if crash["bucket_id"] != self.id:
                     if crash["bucket_id"] is not None:
-                        BucketHit.decrement_count(
-                            crash["bucket_id"], crash["tool_id"], crash["created"]
+                        hits.add(
+                            crash["bucket_id"], crash["tool_id"], crash["created"], -1
                         )
-                CrashEntry.objects.filter(pk__in=updList).update(
-                    bucket=None, triagedOnce=False
+                    hits.add(self.id, crash["tool_id"], crash["created"])
+            CrashEntry.objects.filter(pk__in=updList).update(bucket=self)
+        while outList:
+            updList, outList = outList[:500], outList[500:]
+            for crash in CrashEntry.objects.filter(pk__in=updList).values(
+                "bucket_id", "created", "tool_id"
+            ):
+                if crash["bucket_id"] is not None:
+                    hits.add(crash["bucket_id"], crash["tool_id"], crash["created"], -1)
+            CrashEntry.objects.filter(pk__in=updList).update(
+                bucket=None, triagedOnce=False
+            )
+
+        hits.flush()
+
+    def get_reassign_ranges(self, chunk_size=None):
+        """
+        Split the ids of all entries that are unassigned or in this bucket into
+        ranges of (at most) chunk_size ids, for reassigning them in parallel.
+        """
+        if chunk_size is None:
+            chunk_size = getattr(settings, "REASSIGN_CHUNK_SIZE", 10000)
+        bounds = CrashEntry.objects.filter(
+            models.Q(bucket=None) | models.Q(bucket=self)
+        ).aggregate(first=models.Min("id"), last=models.Max("id"))
+        if bounds["first"] is None:
+            return []
+        return [
+            (first_id, min(first_id + chunk_size - 1, bounds["last"]))
+            for first_id in range(bounds["first"], bounds["last"] + 1, chunk_size)
+        ]
+
+    def reassign_range(self, first_id, last_id):
+        """
+        Assign all unassigned issues with ids in the given (inclusive) range that
+        match our signature to this bucket, and remove all non-matching issues in
+        the range from our bucket.
+
+        Returns how many issues were assigned and removed.
+        """
+        signature = self.getSignature()
+        needTest = signature.matchRequiresTest()
+        entries = CrashEntry.objects.filter(
+            models.Q(bucket=None) | models.Q(bucket=self),
+            id__gte=first_id,
+            id__lte=last_id,
+        ).select_related("product", "platform", "os")
+        if needTest:
+            entries = entries.select_related("testcase")
+
+        requiredOutputs = signature.getRequiredOutputSources()
+        entries = CrashEntry.deferRawFields(entries, requiredOutputs)
+
+        inList, outList = [], []
+        for entry in entries.iterator():
+            match = signature.matches(
+                entry.getCrashInfo(
+                    attachTestcase=needTest, requiredOutputSources=requiredOutputs
                 )
+            )
+            if match and entry.bucket_id is None:
+                inList.append(entry.pk)
+            elif not match and entry.bucket_id is not None:
+                outList.append(entry.pk)
 
-        return inList, outList, inListCount, outListCount, nextOffset
+        self._apply_reassign(inList, outList)
+        return len(inList), len(outList)
+
+    def reassign_parallel(self, processes=None, chunk_size=None):
+        """
+        Reassign all issues like L{reassign} with submitSave set, but match them
+        in a pool of worker processes, each handling one range of entry ids.
+
+        Returns how many issues were assigned and removed.
+        """
+        ranges = self.get_reassign_ranges(chunk_size)
+        if processes is None:
+            processes = getattr(settings, "REASSIGN_PROCESSES", os.cpu_count())
 
-    def optimizeSignature(self, unbucketed_entries):
-        buckets = Bucket.objects.all()
+        if processes <= 1 or len(ranges) <= 1:
+            results = [self.reassign_range(*id_range) for id_range in ranges]
+        else:
+            # Database connections must not be shared with the forked workers
+            connections.close_all()
+            with multiprocessing.get_context("fork").Pool(processes) as pool:
+                results = pool.starmap(
+                    _reassign_range, [(self.pk, *id_range) for id_range in ranges]
+                )
+
+        return (
+            sum(inCount for inCount, _ in results),
+            sum(outCount for _, outCount in results),
+        )
+
+    def optimizeSignature(self, unbucketed_entries, firstEntryCache=None):
+        """
+        Try to find a more general signature for this bucket that also matches
+        some of the given unbucketed entries, but none of the other buckets.
+
+        @type firstEntryCache: FirstEntryCache
+        @param firstEntryCache: Cache of the first entry of every bucket, can
+                                be shared when optimizing several buckets
+
+        @return: The optimized signature (or None) and the matching entries
+        """
+        if firstEntryCache is None:
+            firstEntryCache = FirstEntryCache()
 
         signature = self.getSignature()
         if signature.matchRequiresTest():
@@ -310,10 +424,6 @@ class Bucket(models.Model):
         optimizedSignature = None
         matchingEntries = []
 
-        # Avoid hitting the database multiple times when looking for the first
-        # entry of a bucket. Keeping these in memory is less expensive.
-        firstEntryPerBucketCache = {}
-
         for entry in entries:
             entry.crashinfo = entry.getCrashInfo(
                 attachTestcase=signature.matchRequiresTest(),
@@ -333,36 +443,18 @@ class Bucket(models.Model):
                 # likely too broad and we should not consider it (or later rate it worse
                 # than others).
                 matchesInOtherBuckets = False
-                nonMatchesInOtherBuckets = 0  # noqa
-                otherMatchingBucketIds = []  # noqa
-                for otherBucket in buckets:
-                    if otherBucket.pk == self.pk:
+                for otherBucketId, otherBugId in firstEntryCache.buckets():
+                    if otherBucketId == self.pk:
                         continue
 
-                    if (
-                        self.bug
-                        and otherBucket.bug
-                        and self.bug.pk == otherBucket.bug.pk
-                    ):
+                    if self.bug_id is not None and self.bug_id == otherBugId:
                         # Allow matches in other buckets if they are both linked to the
                         # same bug
                         continue
 
-                    if otherBucket.pk not in firstEntryPerBucketCache:
-                        c = CrashEntry.objects.filter(
-                            bucket=otherBucket
-                        ).select_related("product", "platform", "os")
-                        c = CrashEntry.deferRawFields(c, requiredOutputs)
-                        c = c.first()
-                        firstEntryPerBucketCache[otherBucket.pk] = c
-                        if c:
-                            # Omit testcase for performance reasons for now
-                            firstEntryPerBucketCache[otherBucket.pk] = c.getCrashInfo(
-                                attachTestcase=False,
-                                requiredOutputSources=requiredOutputs,
-                            )
-
-                    firstEntryCrashInfo = firstEntryPerBucketCache[otherBucket.pk]
+                    firstEntryCrashInfo = firstEntryCache.get(
+                        otherBucketId, requiredOutputs
+                    )
                     if firstEntryCrashInfo:
                         # Omit testcase for performance reasons for now
                         if optimizedSignature.matches(firstEntryCrashInfo):
@@ -391,36 +483,308 @@ class Bucket(models.Model):
         return (optimizedSignature, matchingEntries)
 
 
+class FirstEntryCache:
+    """
+    The buckets and the CrashInfo of the first entry of each bucket, as used by
+    Bucket.optimizeSignature to check that an optimized signature does not
+    match other buckets. Avoids hitting the database for every bucket and can
+    be shared by the optimization of several buckets.
+
+    Only the raw output fields needed by the signatures matched against them
+    are loaded, and at most FIRST_ENTRY_CACHE_ENTRIES buckets are kept.
+    """
+
+    CHUNK_SIZE = 500
+    ALL_OUTPUTS = frozenset(("stdout", "stderr", "crashdata"))
+
+    def __init__(self, size=None):
+        if size is None:
+            size = getattr(settings, "FIRST_ENTRY_CACHE_ENTRIES", 10000)
+        self.size = max(size, 1)
+        self.bucketList = None
+        # bucket id -> (loaded output sources, CrashInfo or None), least
+        # recently used first
+        self.crashInfos = OrderedDict()
+
+    def buckets(self):
+        """
+        @return: (id, bug id) of all buckets
+        """
+        if self.bucketList is None:
+            self.bucketList = list(
+                Bucket.objects.order_by("pk").values_list("pk", "bug_id")
+            )
+        return self.bucketList
+
+    def _cached(self, bucketId, requiredOutputs):
+        cached = self.crashInfos.get(bucketId)
+        return cached is not None and cached[0] >= requiredOutputs
+
+    def _put(self, bucketId, outputs, crashInfo):
+        self.crashInfos[bucketId] = (outputs, crashInfo)
+        self.crashInfos.move_to_end(bucketId)
+        while len(self.crashInfos) > self.size:
+            self.crashInfos.popitem(last=False)
+
+    def preload(self, bucketIds, requiredOutputs=ALL_OUTPUTS):
+        """
+        Load the first entries of the given buckets with as few queries as
+        possible, up to the size of the cache.
+
+        @type requiredOutputs: list(str)
+        @param requiredOutputs: Output sources needed for matching, see
+                                CrashSignature.getRequiredOutputSources
+        """
+        requiredOutputs = frozenset(requiredOutputs)
+        bucketIds = [
+            pk
+            for pk in dict.fromkeys(bucketIds)
+            if not self._cached(pk, requiredOutputs)
+        ][: self.size]
+        for offset in range(0, len(bucketIds), self.CHUNK_SIZE):
+            chunk = bucketIds[offset : offset + self.CHUNK_SIZE]
+            firstIds = (
+                CrashEntry.objects.filter(bucket_id__in=chunk)
+                .values("bucket_id")
+                .annotate(first=models.Min("id"))
+                .values_list("first", flat=True)
+            )
+            for pk in chunk:
+                # Empty buckets don't match any signature
+                self._put(pk, self.ALL_OUTPUTS, None)
+            entries = CrashEntry.deferRawFields(
+                CrashEntry.objects.filter(pk__in=list(firstIds)).select_related(
+                    "product", "platform", "os"
+                ),
+                requiredOutputs,
+            )
+            for entry in entries:
+                self._put(
+                    entry.bucket_id,
+                    requiredOutputs,
+                    entry.getCrashInfo(
+                        attachTestcase=False, requiredOutputSources=requiredOutputs
+                    ),
+                )
+
+    def get(self, bucketId, requiredOutputs=ALL_OUTPUTS):
+        requiredOutputs = frozenset(requiredOutputs)
+        if not self._cached(bucketId, requiredOutputs):
+            # Most of the following buckets will be needed as well
+            bucketIds = [pk for pk, _ in self.buckets()]
+            try:
+                following = bucketIds[bucketIds.index(bucketId) :]
+            except ValueError:
+                following = []
+            self.preload([bucketId] + following, requiredOutputs)
+        self.crashInfos.move_to_end(bucketId)
+        return self.crashInfos[bucketId][1]
+
+
+def precompute_optimized_signatures(bucketIds):
+    """
+    Compute and store the optimized signatures of the given buckets against
+    all unbucketed entries.
+
+    @return: Number of buckets for which an optimized signature was found
+    """
+    firstEntryCache = FirstEntryCache()
+    unbucketed = (
+        CrashEntry.objects.filter(bucket=None)
+        .order_by("-id")
+        .select_related("platform", "product", "os", "tool")
+    )
+
+    found = 0
+    for bucket in Bucket.objects.filter(pk__in=bucketIds).order_by("pk"):
+        start = time.perf_counter()
+        optimizedSignature, _ = bucket.optimizeSignature(unbucketed, firstEntryCache)
+        if optimizedSignature is not None:
+            optimizedSignature = str(optimizedSignature)
+            found += 1
+        # Don't store the result if the signature was changed in the meantime
+        Bucket.objects.filter(pk=bucket.pk, signature=bucket.signature).update(
+            optimizedSignature=optimizedSignature,
+            optimizedSignatureComputed=timezone.now(),
+        )
+        LOG.debug(
+            "Optimized signature of bucket %d in %.3fs (%s)",
+            bucket.pk,
+            time.perf_counter() - start,
+            "found" if optimizedSignature else "none",
+        )
+    return found
+
+
+def _reassign_range(bucket_id, first_id, last_id):
+    # Entry point for the worker processes of Bucket.reassign_parallel
+    bucket = Bucket.objects.filter(pk=bucket_id).first()
+    if bucket is None:
+        return (0, 0)
+    return bucket.reassign_range(first_id, last_id)
+
+
 def buckethit_default_range_begin():
     return timezone.now().replace(microsecond=0, second=0, minute=0)
 
 
+class BucketHitCounter:
+    """
+    Accumulates changes of BucketHit counters per (bucket, tool, hour) and
+    applies them with few queries: one upsert per chunk of increments and one
+    update per chunk of decrements by the same amount.
+    """
+
+    CHUNK_SIZE = 500
+
+    def __init__(self):
+        self.increments = Counter()
+        self.decrements = Counter()
+
+    def add(self, bucket_id, tool_id, begin, count=1):
+        key = (bucket_id, tool_id, begin.replace(microsecond=0, second=0, minute=0))
+        if count > 0:
+            self.increments[key] += count
+        elif count < 0:
+            self.decrements[key] -= count
+
+    def flush(self):
+        """Apply all accumulated changes, decrements first."""
+        decrements, self.decrements = (self.decrements, Counter())
+        increments, self.increments = (self.increments, Counter())
+
+        by_amount = {}
+        for key, count in decrements.items():
+            by_amount.setdefault(count, []).append(key)
+        for count, keys in by_amount.items():
+            for offset in range(0, len(keys), self.CHUNK_SIZE):
+                query = functools.reduce(
+                    operator.or_,
+                    (
+                        models.Q(bucket_id=bucket_id, tool_id=tool_id, begin=begin)
+                        for bucket_id, tool_id, begin in keys[
+                            offset : offset + self.CHUNK_SIZE
+                        ]
+                    ),
+                )
+                # Counters may be updated concurrently, so update them in the
+                # database
+                BucketHit.objects.filter(query, count__gt=0).update(
+                    count=Greatest(models.F("count") - count, 0)
+                )
+
+        rows = list(increments.items())
+        for offset in range(0, len(rows), self.CHUNK_SIZE):
+            self._upsert(rows[offset : offset + self.CHUNK_SIZE])
+
+    @staticmethod
+    def _upsert(rows):
+        connection = connections[router.db_for_write(BucketHit)]
+        opts = BucketHit._meta
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        columns = [
+            qn(opts.get_field(name).column)
+            for name in ("bucket", "tool", "begin", "count")
+        ]
+        count_column = columns[-1]
+
+        if connection.vendor in ("postgresql", "sqlite"):
+            conflict = (
+                f"ON CONFLICT ({', '.join(columns[:-1])}) DO UPDATE SET "
+                f"{count_column} = {table}.{count_column} + "
+                f"EXCLUDED.{count_column}"
+            )
+        elif connection.vendor == "mysql":
+            conflict = (
+                f"ON DUPLICATE KEY UPDATE {count_column} = "
+                f"{count_column} + VALUES({count_column})"
+            )
+        else:
+            for (bucket_id, tool_id, begin), count in rows:
+                counter, _ = BucketHit.objects.get_or_create(
+                    bucket_id=bucket_id, begin=begin, tool_id=tool_id
+                )
+                BucketHit.objects.filter(pk=counter.pk).update(
+                    count=models.F("count") + count
+                )
+            return
+
+        begin_field = opts.get_field("begin")
+        params = []
+        for (bucket_id, tool_id, begin), count in rows:
+            params.extend(
+                (
+                    bucket_id,
+                    tool_id,
+                    begin_field.get_db_prep_value(begin, connection),
+                    count,
+                )
+            )
+        values = ", ".join(["(%s, %s, %s, %s)"] * len(rows))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values} "
+                + conflict,
+                params,
+            )
+
+
+# BucketHitCounter collecting all changes of the current thread, see
+# BucketHit.batch
+_BUCKETHIT_BATCH = threading.local()
+
+
 class BucketHit(models.Model):
     bucket = models.ForeignKey(Bucket, on_delete=models.deletion.CASCADE)
     tool = models.ForeignKey(Tool, on_delete=models.deletion.CASCADE)
-    begin = models.DateTimeField(default=buckethit_default_range_begin)
+    begin = models.DateTimeField(default=buckethit_default_range_begin, db_index=True)
     count = models.IntegerField(default=0)
 
     @classmethod
-    def decrement_count(cls, bucket_id, tool_id, begin):
-        begin = begin.replace(microsecond=0, second=0, minute=0)
-        counter = cls.objects.filter(
-            bucket_id=bucket_id,
-            begin=begin,
-            tool_id=tool_id,
-        ).first()
-        if counter is not None and counter.count > 0:
-            counter.count -= 1
-            counter.save()
+    def _change_count(cls, bucket_id, tool_id, begin, count):
+        batch = getattr(_BUCKETHIT_BATCH, "counter", None)
+        counter = batch or BucketHitCounter()
+        counter.add(bucket_id, tool_id, begin, count)
+        if batch is None:
+            counter.flush()
 
     @classmethod
-    def increment_count(cls, bucket_id, tool_id, begin):
-        begin = begin.replace(microsecond=0, second=0, minute=0)
-        counter, _ = cls.objects.get_or_create(
-            bucket_id=bucket_id, begin=begin, tool_id=tool_id
-        )
-        counter.count += 1
-        counter.save()
+    def decrement_count(cls, bucket_id, tool_id, begin, count=1):
+        cls._change_count(bucket_id, tool_id, begin, -count)
+
+    @classmethod
+    def increment_count(cls, bucket_id, tool_id, begin, count=1):
+        cls._change_count(bucket_id, tool_id, begin, count)
+
+    @classmethod
+    @contextlib.contextmanager
+    def batch(cls):
+        """
+        Collect all counter changes made in this thread (e.g. by the CrashEntry
+        signal handlers while deleting many entries) and apply them together
+        when the context is left. The changes are applied on an exception too,
+        as entries deleted before it are usually committed already.
+        """
+        if getattr(_BUCKETHIT_BATCH, "counter", None) is not None:
+            # Nested, the outermost context applies the changes
+            yield _BUCKETHIT_BATCH.counter
+            return
+        counter = BucketHitCounter()
+        _BUCKETHIT_BATCH.counter = counter
+        try:
+            yield counter
+        except BaseException:
+            _BUCKETHIT_BATCH.counter = None
+            try:
+                counter.flush()
+            except Exception:
+                # e.g. a failed transaction that is rolled back anyway, don't
+                # hide the original error
+                LOG.exception("Failed to apply bucket hit changes")
+            raise
+        _BUCKETHIT_BATCH.counter = None
+        counter.flush()
 
     class Meta:
         constraints = [
@@ -458,8 +822,53 @@ class CrashHit(models.Model):
         ]
 
 
+@functools.lru_cache(maxsize=1024)
+def get_program_configuration(product, version, platform, os):
+    # ProgramConfiguration instances are shared, don't modify them
+    return ProgramConfiguration(product, platform, os, version)
+
+
+class CrashInfoCache:
+    """
+    A bounded, thread-safe LRU cache of parsed CrashInfo objects.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            crashInfo = self.entries.get(key)
+            if crashInfo is not None:
+                self.entries.move_to_end(key)
+            return crashInfo
+
+    def put(self, key, crashInfo):
+        if not self.size:
+            return
+        with self.lock:
+            self.entries[key] = crashInfo
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# This is a per-process cache of CrashInfo objects parsed by getCrashInfo,
+# which is called repeatedly for the same entries when matching signatures.
+CRASHINFO_CACHE = CrashInfoCache(getattr(settings, "CRASHINFO_CACHE_ENTRIES", 200))
+
+# Bucket signatures are parsed from the same few texts over and over again
+SIGNATURE_CACHE.resize(getattr(settings, "SIGNATURE_CACHE_ENTRIES", 10000))
+
+
 class CrashEntry(models.Model):
-    created = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
     tool = models.ForeignKey(Tool, on_delete=models.deletion.CASCADE)
     platform = models.ForeignKey(Platform, on_delete=models.deletion.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.deletion.CASCADE)
@@ -503,6 +912,21 @@ class CrashEntry(models.Model):
         return instance
 
     def save(self, *args, **kwargs):
+        modified = self.prepare_save()
+
+        # required in Django 4.2+
+        if "update_fields" in kwargs and kwargs["update_fields"] is not None:
+            kwargs["update_fields"] = modified.union(kwargs["update_fields"])
+
+        super().save(*args, **kwargs)
+
+    def prepare_save(self):
+        """
+        Sanitize and derive all fields that save() keeps in sync. This is also
+        needed for entries created with bulk_create, which bypasses save().
+
+        Returns the names of all fields that were modified.
+        """
         modified = set()
 
         if self.pk is None and not getattr(settings, "DB_ISUTF8MB4", False):
@@ -530,9 +954,12 @@ class CrashEntry(models.Model):
                 modified.add("rawCrashData")
 
         if not self.cachedCrashInfo:
-            # Serialize the important fields of the CrashInfo class into a JSON blob
+            # Serialize the important fields of the CrashInfo class into a blob
             crashInfo = self.getCrashInfo()
-            self.cachedCrashInfo = json.dumps(crashInfo.toCacheObject())
+            self.cachedCrashInfo = dumpCacheObject(
+                crashInfo.toCacheObject(),
+                compact=getattr(settings, "CRASHINFO_CACHE_COMPACT", True),
+            )
             modified.add("cachedCrashInfo")
 
         # Reserialize data, then call regular save method
@@ -574,11 +1001,7 @@ class CrashEntry(models.Model):
             self.shortSignature = self.shortSignature[:255]
             modified.add("shortSignature")
 
-        # required in Django 4.2+
-        if "update_fields" in kwargs and kwargs["update_fields"] is not None:
-            kwargs["update_fields"] = modified.union(kwargs["update_fields"])
-
-        super().save(*args, **kwargs)
+        return modified
 
     def deserializeFields(self):
         if self.args:
@@ -597,34 +1020,58 @@ class CrashEntry(models.Model):
         attachTestcase=False,
         requiredOutputSources=("stdout", "stderr", "crashdata"),
     ):
-        # TODO: This should be cached at some level
         # TODO: Need to include environment and program arguments here
-        configuration = ProgramConfiguration(
-            self.product.name, self.platform.name, self.os.name, self.product.version
+        configuration = get_program_configuration(
+            self.product.name, self.product.version, self.platform.name, self.os.name
         )
 
-        cachedCrashInfo = None
-        if self.cachedCrashInfo:
-            cachedCrashInfo = json.loads(self.cachedCrashInfo)
-
-        # We can skip loading raw output fields from the database iff
-        #   1) we know we don't need them for matching *and*
-        #   2) we already have the crash data cached
-        (rawStdout, rawStderr, rawCrashData) = (None, None, None)
-        if cachedCrashInfo is None or "stdout" in requiredOutputSources:
-            rawStdout = self.rawStdout
-        if cachedCrashInfo is None or "stderr" in requiredOutputSources:
-            rawStderr = self.rawStderr
-        if cachedCrashInfo is None or "crashdata" in requiredOutputSources:
-            rawCrashData = self.rawCrashData
-
-        crashInfo = CrashInfo.fromRawCrashData(
-            rawStdout,
-            rawStderr,
-            configuration,
-            rawCrashData,
-            cacheObject=cachedCrashInfo,
-        )
+        # Reuse the parsed result as long as none of the data it is based on
+        # changed. Hashing is much cheaper than decoding and parsing again.
+        cacheKey = None
+        crashInfo = None
+        if self.pk is not None and self.cachedCrashInfo:
+            sources = tuple(sorted(requiredOutputSources))
+            cacheKey = (
+                self.pk,
+                hash(self.cachedCrashInfo),
+                sources,
+                hash(self.rawStdout) if "stdout" in sources else None,
+                hash(self.rawStderr) if "stderr" in sources else None,
+                hash(self.rawCrashData) if "crashdata" in sources else None,
+                configuration,
+            )
+            crashInfo = CRASHINFO_CACHE.get(cacheKey)
+
+        if crashInfo is None:
+            cachedCrashInfo = None
+            if self.cachedCrashInfo:
+                cachedCrashInfo = loadCacheObject(self.cachedCrashInfo)
+
+            # We can skip loading raw output fields from the database iff
+            #   1) we know we don't need them for matching *and*
+            #   2) we already have the crash data cached
+            (rawStdout, rawStderr, rawCrashData) = (None, None, None)
+            if cachedCrashInfo is None or "stdout" in requiredOutputSources:
+                rawStdout = self.rawStdout
+            if cachedCrashInfo is None or "stderr" in requiredOutputSources:
+                rawStderr = self.rawStderr
+            if cachedCrashInfo is None or "crashdata" in requiredOutputSources:
+                rawCrashData = self.rawCrashData
+
+            crashInfo = CrashInfo.fromRawCrashData(
+                rawStdout,
+                rawStderr,
+                configuration,
+                rawCrashData,
+                cacheObject=cachedCrashInfo,
+            )
+
+            if cacheKey is not None:
+                CRASHINFO_CACHE.put(cacheKey, crashInfo)
+
+        if cacheKey is not None:
+            # Don't let callers modify the cached instance (e.g. the testcase)
+            crashInfo = copy.copy(crashInfo)
 
         if attachTestcase and self.testcase is not None and not self.testcase.isBinary:
             self.testcase.loadTest()
@@ -686,12 +1133,120 @@ def CrashEntry_delete(sender, instance, **kwargs):
         )
 
 
+@receiver(post_delete, sender=Bucket)
+def Bucket_delete(sender, instance, **kwargs):
+    BUCKET_INDEX.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Bucket)
+def Bucket_save(sender, instance, **kwargs):
+    BUCKET_INDEX.invalidate(instance.pk)
+
+
 @receiver(post_delete, sender=TestCase)
 def TestCase_delete(sender, instance, **kwargs):
     if instance.test:
         instance.test.delete(False)
 
 
+class CrashEntryPurger:
+    """
+    Deletes large numbers of crash entries without loading model instances.
+
+    Instead of running the post_delete handlers above for every entry, the
+    testcase files and bucket hit changes of each batch are collected from a
+    single query. Rows are then removed with plain DELETE statements and the
+    files are deleted from a pool of worker threads.
+    """
+
+    def __init__(self, batch_size=1000, file_workers=4):
+        self.batch_size = batch_size
+        self.file_workers = file_workers
+        self.storage = TestCase._meta.get_field("test").storage
+        self.executor = None
+        self.deleted = 0
+
+    def __enter__(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.file_workers)
+        return self
+
+    def __exit__(self, *exc):
+        self.executor.shutdown(wait=True)
+        self.executor = None
+
+    def _remove_file(self, name):
+        try:
+            self.storage.delete(name)
+        except OSError as exc:
+            LOG.warning("Failed to remove testcase file %s: %s", name, exc)
+
+    def purge(self, queryset):
+        """
+        Delete all crash entries matching the given queryset, along with
+        their testcases, and update the bucket hit counters.
+
+        @return: Number of deleted crash entries
+        """
+        deleted = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list(
+                    "pk",
+                    "bucket_id",
+                    "tool_id",
+                    "created",
+                    "testcase_id",
+                    "testcase__test",
+                )[: self.batch_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            self._delete_batch(rows)
+            deleted += len(rows)
+        self.deleted += deleted
+        return deleted
+
+    def _delete_batch(self, rows):
+        hits = BucketHitCounter()
+        testcase_ids = []
+        files = []
+        for _, bucket_id, tool_id, created, testcase_id, test in rows:
+            if bucket_id is not None:
+                hits.add(bucket_id, tool_id, created, -1)
+            if testcase_id is not None:
+                testcase_ids.append(testcase_id)
+                if test:
+                    files.append(test)
+
+        db = router.db_for_write(CrashEntry)
+        with transaction.atomic(using=db):
+            CrashEntry.objects.filter(pk__in=[row[0] for row in rows])._raw_delete(db)
+            if testcase_ids:
+                TestCase.objects.filter(pk__in=testcase_ids)._raw_delete(db)
+            hits.flush()
+
+        for name in files:
+            self.executor.submit(self._remove_file, name)
+
+
+def notify_bucket_hit(entry):
+    notify.send(
+        entry.bucket,
+        recipient=entry.bucket.watchers,
+        actor=entry.bucket,
+        verb="bucket_hit",
+        target=entry,
+        level="info",
+        description=(
+            f"The bucket {entry.bucket_id} received a new crash entry {entry.pk}"
+        ),
+    )
+
+
 @receiver(post_save, sender=CrashEntry)
 def CrashEntry_save(sender, instance, created, **kwargs):
     if getattr(settings, "USE_CELERY", None):
@@ -712,18 +1267,7 @@ def CrashEntry_save(sender, instance, created, **kwargs):
             )
 
         if instance.bucket is not None:
-            notify.send(
-                instance.bucket,
-                recipient=instance.bucket.watchers,
-                actor=instance.bucket,
-                verb="bucket_hit",
-                target=instance,
-                level="info",
-                description=(
-                    f"The bucket {instance.bucket_id} received a new crash entry "
-                    f"{instance.pk}"
-                ),
-            )
+            notify_bucket_hit(instance)
 
 
 class BugzillaTemplateMode(Enum):
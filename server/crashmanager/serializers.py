@@ -4,6 +4,7 @@ import hashlib
 from django.conf import settings
 from django.core.exceptions import MultipleObjectsReturned  # noqa
 from django.core.files.base import ContentFile
+from django.db import connection, transaction
 from django.forms import widgets  # noqa
 from django.urls import reverse
 from notifications.models import Notification
@@ -33,6 +34,129 @@ class InvalidArgumentException(APIException):
     status_code = 400
 
 
+def _create_testcase(attrs, save=True):
+    """
+    Create the TestCase object for the testcase fields in the given crash
+    attributes, if any, and store its content.
+    """
+    testcase_ext = attrs.pop("testcase_ext", None)
+    if "test" not in attrs["testcase"]:
+        return None
+
+    testcase = attrs["testcase"]
+    testcase_size = testcase.get("size", 0)
+    testcase_quality = testcase.get("quality", 0)
+    testcase_isbinary = testcase.get("isBinary", False)
+    testcase = testcase["test"]
+
+    if testcase_ext is None:
+        raise RuntimeError("Must provide testcase extension when providing testcase")
+
+    h = hashlib.new("sha1")
+    if testcase_isbinary:
+        testcase = base64.b64decode(testcase)
+        h.update(testcase)
+    else:
+        h.update(repr(testcase).encode("utf-8"))
+
+    if not testcase_size:
+        testcase_size = len(testcase)
+
+    dbobj = TestCase(
+        quality=testcase_quality, isBinary=testcase_isbinary, size=testcase_size
+    )
+    dbobj.test.save(
+        f"{h.hexdigest()}.{testcase_ext}", ContentFile(testcase), save=False
+    )
+    if save:
+        dbobj.save()
+    return dbobj
+
+
+def _check_raw_fields(attrs):
+    missing_keys = {"rawStdout", "rawStderr", "rawCrashData"} - set(attrs.keys())
+    if missing_keys:
+        return {key: ["This field is required."] for key in missing_keys}
+    return {}
+
+
+class CrashEntryListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        """
+        Create many CrashEntry instances at once. Unlike creating them one by
+        one, foreign objects are looked up once per distinct value in the batch,
+        all entries are inserted together and triage is started once for the
+        whole batch.
+        """
+        errors = [_check_raw_fields(attrs) for attrs in validated_data]
+        if any(errors):
+            raise InvalidArgumentException(errors)
+
+        foreign = {}
+        for field, model in (
+            ("product", Product),
+            ("platform", Platform),
+            ("os", OS),
+            ("client", Client),
+            ("tool", Tool),
+        ):
+            for attrs in validated_data:
+                key = (field, tuple(sorted(attrs[field].items())))
+                if key not in foreign:
+                    foreign[key] = model.objects.get_or_create(**attrs[field])[0]
+                attrs[field] = foreign[key]
+
+        # Without support for returning primary keys from bulk inserts (MySQL),
+        # we can't refer to the new rows, so save them one by one instead.
+        bulk = connection.features.can_return_rows_from_bulk_insert
+        max_length = CrashEntry._meta.get_field("shortSignature").max_length
+
+        testcases = []
+        try:
+            entries = []
+            for attrs in validated_data:
+                attrs["testcase"] = _create_testcase(attrs, save=False)
+                if attrs["testcase"] is not None:
+                    testcases.append(attrs["testcase"])
+
+                entry = CrashEntry(**attrs)
+                # Parses the crash information into cachedCrashInfo, so the
+                # following getCrashInfo only has to load it again.
+                entry.prepare_save()
+                crashInfo = entry.getCrashInfo()
+                if crashInfo.crashAddress is not None:
+                    entry.crashAddress = f"0x{crashInfo.crashAddress:x}"
+                entry.shortSignature = crashInfo.createShortSignature()[:max_length]
+                # Derive the numeric crash address from the one we just set
+                entry.prepare_save()
+                entries.append(entry)
+
+            with transaction.atomic():
+                if bulk:
+                    TestCase.objects.bulk_create(testcases)
+                    CrashEntry.objects.bulk_create(entries)
+                else:
+                    for entry in entries:
+                        if entry.testcase is not None:
+                            entry.testcase.save()
+                        entry.save()
+        except:  # noqa
+            for testcase in testcases:
+                testcase.test.delete(False)
+            raise
+
+        # bulk_create doesn't send post_save, so start triage here. New entries
+        # have no bucket yet, so there are no bucket hits to count.
+        if bulk and getattr(settings, "USE_CELERY", None):
+            from crashmanager.tasks import triage_crash_batch
+
+            pks = [entry.pk for entry in entries if not entry.triagedOnce]
+            if pks:
+                triage_crash_batch.delay(pks)
+
+        return entries
+
+
 class CrashEntrySerializer(serializers.ModelSerializer):
     # We need to redefine several fields explicitly because we flatten our
     # foreign keys into these fields instead of using primary keys, hyperlinks
@@ -96,6 +220,7 @@ class CrashEntrySerializer(serializers.ModelSerializer):
         )
         ordering = ["-id"]
         read_only_fields = ("bucket", "id", "shortSignature", "crashAddress")
+        list_serializer_class = CrashEntryListSerializer
 
     def create(self, attrs):
         """
@@ -104,11 +229,9 @@ class CrashEntrySerializer(serializers.ModelSerializer):
         platform, os and client and create the foreign objects on the fly
         if they don't exist in our database yet.
         """
-        missing_keys = {"rawStdout", "rawStderr", "rawCrashData"} - set(attrs.keys())
-        if missing_keys:
-            raise InvalidArgumentException(
-                {key: ["This field is required."] for key in missing_keys}
-            )
+        errors = _check_raw_fields(attrs)
+        if errors:
+            raise InvalidArgumentException(errors)
 
         attrs["product"] = Product.objects.get_or_create(**attrs["product"])[0]
         attrs["platform"] = Platform.objects.get_or_create(**attrs["platform"])[0]
@@ -136,38 +259,7 @@ class CrashEntrySerializer(serializers.ModelSerializer):
         ]
 
         # If a testcase is supplied, create a testcase object and store it
-        if "test" in attrs["testcase"]:
-            testcase = attrs["testcase"]
-            testcase_ext = attrs.pop("testcase_ext", None)
-            testcase_size = testcase.get("size", 0)
-            testcase_quality = testcase.get("quality", 0)
-            testcase_isbinary = testcase.get("isBinary", False)
-            testcase = testcase["test"]
-
-            if testcase_ext is None:
-                raise RuntimeError(
-                    "Must provide testcase extension when providing testcase"
-                )
-
-            h = hashlib.new("sha1")
-            if testcase_isbinary:
-                testcase = base64.b64decode(testcase)
-                h.update(testcase)
-            else:
-                h.update(repr(testcase).encode("utf-8"))
-
-            if not testcase_size:
-                testcase_size = len(testcase)
-
-            dbobj = TestCase(
-                quality=testcase_quality, isBinary=testcase_isbinary, size=testcase_size
-            )
-            dbobj.test.save(f"{h.hexdigest()}.{testcase_ext}", ContentFile(testcase))
-            dbobj.save()
-            attrs["testcase"] = dbobj
-        else:
-            attrs["testcase"] = None
-            attrs.pop("testcase_ext", None)
+        attrs["testcase"] = _create_testcase(attrs)
 
         try:
             # Create our CrashEntry instance
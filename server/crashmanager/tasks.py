@@ -1,9 +1,87 @@
+import logging
+import time
+
+from celery import chord
 from celeryconf import app
+from django.conf import settings
+from django.core.cache import cache
 from django.core.management import call_command
 
 from . import cron  # noqa ensure cron tasks get registered
 
+LOG = logging.getLogger("fm.crashmanager.tasks")
+
 
 @app.task(ignore_result=True)
 def triage_new_crash(pk):
     call_command("triage_new_crash", pk)
+
+
+@app.task(ignore_result=True)
+def triage_crash_batch(pks):
+    from .management.commands.triage_new_crashes import Command
+
+    assigned = Command.triage_batch(pks)
+    if assigned < len(pks):
+        # new unbucketed crashes might allow optimizing some signatures
+        schedule_signature_optimization()
+
+
+@app.task(ignore_result=True)
+def optimize_bucket_signatures(pks):
+    from .models import precompute_optimized_signatures
+
+    start = time.perf_counter()
+    found = precompute_optimized_signatures(pks)
+    LOG.info(
+        "Optimized signatures of %d buckets (%d found) in %.2fs",
+        len(pks),
+        found,
+        time.perf_counter() - start,
+    )
+
+
+def schedule_signature_optimization():
+    """
+    Recompute all optimized signatures in the background, unless that already
+    happened in the last OPTIMIZE_SIGNATURES_INTERVAL seconds.
+    """
+    interval = getattr(settings, "OPTIMIZE_SIGNATURES_INTERVAL", 15 * 60)
+    if cache.add(cron.OPTIMIZE_SIGNATURES_SCHEDULED, True, interval):
+        cron.optimize_signatures.delay()
+
+
+@app.task
+def reassign_bucket_range(pk, first_id, last_id):
+    from .models import _reassign_range
+
+    return _reassign_range(pk, first_id, last_id)
+
+
+@app.task(ignore_result=True)
+def reassign_bucket_done(results, pk):
+    from .models import Bucket
+
+    Bucket.objects.filter(pk=pk).update(reassign_in_progress=False)
+    LOG.info(
+        "Reassigned bucket %d: %d crashes added, %d removed",
+        pk,
+        sum(inCount for inCount, _ in results),
+        sum(outCount for _, outCount in results),
+    )
+
+
+def reassign_bucket(bucket):
+    """
+    Reassign all crashes to/from the given bucket in the background, spreading
+    the entry id ranges over all workers. The reassign_in_progress flag of the
+    bucket is cleared once all ranges are done.
+    """
+    ranges = bucket.get_reassign_ranges()
+    if not ranges:
+        reassign_bucket_done([], bucket.pk)
+        return
+    chord(
+        reassign_bucket_range.s(bucket.pk, first_id, last_id)
+        for first_id, last_id in ranges
+    )(reassign_bucket_done.s(bucket.pk))
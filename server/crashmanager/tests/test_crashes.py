@@ -10,10 +10,15 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
 import logging
+from datetime import timedelta
 
 import pytest
 import requests
 from django.urls import reverse
+from django.utils import timezone
+
+from crashmanager.models import BucketHit, BucketHitCounter, CrashEntry, Tool
+from FTB.Signatures.CrashInfo import CrashInfo
 
 from . import assert_contains
 
@@ -90,3 +95,105 @@ def test_delete_testcase_crash(cm):
         raise AssertionError(
             f"file should have been deleted with CrashInfo: {test_file!r}"
         )
+
+
+def test_crashinfo_cache(cm, mocker):
+    """Parsed crash info is reused for the same entry data"""
+    testcase = cm.create_testcase("test.txt", "hello world")
+    crash = cm.create_crash(stderr="foo", testcase=testcase)
+    parse = mocker.spy(CrashInfo, "fromRawCrashData")
+
+    first = CrashEntry.objects.get(pk=crash.pk).getCrashInfo()
+    second = CrashEntry.objects.get(pk=crash.pk).getCrashInfo(attachTestcase=True)
+    assert parse.call_count == 1
+    assert first is not second
+    assert first.configuration is second.configuration
+    assert first.rawStderr == second.rawStderr == ["foo"]
+    assert first.testcase is None
+    assert second.testcase == b"hello world"
+
+    # different output sources are cached separately
+    CrashEntry.objects.get(pk=crash.pk).getCrashInfo(requiredOutputSources=())
+    assert parse.call_count == 2
+
+    # changed data is parsed again
+    entry = CrashEntry.objects.get(pk=crash.pk)
+    entry.rawStderr = "bar"
+    assert entry.getCrashInfo().rawStderr == ["bar"]
+    assert parse.call_count == 3
+
+
+def _bucket_hits():
+    return {
+        (hit.bucket_id, hit.tool_id, hit.begin): hit.count
+        for hit in BucketHit.objects.all()
+    }
+
+
+def test_buckethit_counter(cm, django_assert_num_queries):
+    """Counter changes are aggregated and applied with few queries"""
+    buckets = [cm.create_bucket(shortDescription=f"bucket{i}") for i in range(3)]
+    tool = Tool.objects.create(name="tool")
+    now = timezone.now().replace(microsecond=0, second=0, minute=0)
+    before = now - timedelta(hours=1)
+    BucketHit.objects.create(bucket=buckets[0], tool=tool, begin=now, count=5)
+    BucketHit.objects.create(bucket=buckets[1], tool=tool, begin=now, count=1)
+
+    counter = BucketHitCounter()
+    counter.add(buckets[0].pk, tool.pk, now + timedelta(minutes=5), 2)
+    counter.add(buckets[0].pk, tool.pk, now)
+    counter.add(buckets[2].pk, tool.pk, before, 3)
+    counter.add(buckets[2].pk, tool.pk, now)
+    counter.add(buckets[1].pk, tool.pk, now, -3)
+    counter.add(buckets[1].pk, tool.pk, before, -1)
+    # one update per decrement amount, one upsert for all increments
+    with django_assert_num_queries(3):
+        counter.flush()
+
+    assert _bucket_hits() == {
+        (buckets[0].pk, tool.pk, now): 8,
+        (buckets[1].pk, tool.pk, now): 0,
+        (buckets[2].pk, tool.pk, before): 3,
+        (buckets[2].pk, tool.pk, now): 1,
+    }
+
+    # nothing left to apply
+    with django_assert_num_queries(0):
+        counter.flush()
+
+
+def test_buckethit_batch(cm, django_assert_max_num_queries):
+    """Deleting many crashes updates the bucket hit counters at once"""
+    bucket = cm.create_bucket(shortDescription="bucket")
+    crashes = [cm.create_crash(bucket=bucket) for _ in range(20)]
+    assert sum(_bucket_hits().values()) == 20
+
+    with BucketHit.batch():
+        CrashEntry.objects.filter(pk__in=[crash.pk for crash in crashes[:15]]).delete()
+        with BucketHit.batch():
+            crashes[15].delete()
+        # changes are only applied when leaving the outermost batch
+        assert sum(_bucket_hits().values()) == 20
+    assert sum(_bucket_hits().values()) == 4
+
+    # without a batch, each change is applied immediately
+    with django_assert_max_num_queries(1):
+        BucketHit.increment_count(bucket.pk, crashes[16].tool_id, timezone.now())
+    assert sum(_bucket_hits().values()) == 5
+
+
+def test_buckethit_batch_error(cm):
+    """Changes collected before an error in a batch are still applied"""
+    bucket = cm.create_bucket(shortDescription="bucket")
+    crashes = [cm.create_crash(bucket=bucket) for _ in range(3)]
+
+    with pytest.raises(RuntimeError):
+        with BucketHit.batch():
+            crashes[0].delete()
+            crashes[1].delete()
+            raise RuntimeError("failed")
+    assert sum(_bucket_hits().values()) == 1
+
+    # the batch was left, changes are applied immediately again
+    crashes[2].delete()
+    assert sum(_bucket_hits().values()) == 0
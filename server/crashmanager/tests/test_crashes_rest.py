@@ -18,9 +18,11 @@ from unittest.mock import Mock, patch
 
 import pytest
 import requests
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.http import urlencode
 
-from crashmanager.models import CrashEntry
+from crashmanager.models import BucketHit, CrashEntry, Product
 from crashmanager.models import TestCase as cmTestCase
 
 # What should be allowed:
@@ -549,6 +551,198 @@ def test_rest_crashes_report_crash_long_sig(api_client, user_normal):
     _compare_created_data_to_crash(data, crash, short_signature=expected)
 
 
+def _bulk_crashes(count):
+    crashes = []
+    for idx in range(count):
+        crash = {
+            "rawStdout": "data on\nstdout",
+            "rawStderr": "data on\nstderr",
+            "rawCrashData": f"Assertion failure: crash #{idx}",
+            "platform": "x86",
+            "product": "mozilla-central",
+            "product_version": "badf00d",
+            "os": "linux",
+            "client": f"client{idx % 2}",
+            "tool": "tool1",
+        }
+        if idx % 2:
+            crash.update(
+                {
+                    "testcase": f"foo({idx});",
+                    "testcase_isbinary": False,
+                    "testcase_quality": idx,
+                    "testcase_ext": "js",
+                }
+            )
+        crashes.append(crash)
+    return crashes
+
+
+@pytest.mark.parametrize("user", ["normal", "only_report"], indirect=True)
+@pytest.mark.parametrize("ndjson", [False, True])
+def test_rest_crashes_report_bulk(api_client, user, ndjson):
+    """test that many crashes can be reported at once"""
+    data = _bulk_crashes(3)
+    if ndjson:
+        resp = api_client.post(
+            "/crashmanager/rest/crashes/bulk/",
+            data="\n".join(json.dumps(crash) for crash in data),
+            content_type="application/x-ndjson",
+        )
+    else:
+        resp = api_client.post(
+            "/crashmanager/rest/crashes/bulk/", data=data, format="json"
+        )
+    LOG.debug(resp)
+    assert resp.status_code == requests.codes["created"]
+    result = resp.json()
+    assert len(result) == len(data)
+    assert Product.objects.count() == 1
+    for crash_data, crash_result in zip(data, result):
+        crash = CrashEntry.objects.get(pk=crash_result["id"])
+        assert "rawStderr" not in crash_result
+        assert crash_result["shortSignature"] == crash.shortSignature
+        _compare_created_data_to_crash(
+            crash_data, crash, short_signature=crash_data["rawCrashData"]
+        )
+        assert crash.cachedCrashInfo
+        assert not crash.triagedOnce
+
+
+def test_rest_crashes_report_bulk_queries(api_client, user_normal):
+    """test that the number of queries doesn't depend on the number of crashes"""
+    queries = []
+    for count in (2, 20):
+        with CaptureQueriesContext(connection) as context:
+            resp = api_client.post(
+                "/crashmanager/rest/crashes/bulk/",
+                data=_bulk_crashes(count),
+                format="json",
+            )
+        assert resp.status_code == requests.codes["created"]
+        queries.append(len(context.captured_queries))
+    assert CrashEntry.objects.count() == 22
+    assert queries[1] <= queries[0]
+
+
+def test_rest_crashes_report_bulk_triage(api_client, user_normal, settings, mocker):
+    """test that triage is started once for all crashes"""
+    settings.USE_CELERY = True
+    delay = mocker.patch("crashmanager.tasks.triage_crash_batch.delay")
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/bulk/", data=_bulk_crashes(3), format="json"
+    )
+    assert resp.status_code == requests.codes["created"]
+    delay.assert_called_once_with([crash["id"] for crash in resp.json()])
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        # not a list
+        _bulk_crashes(1)[0],
+        # missing raw field in one of the crashes
+        _bulk_crashes(1)
+        + [{k: v for k, v in _bulk_crashes(2)[1].items() if k != "rawStdout"}],
+        # too many crashes
+        _bulk_crashes(3),
+        # invalid field
+        _bulk_crashes(1) + [dict(_bulk_crashes(1)[0], testcase_quality="x")],
+    ],
+)
+def test_rest_crashes_report_bulk_invalid(api_client, user_normal, settings, data):
+    """test that invalid bulk reports are rejected as a whole"""
+    settings.CRASH_BULK_MAX_ITEMS = 2
+    resp = api_client.post("/crashmanager/rest/crashes/bulk/", data=data, format="json")
+    assert resp.status_code == requests.codes["bad_request"]
+    assert not CrashEntry.objects.exists()
+    assert not cmTestCase.objects.exists()
+
+
+@pytest.mark.parametrize("user", ["normal", "only_report"], indirect=True)
+def test_rest_crashes_hits(api_client, user, cm):
+    """test that repeated occurrences are counted as hits of the crash's bucket"""
+    bucket = cm.create_bucket(shortDescription="bucket")
+    unbucketed = cm.create_crash(shortSignature="crash #1")
+    bucketed = cm.create_crash(shortSignature="crash #2", bucket=bucket)
+    assert sum(BucketHit.objects.values_list("count", flat=True)) == 1
+
+    resp = api_client.post(
+        f"/crashmanager/rest/crashes/{unbucketed.pk}/hits/",
+        data={"count": 5},
+        format="json",
+    )
+    assert resp.status_code == requests.codes["ok"]
+    assert resp.json() == {"bucket": None}
+    assert sum(BucketHit.objects.values_list("count", flat=True)) == 1
+
+    resp = api_client.post(
+        f"/crashmanager/rest/crashes/{bucketed.pk}/hits/",
+        data={"count": 5},
+        format="json",
+    )
+    assert resp.status_code == requests.codes["ok"]
+    assert resp.json() == {"bucket": bucket.pk}
+    assert sum(BucketHit.objects.values_list("count", flat=True)) == 6
+
+    resp = api_client.post(
+        f"/crashmanager/rest/crashes/{bucketed.pk + 1}/hits/",
+        data={"count": 5},
+        format="json",
+    )
+    assert resp.status_code == requests.codes["not_found"]
+
+
+@pytest.mark.parametrize("count", [None, 0, -1, "1", True])
+def test_rest_crashes_hits_invalid(api_client, user_normal, cm, count):
+    """test that invalid hit counts are rejected"""
+    crash = cm.create_crash(bucket=cm.create_bucket(shortDescription="bucket"))
+    resp = api_client.post(
+        f"/crashmanager/rest/crashes/{crash.pk}/hits/",
+        data={} if count is None else {"count": count},
+        format="json",
+    )
+    assert resp.status_code == requests.codes["bad_request"]
+    assert sum(BucketHit.objects.values_list("count", flat=True)) == 1
+
+
+@pytest.mark.parametrize("data", [[{"count": 1}], 1, "count"])
+def test_rest_crashes_hits_invalid_body(api_client, user_normal, cm, data):
+    """test that hits requests which aren't JSON objects are rejected"""
+    crash = cm.create_crash(bucket=cm.create_bucket(shortDescription="bucket"))
+    resp = api_client.post(
+        f"/crashmanager/rest/crashes/{crash.pk}/hits/", data=data, format="json"
+    )
+    assert resp.status_code == requests.codes["bad_request"]
+    assert sum(BucketHit.objects.values_list("count", flat=True)) == 1
+
+
+def test_rest_crashes_hits_restricted(api_client, user_restricted, cm):
+    """test that restricted users can only count hits for crashes in their
+    toolfilter"""
+    bucket = cm.create_bucket(shortDescription="bucket")
+    allowed = cm.create_crash(shortSignature="crash #1", tool="tool1", bucket=bucket)
+    denied = cm.create_crash(shortSignature="crash #2", tool="tool2", bucket=bucket)
+    cm.create_toolfilter("tool1", user=user_restricted.username)
+
+    resp = api_client.post(
+        f"/crashmanager/rest/crashes/{denied.pk}/hits/",
+        data={"count": 5},
+        format="json",
+    )
+    assert resp.status_code == requests.codes["not_found"]
+    assert sum(BucketHit.objects.values_list("count", flat=True)) == 2
+
+    resp = api_client.post(
+        f"/crashmanager/rest/crashes/{allowed.pk}/hits/",
+        data={"count": 5},
+        format="json",
+    )
+    assert resp.status_code == requests.codes["ok"]
+    assert resp.json() == {"bucket": bucket.pk}
+    assert sum(BucketHit.objects.values_list("count", flat=True)) == 7
+
+
 def test_rest_crash_update(api_client, cm, user_normal):
     """test that only allowed fields of CrashEntry can be updated"""
     test = cm.create_testcase("test.txt", quality=0)
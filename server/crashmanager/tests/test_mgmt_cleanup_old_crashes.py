@@ -9,6 +9,7 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
+import os
 from datetime import timedelta
 
 import pytest
@@ -18,12 +19,14 @@ from django.utils import timezone
 from crashmanager.models import (
     OS,
     Bucket,
+    BucketHit,
     Bug,
     BugProvider,
     Client,
     CrashEntry,
     Platform,
     Product,
+    TestCase,
     Tool,
 )
 
@@ -170,3 +173,28 @@ def test_old_crashes(settings):
     }
     assert Bug.objects.count() == 1
     assert Bucket.objects.count() == 2
+
+
+def test_old_crashes_purged(settings, cm, django_assert_max_num_queries):
+    """old entries are purged in batches along with testcases and bucket hits"""
+    settings.CLEANUP_CRASHES_AFTER_DAYS = 3
+    bucket = cm.create_bucket(permanent=True)
+    kept = cm.create_crash(bucket=bucket)
+    crashes = []
+    for days in range(4, 9):
+        crash = cm.create_crash(testcase=cm.create_testcase("t.js", "test %d" % days))
+        crash.created -= timedelta(days=days)
+        crash.bucket = bucket
+        crash.save()
+        crashes.append(crash)
+    files = [crash.testcase.test.path for crash in crashes]
+    assert all(os.path.exists(path) for path in files)
+    assert sum(BucketHit.objects.values_list("count", flat=True)) == 6
+
+    with django_assert_max_num_queries(30):
+        call_command("cleanup_old_crashes", "--batch-size", "2")
+
+    assert list(CrashEntry.objects.values_list("pk", flat=True)) == [kept.pk]
+    assert not TestCase.objects.exists()
+    assert not any(os.path.exists(path) for path in files)
+    assert sum(BucketHit.objects.values_list("count", flat=True)) == 1
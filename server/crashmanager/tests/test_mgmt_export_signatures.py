@@ -19,6 +19,7 @@ import pytest
 from django.core.management import CommandError, call_command
 
 from crashmanager.models import Bucket
+from FTB.Signatures.SignatureManifest import hashSignatureFiles
 
 pytestmark = pytest.mark.django_db()  # pylint: disable=invalid-name
 
@@ -82,3 +83,58 @@ def test_some():
                         assert contents == "sig2"
     finally:
         os.unlink(tmpf)
+
+
+def test_manifest(tmp_path):
+    sig1 = Bucket.objects.create(signature="sig1")
+    sig2 = Bucket.objects.create(signature="sig2")
+    call_command(
+        "export_signatures",
+        str(tmp_path / "sigs.zip"),
+        manifest=str(tmp_path / "manifest.json"),
+    )
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert set(manifest) == {str(sig1.pk), str(sig2.pk)}
+    with zipfile.ZipFile(str(tmp_path / "sigs.zip")) as zipf:
+        for bucket_id, content_hash in manifest.items():
+            assert content_hash == hashSignatureFiles(
+                zipf.read(f"{bucket_id}.signature"), zipf.read(f"{bucket_id}.metadata")
+            )
+    assert manifest[str(sig1.pk)] != manifest[str(sig2.pk)]
+
+
+def test_best_testcase(cm, tmp_path, django_assert_max_num_queries):
+    bug = cm.create_bug("123")
+    bucket1 = cm.create_bucket(signature="sig1", bug=bug)
+    bucket2 = cm.create_bucket(signature="sig2")
+    bucket3 = cm.create_bucket(signature="sig3")
+    for quality, data in ((5, "aaaa"), (1, "aaaaaa"), (1, "aa"), (None, None)):
+        testcase = None
+        if data is not None:
+            testcase = cm.create_testcase("test.js", data, quality=quality)
+        cm.create_crash(bucket=bucket1, testcase=testcase)
+    cm.create_crash(bucket=bucket2)
+
+    # the number of queries doesn't depend on the number of buckets
+    with django_assert_max_num_queries(2):
+        call_command("export_signatures", str(tmp_path / "sigs.zip"))
+
+    with zipfile.ZipFile(str(tmp_path / "sigs.zip")) as zipf:
+        metadata = {
+            bucket.pk: json.loads(zipf.read(f"{bucket.pk}.metadata"))
+            for bucket in (bucket1, bucket2, bucket3)
+        }
+    assert metadata[bucket1.pk] == {
+        "size": 4,
+        "shortDescription": "",
+        "frequent": False,
+        "bug__id": "123",
+        "testcase__quality": 1,
+        "testcase__size": 2,
+    }
+    assert metadata[bucket2.pk] == {
+        "size": 1,
+        "shortDescription": "",
+        "frequent": False,
+    }
+    assert metadata[bucket3.pk]["size"] == 0
@@ -0,0 +1,69 @@
+"""Tests for CrashManager reencode_crashinfo management command
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from crashmanager.models import CrashEntry
+from FTB.Signatures.CacheObject import isCompact
+
+pytestmark = pytest.mark.django_db()  # pylint: disable=invalid-name
+pytestmark = pytest.mark.usefixtures("crashmanager_test")
+
+STDERR = "\n".join(
+    [
+        "==1==ERROR: AddressSanitizer: SEGV on unknown address 0x000000000000",
+        "    #0 0x1 in foo /src/foo.c:1",
+        "    #1 0x2 in bar /src/bar.c:2",
+        "    #2 0x3 in main /src/main.c:3",
+    ]
+)
+
+
+def test_args():
+    with pytest.raises(CommandError, match=r"Error: argument --format: invalid"):
+        call_command("reencode_crashinfo", "--format", "xml")
+
+
+def test_reencode(cm, settings, capsys):
+    settings.CRASHINFO_CACHE_COMPACT = False
+    crashes = [cm.create_crash(stderr=STDERR) for _ in range(3)]
+    # entries without cached crash info are skipped
+    uncached = cm.create_crash(stderr=STDERR)
+    CrashEntry.objects.filter(pk=uncached.pk).update(cachedCrashInfo=None)
+    expected = {crash.pk: crash.getCrashInfo().toCacheObject() for crash in crashes}
+    for crash in crashes:
+        crash.refresh_from_db()
+        assert json.loads(crash.cachedCrashInfo)["backtrace"] == ["foo", "bar", "main"]
+
+    call_command("reencode_crashinfo", "--batch-size", "2")
+    assert "Re-encoded 3 of 3 crash entries as compact" in capsys.readouterr().out
+    for crash in crashes:
+        crash.refresh_from_db()
+        assert isCompact(crash.cachedCrashInfo)
+        assert crash.getCrashInfo().toCacheObject() == expected[crash.pk]
+
+    # entries already in the requested format are left alone
+    call_command("reencode_crashinfo")
+    assert "Re-encoded 0 of 3 crash entries" in capsys.readouterr().out
+
+    call_command("reencode_crashinfo", "--format", "json")
+    for crash in crashes:
+        crash.refresh_from_db()
+        assert json.loads(crash.cachedCrashInfo) == expected[crash.pk]
+
+
+def test_save_compact(cm, settings):
+    settings.CRASHINFO_CACHE_COMPACT = True
+    crash = cm.create_crash(stderr=STDERR)
+    crash = CrashEntry.objects.get(pk=crash.pk)
+    assert isCompact(crash.cachedCrashInfo)
+    assert crash.getCrashInfo().backtrace == ["foo", "bar", "main"]
@@ -19,6 +19,7 @@ from notifications.models import Notification
 from crashmanager.models import (
     OS,
     Bucket,
+    BucketHit,
     BucketWatch,
     Client,
     CrashEntry,
@@ -136,3 +137,91 @@ def test_some_with_notification():
         == f"The bucket {buckets[1].pk} received a new crash entry {crashes[1].pk}"
     )
     assert notification.target == crashes[1]
+
+
+def test_signature_changes():
+    """Changes to buckets are picked up by the triage signature index"""
+
+    def _sig(value):
+        return json.dumps(
+            {"symptoms": [{"src": "stderr", "type": "output", "value": value}]}
+        )
+
+    defaults = {
+        "client": Client.objects.create(),
+        "os": OS.objects.create(),
+        "platform": Platform.objects.create(),
+        "product": Product.objects.create(),
+        "tool": Tool.objects.create(),
+    }
+
+    def _triage(stderr):
+        crash = CrashEntry.objects.create(rawStderr=stderr, **defaults)
+        call_command("triage_new_crashes")
+        crash.refresh_from_db()
+        return crash.bucket_id
+
+    bucket = Bucket.objects.create(signature=_sig("/foo/"))
+    assert _triage("foo") == bucket.pk
+    assert _triage("bar") is None
+
+    # saved through the model
+    bucket.signature = _sig("/bar/")
+    bucket.save()
+    assert _triage("bar") == bucket.pk
+    assert _triage("foo") is None
+
+    # updated without signals, as another process would
+    Bucket.objects.filter(pk=bucket.pk).update(signature=_sig("/baz/"))
+    assert _triage("bar") is None
+    assert _triage("baz") == bucket.pk
+
+    bucket2 = Bucket.objects.create(signature=_sig("/qux/"))
+    assert _triage("qux") == bucket2.pk
+
+    bucket2.delete()
+    assert _triage("qux") is None
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 500])
+def test_batches(capsys, batch_size):
+    buckets = [
+        Bucket.objects.create(
+            signature=json.dumps(
+                {"symptoms": [{"src": "stderr", "type": "output", "value": "/foo/"}]}
+            )
+        ),
+        Bucket.objects.create(
+            signature=json.dumps(
+                {"symptoms": [{"src": "stderr", "type": "output", "value": "/bar/"}]}
+            )
+        ),
+    ]
+    defaults = {
+        "client": Client.objects.create(),
+        "os": OS.objects.create(),
+        "platform": Platform.objects.create(),
+        "product": Product.objects.create(),
+        "tool": Tool.objects.create(),
+    }
+    crashes = [
+        CrashEntry.objects.create(rawStderr=stderr, **defaults)
+        for stderr in ("foo", "bar", "blah", "foo", "foobar")
+    ]
+
+    call_command("triage_new_crashes", "--batch-size", str(batch_size))
+    assert "Triaged 5 crashes (4 assigned)" in capsys.readouterr().out
+
+    crashes = [CrashEntry.objects.get(pk=c.pk) for c in crashes]
+    for c in crashes:
+        assert c.triagedOnce
+    # newest bucket wins when several match
+    assert [c.bucket_id for c in crashes] == [
+        buckets[0].pk,
+        buckets[1].pk,
+        None,
+        buckets[0].pk,
+        buckets[1].pk,
+    ]
+    assert sum(hit.count for hit in BucketHit.objects.filter(bucket=buckets[0])) == 2
+    assert sum(hit.count for hit in BucketHit.objects.filter(bucket=buckets[1])) == 2
@@ -17,7 +17,13 @@ import pytest
 import requests
 from django.urls import reverse
 
-from crashmanager.models import Bucket, BucketWatch, CrashEntry
+from crashmanager.models import (
+    Bucket,
+    BucketWatch,
+    CrashEntry,
+    FirstEntryCache,
+    precompute_optimized_signatures,
+)
 
 from . import assert_contains
 
@@ -373,3 +379,117 @@ def test_watch_signature_crashes(client, cm):  # pylint: disable=invalid-name
     assert response.context["watchId"] == watch.id
     assert response.context["restricted"] is False
     assert_contains(response, "crasheslist")
+
+
+def test_precompute_optimized_signatures(cm):
+    """Optimized signatures are computed and stored in the background"""
+    bucket = cm.create_bucket(
+        signature=json.dumps(
+            {
+                "symptoms": [
+                    {"type": "output", "value": "Assertion X"},
+                    {"type": "output", "value": "extra"},
+                ]
+            }
+        )
+    )
+    other = cm.create_bucket(
+        signature=json.dumps({"symptoms": [{"type": "output", "value": "other"}]})
+    )
+    cm.create_crash(stderr="other", bucket=other)
+    cm.create_crash(stderr="Assertion X")
+
+    expected, matching = bucket.optimizeSignature(
+        CrashEntry.objects.filter(bucket=None)
+    )
+    assert len(matching) == 1
+    assert precompute_optimized_signatures([bucket.pk, other.pk]) == 1
+
+    bucket.refresh_from_db()
+    assert bucket.optimizedSignature == str(expected)
+    assert json.loads(bucket.optimizedSignature) == {
+        "symptoms": [{"type": "output", "value": "Assertion X"}]
+    }
+    assert bucket.optimizedSignatureComputed is not None
+    other.refresh_from_db()
+    assert other.optimizedSignature is None
+    assert other.optimizedSignatureComputed is not None
+
+    # a signature matching the first entry of another bucket is too broad
+    cm.create_crash(stderr="Assertion X other", bucket=cm.create_bucket())
+    assert precompute_optimized_signatures([bucket.pk]) == 0
+    bucket.refresh_from_db()
+    assert bucket.optimizedSignature is None
+
+    # changing the signature resets the optimization
+    precompute_optimized_signatures([other.pk])
+    other.save()
+    other.refresh_from_db()
+    assert other.optimizedSignatureComputed is None
+
+
+def test_first_entry_cache(cm, django_assert_num_queries):
+    """The first entries are loaded with only the needed outputs, and at most
+    as many buckets as fit in the cache are kept"""
+    buckets = [cm.create_bucket() for _ in range(3)]
+    for idx, bucket in enumerate(buckets):
+        cm.create_crash(stdout=f"out {idx}", stderr=f"err {idx}", bucket=bucket)
+        cm.create_crash(stdout="later", stderr="later", bucket=bucket)
+
+    cache = FirstEntryCache(size=2)
+    # buckets, first entry ids and entries without the unneeded raw fields
+    with django_assert_num_queries(3):
+        crashInfo = cache.get(buckets[0].pk, ["stderr"])
+    assert crashInfo.rawStderr == ["err 0"]
+    assert crashInfo.rawStdout == []
+    assert set(cache.crashInfos) == {buckets[0].pk, buckets[1].pk}
+    with django_assert_num_queries(0):
+        assert cache.get(buckets[1].pk, ["stderr"]).rawStderr == ["err 1"]
+
+    # needing more outputs loads the entries again
+    crashInfo = cache.get(buckets[0].pk, ["stdout", "stderr"])
+    assert crashInfo.rawStdout == ["out 0"]
+
+    # the least recently used bucket is dropped
+    assert cache.get(buckets[2].pk, ["stderr"]).rawStderr == ["err 2"]
+    assert len(cache.crashInfos) == 2
+    assert buckets[1].pk not in cache.crashInfos
+
+
+def test_find_signature_similar(client, cm):
+    """Similar buckets are found through the signature index"""
+    client.login(username="test", password="test")
+
+    def frames_signature(*names):
+        return json.dumps(
+            {"symptoms": [{"type": "stackFrames", "functionNames": list(names)}]}
+        )
+
+    crashdata = "\n".join(
+        ["==1==ERROR: AddressSanitizer: SEGV on unknown address 0x000000000000"]
+        + [
+            "    #%d 0x%x in %s /src/file.cpp:1:1" % (idx, 0x1000 + idx, name)
+            for idx, name in enumerate(("a", "b", "c", "d", "e"))
+        ]
+    )
+    crash = cm.create_crash(crashdata=crashdata)
+    assert crash.getCrashInfo().backtrace == ["a", "b", "c", "d", "e"]
+    similar = cm.create_bucket(signature=frames_signature("a", "b", "x"))
+    cm.create_bucket(signature=frames_signature("v", "w", "x", "y", "z"))
+    cm.create_crash(bucket=similar)
+
+    response = client.get(
+        reverse("crashmanager:findsigs", kwargs={"crashid": crash.pk})
+    )
+    assert response.status_code == requests.codes["ok"]
+    assert [bucket.pk for bucket in response.context["buckets"]] == [similar.pk]
+    assert response.context["buckets"][0].offCount == 1
+
+    matching = cm.create_bucket(signature=frames_signature("a", "b", "c"))
+    response = client.get(
+        reverse("crashmanager:findsigs", kwargs={"crashid": crash.pk})
+    )
+    assert response.status_code == requests.codes["ok"]
+    assert response.context["bucket"] == matching
+    crash.refresh_from_db()
+    assert crash.bucket == matching
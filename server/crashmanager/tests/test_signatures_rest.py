@@ -9,15 +9,17 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
+import io
 import json
 import logging
+import zipfile
 
 import pytest
 import requests
 from django.urls import reverse
 from rest_framework import status
 
-from crashmanager.models import Bucket, Bug, CrashEntry
+from crashmanager.models import Bucket, BucketHit, Bug, CrashEntry
 
 from .conftest import _create_user
 
@@ -643,6 +645,94 @@ def test_edit_signature_edit_w_reassign(
     }
 
 
+@pytest.mark.parametrize("user", ["normal"], indirect=True)
+def test_edit_signature_edit_w_reassign_celery(
+    api_client, cm, mocker, settings, user
+):  # pylint: disable=invalid-name
+    bucket = cm.create_bucket()
+    crash = cm.create_crash(shortSignature="crash #1", stderr="blah")
+    settings.USE_CELERY = True
+    reassign_bucket = mocker.patch("crashmanager.tasks.reassign_bucket")
+    sig = json.dumps(
+        {"symptoms": [{"src": "stderr", "type": "output", "value": "/^blah/"}]}
+    )
+
+    resp = api_client.patch(
+        "/crashmanager/rest/buckets/%d/?reassign=true" % bucket.pk,
+        data={"signature": sig},
+        format="json",
+    )
+
+    LOG.debug(resp)
+    assert resp.status_code == requests.codes["ok"]
+    assert resp.json() == {
+        "url": reverse("crashmanager:sigview", kwargs={"sigid": bucket.pk}),
+        "inList": [],
+        "inListCount": 0,
+        "outList": [],
+        "outListCount": 0,
+        "nextOffset": None,
+    }
+    bucket = Bucket.objects.get(pk=bucket.pk)
+    assert bucket.reassign_in_progress
+    assert reassign_bucket.call_count == 1
+    assert reassign_bucket.call_args[0][0].pk == bucket.pk
+    # done in the background
+    assert CrashEntry.objects.get(pk=crash.pk).bucket is None
+
+
+def test_reassign_bucket_tasks(db, cm):
+    from crashmanager.tasks import reassign_bucket_done, reassign_bucket_range
+
+    bucket = cm.create_bucket(
+        signature=json.dumps(
+            {"symptoms": [{"src": "stderr", "type": "output", "value": "/^blah/"}]}
+        ),
+        reassign_in_progress=True,
+    )
+    crashes = [cm.create_crash(stderr="blah") for _ in range(3)]
+
+    assert reassign_bucket_range(bucket.pk, crashes[0].pk, crashes[1].pk) == (2, 0)
+    assert [CrashEntry.objects.get(pk=c.pk).bucket_id for c in crashes] == [
+        bucket.pk,
+        bucket.pk,
+        None,
+    ]
+
+    reassign_bucket_done([(2, 0)], bucket.pk)
+    assert not Bucket.objects.get(pk=bucket.pk).reassign_in_progress
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 100])
+def test_reassign_parallel(db, cm, chunk_size):
+    sig = json.dumps(
+        {"symptoms": [{"src": "stderr", "type": "output", "value": "/^blah/"}]}
+    )
+    bucket = cm.create_bucket(signature=sig)
+    other = cm.create_bucket(signature=sig)
+    crashes = [
+        cm.create_crash(stderr="blah"),
+        cm.create_crash(stderr="foo", bucket=bucket),
+        cm.create_crash(stderr="blah", bucket=other),
+        cm.create_crash(stderr="foo"),
+        cm.create_crash(stderr="blah", bucket=bucket),
+        cm.create_crash(stderr="blah"),
+    ]
+
+    assert bucket.reassign_parallel(processes=1, chunk_size=chunk_size) == (2, 1)
+
+    assert [CrashEntry.objects.get(pk=c.pk).bucket_id for c in crashes] == [
+        bucket.pk,
+        None,
+        other.pk,
+        None,
+        bucket.pk,
+        bucket.pk,
+    ]
+    assert sum(hit.count for hit in BucketHit.objects.filter(bucket=bucket)) == 3
+    assert not CrashEntry.objects.get(pk=crashes[1].pk).triagedOnce
+
+
 @pytest.mark.parametrize("user", ["normal"], indirect=True)
 @pytest.mark.parametrize(
     "many", [pytest.param(False, id="single"), pytest.param(True, id="many")]
@@ -827,3 +917,53 @@ def test_signatures_download_perms(api_client, user, settings, tmp_path):
         api_client.get("/crashmanager/rest/signatures/download/", {}).status_code
         == requests.codes["ok"]
     )
+
+
+def test_signatures_download_conditional(user_normal, api_client, settings, tmp_path):
+    """signatures.zip and the manifest support conditional requests"""
+    settings.SIGNATURE_STORAGE = str(tmp_path)
+    (tmp_path / "signatures.zip").write_bytes(b"zip")
+    (tmp_path / "signatures.manifest.json").write_text('{"1": "abc"}')
+    url = "/crashmanager/rest/signatures/download/"
+
+    for params, content in (({}, b"zip"), ({"manifest": "1"}, b'{"1": "abc"}')):
+        response = api_client.get(url, params)
+        assert response.status_code == requests.codes["ok"]
+        assert response.content == content
+        etag = response["ETag"]
+
+        response = api_client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == requests.codes["not_modified"]
+        response = api_client.get(url, params, HTTP_IF_NONE_MATCH='"other"')
+        assert response.status_code == requests.codes["ok"]
+
+    response = api_client.get(url, {"manifest": "1"})
+    assert response["Content-Type"] == "application/json"
+
+
+def test_signatures_download_partial(user_normal, api_client, settings, tmp_path):
+    """only the requested signatures are sent"""
+    settings.SIGNATURE_STORAGE = str(tmp_path)
+    url = "/crashmanager/rest/signatures/download/"
+    assert (
+        api_client.get(url, {"buckets": "1"}).status_code == requests.codes["not_found"]
+    )
+
+    with zipfile.ZipFile(str(tmp_path / "signatures.zip"), "w") as zipf:
+        for bucket_id in (1, 2, 12):
+            zipf.writestr(f"{bucket_id}.signature", f"sig{bucket_id}")
+            zipf.writestr(f"{bucket_id}.metadata", "{}")
+
+    response = api_client.get(url, {"buckets": "12,1,3"})
+    assert response.status_code == requests.codes["ok"]
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zipf:
+        assert sorted(zipf.namelist()) == [
+            "1.metadata",
+            "1.signature",
+            "12.metadata",
+            "12.signature",
+        ]
+        assert zipf.read("12.signature") == b"sig12"
+
+    response = api_client.get(url, {"buckets": "1,x"})
+    assert response.status_code == requests.codes["bad_request"]
@@ -18,6 +18,7 @@ from datetime import timedelta
 
 import pytest
 import requests
+from django.core.cache import cache
 from django.urls import reverse
 from django.utils import timezone
 
@@ -32,6 +33,13 @@ API_NAME = "crashmanager:crash_stats_rest"
 VIEW_ENTRIES_FMT = "Total reports in the last hour: %d"
 
 
+@pytest.fixture(autouse=True)
+def clear_stats_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
 def test_stats_view_no_login(client):
     """Request without login hits the login redirect"""
     path = reverse(VIEW_NAME)
@@ -123,11 +131,14 @@ def test_rest_stats_with_crashes(
     cm.create_crash(shortSignature="crash #5", tool="tool #2", bucket=bucket2)
     cm.create_crash(shortSignature="crash #6", tool="tool #2", bucket=bucket2)
     cm.create_crash(shortSignature="crash #7", tool="tool #2", bucket=bucket2)
-    c8 = cm.create_crash(shortSignature="crash #8", tool="tool #2", bucket=bucket2)
+    # bucket these after moving them back, so BucketHit counts them at that time
+    c8 = cm.create_crash(shortSignature="crash #8", tool="tool #2")
     c8.created -= timedelta(days=1, seconds=1)
+    c8.bucket = bucket2
     c8.save()
-    c9 = cm.create_crash(shortSignature="crash #9", tool="tool #2", bucket=bucket2)
+    c9 = cm.create_crash(shortSignature="crash #9", tool="tool #2")
     c9.created -= timedelta(hours=1, seconds=1)
+    c9.bucket = bucket2
     c9.save()
     cm.create_toolfilter("tool #1", user=user.username)
     params = {}
@@ -165,6 +176,72 @@ def test_rest_stats_with_crashes(
         }
 
 
+def test_rest_stats_bucket_hours(api_client, user_normal, cm):
+    """Bucket counts combine hourly BucketHit rows with partial hours"""
+    bucket = cm.create_bucket(shortDescription="bucket #1")
+    now = timezone.now()
+    ages = [
+        timedelta(minutes=1),
+        timedelta(minutes=59),
+        timedelta(minutes=61),
+        timedelta(hours=3),
+        timedelta(hours=23, minutes=59),
+        timedelta(days=1, minutes=1),
+        timedelta(days=3),
+        timedelta(days=6, hours=23, minutes=59),
+        timedelta(days=7, minutes=1),
+        timedelta(days=10),
+    ]
+    for age in ages:
+        crash = cm.create_crash(tool="tool #1")
+        crash.created = now - age
+        crash.bucket = bucket
+        crash.save()
+    cm.create_toolfilter("tool #1", user=user_normal.username)
+
+    resp = api_client.get(reverse(API_NAME))
+    assert resp.status_code == requests.codes["ok"]
+    resp = resp.json()
+    assert resp["totals"] == [2, 5, 8]
+    assert resp["frequentBuckets"] == {str(bucket.pk): [2, 5, 8]}
+
+
+def test_rest_stats_bucket_hits(api_client, user_normal, cm):
+    """Hits counted for existing crashes (see CrashEntryViewSet.hits) are
+    included in the bucket counts and the totals, so they add up. The graph
+    only shows submitted reports."""
+    bucket = cm.create_bucket(shortDescription="bucket #1")
+    cm.create_crash(tool="tool #1")
+    crash = cm.create_crash(tool="tool #1", bucket=bucket)
+    old = cm.create_crash(tool="tool #1")
+    old.created -= timedelta(hours=2)
+    old.bucket = bucket
+    old.save()
+    cm.create_toolfilter("tool #1", user=user_normal.username)
+    resp = api_client.post(
+        f"/crashmanager/rest/crashes/{crash.pk}/hits/", {"count": 5}, format="json"
+    )
+    assert resp.status_code == requests.codes["ok"]
+
+    resp = api_client.get(reverse(API_NAME))
+    assert resp.status_code == requests.codes["ok"]
+    resp = resp.json()
+    assert resp["frequentBuckets"] == {str(bucket.pk): [6, 7, 7]}
+    assert resp["totals"] == [7, 8, 8]
+    assert set(resp["inFilterGraphData"]) == {0}
+
+
+def test_rest_stats_cached(api_client, user_normal, cm, settings):
+    """Stats are cached for CRASH_STATS_CACHE_TIMEOUT seconds"""
+    cm.create_crash()
+    cm.create_toolfilter("testtool", user=user_normal.username)
+    assert api_client.get(reverse(API_NAME)).json()["totals"] == [1, 1, 1]
+    cm.create_crash()
+    assert api_client.get(reverse(API_NAME)).json()["totals"] == [1, 1, 1]
+    settings.CRASH_STATS_CACHE_TIMEOUT = 0
+    assert api_client.get(reverse(API_NAME)).json()["totals"] == [2, 2, 2]
+
+
 @pytest.mark.parametrize("user", ["normal", "restricted"], indirect=True)
 @pytest.mark.parametrize("ignore_toolfilter", [True, False])
 def test_rest_stats_graph_data(api_client, user, cm, ignore_toolfilter, settings):
@@ -238,3 +315,34 @@ def test_update_crash_stats(db, cm, settings):
     assert hit3.tool.name == "tool #1"
     assert hit3.count == 3
     assert orig_hit3_time < hit3.lastUpdate
+
+
+def test_update_crash_stats_rollup(db, cm, settings, django_assert_max_num_queries):
+    """Crash stats for a long gap are rolled up with a constant number of queries"""
+    settings.CRASH_STATS_MAX_HISTORY_DAYS = 9
+    cur_hour = timezone.now().replace(microsecond=0, second=0, minute=0)
+    expected = {}
+    for hours in range(0, 8 * 24, 7):
+        for tool in ("tool #1", "tool #2")[: hours % 2 + 1]:
+            crash = cm.create_crash(tool=tool)
+            # every other crash exactly on the hour, it belongs to that period
+            crash.created = cur_hour - timedelta(hours=hours, minutes=hours % 2 * 20)
+            crash.save()
+            key = (CrashHit.get_period(crash.created), tool)
+            expected[key] = expected.get(key, 0) + 1
+
+    with django_assert_max_num_queries(8):
+        update_crash_stats()
+
+    hits = {
+        (CrashHit.get_period(hit.lastUpdate), hit.tool.name): hit.count
+        for hit in CrashHit.objects.select_related("tool")
+    }
+    assert hits == expected
+
+    # a second run only adds new crashes to the existing periods
+    cm.create_crash(tool="tool #1")
+    update_crash_stats()
+    assert sum(CrashHit.objects.values_list("count", flat=True)) == (
+        sum(expected.values()) + 1
+    )
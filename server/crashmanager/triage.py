@@ -0,0 +1,173 @@
+import logging
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.aggregates import Count, Max
+
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.SignatureIndex import SignatureIndex
+
+LOG = logging.getLogger("fm.crashmanager.triage")
+
+
+class BucketIndex:
+    """
+    Per-process index of all bucket signatures, used to triage crashes without
+    parsing and matching every bucket signature for every crash.
+
+    Buckets saved or deleted in this process are invalidated through model signals.
+    Buckets created or deleted by other processes are detected by a cheap aggregate
+    query on every use, and all other changes (e.g. a signature edited in the web
+    UI) are picked up by a resync at least every TRIAGE_SIGNATURE_INDEX_TTL seconds.
+    Resyncs only re-parse signatures whose text changed.
+    """
+
+    def __init__(self):
+        self.index = SignatureIndex()
+        self.raw_signatures = {}
+        self.dirty = set()
+        self.state = None
+        self.last_sync = None
+        self._requirements = None
+
+    def invalidate(self, pk):
+        # Nothing to do if the index was never loaded in this process
+        if self.last_sync is not None:
+            self.dirty.add(pk)
+
+    def _remove(self, pk):
+        self.index.remove(pk)
+        self.raw_signatures.pop(pk, None)
+        self._requirements = None
+
+    def _update(self, rows):
+        for pk, raw_signature in rows:
+            if self.raw_signatures.get(pk) == raw_signature:
+                continue
+            self.raw_signatures[pk] = raw_signature
+            self._requirements = None
+            try:
+                self.index.add(pk, CrashSignature.fromCache(raw_signature))
+            except RuntimeError as e:
+                # An invalid signature can't match anything, keep it out of the
+                # index, but remember its text so we don't try again every sync.
+                LOG.warning("Ignoring invalid signature of bucket %d: %s", pk, e)
+                self.index.remove(pk)
+
+    def sync(self):
+        from .models import Bucket
+
+        state = Bucket.objects.aggregate(count=Count("id"), last=Max("id"))
+        ttl = getattr(settings, "TRIAGE_SIGNATURE_INDEX_TTL", 60)
+        now = time.monotonic()
+
+        if self.last_sync is None or state != self.state or now - self.last_sync >= ttl:
+            rows = list(Bucket.objects.values_list("id", "signature"))
+            for pk in set(self.raw_signatures) - {pk for pk, _ in rows}:
+                self._remove(pk)
+            self._update(rows)
+            self.dirty.clear()
+            self.last_sync = now
+        elif self.dirty:
+            dirty, self.dirty = self.dirty, set()
+            rows = list(
+                Bucket.objects.filter(pk__in=dirty).values_list("id", "signature")
+            )
+            for pk in dirty - {pk for pk, _ in rows}:
+                self._remove(pk)
+            self._update(rows)
+
+        self.state = state
+
+    def get_matches(self, crashInfo, preferred=(), sync=True):
+        """
+        Generate the ids of all buckets matching the given crash, newest first.
+        Buckets in preferred are tried before all others.
+        """
+        if sync:
+            self.sync()
+        return self.index.getMatches(crashInfo, preferred=preferred)
+
+    def get_nearest(self, crashInfo, max_distance, limit=None, sync=True):
+        """
+        Shortlist the ids of the buckets that may be within max_distance of the
+        given crash, nearest first (see SignatureIndex.getNearest).
+        """
+        if sync:
+            self.sync()
+        return self.index.getNearest(crashInfo, max_distance, limit=limit)
+
+    def get_raw_signature(self, pk):
+        return self.raw_signatures.get(pk)
+
+    def _get_requirements(self):
+        if self._requirements is None:
+            sources = set()
+            testcase = False
+            for signature in self.index.signatures.values():
+                sources.update(signature.getRequiredOutputSources())
+                testcase = testcase or signature.matchRequiresTest()
+            self._requirements = (sources, testcase)
+        return self._requirements
+
+    @property
+    def required_output_sources(self):
+        """Output sources required to match a crash against any bucket"""
+        return self._get_requirements()[0]
+
+    @property
+    def requires_testcase(self):
+        """True if any bucket requires the testcase for matching"""
+        return self._get_requirements()[1]
+
+
+# This is a per-worker global index, shared by all triage calls in the
+# same process (triage_new_crashes and celery workers alike).
+BUCKET_INDEX = BucketIndex()
+
+# This is a per-worker global cache mapping short descriptions of
+# crashes to a list of bucket candidates to try first.
+TRIAGE_CACHE = OrderedDict()
+
+
+def find_bucket(crashInfo, shortSignature, accept=None, sync=True):
+    """
+    Find the bucket for the given crash. Buckets that matched crashes with the
+    same short signature before are tried first, then all others, newest first.
+
+    The optional accept callable is called with the id of each matching bucket
+    and can reject it (e.g. because it changed since the index was synced).
+
+    Returns a tuple of the bucket id (or None) and whether it was a cache hit.
+    """
+    triage_cache_hint = TRIAGE_CACHE.get(shortSignature, [])
+
+    for bucket_id in BUCKET_INDEX.get_matches(
+        crashInfo, preferred=set(triage_cache_hint), sync=sync
+    ):
+        if accept is not None and not accept(bucket_id):
+            continue
+
+        if bucket_id in triage_cache_hint:
+            return (bucket_id, True)
+
+        cacheList = [bucket_id]
+        if triage_cache_hint:
+            cacheList = TRIAGE_CACHE[shortSignature]
+
+            # We delete the current entry and add it again to ensure
+            # that our dictionary remains ordered by the time of last
+            # use. We can then just pop the first element if the cache
+            # grows too large, evicting the least used item.
+            del TRIAGE_CACHE[shortSignature]
+            cacheList.append(bucket_id)
+
+        TRIAGE_CACHE[shortSignature] = cacheList
+
+        if len(TRIAGE_CACHE) > getattr(settings, "CELERY_TRIAGE_MEMCACHE_ENTRIES", 100):
+            TRIAGE_CACHE.popitem(last=False)
+
+        return (bucket_id, False)
+
+    return (None, False)
@@ -1,18 +1,25 @@
+import functools
 import json
+import operator
 import os
 from collections import OrderedDict
 from datetime import datetime, timedelta
+from io import BytesIO
 from wsgiref.util import FileWrapper
+from zipfile import ZipFile
 
 from django.conf import settings as django_settings
 from django.conf import settings as djangosettings
+from django.core.cache import cache
 from django.core.exceptions import FieldError, PermissionDenied, SuspiciousOperation
 from django.db.models import F, Q
-from django.db.models.aggregates import Count, Min
+from django.db.models.aggregates import Count, Min, Sum
 from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.views.generic import TemplateView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic.list import ListView
@@ -20,8 +27,9 @@ from notifications.models import Notification
 from rest_framework import mixins, status, viewsets
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
 from rest_framework.decorators import action
-from rest_framework.exceptions import MethodNotAllowed, ValidationError
+from rest_framework.exceptions import MethodNotAllowed, ParseError, ValidationError
 from rest_framework.filters import BaseFilterBackend, OrderingFilter
+from rest_framework.parsers import BaseParser, JSONParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
@@ -44,6 +52,7 @@ from .models import (
     BugzillaTemplateMode,
     CrashEntry,
     CrashHit,
+    FirstEntryCache,
     Tool,
     User,
 )
@@ -57,6 +66,7 @@ from .serializers import (
     InvalidArgumentException,
     NotificationSerializer,
 )
+from .triage import BUCKET_INDEX
 
 
 class JSONDateEncoder(json.JSONEncoder):
@@ -647,14 +657,29 @@ def findSignatures(request, crashid):
 
     buckets = Bucket.objects.all()
     buckets = filter_signatures_by_toolfilter(request, buckets, restricted_only=True)
+    bucketIds = list(buckets.values_list("pk", flat=True))
     similarBuckets = []
     matchingBucket = None
 
+    # TODO: This could be made configurable through a GET parameter
+    maxDistance = 4
+
+    # Only compute the exact distance for the buckets that can be close enough
+    # according to the signature index, in the original order.
+    allowedIds = set(bucketIds)
+    candidateIds = [
+        pk
+        for pk in BUCKET_INDEX.get_nearest(entry.crashinfo, maxDistance)
+        if pk in allowedIds
+    ][: getattr(djangosettings, "FIND_SIGNATURES_CANDIDATES", 500)]
+    candidates = Bucket.objects.in_bulk(candidateIds)
+    candidates = [candidates[pk] for pk in bucketIds if pk in candidates]
+
     # Avoid hitting the database multiple times when looking for the first
     # entry of a bucket. Keeping these in memory is less expensive.
-    firstEntryPerBucketCache = {}
+    firstEntryCache = FirstEntryCache()
 
-    for bucket in buckets:
+    for bucket in candidates:
         signature = bucket.getSignature()
         distance = signature.getDistance(entry.crashinfo)
 
@@ -663,8 +688,7 @@ def findSignatures(request, crashid):
             matchingBucket = bucket
             break
 
-        # TODO: This could be made configurable through a GET parameter
-        if distance <= 4:
+        if distance <= maxDistance:
             proposedCrashSignature = signature.fit(entry.crashinfo)
             if proposedCrashSignature:
                 # We now try to determine how this signature will behave in other
@@ -675,25 +699,20 @@ def findSignatures(request, crashid):
                 matchesInOtherBucketsLimitExceeded = False
                 nonMatchesInOtherBuckets = 0
                 otherMatchingBucketIds = []
-                for otherBucket in buckets:
-                    if otherBucket.pk == bucket.pk:
+                requiredOutputs = proposedCrashSignature.getRequiredOutputSources()
+                firstEntryCache.preload(bucketIds, requiredOutputs)
+                for otherBucketId in bucketIds:
+                    if otherBucketId == bucket.pk:
                         continue
 
-                    if otherBucket.pk not in firstEntryPerBucketCache:
-                        c = CrashEntry.objects.filter(bucket=otherBucket).first()
-                        firstEntryPerBucketCache[otherBucket.pk] = c
-                        if c:
-                            # Omit testcase for performance reasons for now
-                            firstEntryPerBucketCache[otherBucket.pk] = c.getCrashInfo(
-                                attachTestcase=False
-                            )
-
-                    firstEntryCrashInfo = firstEntryPerBucketCache[otherBucket.pk]
+                    firstEntryCrashInfo = firstEntryCache.get(
+                        otherBucketId, requiredOutputs
+                    )
                     if firstEntryCrashInfo:
                         # Omit testcase for performance reasons for now
                         if proposedCrashSignature.matches(firstEntryCrashInfo):
                             matchesInOtherBuckets += 1
-                            otherMatchingBucketIds.append(otherBucket.pk)
+                            otherMatchingBucketIds.append(otherBucketId)
 
                             # We already match too many foreign buckets. Abort our
                             # search here to speed up the response time.
@@ -1009,6 +1028,20 @@ class DeferRawFilterBackend(BaseFilterBackend):
         return queryset
 
 
+class NDJSONParser(BaseParser):
+    """Parses newline delimited JSON into a list of the objects on each line."""
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return []
+        try:
+            return [json.loads(line) for line in stream if line.strip()]
+        except ValueError as exc:
+            raise ParseError(f"NDJSON parse error - {exc}")
+
+
 class CrashEntryViewSet(
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
@@ -1041,6 +1074,26 @@ class CrashEntryViewSet(
         else:
             return super().get_serializer(*args, **kwds)
 
+    @action(detail=False, methods=["post"], parser_classes=(JSONParser, NDJSONParser))
+    def bulk(self, request):
+        """Create many CrashEntries at once from a list (or NDJSON stream) of
+        crashes in the same format as accepted by create."""
+        if not isinstance(request.data, list):
+            raise InvalidArgumentException("Expecting a list of crashes.")
+        limit = getattr(django_settings, "CRASH_BULK_MAX_ITEMS", 500)
+        if len(request.data) > limit:
+            raise InvalidArgumentException(
+                f"At most {limit} crashes can be submitted at once."
+            )
+
+        serializer = CrashEntrySerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        entries = serializer.save()
+        return Response(
+            CrashEntrySerializer(entries, many=True, include_raw=False).data,
+            status=status.HTTP_201_CREATED,
+        )
+
     @action(detail=False, methods=["delete"])
     def delete(self, request, pk=None):
         if pk is not None:
@@ -1068,10 +1121,12 @@ class CrashEntryViewSet(
 
         deleted = 0
         pks = list(queryset.values_list("id", flat=True))
-        while pks:
-            chunk, pks = pks[:100], pks[100:]
-            deleteStats = CrashEntry.objects.filter(pk__in=chunk).delete()
-            deleted += deleteStats[1]["crashmanager.CrashEntry"]
+        # Update the bucket hit counters of all deleted entries at once
+        with BucketHit.batch():
+            while pks:
+                chunk, pks = pks[:100], pks[100:]
+                deleteStats = CrashEntry.objects.filter(pk__in=chunk).delete()
+                deleted += deleteStats[1]["crashmanager.CrashEntry"]
 
         return Response(
             status=status.HTTP_200_OK,
@@ -1134,6 +1189,30 @@ class CrashEntryViewSet(
             obj.testcase.save()
         return Response(CrashEntrySerializer(obj).data)
 
+    @action(detail=True, methods=["post"])
+    def hits(self, request, pk=None):
+        """Count further occurrences of a crash that were not submitted again,
+        as hits of the bucket the crash is in. Nothing is counted if the crash
+        wasn't triaged into a bucket yet."""
+        if not isinstance(request.data, dict):
+            raise InvalidArgumentException("Expecting a JSON object.")
+        count = request.data.get("count")
+        if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+            raise InvalidArgumentException({"count": ["Expecting a positive integer."]})
+        # Look the crash up like get_object() does, so restricted users can only
+        # count hits for crashes in their toolfilter, without loading raw fields.
+        queryset = self.filter_queryset(self.get_queryset())
+        entry = get_object_or_404(
+            queryset.select_related(None).only("bucket_id", "tool_id"), pk=pk
+        )
+        self.check_object_permissions(request, entry)
+        check_authorized_for_crash_entry(request, entry)
+        if entry.bucket_id is not None:
+            BucketHit.increment_count(
+                entry.bucket_id, entry.tool_id, timezone.now(), count
+            )
+        return Response({"bucket": entry.bucket_id}, status=status.HTTP_200_OK)
+
 
 class BucketViewSet(
     mixins.CreateModelMixin,
@@ -1300,7 +1379,18 @@ class BucketViewSet(
         inListCount, outListCount = 0, 0
         nextOffset = None
         # If the reassign checkbox is checked
-        if reassign:
+        if (
+            reassign
+            and submitSave
+            and not offset
+            and getattr(djangosettings, "USE_CELERY", None)
+        ):
+            from .tasks import reassign_bucket
+
+            # Matching all crashes can take a long time, so let the workers do it.
+            # The bucket is flagged with reassign_in_progress until they are done.
+            reassign_bucket(bucket)
+        elif reassign:
             inList, outList, inListCount, outListCount, nextOffset = bucket.reassign(
                 submitSave, limit=limit, offset=offset
             )
@@ -1548,15 +1638,31 @@ class AbstractDownloadView(APIView):
     authentication_classes = (TokenAuthentication, SessionAuthentication)
     permission_classes = (CheckAppPermission,)
 
-    def response(self, file_path, filename, content_type="application/octet-stream"):
+    def response(
+        self,
+        file_path,
+        filename,
+        content_type="application/octet-stream",
+        request=None,
+    ):
         if not os.path.exists(file_path):
             return HttpResponse(status=404)
 
+        etag = None
+        if request is not None:
+            # Files are replaced rather than modified, so this is enough to
+            # answer conditional requests without reading them.
+            stat = os.stat(file_path)
+            etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
+
         test_file = open(file_path, "rb")
-        response = HttpResponse(
-            FileWrapper(test_file), content_type="application/octet-stream"
-        )
+        response = HttpResponse(FileWrapper(test_file), content_type=content_type)
         response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        if etag is not None:
+            response["ETag"] = etag
         return response
 
     def get(self):
@@ -1589,10 +1695,51 @@ class SignaturesDownloadView(AbstractDownloadView):
             # This is a misconfiguration
             return HttpResponse(status=500)
 
+        # The manifest maps bucket ids to a hash of their exported files, so
+        # clients can download only the signatures that changed (see buckets).
+        if "manifest" in request.query_params:
+            filename = "signatures.manifest.json"
+            file_path = os.path.join(storage_base, filename)
+            return self.response(
+                file_path, filename, content_type="application/json", request=request
+            )
+
         filename = "signatures.zip"
         file_path = os.path.join(storage_base, filename)
 
-        return self.response(file_path, filename)
+        if "buckets" in request.query_params:
+            return self.partial_response(
+                file_path, filename, request.query_params["buckets"]
+            )
+
+        return self.response(file_path, filename, request=request)
+
+    @staticmethod
+    def partial_response(file_path, filename, buckets):
+        """Respond with a zip of only the signatures of the given (comma separated)
+        bucket ids, taken from the exported signatures."""
+        try:
+            bucket_ids = {
+                int(bucket_id) for bucket_id in buckets.split(",") if bucket_id
+            }
+        except ValueError:
+            raise InvalidArgumentException("Invalid bucket id list")
+
+        if not os.path.exists(file_path):
+            return HttpResponse(status=404)
+
+        data = BytesIO()
+        with ZipFile(file_path) as signatures, ZipFile(data, "w") as partial:
+            for member in signatures.infolist():
+                bucket_id = os.path.splitext(member.filename)[0]
+                if bucket_id.isdigit() and int(bucket_id) in bucket_ids:
+                    partial.writestr(member, signatures.read(member))
+
+        response = HttpResponse(
+            data.getvalue(), content_type="application/octet-stream"
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
 
 
 class BugzillaTemplateListView(ListView):
@@ -1752,34 +1899,30 @@ class InboxView(TemplateView):
     template_name = "inbox.html"
 
 
-class _FreqCount:
-    def __init__(self):
-        self.hour = 0
-        self.day = 0
-        self.week = 0
-        self.bucket_hour = {}
-        self.bucket_day = {}
-        self.bucket_week = {}
-
-    def add_hour(self, bucket):
-        self.hour += 1
-        if bucket is not None:
-            self.bucket_hour.setdefault(bucket, 0)
-            self.bucket_hour[bucket] += 1
-        self.add_day(bucket)
-
-    def add_day(self, bucket):
-        self.day += 1
-        if bucket is not None:
-            self.bucket_day.setdefault(bucket, 0)
-            self.bucket_day[bucket] += 1
-        self.add_week(bucket)
-
-    def add_week(self, bucket):
-        self.week += 1
-        if bucket is not None:
-            self.bucket_week.setdefault(bucket, 0)
-            self.bucket_week[bucket] += 1
+def _stats_windows(now):
+    """
+    Split the hour, day and week windows ending at `now` into the hours
+    covered by BucketHit and the partial hour at the start.
+
+    Returns a list of (name, start, first_full_hour) tuples and the beginning
+    of the current hour. The hours from first_full_hour up to and including
+    the current one are covered by BucketHit (nothing is counted after `now`
+    yet), the remainder of each window (start, first_full_hour) has to be
+    counted from the crash entries themselves.
+    """
+    cur_hour = now.replace(microsecond=0, second=0, minute=0)
+    windows = []
+    for name, length in (
+        ("hour", timedelta(hours=1)),
+        ("day", timedelta(days=1)),
+        ("week", timedelta(days=7)),
+    ):
+        start = now - length
+        first_full = start.replace(microsecond=0, second=0, minute=0) + timedelta(
+            hours=1
+        )
+        windows.append((name, start, min(first_full, cur_hour)))
+    return windows, cur_hour
 
 
 class CrashStatsViewSet(viewsets.GenericViewSet):
@@ -1793,57 +1936,104 @@ class CrashStatsViewSet(viewsets.GenericViewSet):
         ToolFilterCrashesBackend,
     ]
 
+    def _bucket_counts(self, request, entries, now):
+        """
+        Count crashes per bucket in the last hour, day and week.
+
+        Hours are summed from the hourly BucketHit counters, which include the
+        hits counted with CrashEntryViewSet.hits. Only the partial hour at the
+        start of each window is counted from CrashEntry.
+        """
+        windows, cur_hour = _stats_windows(now)
+        week_first_full = windows[-1][2]
+
+        counts = {}
+        hits = filter_bucket_hits_by_toolfilter(
+            request,
+            BucketHit.objects.all(),
+            restricted_only=self.ignore_toolfilter or self.detail,
+        ).filter(begin__gte=week_first_full, begin__lte=cur_hour)
+        for row in hits.values("bucket_id").annotate(
+            **{
+                name: Sum("count", filter=Q(begin__gte=first_full))
+                for name, _, first_full in windows
+            }
+        ):
+            counts[row["bucket_id"]] = [row[name] or 0 for name, _, _ in windows]
+
+        edges = {
+            name: Q(created__gt=start, created__lt=first_full)
+            for name, start, first_full in windows
+        }
+        edge_rows = (
+            entries.filter(bucket__isnull=False)
+            .filter(functools.reduce(operator.or_, edges.values()))
+            .values("bucket_id")
+            .annotate(
+                **{name: Count("pk", filter=query) for name, query in edges.items()}
+            )
+        )
+        for row in edge_rows:
+            bucket_counts = counts.setdefault(row["bucket_id"], [0] * len(windows))
+            for idx, (name, _, _) in enumerate(windows):
+                bucket_counts[idx] += row[name]
+
+        # (hour, day, week) per bucket, leaving out buckets without crashes
+        return {
+            bucket_id: bucket_counts
+            for bucket_id, bucket_counts in counts.items()
+            if bucket_counts[-1] > 0
+        }
+
     def retrieve(self, request, *_args, **_kwds):
         user = User.get_or_create_restricted(request.user)[0]
         entries = self.filter_queryset(self.get_queryset())
+        default_tools_filter = set(user.defaultToolsFilter.values_list("id", flat=True))
+
+        cache_timeout = getattr(django_settings, "CRASH_STATS_CACHE_TIMEOUT", 30)
+        cache_key = "crashmanager:stats:%d:%d:%s" % (
+            user.pk,
+            self.ignore_toolfilter,
+            ",".join(str(tool_id) for tool_id in sorted(default_tools_filter)),
+        )
+        if cache_timeout:
+            result = cache.get(cache_key)
+            if result is not None:
+                return Response(result, status=status.HTTP_200_OK)
 
         now = timezone.now()
         last_hour = now - timedelta(hours=1)
         last_day = now - timedelta(days=1)
         last_week = now - timedelta(days=7)
-        entries = entries.filter(created__gt=last_week)
-
-        totals = _FreqCount()
-        for created, bucket_id in entries.values_list("created", "bucket_id"):
-            if created > last_hour:
-                totals.add_hour(bucket_id)
-            elif created > last_day:
-                totals.add_day(bucket_id)
-            else:
-                totals.add_week(bucket_id)
+
+        unbucketed = entries.filter(
+            bucket__isnull=True, created__gt=last_week
+        ).aggregate(
+            hour=Count("pk", filter=Q(created__gt=last_hour)),
+            day=Count("pk", filter=Q(created__gt=last_day)),
+            week=Count("pk"),
+        )
+        bucket_counts = self._bucket_counts(request, entries, now)
+        # the totals include the hits counted for bucketed crashes, so they
+        # add up with the bucket counts
+        totals = [
+            unbucketed[name] + sum(counts[idx] for counts in bucket_counts.values())
+            for idx, name in enumerate(("hour", "day", "week"))
+        ]
 
         # this gives all the bucket ids
         #   where the bucket is top10 for any period (hour, day, week)
-        top10s = (
-            {
-                b_id
-                for b_id, _ in sorted(
-                    totals.bucket_hour.items(), key=lambda t: t[1], reverse=True
-                )[:10]
-            }
-            | {
+        top10s = set()
+        for idx in range(3):
+            top10s.update(
                 b_id
-                for b_id, _ in sorted(
-                    totals.bucket_day.items(), key=lambda t: t[1], reverse=True
+                for b_id, counts in sorted(
+                    bucket_counts.items(), key=lambda t: t[1][idx], reverse=True
                 )[:10]
-            }
-            | {
-                b_id
-                for b_id, _ in sorted(
-                    totals.bucket_week.items(), key=lambda t: t[1], reverse=True
-                )[:10]
-            }
-        )
+                if counts[idx]
+            )
 
-        frequent_buckets = {}
-        for b_id in top10s:
-            frequent_buckets[b_id] = [
-                totals.bucket_hour.get(b_id, 0),
-                totals.bucket_day.get(b_id, 0),
-                totals.bucket_week[b_id],  # only one that's guaranteed to exist
-            ]
-
-        default_tools_filter = set(user.defaultToolsFilter.values_list("id", flat=True))
+        frequent_buckets = {b_id: bucket_counts[b_id] for b_id in top10s}
 
         n_periods = getattr(django_settings, "CRASH_STATS_MAX_HISTORY_DAYS", 14) * 24
         cur_period = CrashHit.get_period(now)
@@ -1864,17 +2054,17 @@ class CrashStatsViewSet(viewsets.GenericViewSet):
             elif not user.restricted:
                 out_filter_hits_per_hour[hit_idx] += hit.count
 
-        return Response(
-            {
-                # [int, int, int] (hour, day, week)
-                "totals": [totals.hour, totals.day, totals.week],
-                # { bucket_id: [hour, day, week] }
-                # includes the top 10 for each time-frame, which usually overlap
-                "frequentBuckets": frequent_buckets,
-                # [int, ...] hits per hour for last week
-                "outFilterGraphData": out_filter_hits_per_hour,
-                # ditto
-                "inFilterGraphData": in_filter_hits_per_hour,
-            },
-            status=status.HTTP_200_OK,
-        )
+        result = {
+            # [int, int, int] (hour, day, week)
+            "totals": totals,
+            # { bucket_id: [hour, day, week] }
+            # includes the top 10 for each time-frame, which usually overlap
+            "frequentBuckets": frequent_buckets,
+            # [int, ...] hits per hour for last week
+            "outFilterGraphData": out_filter_hits_per_hour,
+            # ditto
+            "inFilterGraphData": in_filter_hits_per_hour,
+        }
+        if cache_timeout:
+            cache.set(cache_key, result, cache_timeout)
+        return Response(result, status=status.HTTP_200_OK)
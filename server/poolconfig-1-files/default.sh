@@ -0,0 +1 @@
+cleverscript
\ No newline at end of file
@@ -0,0 +1 @@
+a
\ No newline at end of file
@@ -47,7 +47,7 @@ class CheckAppPermission(permissions.BasePermission):
                     if (
                         view_name == "CrashEntryViewSet"
                         and request.method == "POST"
-                        and not view.detail
+                        and (not view.detail or view.action == "hits")
                         and request.user.has_perm(f"{app}.{app}_report_crashes")
                     ):
                         return True
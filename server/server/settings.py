@@ -365,6 +365,59 @@ CELERY_RESULT_SERIALIZER = "json"
 CELERY_BROKER_URL = "redis:///2"
 CELERY_RESULT_BACKEND = "redis:///1"
 CELERY_TRIAGE_MEMCACHE_ENTRIES = 100
+# Maximum age (seconds) of the per-worker bucket signature index used for triage
+# before it is fully resynced. Buckets saved in the same process are always
+# picked up immediately.
+# TRIAGE_SIGNATURE_INDEX_TTL = 60
+# Number of crash ids handled per task/process when reassigning a bucket in the
+# background, and number of processes used by Bucket.reassign_parallel
+# (defaults to the number of CPUs).
+# REASSIGN_CHUNK_SIZE = 10000
+# REASSIGN_PROCESSES = 4
+# Number of parsed crash entries kept in memory per process (0 disables caching)
+# CRASHINFO_CACHE_ENTRIES = 200
+# Store crash info caches in the compact format instead of JSON. Existing rows
+# can be converted with the reencode_crashinfo management command.
+# CRASHINFO_CACHE_COMPACT = True
+# Number of parsed bucket signatures kept in memory per process (0 disables caching)
+# SIGNATURE_CACHE_ENTRIES = 10000
+# Maximum number of crashes accepted in one request to rest/crashes/bulk/
+# CRASH_BULK_MAX_ITEMS = 500
+# Seconds for which the crash statistics shown on the stats page are cached per
+# user (0 disables caching)
+# CRASH_STATS_CACHE_TIMEOUT = 30
+# Minimum number of seconds between recomputing optimized signatures after
+# triage, and number of buckets optimized per task
+# OPTIMIZE_SIGNATURES_INTERVAL = 900
+# OPTIMIZE_SIGNATURES_CHUNK_SIZE = 50
+# Number of buckets whose first crash entry is kept in memory while optimizing
+# signatures or looking for similar signatures
+# FIRST_ENTRY_CACHE_ENTRIES = 10000
+# Maximum number of buckets compared in detail when looking for signatures
+# similar to a crash
+# FIND_SIGNATURES_CANDIDATES = 500
+# Store new coverage collections in the memory-mappable columnar format instead
+# of JSON. Existing collections can be converted with the reencode_coverage
+# management command.
+# COV_STORAGE_COLUMNAR = True
+# Total size in bytes of the stripped directory views of coverage collections
+# kept in memory per process for the browse and diff APIs (0 disables caching).
+# Larger views are not cached. With COV_SUBSET_CACHE_REDIS, views are also
+# shared through Redis for COV_SUBSET_CACHE_TIMEOUT seconds, and the top
+# COV_SUBSET_CACHE_WARM_DEPTH directory levels of new collections are cached by
+# a Celery task, up to the same total size.
+# COV_SUBSET_CACHE_BYTES = 67108864
+# COV_SUBSET_CACHE_REDIS = False
+# COV_SUBSET_CACHE_TIMEOUT = 604800
+# COV_SUBSET_CACHE_WARM_DEPTH = 2
+# Directory for the temporary files used when aggregating coverage collections,
+# which hold the complete merged coverage (defaults to the system temporary
+# directory, which shouldn't be in memory for large collections).
+# COV_AGGREGATE_TMPDIR = "/var/tmp"
+# Number of Celery tasks used to aggregate coverage collections. Each task
+# merges a part of the files of all collections, the result is the same. With
+# more than one, COV_AGGREGATE_TMPDIR must be shared by all Celery workers.
+# COV_AGGREGATE_PARTITIONS = 1
 CELERY_TASK_ROUTES = {
     "covmanager.cron.*": {"queue": "cron"},
     "crashmanager.cron.*": {"queue": "cron"},
@@ -392,6 +445,10 @@ CELERY_BEAT_SCHEDULE = {
         "task": "crashmanager.cron.export_signatures",
         "schedule": 60 * 60,
     },
+    "Precompute optimized signatures hourly": {
+        "task": "crashmanager.cron.optimize_signatures",
+        "schedule": 60 * 60,
+    },
     # 'Update EC2SpotManager statistics': {
     #     'task': 'ec2spotmanager.cron.update_stats',
     #     'schedule': 60,
@@ -0,0 +1 @@
+foo(89);
\ No newline at end of file
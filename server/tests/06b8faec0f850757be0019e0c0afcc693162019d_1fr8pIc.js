@@ -0,0 +1 @@
+foo(189);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(53);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(115);
\ No newline at end of file
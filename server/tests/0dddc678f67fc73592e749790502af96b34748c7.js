@@ -0,0 +1 @@
+foo(165);
\ No newline at end of file
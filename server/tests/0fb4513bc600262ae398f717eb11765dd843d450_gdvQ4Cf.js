@@ -0,0 +1 @@
+foo(163);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(51);
\ No newline at end of file
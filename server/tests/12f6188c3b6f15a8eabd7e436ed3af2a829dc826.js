@@ -0,0 +1 @@
+foo(25);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(179);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(195);
\ No newline at end of file
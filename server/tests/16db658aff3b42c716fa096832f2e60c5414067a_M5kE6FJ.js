@@ -0,0 +1 @@
+foo(47);
\ No newline at end of file
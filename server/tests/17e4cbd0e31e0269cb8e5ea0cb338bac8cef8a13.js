@@ -0,0 +1 @@
+foo(183);
\ No newline at end of file
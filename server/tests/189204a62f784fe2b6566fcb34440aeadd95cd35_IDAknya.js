@@ -0,0 +1 @@
+foo(57);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(167);
\ No newline at end of file
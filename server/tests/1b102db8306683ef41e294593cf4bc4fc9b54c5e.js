@@ -0,0 +1 @@
+foo(197);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(17);
\ No newline at end of file
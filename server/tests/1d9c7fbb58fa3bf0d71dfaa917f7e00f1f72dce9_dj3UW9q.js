@@ -0,0 +1 @@
+foo(87);
\ No newline at end of file
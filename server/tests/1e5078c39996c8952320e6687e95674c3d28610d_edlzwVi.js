@@ -0,0 +1 @@
+foo(49);
\ No newline at end of file
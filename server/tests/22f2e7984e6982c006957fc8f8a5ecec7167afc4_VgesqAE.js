@@ -0,0 +1 @@
+foo(59);
\ No newline at end of file
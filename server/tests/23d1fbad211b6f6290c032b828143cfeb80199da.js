@@ -0,0 +1 @@
+foo(113);
\ No newline at end of file
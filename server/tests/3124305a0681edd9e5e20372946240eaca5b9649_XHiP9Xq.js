@@ -0,0 +1 @@
+foo(193);
\ No newline at end of file
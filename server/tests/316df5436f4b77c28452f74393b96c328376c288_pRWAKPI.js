@@ -0,0 +1 @@
+foo(13);
\ No newline at end of file
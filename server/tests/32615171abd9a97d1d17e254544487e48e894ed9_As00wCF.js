@@ -0,0 +1 @@
+foo(95);
\ No newline at end of file
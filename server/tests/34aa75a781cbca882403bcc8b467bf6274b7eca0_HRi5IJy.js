@@ -0,0 +1 @@
+foo(159);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(55);
\ No newline at end of file
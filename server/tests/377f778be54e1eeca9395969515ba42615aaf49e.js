@@ -0,0 +1 @@
+foo(181);
\ No newline at end of file
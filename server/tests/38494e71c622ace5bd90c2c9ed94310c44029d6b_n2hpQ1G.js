@@ -0,0 +1 @@
+foo(155);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(101);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(105);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(143);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(103);
\ No newline at end of file
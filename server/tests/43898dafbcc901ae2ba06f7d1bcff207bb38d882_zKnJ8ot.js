@@ -0,0 +1 @@
+foo(7);
\ No newline at end of file
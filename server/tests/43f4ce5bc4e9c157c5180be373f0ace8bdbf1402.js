@@ -0,0 +1 @@
+foo(27);
\ No newline at end of file
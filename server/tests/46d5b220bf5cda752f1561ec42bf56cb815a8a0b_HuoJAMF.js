@@ -0,0 +1 @@
+foo(21);
\ No newline at end of file
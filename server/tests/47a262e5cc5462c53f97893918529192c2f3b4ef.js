@@ -0,0 +1 @@
+foo(93);
\ No newline at end of file
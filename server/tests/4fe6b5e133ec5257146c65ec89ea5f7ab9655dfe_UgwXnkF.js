@@ -0,0 +1,2 @@
+foo();
+test();
\ No newline at end of file
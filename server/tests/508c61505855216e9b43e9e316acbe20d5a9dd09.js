@@ -0,0 +1 @@
+foo(63);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(65);
\ No newline at end of file
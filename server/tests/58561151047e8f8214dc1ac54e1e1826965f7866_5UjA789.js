@@ -0,0 +1 @@
+foo(45);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(141);
\ No newline at end of file
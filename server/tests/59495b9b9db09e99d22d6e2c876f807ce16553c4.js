@@ -0,0 +1 @@
+foo(153);
\ No newline at end of file
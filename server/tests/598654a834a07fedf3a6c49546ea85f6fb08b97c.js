@@ -0,0 +1 @@
+foo(29);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(187);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(177);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(23);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(91);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(119);
\ No newline at end of file
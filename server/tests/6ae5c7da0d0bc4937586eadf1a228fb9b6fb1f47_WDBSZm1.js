@@ -0,0 +1 @@
+foo(79);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(19);
\ No newline at end of file
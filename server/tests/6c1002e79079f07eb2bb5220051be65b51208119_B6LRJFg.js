@@ -0,0 +1 @@
+foo(173);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(31);
\ No newline at end of file
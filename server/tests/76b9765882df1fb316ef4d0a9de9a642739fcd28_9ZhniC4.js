@@ -0,0 +1 @@
+foo(83);
\ No newline at end of file
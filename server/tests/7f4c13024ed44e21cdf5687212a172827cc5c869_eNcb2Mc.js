@@ -0,0 +1 @@
+foo(11);
\ No newline at end of file
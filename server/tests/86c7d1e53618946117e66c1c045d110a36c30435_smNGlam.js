@@ -0,0 +1 @@
+foo(35);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(77);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(129);
\ No newline at end of file
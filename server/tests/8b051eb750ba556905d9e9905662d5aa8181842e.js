@@ -0,0 +1 @@
+foo(121);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(3);
\ No newline at end of file
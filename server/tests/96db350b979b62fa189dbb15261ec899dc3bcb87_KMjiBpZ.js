@@ -0,0 +1 @@
+foo(161);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(73);
\ No newline at end of file
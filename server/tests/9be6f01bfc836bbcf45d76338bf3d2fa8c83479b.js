@@ -0,0 +1 @@
+foo(67);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(97);
\ No newline at end of file
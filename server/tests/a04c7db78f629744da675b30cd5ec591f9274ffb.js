@@ -0,0 +1 @@
+foo(199);
\ No newline at end of file
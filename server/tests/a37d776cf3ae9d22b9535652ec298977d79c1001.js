@@ -0,0 +1 @@
+foo(69);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(109);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(117);
\ No newline at end of file
@@ -0,0 +1,4 @@
+function init() {
+    while ( {}, this) !(Object === "Infinity");
+}
+eval("init()");
\ No newline at end of file
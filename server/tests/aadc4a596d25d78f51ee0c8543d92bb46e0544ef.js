@@ -0,0 +1 @@
+foo(43);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(33);
\ No newline at end of file
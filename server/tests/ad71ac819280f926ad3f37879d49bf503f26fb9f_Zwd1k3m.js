@@ -0,0 +1 @@
+foo(139);
\ No newline at end of file
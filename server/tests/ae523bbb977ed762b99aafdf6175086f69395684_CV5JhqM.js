@@ -0,0 +1 @@
+foo(131);
\ No newline at end of file
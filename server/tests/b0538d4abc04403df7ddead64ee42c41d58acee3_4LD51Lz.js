@@ -0,0 +1 @@
+foo(137);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(151);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(123);
\ No newline at end of file
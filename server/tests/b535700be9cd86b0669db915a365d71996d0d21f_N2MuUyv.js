@@ -0,0 +1 @@
+foo(75);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(1);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(127);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(5);
\ No newline at end of file
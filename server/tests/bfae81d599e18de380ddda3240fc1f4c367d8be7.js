@@ -0,0 +1 @@
+foo(135);
\ No newline at end of file
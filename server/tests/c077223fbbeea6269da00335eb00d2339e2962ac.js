@@ -0,0 +1 @@
+foo(85);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(41);
\ No newline at end of file
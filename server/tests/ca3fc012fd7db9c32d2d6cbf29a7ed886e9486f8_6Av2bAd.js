@@ -0,0 +1 @@
+foo(9);
\ No newline at end of file
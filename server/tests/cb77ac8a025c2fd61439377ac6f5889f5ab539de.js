@@ -0,0 +1 @@
+foo(149);
\ No newline at end of file
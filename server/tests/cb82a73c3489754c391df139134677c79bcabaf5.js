@@ -0,0 +1 @@
+foo(107);
\ No newline at end of file
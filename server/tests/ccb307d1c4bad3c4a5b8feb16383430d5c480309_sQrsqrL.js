@@ -0,0 +1 @@
+foo(147);
\ No newline at end of file
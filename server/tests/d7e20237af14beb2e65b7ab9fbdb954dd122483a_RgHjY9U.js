@@ -0,0 +1 @@
+foo(157);
\ No newline at end of file
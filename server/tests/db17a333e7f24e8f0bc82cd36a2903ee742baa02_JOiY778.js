@@ -0,0 +1 @@
+foo(39);
\ No newline at end of file
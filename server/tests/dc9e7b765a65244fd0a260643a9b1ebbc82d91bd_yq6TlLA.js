@@ -0,0 +1 @@
+foo(61);
\ No newline at end of file
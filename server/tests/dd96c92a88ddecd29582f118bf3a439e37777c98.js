@@ -0,0 +1 @@
+foo(133);
\ No newline at end of file
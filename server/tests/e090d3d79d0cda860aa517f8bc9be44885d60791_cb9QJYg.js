@@ -0,0 +1 @@
+foo(111);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(15);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(125);
\ No newline at end of file
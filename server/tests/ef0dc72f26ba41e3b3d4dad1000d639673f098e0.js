@@ -0,0 +1 @@
+foo(171);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(81);
\ No newline at end of file
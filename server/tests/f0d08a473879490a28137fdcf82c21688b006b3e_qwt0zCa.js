@@ -0,0 +1 @@
+foo(99);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(169);
\ No newline at end of file
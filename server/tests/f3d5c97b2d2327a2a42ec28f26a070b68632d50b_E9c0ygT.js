@@ -0,0 +1 @@
+foo(37);
\ No newline at end of file
@@ -0,0 +1 @@
+foo(175);
\ No newline at end of file
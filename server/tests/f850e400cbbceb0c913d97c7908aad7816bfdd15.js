@@ -0,0 +1 @@
+foo(185);
\ No newline at end of file
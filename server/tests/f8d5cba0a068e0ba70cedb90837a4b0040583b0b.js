@@ -0,0 +1 @@
+foo(145);
\ No newline at end of file
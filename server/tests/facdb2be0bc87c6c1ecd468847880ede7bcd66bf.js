@@ -0,0 +1 @@
+foo(191);
\ No newline at end of file
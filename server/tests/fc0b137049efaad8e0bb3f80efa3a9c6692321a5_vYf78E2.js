@@ -0,0 +1 @@
+foo(71);
\ No newline at end of file
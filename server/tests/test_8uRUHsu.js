@@ -0,0 +1 @@
+aa
\ No newline at end of file
@@ -0,0 +1 @@
+aaaa
\ No newline at end of file
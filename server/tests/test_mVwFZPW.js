@@ -0,0 +1 @@
+aaaaaa
\ No newline at end of file